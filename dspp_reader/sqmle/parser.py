@@ -0,0 +1,111 @@
+import re
+
+from typing import NamedTuple, Union
+
+READING_UNITS = {
+    'magnitude': 'mag',
+    'frequency': 'Hz',
+    'period_count': 'ct',
+    'period_seconds': 's',
+    'temperature': 'C',
+}
+
+_NUMBER = r'\s*(-?\d+(?:\.\d*)?)'
+
+_READING = re.compile(rf'\s*(r),{_NUMBER}m,{_NUMBER}Hz,\s*(\d+)c,{_NUMBER}s,{_NUMBER}C(?:,\s*(\d+))?\s*$')
+_CALIBRATION = re.compile(rf'\s*(c),{_NUMBER}m,{_NUMBER}s,{_NUMBER}C,{_NUMBER}m,{_NUMBER}C\s*$')
+_UNIT_INFORMATION = re.compile(r'\s*(i),\s*(\d+),\s*(\d+),\s*(\d+),\s*(\d+)\s*$')
+
+
+class SQMReading(NamedTuple):
+    """Response to the `rx` and `Rx` commands, values are plain numbers in the units of `READING_UNITS`."""
+    type: str
+    magnitude: float
+    frequency: float
+    period_count: int
+    period_seconds: float
+    temperature: float
+    serial_number: Union[str, None] = None
+
+    def to_quantities(self) -> dict:
+        """Get the reading as a dictionary with astropy Quantities."""
+        import astropy.units as u
+
+        return {
+            'type': self.type,
+            'magnitude': self.magnitude * u.mag,
+            'frequency': self.frequency * u.Hz,
+            'period_count': self.period_count * u.count,
+            'period_seconds': self.period_seconds * u.second,
+            'temperature': self.temperature * u.C,
+            'serial_number': self.serial_number,
+        }
+
+
+class SQMCalibration(NamedTuple):
+    """Response to the `cx` command."""
+    type: str
+    magnitude_offset_calibration: float
+    dark_period: float
+    temperature_light_calibration: float
+    magnitude_offset_manufacturer: float
+    temperature_dark_calibration: float
+
+
+class SQMUnitInformation(NamedTuple):
+    """Response to the `ix` command."""
+    type: str
+    protocol_number: str
+    model_number: str
+    feature_number: str
+    serial_number: str
+
+
+def parse_reading(response: str, with_serial_number: bool = True) -> SQMReading:
+    """Parse a response to `Rx`, or `rx` if `with_serial_number` is false.
+
+    Args:
+        response (str): Raw response, for instance ``r, 19.29m,0000000022Hz,0000000000c,0000000.000s, 027.0C,00000001``.
+        with_serial_number (bool): Whether the serial number is expected at the end.
+
+    Returns:
+        SQMReading: Parsed reading.
+
+    Raises:
+        ValueError: If the response does not have the expected format.
+    """
+    match = _READING.match(response)
+    if match is None or (match[7] is not None) != with_serial_number:
+        raise ValueError(f"Invalid {'Rx' if with_serial_number else 'rx'} response: {response.strip()!r}")
+    response_type, magnitude, frequency, period_count, period_seconds, temperature, serial_number = match.groups()
+    return SQMReading(response_type,
+                      float(magnitude),
+                      float(frequency),
+                      int(period_count),
+                      float(period_seconds),
+                      float(temperature),
+                      str(int(serial_number)) if serial_number is not None else None)
+
+
+def parse_calibration(response: str) -> SQMCalibration:
+    """Parse a response to `cx`.
+
+    Raises:
+        ValueError: If the response does not have the expected format.
+    """
+    match = _CALIBRATION.match(response)
+    if match is None:
+        raise ValueError(f"Invalid cx response: {response.strip()!r}")
+    return SQMCalibration(match[1], *(float(value) for value in match.groups()[1:]))
+
+
+def parse_unit_information(response: str) -> SQMUnitInformation:
+    """Parse a response to `ix`.
+
+    Raises:
+        ValueError: If the response does not have the expected format.
+    """
+    match = _UNIT_INFORMATION.match(response)
+    if match is None:
+        raise ValueError(f"Invalid ix response: {response.strip()!r}")
+    return SQMUnitInformation(*match.groups())
@@ -16,6 +16,7 @@ CONFIG_FIELDS_DEFAULT = {
     "site_elevation": 2174,
     "site_timezone": "America/Santiago",
     "sun_altitude": -10,
+    "ephemeris_table": None,
     "device_type": "sqm-le",
     "device_id": "1823",
     "device_altitude": 45,
@@ -24,8 +25,15 @@ CONFIG_FIELDS_DEFAULT = {
     "device_port": 10001,
     "device_window_correction": -0.11,
     "number_of_reads": 5,
+    "reads_spacing": 1,
+    "averaging_method": "mean",
     "delay_between_reads": 30,
+    "adaptive_cadence": False,
+    "min_delay_between_reads": 5,
+    "max_datapoints_per_night": None,
     "read_always": False,
+    "health_check_interval": 1800,
+    "show_countdown": True,
     "save_to_file": True,
     "save_to_database": False,
     "post_to_api": False,
@@ -33,6 +41,18 @@ CONFIG_FIELDS_DEFAULT = {
     "api_endpoint": "http://localhost:8000/api/sqm-le",
     "api_token": "<get-an-appropriate-api-token>",
     "file_format": 'tsv',
+    "file_flush_every": None,
+    "file_flush_interval": None,
+    "file_fsync": False,
+    "database_file": None,
+    "outbox_file": None,
+    "api_bulk_endpoint": None,
+    "api_batch_size": 1,
+    "api_batch_latency": 60,
+    "api_gzip": False,
+    "metrics_port": None,
+    "metrics_file": None,
+    "metrics_address": None,
     "save_logs_to": None,
 }
 
@@ -1,24 +1,28 @@
 import json
 
-import astropy.units as u
 import datetime
 import os
-import re
-import pandas as pd
-import socket
 import logging
 import sys
 
-import requests
-
 from astropy.units import Quantity
 from pathlib import Path
-from requests.exceptions import ConnectionError
 from time import sleep
 from zoneinfo import ZoneInfo
 
+from dspp_reader.sqmle.parser import READING_UNITS, SQMReading, parse_calibration, parse_reading, parse_unit_information
 from dspp_reader.tools import Device, Site
-from dspp_reader.tools.generics import augment_data, clean_data, get_filename
+from dspp_reader.tools.cadence import AdaptiveCadence
+from dspp_reader.tools.generics import augment_data, clean_data
+from dspp_reader.tools.connection import get_connection
+from dspp_reader.tools.database import DATABASE_FILENAME, SQLiteStorage
+from dspp_reader.tools.metrics import ReaderMetrics, start_exporters
+from dspp_reader.tools.api import ApiClient
+from dspp_reader.tools.outbox import OUTBOX_FILENAME, Outbox
+from dspp_reader.tools.profiling import NULL_TRACER, span
+from dspp_reader.tools.scheduler import WindowScheduler
+from dspp_reader.tools.statistics import AVERAGING_METHODS, ConstantFieldError, RecordAccumulator
+from dspp_reader.tools.writers import COLUMNAR_FORMATS, ColumnarNightWriter, NightFileWriter, get_flush_policy, split_units
 
 logger = logging.getLogger()
 
@@ -27,6 +31,9 @@ READ_WITH_SERIAL_NUMBER = b'Rx\r\n'
 REQUEST_CALIBRATION_INFORMATION = b'cx\r\n'
 UNIT_INFORMATION_REQUEST = b'ix\r\n'
 
+AVERAGED_FIELDS = ('magnitude', 'frequency', 'period_count', 'period_seconds', 'temperature')
+DISPERSION_FIELDS = ('magnitude', 'frequency', 'period_seconds', 'temperature')
+
 
 class SQMLE(object):
     """Class that implements the necessary code to read data from SQM-LE devices.
@@ -39,6 +46,7 @@ class SQMLE(object):
         site_longitude (float): Longitude of the site's location in degrees.
         site_elevation (int): Elevation of the site's location in meters above sea level.
         sun_altitude (float): Location of the sun with respect to the site's horizon to start measuring.
+        ephemeris_table (str): Path to a precomputed ephemeris table for the site. Optional.
         device_type (str): Type of the device. Must be 'sqm-le'.
         device_id (str): ID or serial number of the device for reading.
         device_altitude (float): Altitude of the device for reading in degrees.
@@ -47,16 +55,37 @@ class SQMLE(object):
         device_port (int): Port number of the device for reading.
         device_window_correction (float): Additive correction of device. In magnitudes.
         number_of_reads (int): How many reads to produce one datapoint.
-        reads_spacing (int): Spacing between reads in seconds.
-        delay_between_reads (int): Delay between reads in seconds.
+        reads_spacing (float): Spacing between reads in seconds.
+        averaging_method (str): How the reads are combined, 'mean', 'median' or 'sigma_clip'.
+        delay_between_reads (int): Delay between reads in seconds. With `adaptive_cadence` the delay while the sky is stable.
+        adaptive_cadence (bool): If true, read faster during the twilight and when the sky brightness changes fast.
+        min_delay_between_reads (float): Delay between reads in seconds while the sky changes fast, with `adaptive_cadence`.
+        max_datapoints_per_night (int): Maximum number of datapoints per night with `adaptive_cadence`. Optional.
         read_always (bool): If true, always return reads.
+        health_check_interval (int): Seconds between connection tests while waiting for the night.
+        show_countdown (bool): If true, show a countdown in the terminal while waiting.
         save_to_file (bool): If true, save to plain text file.
         save_to_database (bool): If true, save to database.
         post_to_api (bool): If true, post to API.
         save_files_to (Path): Directory where files are saved.
         api_endpoint (str): Full URL of API endpoint where data is going to be posted.
         api_token (str): API token for authentication.
-        file_format (str): File format for reading data. Default is 'tsv'.
+        file_format (str): File format for reading data, 'tsv', 'csv', 'txt', 'parquet' or 'arrow'. Default is 'tsv'.
+        file_flush_every (int): Number of datapoints buffered before writing them to the file. Default is 1, or 100 with
+            the columnar formats.
+        file_flush_interval (float): Maximum seconds between writes to the file. Default is 60, or 600 with the
+            columnar formats.
+        file_fsync (bool): If true, force the operating system to write the file to disk on every flush.
+        database_file (str): SQLite database used with `save_to_database`. Default is 'dspp_reader.sqlite' in `save_files_to`.
+        outbox_file (str): SQLite database where datapoints wait to be posted with `post_to_api`. Default is 'dspp_reader_outbox.sqlite' in `save_files_to`.
+        api_bulk_endpoint (str): Full URL of an API endpoint that accepts a list of datapoints.
+        api_batch_size (int): Maximum number of datapoints posted in one request to `api_bulk_endpoint`.
+        api_batch_latency (float): Maximum seconds a datapoint waits for a batch to be complete.
+        api_gzip (bool): If true, compress the requests to the API with gzip.
+        metrics_port (int): Serve Prometheus metrics of the reader over HTTP on this port. Optional.
+        metrics_file (str): Write Prometheus metrics of the reader to this file, for the textfile collector of the node exporter. Optional.
+        metrics_address (str): Address the metrics are served on with `metrics_port`, only the local host by default.
+        tracer (SpanTracer): Records the time spent in every stage of each datapoint. Optional.
     """
     def __init__(self,
                  site_id: str = '',
@@ -66,6 +95,7 @@ class SQMLE(object):
                  site_longitude: float = 0,
                  site_elevation: int = 0,
                  sun_altitude: int = -10,
+                 ephemeris_table: str = None,
                  device_type: str = 'sqm-le',
                  device_id: str = None,
                  device_altitude: float = None,
@@ -74,16 +104,35 @@ class SQMLE(object):
                  device_port: int = 10001,
                  device_window_correction: float = 0,
                  number_of_reads: int = 3,
-                 reads_spacing: int = 1,
+                 reads_spacing: float = 1,
+                 averaging_method: str = 'mean',
                  delay_between_reads: int = 30,
+                 adaptive_cadence: bool = False,
+                 min_delay_between_reads: float = 5,
+                 max_datapoints_per_night: int = None,
                  read_always: bool = False,
+                 health_check_interval: int = 1800,
+                 show_countdown: bool = True,
                  save_to_file: bool = True,
                  save_to_database: bool = False,
                  post_to_api: bool = False,
                  save_files_to: Path = '.',
                  api_endpoint: str = '',
                  api_token: str = '',
-                 file_format: str = "tsv",):
+                 file_format: str = "tsv",
+                 file_flush_every: int = None,
+                 file_flush_interval: float = None,
+                 file_fsync: bool = False,
+                 database_file: str = None,
+                 outbox_file: str = None,
+                 api_bulk_endpoint: str = None,
+                 api_batch_size: int = 1,
+                 api_batch_latency: float = 60,
+                 api_gzip: bool = False,
+                 metrics_port: int = None,
+                 metrics_file: str = None,
+                 metrics_address: str = None,
+                 tracer=None):
         self.site_id = site_id
         self.site_name = site_name
         self.site_timezone = site_timezone
@@ -91,6 +140,7 @@ class SQMLE(object):
         self.site_longitude = site_longitude
         self.site_elevation = site_elevation
         self.sun_altitude = sun_altitude
+        self.ephemeris_table = ephemeris_table
         self.device_type = device_type
         self.device_id = device_id
         self.device_port = device_port
@@ -101,8 +151,16 @@ class SQMLE(object):
 
         self.number_of_reads = number_of_reads
         self.reads_spacing = reads_spacing
+        if averaging_method not in AVERAGING_METHODS:
+            raise ValueError(f"Unknown averaging method {averaging_method}, use one of {', '.join(AVERAGING_METHODS)}")
+        self.averaging_method = averaging_method
         self.delay_between_reads = delay_between_reads
+        self.adaptive_cadence = adaptive_cadence
+        self.min_delay_between_reads = min_delay_between_reads
+        self.max_datapoints_per_night = max_datapoints_per_night
         self.read_always = read_always
+        self.health_check_interval = health_check_interval
+        self.show_countdown = show_countdown
         self.save_to_file = save_to_file
         self.save_to_database = save_to_database
         self.post_to_api = post_to_api
@@ -110,6 +168,22 @@ class SQMLE(object):
         self.file_format = file_format
         self.api_endpoint = api_endpoint
         self.api_token = api_token
+        self.file_flush_every = file_flush_every
+        self.file_flush_interval = file_flush_interval
+        self.file_fsync = file_fsync
+        self.database_file = Path(database_file) if database_file else self.save_files_to / DATABASE_FILENAME
+        self.outbox_file = Path(outbox_file) if outbox_file else self.save_files_to / OUTBOX_FILENAME
+        self.api_bulk_endpoint = api_bulk_endpoint
+        self.api_batch_size = api_batch_size
+        self.api_batch_latency = api_batch_latency
+        self.api_gzip = api_gzip
+        self.metrics_port = metrics_port
+        self.metrics_file = metrics_file
+        self.metrics_address = metrics_address
+        self.tracer = tracer or NULL_TRACER
+        self.metrics = ReaderMetrics(device_type=self.device_type, device_id=self.device_id)
+        self.exporters = []
+        self._api_device = None
         self.separator = ''
         if self.file_format == "tsv":
             self.separator = "\t"
@@ -129,6 +203,8 @@ class SQMLE(object):
                 longitude=self.site_longitude,
                 elevation=self.site_elevation,
                 timezone=self.site_timezone)
+            if self.ephemeris_table:
+                self.site.load_ephemeris_table(table=self.ephemeris_table)
         else:
             logger.error("Not enough site info provided: Please provide: site_id, site_name, site_timezone, site_latitude, site_longitude, site_elevation")
 
@@ -163,63 +239,113 @@ class SQMLE(object):
                     sys.exit(1)
             logger.info(f"Data will be saved to {self.save_files_to}")
 
+        self.connection = None
+        if self.device:
+            self.connection = get_connection(ip=self.device.ip, port=self.device.port)
+
+        self.writer = None
+        flush_every, flush_interval = get_flush_policy(
+            columnar=self.file_format in COLUMNAR_FORMATS, flush_every=self.file_flush_every, flush_interval=self.file_flush_interval)
+        if self.device and self.save_to_file and self.file_format in COLUMNAR_FORMATS:
+            self.writer = ColumnarNightWriter(
+                save_files_to=self.save_files_to,
+                device_name=self.device.serial_id,
+                device_type='sqmle',
+                file_format=self.file_format,
+                flush_every=flush_every,
+                flush_interval=flush_interval,
+                metadata={'site_name': self.site_name})
+        elif self.device and self.save_to_file:
+            self.writer = NightFileWriter(
+                save_files_to=self.save_files_to,
+                device_name=self.device.serial_id,
+                device_type='sqmle',
+                file_format=self.file_format,
+                flush_every=flush_every,
+                flush_interval=flush_interval,
+                fsync=self.file_fsync)
+
+        self.database = None
+        if self.save_to_database:
+            database_flush_every, database_flush_interval = get_flush_policy(
+                columnar=False, flush_every=self.file_flush_every, flush_interval=self.file_flush_interval)
+            self.database = SQLiteStorage(
+                filename=self.database_file,
+                device_type=self.device_type,
+                batch_size=database_flush_every,
+                batch_interval=database_flush_interval)
+            logger.info(f"Data will be saved to database {self.database_file}")
+
+        self.outbox = None
+        if self.post_to_api:
+            self.outbox = Outbox(
+                filename=self.outbox_file,
+                queue=f"{self.device_type}_{self.device_id}",
+                client=ApiClient(
+                    api_endpoint=self.api_endpoint,
+                    api_token=self.api_token,
+                    api_bulk_endpoint=self.api_bulk_endpoint,
+                    compress=self.api_gzip),
+                batch_size=self.api_batch_size,
+                batch_latency=self.api_batch_latency)
+            self.outbox.start()
+            logger.info(f"Data will be posted to {self.api_endpoint} through {self.outbox_file}")
+
+        if self.writer:
+            self.metrics.track_queue(queue='file', function=lambda: self.writer.pending)
+        if self.database:
+            self.metrics.track_queue(queue='database', function=lambda: self.database.pending)
+        if self.outbox:
+            self.metrics.track_queue(queue='api', function=lambda: len(self.outbox))
+
+        self.cadence = None
+        if self.adaptive_cadence:
+            self.cadence = AdaptiveCadence(
+                min_delay=self.min_delay_between_reads,
+                max_delay=self.delay_between_reads,
+                max_datapoints_per_night=self.max_datapoints_per_night,
+                site=self.site,
+                sun_altitude=self.sun_altitude)
+
+        self.scheduler = WindowScheduler(
+            site=self.site,
+            sun_altitude=self.sun_altitude,
+            read_always=self.read_always,
+            health_check=self._check_connection if self.device else None,
+            health_check_interval=self.health_check_interval,
+            show_countdown=self.show_countdown)
+
     def __call__(self):
+        self.exporters = start_exporters(metrics_port=self.metrics_port, metrics_file=self.metrics_file, metrics_address=self.metrics_address)
         try:
             while True:
                 if self.device:
                     if self.device.site:
-                        next_period_start, next_period_end, time_to_next_start, time_to_next_end = self.device.site.get_time_range(sun_altitude=self.sun_altitude)
-                        if time_to_next_end > time_to_next_start and not self.read_always:
-                            logger.debug(
-                                f"Next Sunset is at {next_period_start.strftime('%Y-%m-%d %H:%M:%S %Z (UTC%z)')}")
-                            hours = int(time_to_next_start.sec // 3600)
-                            minutes = int((time_to_next_start.sec % 3600) // 60)
-                            seconds = int(time_to_next_start.sec % 60)
-
-                            try:
-                                self._send_command(command=UNIT_INFORMATION_REQUEST)
-                                message = f"Waiting for {hours:02d} hours {minutes:02d} minutes {seconds:02d} seconds until next sunset {next_period_start.to_datetime(timezone=ZoneInfo(self.device.site.timezone)).strftime('%Y-%m-%d %H:%M:%S')} {self.device.site.timezone} "
-                                if logger.getEffectiveLevel() == logging.DEBUG:
-                                    logger.debug(message)
-                                else:
-                                    print(f"\r{message}", end="", flush=True)
-                            except OSError as e:
-                                error_message = f"Socket error: {e}. The device may be unavailable."
-                                if logger.getEffectiveLevel() == logging.DEBUG:
-                                    logger.debug(error_message)
-                                else:
-                                    print(f"\033[2K\r{error_message}", end="", flush=True)
-
-                            continue
+                        self.scheduler.wait_for_window()
                     else:
                         logger.warning("No device has been defined, this program will continue reading continuously.")
 
-                    data = self.get_data_point()
+                    with self.tracer.trace(name=f"{self.device_type} {self.device_id}"):
+                        data = self.get_data_point()
 
-                    if not any([self.save_to_file, self.save_to_database, self.post_to_api]):
-                        logger.warning("Data will not be stored in any way...")
-                        sleep(3)
+                        if not any([self.save_to_file, self.save_to_database, self.post_to_api]):
+                            logger.warning("Data will not be stored in any way...")
+                            sleep(3)
 
-                    if self.save_to_file:
-                        self._write_to_txt(data=data)
-                    if self.save_to_database:
-                        self._write_to_database(data=data)
-                    if self.post_to_api:
-                        self._post_to_api(data=data)
+                        self.store_data_point(data=data)
 
                     last_datapoint = datetime.datetime.now(datetime.UTC)
                     logger.info(f"Last Datapoint recorded at {last_datapoint.strftime('%Y-%m-%d %H:%M:%S %Z')} or localtime {last_datapoint.astimezone(ZoneInfo(self.device.site.timezone)).strftime('%Y-%m-%d %H:%M:%S %Z')}.")
-                    for i in range(self.delay_between_reads):
-                        print(f"\r\rNext read in {self.delay_between_reads - i} seconds...", end="", flush=True)
-                        sleep(1)
-                    print("")
+                    self.scheduler.sleep(seconds=self.get_delay(data=data))
                 else:
-                    if not self.device:
-                        logger.error("A device is needed to be able to continue")
+                    logger.error("A device is needed to be able to continue")
+                    return
         except KeyboardInterrupt:
             logger.info("SQM-LE stopped by user")
         except ConnectionRefusedError:
             logger.info("SQM-LE connection refused")
+        finally:
+            self.close()
 
     def get_data_point(self):
         """Handles SQM-LE reading.
@@ -227,29 +353,28 @@ class SQMLE(object):
         This method encapsulates the entire process of reading an SQM-LE.
 
         In particular, it sends the command `Rx` which will return the data and the serial number of the device.
+        Each sample is folded into a `RecordAccumulator` as soon as it is parsed.
 
         Returns:
             A dictionary with the data obtained from the SQM-LE device
         """
         timestamp = datetime.datetime.now(datetime.UTC)
-        data = {}
-        measurements = []
-        while len(measurements) < self.number_of_reads:
+        accumulator = self.create_accumulator()
+        while len(accumulator) < self.number_of_reads:
             try:
 
-                logger.debug(f"Reading {len(measurements) + 1} of {self.number_of_reads} samples...")
+                logger.debug(f"Reading {len(accumulator) + 1} of {self.number_of_reads} samples...")
                 data = self._send_command(command=READ_WITH_SERIAL_NUMBER)
                 logger.debug(f"Response: {data}")
 
-                parsed_data = self._parse_data(data=data, command=READ_WITH_SERIAL_NUMBER)
-
-                corrected_data = self.__apply_window_correction(data=parsed_data)
-
-                measurements.append(corrected_data)
-                if self.device.serial_id:
-                    if self.device.serial_id != parsed_data['serial_number']:
-                        logger.warning(
-                            f"Serial number mismatch: {self.device.serial_id} != {parsed_data['serial_number']}")
+                reading = self.process_response(response=data)
+                try:
+                    accumulator.add(reading)
+                except ConstantFieldError as e:
+                    # another device may have taken over, the reads so far belong to a different one
+                    logger.warning(f"{e}, discarding the previous {len(accumulator)} samples")
+                    accumulator = self.create_accumulator()
+                    accumulator.add(reading)
                 sleep(self.reads_spacing)
 
             except IndexError as e:
@@ -261,15 +386,133 @@ class SQMLE(object):
                 sleep(self.reads_spacing)
                 continue
 
-        if len(measurements) == 1:
-            data = measurements[0]
-        elif len(measurements) > 1:
-            data = self.__average_data(measurements=measurements, command=READ_WITH_SERIAL_NUMBER)
+        return self.combine_measurements(accumulator=accumulator, timestamp=timestamp)
+
+    def get_delay(self, data: dict) -> float:
+        """Get the seconds to wait before the next datapoint.
+
+        Args:
+            data (dict): Datapoint just taken, returned by `get_data_point`.
+
+        Returns:
+            float: `delay_between_reads`, or the delay chosen by the adaptive cadence from the magnitude and its
+                standard deviation.
+        """
+        if self.cadence is None:
+            return self.delay_between_reads
+        return self.cadence.update(magnitude=data.get('magnitude'), dispersion=data.get('magnitude_std', 0.))
+
+    def process_response(self, response: str) -> dict:
+        """Parse a response to `Rx` and apply the window correction.
+
+        Args:
+            response (str): Raw response from the device.
+
+        Returns:
+            SQMReading: The corrected measurement.
+
+        Raises:
+            ValueError: If the response can not be parsed.
+        """
+        try:
+            with self.metrics.parse_seconds.time(), span('parse'):
+                parsed_data = self._parse_data(data=response, command=READ_WITH_SERIAL_NUMBER)
+        except ValueError:
+            self.metrics.decode_errors.inc()
+            raise
+
+        with span('window_correction'):
+            corrected_data = self.__apply_window_correction(data=parsed_data)
+
+        if self.device.serial_id:
+            if self.device.serial_id != parsed_data.serial_number:
+                logger.warning(
+                    f"Serial number mismatch: {self.device.serial_id} != {parsed_data.serial_number}")
+        return corrected_data
+
+    def create_accumulator(self) -> RecordAccumulator:
+        """Create the accumulator for the measurements of one datapoint.
+
+        Measurements with a different type or serial number than the first one are rejected by the accumulator, then
+        `get_data_point` starts the datapoint again from the rejected measurement.
+
+        Returns:
+            RecordAccumulator: Empty accumulator using `averaging_method`.
+        """
+        return RecordAccumulator(
+            fields=AVERAGED_FIELDS,
+            dispersion_fields=DISPERSION_FIELDS,
+            constant_fields=('type', 'serial_number'),
+            method=self.averaging_method,
+            buffer_size=max(1, self.number_of_reads))
+
+    def combine_measurements(self, accumulator: RecordAccumulator, timestamp: datetime.datetime) -> dict:
+        """Average the measurements of one datapoint and add the device and site information.
+
+        Besides the averaged values, the standard deviation, minimum and maximum of the magnitude, frequency, period
+        and temperature are included as `<field>_std`, `<field>_min` and `<field>_max`.
+
+        Args:
+            accumulator (RecordAccumulator): Accumulator with the measurements returned by `process_response`.
+            timestamp (datetime.datetime): Timestamp of the datapoint.
+
+        Returns:
+            dict: The datapoint ready to be stored.
+        """
+        logger.debug(f"Average data from {len(accumulator)} measurements using {self.averaging_method}")
+        with self.metrics.averaging_seconds.time():
+            with span('average'):
+                data = accumulator.result()
 
-        augmented_data = augment_data(data=data, timestamp=timestamp, device=self.device)
+            with span('augment'):
+                augmented_data = augment_data(data=data, timestamp=timestamp, device=self.device)
 
         return augmented_data
 
+    def store_data_point(self, data: dict):
+        """Send a datapoint to every enabled destination.
+
+        Args:
+            data (dict): Datapoint returned by `get_data_point`.
+        """
+        if self.save_to_file:
+            with self.metrics.output_seconds(output='file').time(), span('write'):
+                self._write_to_txt(data=data)
+        if self.save_to_database:
+            with self.metrics.output_seconds(output='database').time(), span('database'):
+                self._write_to_database(data=data)
+        if self.post_to_api:
+            with self.metrics.output_seconds(output='api').time(), span('post'):
+                self._post_to_api(data=data)
+        self.metrics.datapoint_stored()
+
+    def close(self):
+        """Close the connection to the device and flush and close the data file, database and API queue."""
+        if self.connection:
+            self.connection.close()
+        if self.writer:
+            self.writer.close()
+        if self.database:
+            self.database.close()
+        if self.outbox:
+            self.outbox.close()
+        for exporter in self.exporters:
+            exporter.close()
+        self.exporters = []
+
+    def _check_connection(self):
+        """Test the connection to the device requesting the unit information, without retrying.
+
+        The persistent connection is used since the device may accept only one connection at a time.
+        """
+        try:
+            response = self.connection.request(command=UNIT_INFORMATION_REQUEST)
+            logger.info(f"Successful connection test to {self.device.type.upper()} {self.device.serial_id} at {self.device.ip}:{self.device.port}: {response.decode(errors='replace').strip()}")
+            return True
+        except OSError as e:
+            logger.error(f"Socket error: {e}. The {self.device.type.upper()} {self.device.serial_id} at {self.device.ip}:{self.device.port} may be unavailable.")
+            return False
+
     def _send_command(self, command: bytes):
         r"""Helper method to send TCP/IP commands to the SQM-LE device.
 
@@ -282,22 +525,22 @@ class SQMLE(object):
             REQUEST_CALIBRATION_INFORMATION = b'cx\\r\\n'
             UNIT_INFORMATION_REQUEST = b'ix\\r\\n'
 
+        The command is sent through a persistent connection and the response is read until the `\\r\\n` terminator.
+
         Args:
             command (bytes): The command to send.
 
         Returns:
             The response from the SQM-LE device as a string.
         """
+        command_seconds = self.metrics.command_seconds(command=command.decode().strip())
         while True:
             try:
-                logger.debug(f"Creating socket connection for {self.device.type} {self.device.serial_id}")
-                with socket.create_connection((self.device.ip, self.device.port), timeout=5) as sock:
-                    logger.debug(f"Created socket connection for {self.device.type} {self.device.serial_id}")
-                    sock.sendall(command)
-                    sleep(1)
-                    data = sock.recv(1024)
-                    return data.decode()
+                with command_seconds.time():
+                    data = self.connection.request(command=command)
+                return data.decode()
             except OSError as e:
+                self.metrics.reconnects.inc()
                 timeout = 20
                 logger.error(
                     f"{datetime.datetime.now().astimezone()}: Unable to connect to {self.device.serial_id} at {self.device.ip}:{self.device.port}: {e}")
@@ -306,128 +549,50 @@ class SQMLE(object):
                     sleep(1)
                 print("")
             except UnicodeDecodeError as e:
+                self.metrics.decode_errors.inc()
                 logger.error(f"Error decoding data: {e}")
                 sleep(1)
 
-    def __apply_window_correction(self, data: dict):
+    def __apply_window_correction(self, data: SQMReading):
         """Applies window correction to data.
 
         Args:
-            data (dict): The data to process.
+            data (SQMReading): The data to process.
 
         Returns:
-            dict: The processed data with the window correction added to `magnitude`.
+            SQMReading: The processed data with the window correction added to `magnitude`.
         """
-        data['magnitude'] = data['magnitude'] + self.device_window_correction * u.mag
-        return data
+        return data._replace(magnitude=data.magnitude + self.device_window_correction)
 
     def _parse_data(self, data, command):
+        """Parse a response from the device into a typed record.
+
+        Values are plain numbers, units are attached only when writing the data, see `READING_UNITS` and
+        `SQMReading.to_quantities`.
+
+        Args:
+            data (str): Raw response.
+            command (bytes): Command that produced the response.
+
+        Returns:
+            SQMReading, SQMCalibration or SQMUnitInformation depending on the command.
+
+        Raises:
+            ValueError: If the response is empty or does not have the expected format.
+        """
         if len(data) == 0:
             raise ValueError("No data has been read")
-        data = data.strip().split(',')
-        if command == READ:
-            if len(data) != 6:
-                raise ValueError(f"The command {command.decode().strip()} expects 6 values, but got {len(data)}")
-            return {
-                'type': data[0],
-                'magnitude': float(re.sub('m', '', data[1])) * u.mag,
-                'frequency': float(re.sub('Hz', '', data[2])) * u.Hz,
-                'period_count': int(re.sub('c', '', data[3])) * u.count,
-                'period_seconds': float(re.sub('s', '', data[4])) * u.second,
-                'temperature': float(re.sub('C', '', data[5])) * u.C,
-            }
-        elif command == READ_WITH_SERIAL_NUMBER:
-            if len(data) != 7:
-                raise ValueError(f"The command {command.decode().strip()} expects 7 values, but got {len(data)}")
-            response_type = data[0]
-            if response_type != 'r':
-                raise ValueError(f"Invalid response type {response_type}, the command {command.decode().strip()} expected a type `r`")
-            magnitude = float(re.sub('m', '', data[1])) * u.mag
-            frequency = float(re.sub('Hz', '', data[2])) * u.Hz
-            period_count = int(re.sub('c', '', data[3])) * u.count
-            period_seconds = float(re.sub('s', '', data[4])) * u.second
-            temperature = float(re.sub('C', '', data[5])) * u.C
-            serial_number = str(int(data[6]))
-
-            return {
-                'type': response_type,
-                'magnitude': magnitude,
-                'frequency': frequency,
-                'period_count': period_count,
-                'period_seconds': period_seconds,
-                'temperature': temperature,
-                'serial_number': serial_number,
-            }
+        if command == READ_WITH_SERIAL_NUMBER:
+            return parse_reading(response=data, with_serial_number=True)
+        elif command == READ:
+            return parse_reading(response=data, with_serial_number=False)
         elif command == REQUEST_CALIBRATION_INFORMATION:
-            if len(data) != 6:
-                raise ValueError(f"The command {command.decode().strip()} expects 6 values, but got {len(data)}")
-            return {
-                'type': data[0],
-                'magnitude_offset_calibration': float(data[1]),
-                'dark_period': float(data[2]),
-                'temperature_light_calibration': float(data[3]),
-                'magnitude_offset_manufacturer': float(data[4]),
-                'temperature_dark_calibration': float(data[5]),
-            }
+            return parse_calibration(response=data)
         elif command == UNIT_INFORMATION_REQUEST:
-            if len(data) != 5:
-                raise ValueError(f"The command {command.decode().strip()} expects 5 values, but got {len(data)}")
-            return {
-                'type': data[0],
-                'protocol_number': data[1],
-                'model_number': data[2],
-                'feature_number': data[3],
-                'serial_number': data[4],
-            }
+            return parse_unit_information(response=data)
         else:
             logger.error(f"Unknown command: {command.decode().strip()}")
-            return data
-
-    def __average_data(self, measurements, command):
-        if len(measurements) == 0:
-            raise ValueError("No data has been read")
-        else:
-            logger.debug(f"Average data from {len(measurements)} measurements")
-        if command not in [READ, READ_WITH_SERIAL_NUMBER]:
-            raise NotImplementedError(f"Command {command.decode().strip()} does not support value averaging")
-
-        df = pd.DataFrame(measurements)
-        response_type = df['type'].unique()
-        if len(response_type) != 1:
-            raise ValueError(
-                f"Data is not clean, received multiple data type: {' '.join(response_type)}")
-        # Guille should work here
-        magnitude = df['magnitude'].mean()
-        frequency = df['frequency'].mean()
-        period_count = df['period_count'].mean()
-        period_seconds = df['period_seconds'].mean()
-        temperature = df['temperature'].mean()
-
-        if command == READ:
-            return {
-                'type': response_type[0],
-                'magnitude': magnitude,
-                'frequency': frequency,
-                'period_count': period_count,
-                'period_seconds': period_seconds,
-                'temperature': temperature,
-            }
-        elif command == READ_WITH_SERIAL_NUMBER:
-            serial_number = df['serial_number'].unique()
-            if len(serial_number) != 1:
-                raise ValueError(f"Data is not clean, received multiple serial number: {' '.join(serial_number)}")
-
-            return {
-                'type': response_type[0],
-                'magnitude': magnitude,
-                'frequency': frequency,
-                'period_count': period_count,
-                'period_seconds': period_seconds,
-                'temperature': temperature,
-                'serial_number': serial_number[0],
-            }
-        else:
-            raise ValueError(f"Unknown command: {command.decode().strip()}")
+            return data.strip().split(',')
 
     def __get_header(self, data, filename):
         """Create the header of the data file."""
@@ -435,7 +600,9 @@ class SQMLE(object):
         units = []
         for key in data.keys():
             columns.append(key)
-            if isinstance(data[key], Quantity):
+            if key in READING_UNITS:
+                units.append(f"# {key}: {READING_UNITS[key]}\n")
+            elif isinstance(data[key], Quantity):
                 units.append(f"# {key}: {data[key].unit}\n")
         return f"# Filename {filename}\n{''.join(units)}# {self.separator.join(columns)}\n"
 
@@ -459,64 +626,32 @@ class SQMLE(object):
         return f"{self.separator.join(fields)}\n"
 
     def _write_to_txt(self, data):
-        filename = get_filename(
-            save_files_to=self.save_files_to,
-            device_name=self.device.serial_id,
-            device_type='sqmle',
-            file_format=self.file_format)
-        if not os.path.exists(filename):
-            header = self.__get_header(data=data, filename=filename)
-            with open(filename, 'w') as f:
-                f.write(header)
-        data_line = self.__get_line_for_plain_text(data=data)
-        with open(filename, "a") as f:
-            f.write(data_line)
-            logger.info(f"Data point written to {filename}")
+        if isinstance(self.writer, ColumnarNightWriter):
+            record, units = split_units(data=data, units=READING_UNITS)
+            filename = self.writer.write(record=record, units=units)
+        else:
+            filename = self.writer.write(
+                line=self.__get_line_for_plain_text(data=data),
+                header=lambda filename: self.__get_header(data=data, filename=filename))
+        logger.info(f"Data point written to {filename}")
 
     def _write_to_database(self, data):
-        pass
+        self.database.add(data=data)
+        logger.debug(f"Data point added to database {self.database_file}")
 
     def _post_to_api(self, data):
-        cleaned_data = clean_data(data)
+        with span('clean'):
+            cleaned_data = clean_data(data)
         reorganized_data = self.__organize_for_api(data=cleaned_data)
-        if logger.getEffectiveLevel() == logging.DEBUG:
-            print(json.dumps(reorganized_data, indent=4))
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"Payload:\n{json.dumps(reorganized_data, indent=4)}")
 
-        max_failed_attempts = 5
-        failed_attempts = 0
-        while failed_attempts <= max_failed_attempts:
-            try:
-                response = requests.post(
-                    self.api_endpoint,
-                    json=reorganized_data,
-                    headers={
-                        'Authorization': f"Token {self.api_token}",
-                        'Content-Type': 'application/json'
-                    }
-                )
-                if response.status_code == 201:
-                    logger.info("Successfully created new entry in API")
-                    return
-                else:
-                    logger.error(f"Failed to create new entry in API, Status Code: {response.status_code}")
-                    failed_attempts += 1
-                    sleep(1)
-            except ConnectionError as e:
-                logger.error(f"Failed to create new entry in API, Error {e}")
-                failed_attempts += 1
-                sleep(1)
+        self.outbox.put(payload=reorganized_data)
+        logger.debug(f"Data point queued to be posted to {self.api_endpoint}")
 
     def __organize_for_api(self, data):
-
-        return {
-            'type': data['type'],
-            'magnitude': data['magnitude'],
-            'frequency': data['frequency'],
-            'period_count': data['period_count'],
-            'period_seconds': data['period_seconds'],
-            'temperature': data['temperature'],
-            'timestamp': data['timestamp'],
-            'device': {
+        if self._api_device is None:
+            self._api_device = {
                 'type': data['device'],
                 'serial_number': data['serial_number'],
                 'altitude': data['altitude'],
@@ -529,6 +664,15 @@ class SQMLE(object):
                     'elevation': data['elevation'],
                     'timezone': data['timezone'],
                 }
-            },
+            }
+        return {
+            'type': data['type'],
+            'magnitude': data['magnitude'],
+            'frequency': data['frequency'],
+            'period_count': data['period_count'],
+            'period_seconds': data['period_seconds'],
+            'temperature': data['temperature'],
+            'timestamp': data['timestamp'],
+            'device': self._api_device,
 
         }
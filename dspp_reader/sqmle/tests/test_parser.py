@@ -0,0 +1,97 @@
+import os
+import re
+import timeit
+
+import astropy.units as u
+
+from unittest import TestCase, skipUnless
+
+from dspp_reader.sqmle.parser import SQMReading, parse_calibration, parse_reading, parse_unit_information
+
+READ_RESPONSES = [
+    'r, 19.29m,0000000022Hz,0000000000c,0000000.000s, 027.0C,00000001\r\n',
+    'r, 16.31m,0000000024Hz,0000018638c,0000000.040s, 024.4C,00007281\r\n',
+    'r, 21.39m,0000000146Hz,0000023192c,0000000.050s, 025.4C,00007826\r\n',
+    'r,-00.52m,0001351235Hz,0000000012c,0000000.000s,-002.3C,00007826\r\n',
+]
+
+
+def legacy_parse(data):
+    """Parser used before the typed records, kept as reference for the benchmark."""
+    data = data.strip().split(',')
+    return {
+        'type': data[0],
+        'magnitude': float(re.sub('m', '', data[1])) * u.mag,
+        'frequency': float(re.sub('Hz', '', data[2])) * u.Hz,
+        'period_count': int(re.sub('c', '', data[3])) * u.count,
+        'period_seconds': float(re.sub('s', '', data[4])) * u.second,
+        'temperature': float(re.sub('C', '', data[5])) * u.C,
+        'serial_number': str(int(data[6])),
+    }
+
+
+class TestParseReading(TestCase):
+
+    def test_read_with_serial_number(self):
+        reading = parse_reading(response=READ_RESPONSES[1])
+
+        self.assertEqual(reading, SQMReading('r', 16.31, 24., 18638, 0.04, 24.4, '7281'))
+
+    def test_negative_values(self):
+        reading = parse_reading(response=READ_RESPONSES[3])
+
+        self.assertEqual(reading.magnitude, -0.52)
+        self.assertEqual(reading.temperature, -2.3)
+
+    def test_read_without_serial_number(self):
+        reading = parse_reading(response='r, 19.29m,0000000022Hz,0000000000c,0000000.000s, 027.0C\r\n', with_serial_number=False)
+
+        self.assertIsNone(reading.serial_number)
+        self.assertEqual(reading.magnitude, 19.29)
+
+    def test_missing_serial_number(self):
+        self.assertRaises(ValueError, parse_reading, response='r, 19.29m,0000000022Hz,0000000000c,0000000.000s, 027.0C\r\n')
+
+    def test_invalid_responses(self):
+        for response in ['', 'x, 19.29m,0000000022Hz,0000000000c,0000000.000s, 027.0C,00000001',
+                         'r, 19.29m,0000000022Hz,0000000000c,0000000.000s', 'r, 19.29m,0000000022Hz,garbage']:
+            self.assertRaises(ValueError, parse_reading, response=response)
+
+    def test_matches_legacy_parser(self):
+        for response in READ_RESPONSES:
+            legacy = legacy_parse(response)
+            quantities = parse_reading(response=response).to_quantities()
+            for key, value in legacy.items():
+                self.assertEqual(quantities[key], value)
+
+
+class TestParseOtherCommands(TestCase):
+
+    def test_calibration(self):
+        calibration = parse_calibration(response='c,00000019.84m,0000151.517s, 023.2C,00000008.71m, 029.6C\r\n')
+
+        self.assertEqual(calibration.magnitude_offset_calibration, 19.84)
+        self.assertEqual(calibration.dark_period, 151.517)
+        self.assertEqual(calibration.temperature_dark_calibration, 29.6)
+
+    def test_unit_information(self):
+        information = parse_unit_information(response='i,00000002,00000003,00000001,00000413\r\n')
+
+        self.assertEqual(information.protocol_number, '00000002')
+        self.assertEqual(information.serial_number, '00000413')
+
+    def test_invalid_unit_information(self):
+        self.assertRaises(ValueError, parse_unit_information, response='i,00000002,00000003\r\n')
+
+
+@skipUnless(os.environ.get('DSPP_BENCHMARK'), 'Set DSPP_BENCHMARK=1 to run benchmarks')
+class BenchmarkParser(TestCase):
+
+    def test_faster_than_legacy_parser(self):
+        number = 500
+        legacy = min(timeit.repeat(lambda: [legacy_parse(response) for response in READ_RESPONSES], number=number, repeat=3))
+        current = min(timeit.repeat(lambda: [parse_reading(response) for response in READ_RESPONSES], number=number, repeat=3))
+
+        samples = number * len(READ_RESPONSES)
+        print(f"\nSQM-LE parser: legacy {1e6 * legacy / samples:.2f} us/sample, current {1e6 * current / samples:.2f} us/sample, speedup {legacy / current:.1f}x")
+        self.assertLess(current * 3, legacy)
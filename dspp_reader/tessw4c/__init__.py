@@ -1 +1,5 @@
-from .tessw4c import TESSW4C
+def __getattr__(name):  # pragma: no cover
+    if name == 'TESSW4C':
+        from .tessw4c import TESSW4C
+        return TESSW4C
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -14,14 +14,22 @@ CONFIG_FIELDS_DEFAULT = {
     "site_elevation": 2174,
     "site_timezone": "America/Santiago",
     "sun_altitude": -10,
+    "ephemeris_table": None,
     "device_type": "tess-w4c",
     "device_id": "stars1823",
     "device_altitude": 45,
     "device_azimuth": 0,
     "device_ip": "0.0.0.0",
     "device_port": 32,
+    "stream_policy": "latest",
+    "udp_port": None,
     "delay_between_reads": 30,
+    "adaptive_cadence": False,
+    "min_delay_between_reads": 5,
+    "max_datapoints_per_night": None,
     "read_always": False,
+    "health_check_interval": 1800,
+    "show_countdown": True,
     "save_to_file": True,
     "save_to_database": False,
     "post_to_api": False,
@@ -29,6 +37,18 @@ CONFIG_FIELDS_DEFAULT = {
     "api_endpoint": "http://localhost:8000/api/tess-w4c",
     "api_token": "<get-an-appropriate-api-token>",
     "file_format": 'tsv',
+    "file_flush_every": None,
+    "file_flush_interval": None,
+    "file_fsync": False,
+    "database_file": None,
+    "outbox_file": None,
+    "api_bulk_endpoint": None,
+    "api_batch_size": 1,
+    "api_batch_latency": 60,
+    "api_gzip": False,
+    "metrics_port": None,
+    "metrics_file": None,
+    "metrics_address": None,
     "save_logs_to": None,
 }
 
@@ -1,22 +1,33 @@
 import datetime
-import json
 import os
-import socket
 import logging
+import random
 import sys
-from json import JSONDecodeError
-from time import sleep
+import time
 
 from pathlib import Path
 from zoneinfo import ZoneInfo
 
-import requests
-
 from dspp_reader.tools import Site, Device
-from dspp_reader.tools.generics import augment_data, get_filename, clean_data
+from dspp_reader.tools.cadence import AdaptiveCadence
+from dspp_reader.tools.generics import augment_data, clean_data
+from dspp_reader.tools.database import DATABASE_FILENAME, SQLiteStorage
+from dspp_reader.tools.metrics import ReaderMetrics, start_exporters
+from dspp_reader.tools.api import ApiClient
+from dspp_reader.tools.codec import flatten_tess_message, get_tessw4c_payload, validate_tess_message
+from dspp_reader.tools.connection import STREAM_POLICIES, MessageStream
+from dspp_reader.tools.outbox import OUTBOX_FILENAME, Outbox
+from dspp_reader.tools.profiling import NULL_TRACER, span
+from dspp_reader.tools.scheduler import WindowScheduler, check_connection
+from dspp_reader.tools.udp import UDP_BUFFER_SIZE, UDPDemultiplexer, open_udp_socket
+from dspp_reader.tools.writers import COLUMNAR_FORMATS, ColumnarNightWriter, NightFileWriter, get_flush_policy, split_units
 
 logger = logging.getLogger(__name__)
 
+# Seconds to wait before reconnecting, doubled after every failed attempt up to the maximum.
+MIN_RECONNECT_DELAY = 1
+MAX_RECONNECT_DELAY = 60
+
 
 class TESSW4C(object):
     """Class that implements the necessary code to read data from TESS-W4 devices."""
@@ -28,21 +39,42 @@ class TESSW4C(object):
                  site_longitude: str = '',
                  site_elevation: str = '',
                  sun_altitude: float = -10,
+                 ephemeris_table: str = None,
                  device_type: str = 'tess-w4c',
                  device_id: str = '',
                  device_altitude: float = 0,
                  device_azimuth: float = 0,
                  device_ip: str = '0.0.0.0',
                  device_port: int = 23,
+                 stream_policy: str = 'latest',
+                 udp_port: int = None,
                  delay_between_reads: int = 30,
+                 adaptive_cadence: bool = False,
+                 min_delay_between_reads: float = 5,
+                 max_datapoints_per_night: int = None,
                  read_always: bool = False,
+                 health_check_interval: int = 1800,
+                 show_countdown: bool = True,
                  save_to_file: bool = True,
                  save_to_database: bool = False,
                  post_to_api: bool = False,
                  save_files_to: Path = os.getcwd(),
                  api_endpoint: str = '',
                  api_token: str = '',
-                 file_format: str = 'tsv'):
+                 file_format: str = 'tsv',
+                 file_flush_every: int = None,
+                 file_flush_interval: float = None,
+                 file_fsync: bool = False,
+                 database_file: str = None,
+                 outbox_file: str = None,
+                 api_bulk_endpoint: str = None,
+                 api_batch_size: int = 1,
+                 api_batch_latency: float = 60,
+                 api_gzip: bool = False,
+                 metrics_port: int = None,
+                 metrics_file: str = None,
+                 metrics_address: str = None,
+                 tracer=None):
         self.site_id = site_id
         self.site_name = site_name
         self.site_timezone = site_timezone
@@ -50,14 +82,24 @@ class TESSW4C(object):
         self.site_longitude = site_longitude
         self.site_elevation = site_elevation
         self.sun_altitude = sun_altitude
+        self.ephemeris_table = ephemeris_table
         self.device_type = device_type
         self.device_id = device_id
         self.device_altitude = device_altitude
         self.device_azimuth = device_azimuth
         self.device_ip = device_ip
         self.device_port = device_port
+        if stream_policy not in STREAM_POLICIES:
+            raise ValueError(f"Unknown stream policy {stream_policy}, use one of {', '.join(STREAM_POLICIES)}")
+        self.stream_policy = stream_policy
+        self.udp_port = udp_port
         self.delay_between_reads = delay_between_reads
+        self.adaptive_cadence = adaptive_cadence
+        self.min_delay_between_reads = min_delay_between_reads
+        self.max_datapoints_per_night = max_datapoints_per_night
         self.read_always = read_always
+        self.health_check_interval = health_check_interval
+        self.show_countdown = show_countdown
         self.save_to_file = save_to_file
         self.save_to_database = save_to_database
         self.post_to_api = post_to_api
@@ -68,6 +110,23 @@ class TESSW4C(object):
         self.file_format = file_format
         self.api_endpoint = api_endpoint
         self.api_token = api_token
+        self.file_flush_every = file_flush_every
+        self.file_flush_interval = file_flush_interval
+        self.file_fsync = file_fsync
+        self.database_file = Path(database_file) if database_file else self.save_files_to / DATABASE_FILENAME
+        self.outbox_file = Path(outbox_file) if outbox_file else self.save_files_to / OUTBOX_FILENAME
+        self.api_bulk_endpoint = api_bulk_endpoint
+        self.api_batch_size = api_batch_size
+        self.api_batch_latency = api_batch_latency
+        self.api_gzip = api_gzip
+        self.metrics_port = metrics_port
+        self.metrics_file = metrics_file
+        self.metrics_address = metrics_address
+        self.tracer = tracer or NULL_TRACER
+        self.metrics = ReaderMetrics(device_type=self.device_type, device_id=self.device_id)
+        self.exporters = []
+        self._api_device = None
+        self.writer = None
         if self.file_format == 'tsv':
             self.separator = '\t'
         elif self.file_format == 'csv':
@@ -84,6 +143,8 @@ class TESSW4C(object):
                 longitude=self.site_longitude,
                 elevation=self.site_elevation,
                 timezone=self.site_timezone)
+            if self.ephemeris_table:
+                self.site.load_ephemeris_table(table=self.ephemeris_table)
         else:
             logger.error("Not enough site info provided: Please provide: site_id, site_name, site_timezone, site_latitude, site_longitude, site_elevation")
 
@@ -120,14 +181,62 @@ class TESSW4C(object):
                     sys.exit(1)
             logger.info(f"Data will be saved to {self.save_files_to}")
 
-    def __call__(self):
-        last_message_id = None
-        last_test_of_connection = None
-        connection_test_delay = 30  # Minutes
-        show_next_sunset_message = True
+        self.database = None
+        if self.save_to_database:
+            database_flush_every, database_flush_interval = get_flush_policy(
+                columnar=False, flush_every=self.file_flush_every, flush_interval=self.file_flush_interval)
+            self.database = SQLiteStorage(
+                filename=self.database_file,
+                device_type=self.device_type,
+                batch_size=database_flush_every,
+                batch_interval=database_flush_interval)
+            logger.info(f"Data will be saved to database {self.database_file}")
+
+        self.outbox = None
+        if self.post_to_api:
+            self.outbox = Outbox(
+                filename=self.outbox_file,
+                queue=f"{self.device_type}_{self.device_id}",
+                client=ApiClient(
+                    api_endpoint=self.api_endpoint,
+                    api_token=self.api_token,
+                    api_bulk_endpoint=self.api_bulk_endpoint,
+                    compress=self.api_gzip),
+                batch_size=self.api_batch_size,
+                batch_latency=self.api_batch_latency)
+            self.outbox.start()
+            logger.info(f"Data will be posted to {self.api_endpoint} through {self.outbox_file}")
+
+        if self.save_to_file:
+            self.metrics.track_queue(queue='file', function=lambda: self.writer.pending if self.writer else 0)
+        if self.database:
+            self.metrics.track_queue(queue='database', function=lambda: self.database.pending)
+        if self.outbox:
+            self.metrics.track_queue(queue='api', function=lambda: len(self.outbox))
 
+        self.cadence = None
+        if self.adaptive_cadence:
+            self.cadence = AdaptiveCadence(
+                min_delay=self.min_delay_between_reads,
+                max_delay=self.delay_between_reads,
+                max_datapoints_per_night=self.max_datapoints_per_night,
+                site=self.site,
+                sun_altitude=self.sun_altitude)
+        if self.cadence and self.stream_policy != 'latest':
+            logger.warning(f"The adaptive cadence is only used with the 'latest' stream policy, every message is stored with '{self.stream_policy}'")
+
+        self.scheduler = WindowScheduler(
+            site=self.site,
+            sun_altitude=self.sun_altitude,
+            read_always=self.read_always,
+            health_check=self._check_connection,
+            health_check_interval=self.health_check_interval,
+            show_countdown=self.show_countdown)
+
+    def __call__(self):
+        self.exporters = start_exporters(metrics_port=self.metrics_port, metrics_file=self.metrics_file, metrics_address=self.metrics_address)
         try:
-            logger.info(f"{self.device_type.upper()} started using TCP/IP")
+            logger.info(f"{self.device_type.upper()} started using {f'UDP port {self.udp_port}' if self.udp_port else 'TCP/IP'}")
             if self.site:
                 logger.info(f"Using site {self.site.name} at {self.site.latitude} {self.site.longitude}")
             else:
@@ -135,195 +244,250 @@ class TESSW4C(object):
             if self.device:
                 logger.info(f"Using device type {self.device.type} Serial ID {self.device.serial_id} configured with Altitude {self.device.altitude} and Azimuth {self.device.azimuth}")
 
+            if self.udp_port:
+                self._listen()
+            else:
+                self._read_stream()
+
+        except KeyboardInterrupt:
+            logger.info(f"{self.device_type.upper()} stopped by user")
+        finally:
+            self.close()
+
+    def _read_stream(self):
+        """Read the messages pushed by the device over a persistent TCP connection."""
+        last_message_id = None
+        stream = MessageStream(ip=self.device.ip, port=self.device.port, timeout=5)
+        discarded = 0
+        reconnect_delay = 0.
+        try:
             while True:
-                if self.device and self.device.site:
-                    next_period_start, next_period_end, time_to_next_start, time_to_next_end = self.device.site.get_time_range(sun_altitude=self.sun_altitude)
-                    if time_to_next_end > time_to_next_start and not self.read_always:
-                        if show_next_sunset_message:
-                            logger.info(f"Next Sunset (Sun at {self.sun_altitude} degrees from the horizon) is at {next_period_start.to_datetime(timezone=datetime.timezone.utc).strftime('%Y-%m-%d %H:%M:%S %Z')}")
-                            show_next_sunset_message = False
-                        hours = int(time_to_next_start.sec // 3600)
-                        minutes = int((time_to_next_start.sec % 3600) // 60)
-                        seconds = int(time_to_next_start.sec % 60)
-
-                        try:
-                            if last_test_of_connection is None or datetime.datetime.now(datetime.UTC) - last_test_of_connection > datetime.timedelta(minutes=connection_test_delay):
-                                last_test_of_connection = datetime.datetime.now(datetime.UTC)
-                                next_test_of_connection = last_test_of_connection + datetime.timedelta(minutes=connection_test_delay)
-                                logger.info(f"Testing connection to {self.device.type.upper()} {self.device.serial_id} at {self.device.ip}:{self.device.port}. Next connection test at {next_test_of_connection.strftime('%Y-%m-%d %H:%M:%S %Z')}")
-                                with socket.create_connection((self.device.ip, self.device.port)) as sock:
-                                    peer = sock.getpeername()
-                                    logger.info(f"Successful connection test to {peer[0]}:{peer[1]}.")
-                            message = f"Waiting for {hours:02d} hours {minutes:02d} minutes {seconds:02d} seconds until next sunset {next_period_start.to_datetime(timezone=ZoneInfo(self.device.site.timezone)).strftime('%Y-%m-%d %H:%M:%S')} {self.device.site.timezone} "
-                            if self.logger_level == logging.DEBUG:
-                                logger.debug(message)
-                            else:
-                                print(f"\r{message}", end="", flush=True)
-                            sleep(1)
-                        except ConnectionRefusedError as e:
-                            error_message = f"Socket error: {e}. The device may be unavailable."
-                            logger.error(error_message)
-                            sleep(5)
-                        except TimeoutError as e:
-                            logger.error(f"Socket timed out: {e}")
-                            sleep(5)
-                        continue
-                    else:
-                        show_next_sunset_message = True
-                else:
-                    logger.warning("No device has been defined, this program will continue reading continuously.")
+                if not self._is_within_window():
+                    # messages sent during the day are not stored
+                    stream.close()
+                self._wait_for_window()
 
+                try:
+                    messages = stream.read()
+                except OSError as e:
+                    self.metrics.reconnects.inc()
+                    reconnect_delay = min(MAX_RECONNECT_DELAY, max(MIN_RECONNECT_DELAY, reconnect_delay * 2))
+                    logger.error(f"Unable to read from {self.device.ip}:{self.device.port}: {e}. Attempting again in {reconnect_delay:.0f} seconds.")
+                    self.scheduler.sleep(seconds=reconnect_delay * random.uniform(0.5, 1), message="until reconnecting")
+                    continue
+                reconnect_delay = 0.
                 self.timestamp = datetime.datetime.now(datetime.UTC)
+                self.metrics.decode_errors.inc(stream.framer.discarded - discarded)
+                discarded = stream.framer.discarded
 
-                with socket.create_connection((self.device.ip, self.device.port), timeout=5) as sock:
+                if self.stream_policy == 'latest':
+                    messages = messages[-1:]
+                stored = None
+                for parsed_data in messages:
                     try:
-                        data = sock.recv(1024)
-                        parsed_data = json.loads(data.decode('utf-8'))
-                        message_id = parsed_data['udp']
-                        if message_id != last_message_id:
-                            last_message_id = message_id
-
-                            augmented_data = augment_data(data=parsed_data,
-                                                          timestamp=self.timestamp,
-                                                          device=self.device)
-                            if self.save_to_file:
-                                self._write_to_file(data=augmented_data)
-                            if self.save_to_database:
-                                self._write_to_database(data=augmented_data)
-                            if self.post_to_api:
-                                self._post_to_api(data=augmented_data)
-
-                            message = f"Last data point retrieved at {self.timestamp.strftime('%Y-%m-%d %H:%M:%S %Z')} or localtime {self.timestamp.astimezone(ZoneInfo(self.device.site.timezone)).strftime('%Y-%m-%d %H:%M:%S %Z')}"
-                            logger.info(message)
-
-                            for i in range(self.delay_between_reads):
-                                print(f"\r\rNext read in {self.delay_between_reads - i} seconds...", end="", flush=True)
-                                sleep(1)
-                            print("")
-
-                        else:
-                            logger.debug(f"Message id {message_id} skipped at {self.timestamp.strftime('%Y-%m-%d %H:%M:%S %Z')} because it has the same id as previous message ({last_message_id}).)")
-                            continue
-                    except TimeoutError:
-                        logger.error("Socket timed out")
+                        message_id = validate_tess_message(message=parsed_data)['udp']
+                    except ValueError as e:
+                        self.metrics.decode_errors.inc()
+                        logger.error(f"Error parsing data: {e}: {parsed_data}")
                         continue
-                    except JSONDecodeError as e:
-                        logger.error(f"Error parsing data: {e}")
-                        if data:
-                            logger.error(f"Error parsing string: {data.decode('utf-8')}")
+                    if message_id == last_message_id:
+                        self.metrics.duplicates.inc()
+                        logger.debug(f"Message id {message_id} skipped at {self.timestamp.strftime('%Y-%m-%d %H:%M:%S %Z')} because it has the same id as previous message ({last_message_id}).)")
                         continue
-                    except ConnectionRefusedError as e:
-                        logger.error(f"Socket error: {e}")
+                    last_message_id = message_id
+                    with self.tracer.trace(name=f"{self.device_type} {self.device_id}"):
+                        stored = self._store_message(message=parsed_data)
+
+                if stored and self.stream_policy == 'latest':
+                    self.scheduler.sleep(seconds=self.get_delay(data=stored))
+        finally:
+            stream.close()
+
+    def _listen(self):
+        """Receive the messages broadcast by the device on `udp_port`."""
+        demultiplexer = UDPDemultiplexer(readers=[self])
+        next_store = 0.
+        sock = None
+        reconnect_delay = 0.
+        try:
+            while True:
+                if sock is not None and not self._is_within_window():
+                    # datagrams received during the day are not stored
+                    sock.close()
+                    sock = None
+                self._wait_for_window()
+
+                try:
+                    if sock is None:
+                        sock = open_udp_socket(port=self.udp_port, timeout=MAX_RECONNECT_DELAY)
+                    data, address = sock.recvfrom(UDP_BUFFER_SIZE)
+                except TimeoutError:
+                    logger.warning(f"No messages received on UDP port {self.udp_port} in {MAX_RECONNECT_DELAY} seconds")
+                    continue
+                except OSError as e:
+                    if sock is not None:
+                        sock.close()
+                        sock = None
+                    self.metrics.reconnects.inc()
+                    reconnect_delay = min(MAX_RECONNECT_DELAY, max(MIN_RECONNECT_DELAY, reconnect_delay * 2))
+                    logger.error(f"Unable to receive on UDP port {self.udp_port}: {e}. Attempting again in {reconnect_delay:.0f} seconds.")
+                    self.scheduler.sleep(seconds=reconnect_delay * random.uniform(0.5, 1), message="until reopening the socket")
+                    continue
+                reconnect_delay = 0.
+                self.timestamp = datetime.datetime.now(datetime.UTC)
+                with self.tracer.trace(name=f"{self.device_type} {self.device_id}"):
+                    with self.metrics.parse_seconds.time(), span('parse'):
+                        routed = demultiplexer.route(data=data, address=address)
+                    if routed is None:
+                        continue
+                    if self.stream_policy == 'latest' and time.monotonic() < next_store:
                         continue
+                    data = self._store_message(message=routed[1])
+                    if self.stream_policy == 'latest':
+                        next_store = time.monotonic() + self.get_delay(data=data)
+        finally:
+            if sock is not None:
+                sock.close()
 
-        except KeyboardInterrupt:
-            logger.info(f"{self.device_type.upper()} stopped by user")
+    def _is_within_window(self) -> bool:
+        if self.read_always or not (self.device and self.device.site):
+            return True
+        return self.device.site.is_within_window(sun_altitude=self.sun_altitude)
 
-    def __get_header(self, data, filename):
-        columns = []
-        for key in data.keys():
-            if key.startswith('F'):
-                for subkey in data[key].keys():
-                    columns.append(f"{key}_{subkey}")
-            else:
-                columns.append(key)
-        return f"# File name: {filename}\n# {self.separator.join(columns)}\n"
-
-    def __get_line_for_plain_text(self, data):
-        fields = []
-        for key in data.keys():
-            if key.startswith('F'):
-                for subkey in data[key].keys():
-                    fields.append(str(data[key][subkey]))
+    def _wait_for_window(self):
+        if self.device and self.device.site:
+            self.scheduler.wait_for_window()
+        else:
+            logger.warning("No device has been defined, this program will continue reading continuously.")
+
+    def _store_message(self, message: dict) -> dict:
+        with span('augment'):
+            augmented_data = augment_data(data=message,
+                                          timestamp=self.timestamp,
+                                          device=self.device)
+        self.store_data_point(data=augmented_data)
+
+        message = f"Last data point retrieved at {self.timestamp.strftime('%Y-%m-%d %H:%M:%S %Z')} or localtime {self.timestamp.astimezone(ZoneInfo(self.device.site.timezone)).strftime('%Y-%m-%d %H:%M:%S %Z')}"
+        logger.info(message)
+        return augmented_data
+
+    def get_delay(self, data: dict) -> float:
+        """Get the seconds to wait before storing the next message with the `latest` stream policy.
+
+        Args:
+            data (dict): Message just stored, after `augment_data`.
+
+        Returns:
+            float: `delay_between_reads`, or the delay chosen by the adaptive cadence from the magnitude of the first
+                channel.
+        """
+        if self.cadence is None:
+            return self.delay_between_reads
+        channel = data.get('F1', data)
+        return self.cadence.update(magnitude=channel.get('mag') if isinstance(channel, dict) else None)
+
+    def close(self):
+        """Flush and close the data file, database and API queue."""
+        if self.writer:
+            self.writer.close()
+        if self.database:
+            self.database.close()
+        if self.outbox:
+            self.outbox.close()
+        for exporter in self.exporters:
+            exporter.close()
+        self.exporters = []
+
+    def _check_connection(self):
+        """Test the connection to the device."""
+        return check_connection(device=self.device)
+
+    def store_data_point(self, data: dict):
+        """Send a datapoint to every enabled destination.
+
+        Args:
+            data (dict): Message from the device after `augment_data`.
+        """
+        with span('flatten'):
+            row = flatten_tess_message(data=data) if self.save_to_file or self.post_to_api else None
+        if self.save_to_file:
+            with self.metrics.output_seconds(output='file').time(), span('write'):
+                self._write_to_file(data=data, row=row)
+        if self.save_to_database:
+            with self.metrics.output_seconds(output='database').time(), span('database'):
+                self._write_to_database(data=data)
+        if self.post_to_api:
+            with self.metrics.output_seconds(output='api').time(), span('post'):
+                self._post_to_api(data=data, row=row)
+        self.metrics.datapoint_stored()
+
+    def __get_header(self, row, filename):
+        return f"# File name: {filename}\n# {self.separator.join(row.keys())}\n"
+
+    def __get_line_for_plain_text(self, row):
+        return f"{self.separator.join(map(str, row.values()))}\n"
+
+    def _write_to_file(self, data, row=None):
+        device_type = data['type'] if 'type' in data else self.device_type
+        if self.writer is None or (self.writer.device_name, self.writer.device_type) != (data['name'], device_type):
+            if self.writer:
+                self.writer.close()
+            flush_every, flush_interval = get_flush_policy(
+                columnar=self.file_format in COLUMNAR_FORMATS, flush_every=self.file_flush_every, flush_interval=self.file_flush_interval)
+            if self.file_format in COLUMNAR_FORMATS:
+                self.writer = ColumnarNightWriter(
+                    save_files_to=self.save_files_to,
+                    device_name=data['name'],
+                    device_type=device_type,
+                    file_format=self.file_format,
+                    flush_every=flush_every,
+                    flush_interval=flush_interval,
+                    metadata={'site_name': self.site_name})
             else:
-                fields.append(str(data[key]))
-        return f"{self.separator.join(fields)}\n"
-
-    def _write_to_file(self, data):
-        filename = get_filename(
-            save_files_to=self.save_files_to,
-            device_name=data['name'],
-            device_type=data['type'] if 'type' in data else self.device_type,
-            file_format=self.file_format)
-        if not os.path.exists(filename):
-            header = self.__get_header(data=data, filename=filename)
-            with open(filename, 'w') as f:
-                f.write(header)
-        data_line = self.__get_line_for_plain_text(data)
-        with open(filename, 'a') as f:
-            f.write(data_line)
-            logger.debug(f"{self.device_type.upper()} data written to {filename}")
+                self.writer = NightFileWriter(
+                    save_files_to=self.save_files_to,
+                    device_name=data['name'],
+                    device_type=device_type,
+                    file_format=self.file_format,
+                    flush_every=flush_every,
+                    flush_interval=flush_interval,
+                    fsync=self.file_fsync)
+        if isinstance(self.writer, ColumnarNightWriter):
+            record, units = split_units(data=data)
+            filename = self.writer.write(record=record, units=units)
+        else:
+            row = row if row is not None else flatten_tess_message(data=data)
+            filename = self.writer.write(
+                line=self.__get_line_for_plain_text(row),
+                header=lambda filename: self.__get_header(row=row, filename=filename))
+        logger.debug(f"{self.device_type.upper()} data written to {filename}")
 
     def _write_to_database(self, data):
-        print(data)
-        raise NotImplementedError
-
-    def _post_to_api(self, data):
-        data = clean_data(data)
-        organized_data = self.__organize_for_api(data=data)
-
-        max_failed_attempts = 5
-        failed_attempts = 0
-        while failed_attempts < max_failed_attempts:
-            try:
-                response = requests.post(
-                    self.api_endpoint,
-                    json=organized_data,
-                    headers={
-                        'Authorization': f"Token {self.api_token}",
-                        'Content-Type': 'application/json'
-                    }
-                )
-                if response.status_code == 201:
-                    logger.info(f"Successfully posted data to {self.api_endpoint}")
-                    return
-                else:
-                    logger.error(f"Failed to post data to {self.api_endpoint}")
-                    failed_attempts += 1
-                    sleep(1)
-            except ConnectionError:
-                logger.error(f"Failed to connect to {self.api_endpoint}")
-                failed_attempts += 1
-                sleep(1)
-
-    def __organize_for_api(self, data):
+        self.database.add(data=data)
+        logger.debug(f"{self.device_type.upper()} data added to database {self.database_file}")
+
+    def _post_to_api(self, data, row=None):
+        if self._api_device is None:
+            self._api_device = self.__get_api_device(data=clean_data(data))
+        payload = get_tessw4c_payload(row=row if row is not None else flatten_tess_message(data=data), device=self._api_device)
+
+        self.outbox.put(payload=payload)
+        logger.debug(f"{self.device_type.upper()} data queued to be posted to {self.api_endpoint}")
+
+    def __get_api_device(self, data):
         return {
-            "message_id": data['udp'],
-            "timestamp": data['timestamp'],
-            "localtime": data['localtime'],
-            "channel_1": {
-                "frequency": data["F1"]['freq'],
-                "magnitude": data["F1"]['mag'],
-                "zeropoint": data["F1"]['zp']
-            }, "channel_2": {
-                "frequency": data["F2"]['freq'],
-                "magnitude": data["F2"]['mag'],
-                "zeropoint": data["F2"]['zp']
-            }, "channel_3": {
-                "frequency": data["F3"]['freq'],
-                "magnitude": data["F3"]['mag'],
-                "zeropoint": data["F3"]['zp']
-            }, "channel_4": {
-                "frequency": data["F4"]['freq'],
-                "magnitude": data["F4"]['mag'],
-                "zeropoint": data["F4"]['zp']
-            },
-            "ambient_temperature": data["tamb"],
-            "sky_temperature": data["tsky"],
-            'device': {
-                'type': data['device'],
-                'serial_number': data['serial_number'],
-                'altitude': data['altitude'],
-                'azimuth': data['azimuth'],
-                'site': {
-                    'id': data['site'],
-                    'name': self.device.site.name,
-                    'latitude': data['latitude'],
-                    'longitude': data['longitude'],
-                    'elevation': data['elevation'],
-                    'timezone': data['timezone'],
-                }
-            },
+            'type': data['device'],
+            'serial_number': data['serial_number'],
+            'altitude': data['altitude'],
+            'azimuth': data['azimuth'],
+            'site': {
+                'id': data['site'],
+                'name': self.device.site.name,
+                'latitude': data['latitude'],
+                'longitude': data['longitude'],
+                'elevation': data['elevation'],
+                'timezone': data['timezone'],
+            }
         }
 
 
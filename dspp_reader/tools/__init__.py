@@ -1,3 +1,25 @@
-from .site import Site  # pragma: no cover
-from .device import Device  # pragma: no cover
-from .generics import augment_data, get_args, get_filename, setup_logging  # pragma: no cover
+import importlib
+
+# Attributes are imported on first access, so that importing a lightweight module of the package, for instance to
+# parse the arguments of a console script, does not load astropy.
+_LAZY_ATTRIBUTES = {
+    'ArchiveIndex': 'archive',
+    'Site': 'site',
+    'Device': 'device',
+    'augment_data': 'generics',
+    'get_args': 'generics',
+    'get_filename': 'generics',
+    'open_night_file': 'archive',
+    'setup_logging': 'generics',
+    'stop_logging': 'generics',
+}
+
+__all__ = list(_LAZY_ATTRIBUTES.keys())
+
+
+def __getattr__(name):  # pragma: no cover
+    if name in _LAZY_ATTRIBUTES:
+        value = getattr(importlib.import_module(f".{_LAZY_ATTRIBUTES[name]}", __name__), name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
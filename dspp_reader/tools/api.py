@@ -0,0 +1,116 @@
+import gzip
+import logging
+
+from typing import Union
+
+logger = logging.getLogger()
+
+# Status codes meaning the bulk endpoint does not exist or does not accept POST requests.
+BULK_UNSUPPORTED_STATUS_CODES = [404, 405, 501]
+
+
+class ApiClient(object):
+    """Posts JSON payloads to the API through one persistent HTTP session.
+
+    The session keeps the connection to the API open between requests, so only the first request pays for the TCP and
+    TLS handshakes. Payloads are passed already serialized and are sent as they are, several of them can be sent in a
+    single request to `api_bulk_endpoint` as a JSON array. If the API answers the bulk endpoint with one of
+    `BULK_UNSUPPORTED_STATUS_CODES` bulk requests are disabled and `post_bulk` returns None, so the caller can post the
+    payloads one by one.
+
+    Args:
+        api_endpoint (str): Full URL of the API endpoint for one datapoint.
+        api_token (str): API token for authentication.
+        api_bulk_endpoint (str): Full URL of the API endpoint that accepts a list of datapoints, if any.
+        compress (bool): If true, send request bodies compressed with gzip.
+        timeout (float): Seconds to wait for the API on each request.
+    """
+
+    def __init__(self,
+                 api_endpoint: str,
+                 api_token: str,
+                 api_bulk_endpoint: Union[str, None] = None,
+                 compress: bool = False,
+                 timeout: float = 10):
+        self.api_endpoint = api_endpoint
+        self.api_token = api_token
+        self.api_bulk_endpoint = api_bulk_endpoint
+        self.compress = compress
+        self.timeout = timeout
+        self.bulk_supported = bool(api_bulk_endpoint)
+        self._session = None
+
+    def __repr__(self):
+        return f"ApiClient({self.api_endpoint}, bulk: {self.api_bulk_endpoint if self.bulk_supported else None})"
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @property
+    def session(self):
+        if self._session is None:
+            import requests
+
+            self._session = requests.Session()
+            self._session.headers.update({
+                'Authorization': f"Token {self.api_token}",
+                'Content-Type': 'application/json',
+            })
+        return self._session
+
+    def close(self):
+        """Close the connections to the API."""
+        if self._session is not None:
+            self._session.close()
+            self._session = None
+
+    def post(self, payload: str) -> tuple:
+        """Post one datapoint.
+
+        Args:
+            payload (str): Datapoint serialized as JSON.
+
+        Returns:
+            tuple: Status code, None if the API could not be reached, and text of the response.
+        """
+        return self._post(url=self.api_endpoint, body=payload)
+
+    def post_bulk(self, payloads: list) -> Union[tuple, None]:
+        """Post several datapoints in one request to the bulk endpoint.
+
+        Args:
+            payloads (list): Datapoints serialized as JSON.
+
+        Returns:
+            tuple: Status code and text of the response as in `post`, or None if the API does not support bulk requests.
+        """
+        if not self.bulk_supported:
+            return None
+        status_code, response = self._post(url=self.api_bulk_endpoint, body=f"[{','.join(payloads)}]")
+        if status_code in BULK_UNSUPPORTED_STATUS_CODES:
+            logger.warning(f"{self.api_bulk_endpoint} answered with status code {status_code}, datapoints will be posted one by one to {self.api_endpoint}")
+            self.bulk_supported = False
+            return None
+        return status_code, response
+
+    def _post(self, url: str, body: str) -> tuple:
+        import requests
+
+        data = body.encode()
+        headers = {}
+        if self.compress:
+            data = gzip.compress(data, compresslevel=5)
+            headers['Content-Encoding'] = 'gzip'
+        try:
+            response = self.session.post(url, data=data, headers=headers, timeout=self.timeout)
+        except requests.exceptions.RequestException as e:
+            logger.error(f"Failed to connect to {url}, Error {e}")
+            return None, str(e)
+        if 200 <= response.status_code < 300:
+            logger.debug(f"Successfully posted data to {url}")
+        else:
+            logger.error(f"Failed to post data to {url}, Status Code: {response.status_code}")
+        return response.status_code, response.text
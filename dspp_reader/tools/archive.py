@@ -0,0 +1,525 @@
+import datetime
+import logging
+import mmap
+import os
+import re
+import sqlite3
+
+from pathlib import Path
+from typing import NamedTuple, Union
+
+import numpy as np
+
+from dspp_reader.tools.backfill import SEPARATORS, get_device_type, read_header
+
+logger = logging.getLogger()
+
+ARCHIVE_INDEX_FILENAME = 'dspp_archive.sqlite'
+
+# Name of the files returned by `get_filename`, a Parquet file started again during the night has a numeric suffix.
+NIGHT_FILE_NAME = re.compile(r'^(?P<night>\d{8})_(?P<device_type>[^_]+)_(?P<device_id>.+?)(?:\.\d+)?\.(?P<file_format>tsv|csv|txt|parquet|arrow)$')
+
+_NEW_LINE = ord('\n')
+_CARRIAGE_RETURN = ord('\r')
+_COMMENT = ord('#')
+
+
+def get_unix_times(timestamps: np.ndarray) -> np.ndarray:
+    """Convert ISO 8601 timestamps to unix timestamps.
+
+    UTC timestamps, as written by the readers, are converted by NumPy, others one by one.
+
+    Args:
+        timestamps (np.ndarray): Timestamps as bytes or strings, None or ``'None'`` for missing values.
+
+    Returns:
+        np.ndarray: Seconds since the epoch as float64, NaN for missing values.
+    """
+    if len(timestamps) and timestamps.dtype.kind in 'SU':
+        suffix = b'+00:00' if timestamps.dtype.kind == 'S' else '+00:00'
+        if np.char.endswith(timestamps, suffix).all():
+            local = np.char.rpartition(timestamps, suffix[:1])[:, 0]
+            return local.astype('datetime64[us]').astype(np.int64) / 1e6
+    times = np.full(len(timestamps), np.nan)
+    for index, timestamp in enumerate(timestamps):
+        if isinstance(timestamp, bytes):
+            timestamp = timestamp.decode()
+        if timestamp and timestamp != 'None':
+            times[index] = datetime.datetime.fromisoformat(timestamp).timestamp()
+    return times
+
+
+def _to_unix_time(value: Union[datetime.datetime, float, None]) -> Union[float, None]:
+    if isinstance(value, datetime.datetime):
+        return value.timestamp()
+    return value
+
+
+class NightFileReader(object):
+    """Reads a plain text data file through a memory map.
+
+    The header is parsed when the file is opened, then the rows and the fields of each row are located with NumPy over
+    the memory map, without reading the file line by line. Columns are parsed the first time they are used and cached,
+    numeric columns as float64 with NaN for missing values and the others as arrays of strings with None for missing
+    values. A last row without a new line character may still be being written and is ignored, as are rows that do not
+    have the columns of the header.
+
+    Args:
+        filename (Path): Data file, the separator is taken from the extension.
+
+    Raises:
+        ValueError: If the extension is not known or the header can not be parsed.
+    """
+
+    def __init__(self, filename: Union[Path, str]):
+        self.filename = Path(filename)
+        if self.filename.suffix not in SEPARATORS:
+            raise ValueError(f"Unknown file format {self.filename.suffix}, use one of {', '.join(SEPARATORS.keys())}")
+        self.separator = SEPARATORS[self.filename.suffix]
+        self._columns = {}
+        self._times = None
+        self._file = open(self.filename, 'rb')
+        self._map = None
+        self._buffer = np.empty(0, dtype=np.uint8)
+        try:
+            if os.fstat(self._file.fileno()).st_size:
+                self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+                self._buffer = np.frombuffer(self._map, dtype=np.uint8)
+            new_lines = np.flatnonzero(self._buffer == _NEW_LINE)
+            self.header_size = self._read_header(new_lines=new_lines)
+            new_lines = new_lines[new_lines >= self.header_size]
+            self.size = int(new_lines[-1]) + 1 if len(new_lines) else self.header_size
+            self._locate_fields(new_lines=new_lines)
+        except Exception:
+            self.close()
+            raise
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({self.filename}, {len(self)} rows)"
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __len__(self):
+        return len(self._field_starts)
+
+    def __getitem__(self, column: str) -> np.ndarray:
+        """Get the values of a column, parsed the first time it is used.
+
+        Raises:
+            KeyError: If the file does not have the column.
+        """
+        if column not in self._columns:
+            if column not in self.columns:
+                raise KeyError(f"{self.filename.name} has no column {column}")
+            self._columns[column] = self._parse_column(column=column)
+        return self._columns[column]
+
+    @property
+    def columns(self) -> list:
+        return self.header.columns
+
+    @property
+    def units(self) -> dict:
+        return self.header.units
+
+    @property
+    def device_type(self) -> str:
+        return self.header.device_type
+
+    @property
+    def times(self) -> np.ndarray:
+        """Unix timestamps of the rows, from the ``timestamp`` column."""
+        if self._times is None:
+            self._times = get_unix_times(self._get_timestamps())
+        return self._times
+
+    def select(self, start: Union[datetime.datetime, float, None] = None, end: Union[datetime.datetime, float, None] = None) -> np.ndarray:
+        """Get the rows taken from `start`, included, to `end`, excluded.
+
+        Args:
+            start (datetime.datetime): Timezone aware datetime or unix timestamp. Optional.
+            end (datetime.datetime): Timezone aware datetime or unix timestamp. Optional.
+
+        Returns:
+            np.ndarray: Boolean mask of the rows.
+        """
+        mask = np.ones(len(self), dtype=bool)
+        start, end = _to_unix_time(start), _to_unix_time(end)
+        if start is not None:
+            mask &= self.times >= start
+        if end is not None:
+            mask &= self.times < end
+        return mask
+
+    def to_array(self,
+                 columns: Union[list, None] = None,
+                 start: Union[datetime.datetime, float, None] = None,
+                 end: Union[datetime.datetime, float, None] = None) -> np.ndarray:
+        """Get the rows as a NumPy structured array.
+
+        Args:
+            columns (list): Columns to include. Default is all of them.
+            start (datetime.datetime): Only rows taken from this time. Optional.
+            end (datetime.datetime): Only rows taken before this time. Optional.
+
+        Returns:
+            np.ndarray: Structured array with a field per column.
+        """
+        columns = columns or self.columns
+        mask = self.select(start=start, end=end)
+        array = np.empty(int(mask.sum()), dtype=[(column, self[column].dtype) for column in columns])
+        for column in columns:
+            array[column] = self[column][mask]
+        return array
+
+    def close(self):
+        """Release the memory map, the parsed columns are still usable."""
+        self._buffer = np.empty(0, dtype=np.uint8)
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _read_header(self, new_lines: np.ndarray) -> int:
+        lines = []
+        position = 0
+        for end in new_lines.tolist():
+            if self._buffer[position] != _COMMENT:
+                break
+            lines.append(self._map[position:end].decode().rstrip('\r'))
+            position = end + 1
+        self.header = read_header(lines=lines)
+        return position
+
+    def _locate_fields(self, new_lines: np.ndarray):
+        number_of_columns = len(self.columns)
+        starts = np.concatenate(([self.header_size], new_lines + 1))[:len(new_lines)].astype(np.int64)
+        ends = new_lines - (self._buffer[np.maximum(new_lines - 1, 0)] == _CARRIAGE_RETURN)
+        separators = np.flatnonzero(self._buffer[self.header_size:self.size] == ord(self.separator)) + self.header_size
+        line_of_separator = np.searchsorted(new_lines, separators)
+        separators_per_line = np.bincount(line_of_separator, minlength=len(new_lines))
+        rows = new_lines > starts
+        rows[rows] = self._buffer[starts[rows]] != _COMMENT
+        valid = rows & (separators_per_line == number_of_columns - 1)
+
+        field_starts = np.empty((len(new_lines), number_of_columns), dtype=np.int64)
+        field_ends = np.empty((len(new_lines), number_of_columns), dtype=np.int64)
+        separators = separators[valid[line_of_separator]].reshape(-1, number_of_columns - 1)
+        field_starts[valid] = np.column_stack([starts[valid], separators + 1])
+        field_ends[valid] = np.column_stack([separators, ends[valid]])
+        if self.separator == ' ':
+            # quantities are written as '<number> <unit>', which adds a separator, see `NightFileHeader.join_units`
+            for line in np.flatnonzero(rows & (separators_per_line > number_of_columns - 1)).tolist():
+                fields = self._split_with_units(start=int(starts[line]), end=int(ends[line]))
+                if fields is not None:
+                    field_starts[line], field_ends[line] = fields
+                    valid[line] = True
+
+        skipped = int(np.count_nonzero(rows & ~valid))
+        if skipped:
+            logger.warning(f"Skipping {skipped} rows of {self.filename.name} without {number_of_columns} columns")
+        self._field_starts = field_starts[valid]
+        self._field_ends = field_ends[valid]
+
+    def _split_with_units(self, start: int, end: int) -> Union[tuple, None]:
+        values = self.header.join_units(values=self._map[start:end].decode().split(' '))
+        if values is None:
+            return None
+        lengths = np.array([len(value.encode()) for value in values], dtype=np.int64)
+        field_starts = start + np.concatenate(([0], np.cumsum(lengths + 1)[:-1]))
+        return field_starts, field_starts + lengths
+
+    def _get_raw(self, column: str) -> np.ndarray:
+        index = self.columns.index(column)
+        starts, ends = self._field_starts[:, index].tolist(), self._field_ends[:, index].tolist()
+        if self._map is None:
+            raise ValueError(f"{self.filename.name} is closed")
+        return np.array([self._map[start:end] for start, end in zip(starts, ends)], dtype=bytes)
+
+    def _parse_column(self, column: str) -> np.ndarray:
+        raw = self._get_raw(column=column)
+        missing = (raw == b'None') | (raw == b'')
+        converter = self.header.converters[self.columns.index(column)]
+        if converter is None:
+            values = np.char.decode(raw, 'utf-8').astype(object)
+            values[missing] = None
+            return values
+        try:
+            return np.where(missing, b'nan', raw).astype(np.float64)
+        except ValueError:
+            # values with units, like the site coordinates of the TESS-W4C files
+            return np.array([np.nan if is_missing else float(converter(value.decode())) for value, is_missing in zip(raw, missing)])
+
+    def _get_timestamps(self) -> np.ndarray:
+        if 'timestamp' not in self.columns:
+            raise ValueError(f"{self.filename.name} has no timestamp column")
+        if 'timestamp' in self._columns:
+            return self._columns['timestamp']
+        return self._get_raw(column='timestamp')
+
+
+class ColumnarNightReader(NightFileReader):
+    """Reads a Parquet or Arrow IPC data file, see `ColumnarNightWriter`.
+
+    Arrow IPC files are memory-mapped and readable up to the last record batch written, Parquet files only once
+    closed by the writer. Columns are converted to NumPy the first time they are used, with the same types as
+    `NightFileReader`.
+
+    Requires pyarrow, which is an optional dependency: ``pip install dspp-reader[parquet]``.
+
+    Args:
+        filename (Path): Data file.
+    """
+
+    def __init__(self, filename: Union[Path, str]):
+        try:
+            import pyarrow as pa
+        except ImportError as e:
+            raise ImportError(f"pyarrow is required to read {Path(filename).suffix[1:]} files: pip install dspp-reader[parquet]") from e
+        self.filename = Path(filename)
+        self._columns = {}
+        self._times = None
+        self._file = None
+        if self.filename.suffix == '.arrow':
+            self._file = pa.memory_map(str(self.filename))
+            stream = pa.ipc.open_stream(self._file)
+            batches = []
+            try:
+                for batch in stream:
+                    batches.append(batch)
+            except pa.ArrowInvalid:
+                logger.debug(f"{self.filename.name} ends with an incomplete record batch")
+            self.table = pa.Table.from_batches(batches, schema=stream.schema)
+        else:
+            import pyarrow.parquet as pq
+
+            self.table = pq.read_table(self.filename, memory_map=True)
+        self._units = {field.name: field.metadata[b'unit'].decode() for field in self.table.schema if field.metadata and b'unit' in field.metadata}
+        self._device_type = get_device_type(columns=self.table.column_names)
+        self.header_size = 0
+        self.size = self.filename.stat().st_size
+
+    def __len__(self):
+        return self.table.num_rows
+
+    @property
+    def columns(self) -> list:
+        return self.table.column_names
+
+    @property
+    def units(self) -> dict:
+        return self._units
+
+    @property
+    def device_type(self) -> str:
+        return self._device_type
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _parse_column(self, column: str) -> np.ndarray:
+        import pyarrow as pa
+
+        values = self.table.column(column)
+        if pa.types.is_integer(values.type) or pa.types.is_floating(values.type) or pa.types.is_boolean(values.type):
+            return values.to_numpy(zero_copy_only=False).astype(np.float64)
+        return values.to_numpy(zero_copy_only=False).astype(object)
+
+    def _get_timestamps(self) -> np.ndarray:
+        if 'timestamp' not in self.columns:
+            raise ValueError(f"{self.filename.name} has no timestamp column")
+        return self['timestamp'].astype(str)
+
+
+def open_night_file(filename: Union[Path, str]) -> NightFileReader:
+    """Open a data file with the reader of its format.
+
+    Args:
+        filename (Path): Plain text, Parquet or Arrow IPC data file.
+
+    Returns:
+        NightFileReader: `NightFileReader` or `ColumnarNightReader`.
+    """
+    if Path(filename).suffix in ('.parquet', '.arrow'):
+        return ColumnarNightReader(filename=filename)
+    return NightFileReader(filename=filename)
+
+
+class IndexEntry(NamedTuple):
+    """Data file in an `ArchiveIndex`, the path is relative to the directory of the index."""
+    filename: Path
+    device_type: str
+    device_id: str
+    night: datetime.date
+    header_size: int
+    size: int
+    rows: int
+    first_time: Union[float, None]
+    last_time: Union[float, None]
+
+
+class ArchiveIndex(object):
+    """Index of the data files of a directory, to query a period of time without opening every file.
+
+    For each file named as returned by `get_filename` the index keeps the device, the night, where the rows start and
+    end in the file, the number of rows and the first and last timestamps. It is stored in a SQLite database and
+    `update` only opens the files that changed since the previous update, so the file of the current night can be
+    indexed again while a reader is writing it.
+
+    Args:
+        directory (Path): Directory searched recursively for data files.
+        filename (Path): Index database. Default is `ARCHIVE_INDEX_FILENAME` in `directory`.
+    """
+
+    def __init__(self, directory: Union[Path, str], filename: Union[Path, str, None] = None):
+        self.directory = Path(directory)
+        self.filename = Path(filename) if filename else self.directory / ARCHIVE_INDEX_FILENAME
+        self.filename.parent.mkdir(parents=True, exist_ok=True)
+        self.connection = sqlite3.connect(self.filename, timeout=30)
+        self.connection.row_factory = sqlite3.Row
+        with self.connection:
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS files (filename TEXT PRIMARY KEY, device_type TEXT, device_id TEXT, '
+                'night TEXT, header_size INTEGER, size INTEGER, rows INTEGER, first_time REAL, last_time REAL, '
+                'file_size INTEGER, modified INTEGER)')
+            self.connection.execute('CREATE INDEX IF NOT EXISTS files_device ON files (device_type, device_id, first_time)')
+
+    def __repr__(self):
+        return f"ArchiveIndex({self.directory}, {len(self)} files)"
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __len__(self):
+        return self.connection.execute('SELECT COUNT(*) FROM files').fetchone()[0]
+
+    def update(self) -> int:
+        """Index the new and changed files and forget the deleted ones.
+
+        Returns:
+            int: Number of files indexed.
+        """
+        known = {row['filename']: (row['file_size'], row['modified']) for row in self.connection.execute('SELECT filename, file_size, modified FROM files')}
+        found = set()
+        indexed = 0
+        for path in sorted(self.directory.rglob('*')):
+            match = NIGHT_FILE_NAME.match(path.name)
+            if match is None or not path.is_file():
+                continue
+            relative = path.relative_to(self.directory).as_posix()
+            found.add(relative)
+            stat = path.stat()
+            if known.get(relative) == (stat.st_size, stat.st_mtime_ns):
+                continue
+            try:
+                entry = self._get_entry(path=path, relative=relative, match=match)
+            except (ValueError, OSError, ImportError) as e:
+                logger.warning(f"Unable to index {path}: {e}")
+                continue
+            with self.connection:
+                self.connection.execute(
+                    'INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                    (relative, entry.device_type, entry.device_id, entry.night.isoformat(), entry.header_size, entry.size,
+                     entry.rows, entry.first_time, entry.last_time, stat.st_size, stat.st_mtime_ns))
+            indexed += 1
+        removed = set(known) - found
+        with self.connection:
+            self.connection.executemany('DELETE FROM files WHERE filename = ?', [(filename,) for filename in removed])
+        logger.debug(f"Indexed {indexed} files and removed {len(removed)} from {self.filename}")
+        return indexed
+
+    def query(self,
+              start: Union[datetime.datetime, float, None] = None,
+              end: Union[datetime.datetime, float, None] = None,
+              device_type: Union[str, None] = None,
+              device_id: Union[str, None] = None) -> list:
+        """Get the files with rows taken between `start`, included, and `end`, excluded.
+
+        Args:
+            start (datetime.datetime): Timezone aware datetime or unix timestamp. Optional.
+            end (datetime.datetime): Timezone aware datetime or unix timestamp. Optional.
+            device_type (str): Only files of this type of device, 'sqm-le' or 'tess-w4c'. Optional.
+            device_id (str): Only files of this device. Optional.
+
+        Returns:
+            list: `IndexEntry` of each file, by device and time.
+        """
+        conditions, parameters = [], []
+        for condition, value in [('last_time >= ?', _to_unix_time(start)), ('first_time < ?', _to_unix_time(end)),
+                                 ('device_type = ?', device_type), ('device_id = ?', device_id)]:
+            if value is not None:
+                conditions.append(condition)
+                parameters.append(value)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+        rows = self.connection.execute(
+            f'SELECT filename, device_type, device_id, night, header_size, size, rows, first_time, last_time FROM files {where} '
+            f'ORDER BY device_type, device_id, first_time', parameters)
+        return [IndexEntry(**{**dict(row), 'filename': Path(row['filename']), 'night': datetime.date.fromisoformat(row['night'])}) for row in rows]
+
+    def read(self,
+             start: Union[datetime.datetime, float, None] = None,
+             end: Union[datetime.datetime, float, None] = None,
+             device_type: Union[str, None] = None,
+             device_id: Union[str, None] = None,
+             columns: Union[list, None] = None) -> dict:
+        """Read the rows taken between `start`, included, and `end`, excluded, only opening the files that have them.
+
+        Args:
+            start (datetime.datetime): Timezone aware datetime or unix timestamp. Optional.
+            end (datetime.datetime): Timezone aware datetime or unix timestamp. Optional.
+            device_type (str): Only devices of this type, 'sqm-le' or 'tess-w4c'. Optional.
+            device_id (str): Only this device. Optional.
+            columns (list): Columns to read. Default is all the columns the files of each device have in common.
+
+        Returns:
+            dict: Structured array of the rows of each device, by ``(device_type, device_id)``.
+        """
+        parts = {}
+        for entry in self.query(start=start, end=end, device_type=device_type, device_id=device_id):
+            with open_night_file(self.directory / entry.filename) as night_file:
+                array = night_file.to_array(columns=columns, start=start, end=end)
+            if len(array):
+                parts.setdefault((entry.device_type, entry.device_id), []).append(array)
+        return {device: _concatenate(arrays=arrays) for device, arrays in parts.items()}
+
+    def close(self):
+        self.connection.close()
+
+    @staticmethod
+    def _get_entry(path: Path, relative: str, match: re.Match) -> IndexEntry:
+        with open_night_file(path) as night_file:
+            times = night_file.times
+            times = times[np.isfinite(times)]
+            return IndexEntry(
+                filename=Path(relative),
+                device_type=night_file.device_type,
+                device_id=match['device_id'],
+                night=datetime.datetime.strptime(match['night'], '%Y%m%d').date(),
+                header_size=night_file.header_size,
+                size=night_file.size,
+                rows=len(night_file),
+                first_time=float(times.min()) if len(times) else None,
+                last_time=float(times.max()) if len(times) else None)
+
+
+def _concatenate(arrays: list) -> np.ndarray:
+    """Concatenate structured arrays on the columns they have in common."""
+    names = [name for name in arrays[0].dtype.names if all(name in array.dtype.names for array in arrays)]
+    result = np.empty(sum(len(array) for array in arrays), dtype=[(name, np.result_type(*[array.dtype[name] for array in arrays])) for name in names])
+    position = 0
+    for array in arrays:
+        for name in names:
+            result[name][position:position + len(array)] = array[name]
+        position += len(array)
+    return result
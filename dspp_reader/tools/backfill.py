@@ -0,0 +1,467 @@
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Iterator, Union
+
+from dspp_reader.tools.api import ApiClient
+from dspp_reader.tools.codec import dumps, get_tessw4c_payload
+from dspp_reader.tools.database import SCHEMAS
+from dspp_reader.tools.outbox import AUTH_STATUS_CODES, RETRY_STATUS_CODES
+
+logger = logging.getLogger()
+
+CHECKPOINT_FILENAME = 'dspp_backfill.sqlite'
+
+SEPARATORS = {
+    '.tsv': '\t',
+    '.csv': ',',
+    '.txt': ' ',
+}
+
+# the credentials or the endpoint are wrong, uploading the next rows would fail as well
+ABORT_STATUS_CODES = AUTH_STATUS_CODES + [404, 405]
+
+_UNIT_LINE = re.compile(r'^# (\w+): (.+)$')
+
+
+def _to_float(value: str) -> float:
+    # the TESS-W4C files have the unit after the site coordinates, for instance -30.169166 deg
+    return float(value.split(' ', 1)[0])
+
+
+def _to_integer(value: str) -> Union[int, float]:
+    try:
+        return int(value)
+    except ValueError:
+        return _to_float(value)
+
+
+_CONVERTERS = {'REAL': _to_float, 'INTEGER': _to_integer}
+
+
+def _is_number(value: str) -> bool:
+    try:
+        float(value)
+    except ValueError:
+        return False
+    return True
+
+
+class NightFileHeader(object):
+    """Header of a plain text data file.
+
+    Files start with a ``# Filename`` line, the SQM-LE files follow with one ``# <column>: <unit>`` line per column
+    with units, and the last comment line lists the columns.
+
+    Args:
+        columns (list): Names of the columns.
+        units (dict): Unit of the columns that have one.
+        device_type (str): Type of device that produced the file, guessed from the columns.
+    """
+
+    def __init__(self, columns: list, units: dict, device_type: str):
+        self.columns = columns
+        self.units = units
+        self.device_type = device_type
+        types = dict(SCHEMAS[device_type].columns)
+        self.converters = [_CONVERTERS.get(types.get(column, 'TEXT').split()[0]) for column in columns]
+
+    def __repr__(self):
+        return f"NightFileHeader({self.device_type}, {len(self.columns)} columns)"
+
+    def parse(self, values: list) -> dict:
+        """Convert the values of a row to a dictionary with the types of the columns, 'None' becomes None."""
+        row = {}
+        for column, converter, value in zip(self.columns, self.converters, values):
+            if value in ('None', ''):
+                row[column] = None
+            elif converter is not None:
+                row[column] = converter(value)
+            else:
+                row[column] = value
+        return row
+
+    def join_units(self, values: list) -> Union[list, None]:
+        """Join the numbers of a space separated row with the units that follow them.
+
+        Quantities are written as ``<number> <unit>``, like the site coordinates of the TESS-W4C files, so in ``.txt``
+        files they are split in two values. Values are matched to the columns so that numeric columns start with a
+        number and only numeric columns take a unit.
+
+        Args:
+            values (list): Values of the row split by the separator.
+
+        Returns:
+            list: A value per column, or None if the values can not be matched to the columns.
+        """
+        failed = set()
+
+        def match(value_index: int, column_index: int) -> Union[list, None]:
+            if column_index == len(self.columns):
+                return [] if value_index == len(values) else None
+            if (value_index, column_index) in failed or len(values) - value_index < len(self.columns) - column_index:
+                return None
+            value = values[value_index]
+            is_numeric = self.converters[column_index] is not None
+            sizes = [1]
+            if is_numeric and value not in ('None', ''):
+                if not _is_number(value):
+                    sizes = []
+                elif value_index + 1 < len(values) and not _is_number(values[value_index + 1]):
+                    sizes.append(2)
+            for size in sizes:
+                rest = match(value_index=value_index + size, column_index=column_index + 1)
+                if rest is not None:
+                    return [' '.join(values[value_index:value_index + size]), *rest]
+            failed.add((value_index, column_index))
+            return None
+
+        return match(value_index=0, column_index=0)
+
+
+def read_header(lines: list) -> NightFileHeader:
+    """Parse the comment lines at the beginning of a data file.
+
+    Args:
+        lines (list): Comment lines, without the new line character.
+
+    Returns:
+        NightFileHeader: Parsed header.
+
+    Raises:
+        ValueError: If there are no columns or the device type can not be guessed from them.
+    """
+    if not lines:
+        raise ValueError("The file has no header")
+    units = {}
+    for line in lines[1:-1]:
+        match = _UNIT_LINE.match(line)
+        if match:
+            units[match[1]] = match[2]
+    columns = lines[-1][2:].split()
+    if len(columns) == 1 and ',' in columns[0]:
+        columns = columns[0].split(',')
+    return NightFileHeader(columns=columns, units=units, device_type=get_device_type(columns=columns))
+
+
+def get_device_type(columns: list) -> str:
+    """Guess the type of device that produced a data file from its columns.
+
+    Raises:
+        ValueError: If the columns are not those of a known device.
+    """
+    if 'F1_freq' in columns:
+        return 'tess-w4c'
+    elif 'magnitude' in columns:
+        return 'sqm-le'
+    raise ValueError(f"Unknown columns {', '.join(columns)}")
+
+
+def read_night_file(filename: Union[Path, str], offset: int = 0) -> Iterator[tuple]:
+    """Read the rows of a plain text data file one at a time.
+
+    The header is always read, then rows are read from `offset`, so the file is never loaded in memory. A last line
+    without a new line character may still be being written and is not read.
+
+    Args:
+        filename (Path): Data file, the separator is taken from the extension.
+        offset (int): Position in bytes of the first row to read, 0 reads the file from the beginning.
+
+    Yields:
+        tuple: The header, the position in bytes after the row and the row as a dictionary.
+    """
+    filename = Path(filename)
+    separator = SEPARATORS[filename.suffix]
+    with open(filename, 'rb') as f:
+        header_lines = []
+        position = 0
+        for line in f:
+            if not line.startswith(b'#'):
+                break
+            header_lines.append(line.decode().rstrip('\r\n'))
+            position += len(line)
+        header = read_header(lines=header_lines)
+
+        f.seek(max(offset, position))
+        position = f.tell()
+        for line in f:
+            if not line.endswith(b'\n'):
+                break
+            position += len(line)
+            text = line.decode().rstrip('\r\n')
+            if not text or text.startswith('#'):
+                continue
+            values = text.split(separator)
+            if separator == ' ' and len(values) > len(header.columns):
+                values = header.join_units(values=values) or values
+            if len(values) != len(header.columns):
+                logger.warning(f"Skipping row of {filename.name} ending at byte {position} with {len(values)} values instead of {len(header.columns)}")
+                continue
+            try:
+                row = header.parse(values=values)
+            except ValueError as e:
+                logger.warning(f"Skipping row of {filename.name} ending at byte {position}: {e}")
+                continue
+            yield header, position, row
+
+
+def get_device_payload(row: dict, site_name: Union[str, None]) -> dict:
+    """Device and site block of the API payloads, it is the same for all the rows of a file."""
+    return {
+        'type': row.get('device'),
+        'serial_number': row.get('serial_number'),
+        'altitude': row.get('altitude'),
+        'azimuth': row.get('azimuth'),
+        'site': {
+            'id': row.get('site'),
+            'name': site_name,
+            'latitude': row.get('latitude'),
+            'longitude': row.get('longitude'),
+            'elevation': row.get('elevation'),
+            'timezone': row.get('timezone'),
+        }
+    }
+
+
+def get_sqmle_payload(row: dict, device: dict) -> dict:
+    """Payload of a SQM-LE row, as posted by the reader."""
+    return {
+        'type': row.get('type'),
+        'magnitude': row.get('magnitude'),
+        'frequency': row.get('frequency'),
+        'period_count': row.get('period_count'),
+        'period_seconds': row.get('period_seconds'),
+        'temperature': row.get('temperature'),
+        'timestamp': row.get('timestamp'),
+        'device': device,
+    }
+
+
+PAYLOAD_BUILDERS = {
+    'sqm-le': get_sqmle_payload,
+    'tess-w4c': get_tessw4c_payload,
+}
+
+
+class Checkpoints(object):
+    """Keeps, for each file, the position in bytes up to which its rows were uploaded.
+
+    Args:
+        filename (Path): SQLite database, created if it does not exist.
+    """
+
+    def __init__(self, filename: Union[Path, str]):
+        self.filename = Path(filename)
+        self._lock = threading.Lock()
+        self.filename.parent.mkdir(parents=True, exist_ok=True)
+        self.connection = sqlite3.connect(self.filename, check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        with self.connection:
+            self.connection.execute('CREATE TABLE IF NOT EXISTS checkpoints '
+                                    '(filename TEXT PRIMARY KEY, offset INTEGER, uploaded INTEGER, rejected INTEGER, updated REAL)')
+
+    def __repr__(self):
+        return f"Checkpoints({self.filename})"
+
+    def get(self, filename: Path) -> tuple:
+        """Get the position, the number of uploaded rows and of rejected rows of a file, zeros if it was never read."""
+        with self._lock:
+            row = self.connection.execute('SELECT offset, uploaded, rejected FROM checkpoints WHERE filename = ?',
+                                          (str(filename),)).fetchone()
+        return tuple(row) if row else (0, 0, 0)
+
+    def set(self, filename: Path, offset: int, uploaded: int, rejected: int):
+        with self._lock, self.connection:
+            self.connection.execute('INSERT OR REPLACE INTO checkpoints (filename, offset, uploaded, rejected, updated) VALUES (?, ?, ?, ?, ?)',
+                                    (str(filename), offset, uploaded, rejected, time.time()))
+
+    def close(self):
+        with self._lock:
+            self.connection.close()
+
+
+class BackfillError(Exception):
+    """The API could not be reached or kept failing, the file can be resumed later."""
+
+
+class Backfill(object):
+    """Uploads the rows of existing data files to the API.
+
+    Files are read in parallel, one per worker, and the rows of each file are uploaded in order, in batches of
+    `batch_size` datapoints to the bulk endpoint of the client or one by one if it has none. After every batch, or
+    every datapoint when they are posted one by one, the position in the file is saved in the checkpoints, so running
+    the backfill again skips the rows already uploaded, including files that were still being written. Rows rejected by
+    the API are counted and skipped, unless the credentials or the endpoint are refused, then the file is left where it
+    was.
+
+    Args:
+        get_client (Callable): Returns a new `ApiClient`, each worker has its own.
+        checkpoints (Checkpoints): Upload progress of each file.
+        site_name (str): Name of the site, it is not stored in the files.
+        batch_size (int): Number of datapoints per request to the bulk endpoint.
+        workers (int): Number of files uploaded at the same time.
+        retries (int): Number of attempts of a batch before giving up on a file.
+        min_backoff (float): Seconds to wait after the first failed attempt, doubled after every failure.
+    """
+
+    def __init__(self,
+                 get_client: Callable[[], ApiClient],
+                 checkpoints: Checkpoints,
+                 site_name: Union[str, None] = None,
+                 batch_size: int = 100,
+                 workers: int = 4,
+                 retries: int = 5,
+                 min_backoff: float = 1):
+        self.get_client = get_client
+        self.checkpoints = checkpoints
+        self.site_name = site_name
+        self.batch_size = max(1, batch_size)
+        self.workers = max(1, workers)
+        self.retries = retries
+        self.min_backoff = min_backoff
+        self._local = threading.local()
+        self._clients = []
+
+    def __call__(self, filenames: list) -> dict:
+        """Upload a list of files.
+
+        Args:
+            filenames (list): Data files to upload.
+
+        Returns:
+            dict: Number of rows uploaded by this call for each file, None for files that failed.
+        """
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='backfill') as executor:
+                return dict(zip(filenames, executor.map(self._upload_file_safely, filenames)))
+        finally:
+            for client in self._clients:
+                client.close()
+            self._clients = []
+
+    @property
+    def client(self) -> ApiClient:
+        if getattr(self._local, 'client', None) is None:
+            self._local.client = self.get_client()
+            self._clients.append(self._local.client)
+        return self._local.client
+
+    def _upload_file_safely(self, filename: Path) -> Union[int, None]:
+        try:
+            return self.upload_file(filename=filename)
+        except (BackfillError, OSError, ValueError) as e:
+            logger.error(f"Unable to upload {filename}: {e}")
+            return None
+
+    def upload_file(self, filename: Union[Path, str]) -> int:
+        """Upload the rows of a file that were not uploaded yet.
+
+        Args:
+            filename (Path): Data file.
+
+        Returns:
+            int: Number of rows uploaded.
+
+        Raises:
+            BackfillError: If a batch could not be uploaded after all the retries, or the API answered with one of
+                `ABORT_STATUS_CODES`. The rows posted before the error are kept in the checkpoints.
+        """
+        filename = Path(filename).resolve()
+        offset, uploaded, rejected = self.checkpoints.get(filename=filename)
+        size = os.path.getsize(filename)
+        if offset > size:
+            logger.warning(f"{filename} is smaller than when it was uploaded, uploading it again")
+            offset, uploaded, rejected = 0, 0, 0
+        if offset == size:
+            logger.debug(f"{filename} was already uploaded")
+            return 0
+
+        uploaded_before = uploaded
+        device = None
+        payloads = []
+        positions = []
+        for header, position, row in read_night_file(filename=filename, offset=offset):
+            if device is None:
+                device = get_device_payload(row=row, site_name=self.site_name)
+                build_payload = PAYLOAD_BUILDERS[header.device_type]
+            payloads.append(dumps(build_payload(row=row, device=device)))
+            positions.append(position)
+            if len(payloads) >= self.batch_size:
+                uploaded, rejected = self._upload_batch(filename=filename, payloads=payloads, positions=positions, uploaded=uploaded, rejected=rejected)
+                payloads = []
+                positions = []
+        if payloads:
+            uploaded, rejected = self._upload_batch(filename=filename, payloads=payloads, positions=positions, uploaded=uploaded, rejected=rejected)
+        logger.info(f"Uploaded {uploaded - uploaded_before} rows of {filename.name}, {uploaded} in total, {rejected} rejected")
+        return uploaded - uploaded_before
+
+    def _upload_batch(self, filename: Path, payloads: list, positions: list, uploaded: int, rejected: int) -> tuple:
+        """Upload a batch and save the checkpoint as soon as payloads are posted, returns the new number of uploaded and rejected rows."""
+        posted = 0
+        for count, accepted in self._upload(payloads=payloads):
+            posted += count
+            uploaded += accepted
+            rejected += count - accepted
+            self.checkpoints.set(filename=filename, offset=positions[posted - 1], uploaded=uploaded, rejected=rejected)
+        return uploaded, rejected
+
+    def _upload(self, payloads: list) -> Iterator[tuple]:
+        """Upload a batch, yields the number of payloads posted and how many of them were accepted by the API.
+
+        The whole batch is reported at once when it is accepted by the bulk endpoint, and every payload on its own
+        when they are posted one by one, so the caller can save its progress before an error is raised.
+
+        Raises:
+            BackfillError: If the API could not be reached, failed after all the retries or refused the credentials or
+                the endpoint.
+        """
+        next_payload = 0
+        bulk = len(payloads) > 1
+        for attempt in range(self.retries):
+            if attempt:
+                time.sleep(self.min_backoff * 2 ** (attempt - 1))
+            if bulk:
+                result = self.client.post_bulk(payloads=payloads)
+                if result is not None:
+                    status_code, response = result
+                    if status_code is not None and 200 <= status_code < 300:
+                        yield len(payloads), len(payloads)
+                        return
+                    if status_code in ABORT_STATUS_CODES:
+                        raise BackfillError(f"API refused the request with status code {status_code}: {response}")
+                    if status_code is None or status_code in RETRY_STATUS_CODES:
+                        continue
+                    logger.warning(f"API rejected a batch of {len(payloads)} datapoints with status code {status_code}, posting them one by one")
+                bulk = False
+            while next_payload < len(payloads):
+                status_code, response = self.client.post(payload=payloads[next_payload])
+                if status_code in ABORT_STATUS_CODES:
+                    raise BackfillError(f"API refused the request with status code {status_code}: {response}")
+                if status_code is None or status_code in RETRY_STATUS_CODES:
+                    break
+                if not 200 <= status_code < 300:
+                    logger.error(f"API rejected datapoint with status code {status_code}: {response}")
+                next_payload += 1
+                yield 1, int(200 <= status_code < 300)
+            else:
+                return
+        raise BackfillError(f"The API failed {self.retries} times")
+
+
+def find_night_files(paths: list) -> list:
+    """Get the plain text data files in a list of files and directories, directories are searched recursively."""
+    filenames = []
+    for path in map(Path, paths):
+        if path.is_dir():
+            filenames.extend(sorted(filename for filename in path.rglob('*') if filename.suffix in SEPARATORS and filename.is_file()))
+        elif path.suffix in SEPARATORS:
+            filenames.append(path)
+        else:
+            logger.warning(f"Ignoring {path}, only {', '.join(SEPARATORS.keys())} files can be uploaded")
+    return filenames
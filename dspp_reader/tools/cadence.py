@@ -0,0 +1,121 @@
+import logging
+import time
+
+from typing import Union
+
+from dspp_reader.tools.generics import get_next_local_noon
+from dspp_reader.tools.site import Site
+
+logger = logging.getLogger()
+
+# Change of the sky brightness, in magnitudes per minute, above which the sky is considered to be changing fast.
+MAGNITUDE_RATE_THRESHOLD = 0.02
+
+# Standard deviation of the reads of one datapoint, in magnitudes, above which the sky is considered to be changing fast.
+DISPERSION_THRESHOLD = 0.05
+
+# Factor by which the delay grows after every datapoint taken while the sky is stable.
+BACKOFF_FACTOR = 2
+
+# Sun altitude at the end of the astronomical twilight.
+TWILIGHT_SUN_ALTITUDE = -18
+
+
+class AdaptiveCadence(object):
+    """Chooses the delay before the next datapoint from how fast the sky brightness changes.
+
+    The sky is changing fast during the twilight, while the sun is between `sun_altitude` and `TWILIGHT_SUN_ALTITUDE`,
+    when the magnitude changed more than `rate_threshold` magnitudes per minute since the previous datapoint, or when
+    the standard deviation of the reads of the datapoint, as returned by the averaging, is above
+    `dispersion_threshold`. Then the next datapoint is taken after `min_delay`, otherwise the delay is doubled after
+    every datapoint up to `max_delay`.
+
+    With `max_datapoints_per_night` the delay is also long enough to spread the datapoints left until the next local
+    noon, when the files of the next night start, and once they are used up the reader waits for the next night.
+
+    Args:
+        min_delay (float): Seconds between datapoints while the sky is changing fast.
+        max_delay (float): Seconds between datapoints while the sky is stable.
+        max_datapoints_per_night (int): Maximum number of datapoints per night. Zero or None for no limit.
+        site (Site): Site used to find the twilight. Optional.
+        sun_altitude (float): Sun's altitude in degrees with respect to the horizon that starts the reading window.
+        rate_threshold (float): Magnitudes per minute considered a fast change.
+        dispersion_threshold (float): Standard deviation of the reads in magnitudes considered a fast change.
+
+    Raises:
+        ValueError: If `min_delay` is greater than `max_delay`.
+    """
+
+    def __init__(self,
+                 min_delay: float,
+                 max_delay: float,
+                 max_datapoints_per_night: Union[int, None] = None,
+                 site: Union[Site, None] = None,
+                 sun_altitude: float = -10,
+                 rate_threshold: float = MAGNITUDE_RATE_THRESHOLD,
+                 dispersion_threshold: float = DISPERSION_THRESHOLD):
+        if min_delay > max_delay:
+            raise ValueError(f"The minimum delay between reads ({min_delay}) can not be greater than the delay between reads ({max_delay})")
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.max_datapoints_per_night = max_datapoints_per_night
+        self.site = site
+        self.sun_altitude = sun_altitude
+        self.rate_threshold = rate_threshold
+        self.dispersion_threshold = dispersion_threshold
+        self.delay = min_delay
+        self.night_datapoints = 0
+        self._night_end = 0.
+        self._last_magnitude = None
+        self._last_time = None
+
+    def __repr__(self):
+        return f"AdaptiveCadence({self.min_delay}-{self.max_delay} s, delay {self.delay} s)"
+
+    def update(self, magnitude: Union[float, None], dispersion: float = 0., when: Union[float, None] = None) -> float:
+        """Add a datapoint and get the seconds to wait before the next one.
+
+        Args:
+            magnitude (float): Magnitude of the datapoint. If None only the twilight and the limit per night are used.
+            dispersion (float): Standard deviation of the reads of the datapoint in magnitudes.
+            when (float): Unix timestamp of the datapoint. Defaults to now.
+
+        Returns:
+            float: Seconds to wait.
+        """
+        if when is None:
+            when = time.time()
+        if when >= self._night_end:
+            self._night_end = get_next_local_noon(when=when).timestamp()
+            self.night_datapoints = 0
+        self.night_datapoints += 1
+
+        if self.is_twilight(when=when) or self._is_changing_fast(magnitude=magnitude, dispersion=dispersion, when=when):
+            self.delay = self.min_delay
+        else:
+            self.delay = min(self.max_delay, max(self.delay, 1) * BACKOFF_FACTOR)
+        if magnitude is not None:
+            self._last_magnitude, self._last_time = magnitude, when
+
+        if not self.max_datapoints_per_night:
+            return self.delay
+        remaining = self.max_datapoints_per_night - self.night_datapoints
+        if remaining <= 0:
+            logger.warning(f"Reached {self.max_datapoints_per_night} datapoints this night, waiting for the next night")
+            return self._night_end - when
+        return max(self.delay, (self._night_end - when) / (remaining + 1))
+
+    def is_twilight(self, when: float) -> bool:
+        """Check if the sun is between `sun_altitude` and the end of the astronomical twilight."""
+        if self.site is None or self.sun_altitude <= TWILIGHT_SUN_ALTITUDE:
+            return False
+        return (self.site.is_within_window(sun_altitude=self.sun_altitude, when=when) and
+                not self.site.is_within_window(sun_altitude=TWILIGHT_SUN_ALTITUDE, when=when))
+
+    def _is_changing_fast(self, magnitude: Union[float, None], dispersion: float, when: float) -> bool:
+        if dispersion > self.dispersion_threshold:
+            return True
+        if magnitude is None or self._last_magnitude is None:
+            return False
+        minutes = max(when - self._last_time, 1) / 60
+        return abs(magnitude - self._last_magnitude) / minutes > self.rate_threshold
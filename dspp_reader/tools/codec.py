@@ -0,0 +1,143 @@
+import json
+import logging
+
+from typing import Union
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+logger = logging.getLogger()
+
+# Channels of the TESS-W4C and the names of their fields in the API.
+TESS_CHANNELS = ['F1', 'F2', 'F3', 'F4']
+TESS_CHANNEL_FIELDS = {'freq': 'frequency', 'mag': 'magnitude', 'zp': 'zeropoint'}
+
+
+def get_json_backend() -> str:
+    """Get the name of the library used to decode and encode JSON.
+
+    Returns:
+        str: ``orjson`` if it is installed, ``json`` otherwise.
+    """
+    return 'orjson' if orjson is not None else 'json'
+
+
+def loads(data: Union[bytes, str]):
+    """Decode JSON with orjson if it is installed, or with the standard library.
+
+    Args:
+        data (bytes): JSON document.
+
+    Returns:
+        The decoded object.
+
+    Raises:
+        ValueError: If the document is not valid JSON. Both libraries raise a subclass of `json.JSONDecodeError`.
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def dumps(obj) -> str:
+    """Encode JSON with orjson if it is installed, or with the standard library.
+
+    Objects orjson does not support are encoded by the standard library, so the result is the same except for
+    whitespace.
+
+    Args:
+        obj: JSON serializable object.
+
+    Returns:
+        str: The JSON document.
+    """
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY).decode()
+        except TypeError:
+            pass
+    return json.dumps(obj)
+
+
+def decode_tess_message(data: Union[bytes, str]) -> dict:
+    """Decode and validate a TESS-W4C message.
+
+    Args:
+        data (bytes): Message as sent by the device.
+
+    Returns:
+        dict: The message, see `validate_tess_message`.
+
+    Raises:
+        ValueError: If the message is not valid JSON or is not a TESS-W4C message.
+    """
+    return validate_tess_message(message=loads(data))
+
+
+def validate_tess_message(message) -> dict:
+    """Check that a decoded message has the fields used by the outputs.
+
+    Args:
+        message: Decoded message.
+
+    Returns:
+        dict: The same message, with an integer `udp` id and the fields of the four channels.
+
+    Raises:
+        ValueError: If it is not a TESS-W4C message.
+    """
+    if not isinstance(message, dict):
+        raise ValueError(f"Expected a JSON object, got {type(message).__name__}")
+    if not isinstance(message.get('udp'), int):
+        raise ValueError("Message without a valid udp id")
+    for channel in TESS_CHANNELS:
+        fields = message.get(channel)
+        if not isinstance(fields, dict) or any(field not in fields for field in TESS_CHANNEL_FIELDS):
+            raise ValueError(f"Message without {', '.join(TESS_CHANNEL_FIELDS)} in channel {channel}")
+    return message
+
+
+def flatten_tess_message(data: dict) -> dict:
+    """Flatten a TESS-W4C datapoint into the row written to plain text files.
+
+    Channels become ``<channel>_<field>`` columns, for instance ``F1_mag``, other values are kept as they are.
+
+    Args:
+        data (dict): Message after `augment_data`.
+
+    Returns:
+        dict: The row, with the columns in the order of the message.
+    """
+    row = {}
+    for key, value in data.items():
+        if key in TESS_CHANNELS and isinstance(value, dict):
+            for field, field_value in value.items():
+                row[f"{key}_{field}"] = field_value
+        else:
+            row[key] = value
+    return row
+
+
+def get_tessw4c_payload(row: dict, device: dict) -> dict:
+    """Payload posted to the API for a TESS-W4C row.
+
+    Args:
+        row (dict): Row from `flatten_tess_message`, or read from a data file.
+        device (dict): Device and site block of the payload.
+
+    Returns:
+        dict: The payload.
+    """
+    payload = {
+        'message_id': row.get('udp'),
+        'timestamp': row.get('timestamp'),
+        'localtime': row.get('localtime'),
+    }
+    for number, channel in enumerate(TESS_CHANNELS, start=1):
+        payload[f"channel_{number}"] = {name: row.get(f"{channel}_{field}") for field, name in TESS_CHANNEL_FIELDS.items()}
+    payload['ambient_temperature'] = row.get('tamb')
+    payload['sky_temperature'] = row.get('tsky')
+    payload['device'] = device
+    return payload
@@ -1,23 +1,71 @@
+import contextlib
+import importlib
 import logging
 import os
 import re
+import signal
 import sys
+from argparse import Namespace
 from importlib.metadata import version
+from pathlib import Path
 from typing import Union
 
 import yaml
 
-from dspp_reader.sqmle.sqmle import SQMLE
-from dspp_reader.tessw4c import TESSW4C
-from dspp_reader.tools import get_args, setup_logging
+from dspp_reader.tools.generics import get_args, setup_logging
+from dspp_reader.tools.profiling import SpanTracer, StatsProfiler
 
 __version__ = version('dspp-reader')
 
 reader_registry = {
-    "sqm-le": SQMLE,
-    "tess-w4c": TESSW4C
+    "sqm-le": "dspp_reader.sqmle.sqmle:SQMLE",
+    "tess-w4c": "dspp_reader.tessw4c.tessw4c:TESSW4C"
 }
 
+OPTIONAL_CONFIG_FIELDS = [
+    "ephemeris_table",
+    "reads_spacing",
+    "averaging_method",
+    "stream_policy",
+    "health_check_interval",
+    "show_countdown",
+    "file_flush_every",
+    "file_flush_interval",
+    "file_fsync",
+    "database_file",
+    "outbox_file",
+    "api_bulk_endpoint",
+    "api_batch_size",
+    "api_batch_latency",
+    "api_gzip",
+    "metrics_port",
+    "metrics_file",
+    "metrics_address",
+    "adaptive_cadence",
+    "min_delay_between_reads",
+    "max_datapoints_per_night",
+]
+
+
+def get_reader_class(device_type: str):
+    """Import the reader class of a device type.
+
+    Readers are registered by their import path and imported only when needed, since they depend on astropy.
+
+    Args:
+        device_type (str): Type of the device, one of the keys of `reader_registry`.
+
+    Returns:
+        The reader class.
+
+    Raises:
+        ValueError: If the device type is not registered.
+    """
+    if device_type not in reader_registry:
+        raise ValueError(f"Unknown device type {device_type}, use one of {', '.join(reader_registry.keys())}")
+    module_name, class_name = reader_registry[device_type].split(':')
+    return getattr(importlib.import_module(module_name), class_name)
+
 
 def read_device(device_type: str, config_fields_default: dict, args: Union[None, list] = None):
     """Helper function to read a device.
@@ -49,12 +97,16 @@ def read_device(device_type: str, config_fields_default: dict, args: Union[None,
             config[field] = getattr(args, field)
     config["device_type"] = device_type
 
+    for field in OPTIONAL_CONFIG_FIELDS:
+        if field in config and config[field] is None:
+            config[field] = config_fields_default[field]
+
     save_logs_to = config.get("save_logs_to", None)
     setup_logging(debug=args.debug, device_type=device_type, device_id=config["device_id"], save_logs_to=save_logs_to)
     logger = logging.getLogger()
     logger.info(f"Starting {device_type.upper()} reader, Version: {__version__}")
 
-    invalid_fields = [k for k, v in config.items() if v is None and 'udp' not in k]
+    invalid_fields = [k for k, v in config.items() if v is None and 'udp' not in k and k not in OPTIONAL_CONFIG_FIELDS]
     if invalid_fields:
         for field in invalid_fields:
             logger.error(f"Missing argument: --{re.sub('_', '-', field)}")
@@ -65,14 +117,42 @@ def read_device(device_type: str, config_fields_default: dict, args: Union[None,
 
     config.pop("save_logs_to", None)
 
-    cls = reader_registry[device_type]
+    cls = get_reader_class(device_type=device_type)
+
+    # stop on SIGTERM, for instance from systemd, the same way as with Ctrl+C so the data files are flushed
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+
+    tracer = get_tracer(args=args, config=config) if args.profile else None
+    profiler = StatsProfiler(filename=args.profile_stats) if 'profile_stats' in args.__dict__.keys() else contextlib.nullcontext()
 
     try:
-        photometer_reader = cls(**config)
-        photometer_reader()
+        with profiler:
+            photometer_reader = cls(**config, tracer=tracer)
+            photometer_reader()
     except KeyboardInterrupt:
         print("\n")
         logger.info(f"Exiting {device_type.upper()} reader on user request, Version: {__version__}")
         sys.exit(0)
     except NotImplementedError as e:
         logger.critical(f"Critical error in {device_type.upper()}: {e}")
+    finally:
+        if tracer:
+            tracer.close()
+
+
+def get_tracer(args: Namespace, config: dict) -> SpanTracer:
+    """Create the tracer of the timing spans requested with ``--profile``.
+
+    Args:
+        args (Namespace): Command line arguments.
+        config (dict): Configuration of the reader.
+
+    Returns:
+        SpanTracer: Tracer writing to ``--profile-file`` or, by default, next to the data files.
+    """
+    trace_format = getattr(args, 'profile_format', 'jsonl')
+    filename = getattr(args, 'profile_file', None)
+    if not filename:
+        extension = 'json' if trace_format == 'chrome' else 'jsonl'
+        filename = Path(config.get('save_files_to') or os.getcwd()) / f"{config['device_type']}_{config['device_id']}_profile.{extension}"
+    return SpanTracer(filename=filename, trace_format=trace_format)
@@ -0,0 +1,312 @@
+import codecs
+import logging
+import re
+import socket
+import threading
+
+from typing import Union
+
+from dspp_reader.tools.codec import loads
+from dspp_reader.tools.profiling import span
+
+logger = logging.getLogger()
+
+TERMINATOR = b'\r\n'
+
+# Policies for the messages received from a push stream between two reads.
+STREAM_POLICIES = ['latest', 'all']
+
+# Seconds without messages after which a push stream is considered broken.
+STREAM_IDLE_TIMEOUT = 60
+
+
+class DeviceConnection(object):
+    """Persistent TCP connection to a device that answers commands with terminated lines.
+
+    The socket is opened on the first request and kept open for the following ones. Responses are read until the
+    terminator is received, so a request takes as long as the device needs to answer. If the connection fails it is
+    closed and opened again once before giving up.
+
+    Args:
+        ip (str): IP address of the device.
+        port (int): TCP port of the device.
+        timeout (float): Timeout in seconds for connecting and for waiting a response.
+    """
+
+    def __init__(self, ip: str, port: int, timeout: float = 5):
+        self.ip = ip
+        self.port = port
+        self.timeout = timeout
+        self._socket = None
+        self._buffer = b''
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return f"Connection to {self.ip}:{self.port} ({'open' if self.is_open else 'closed'})"
+
+    @property
+    def is_open(self) -> bool:
+        return self._socket is not None
+
+    def connect(self):
+        """Open the connection if it is not open already."""
+        if self._socket is None:
+            logger.debug(f"Creating socket connection to {self.ip}:{self.port}")
+            self._socket = socket.create_connection((self.ip, self.port), timeout=self.timeout)
+            self._buffer = b''
+
+    def close(self):
+        """Close the connection, the next request will open it again."""
+        if self._socket is not None:
+            logger.debug(f"Closing socket connection to {self.ip}:{self.port}")
+            try:
+                self._socket.close()
+            except OSError:
+                pass
+        self._socket = None
+        self._buffer = b''
+
+    def request(self, command: bytes, terminator: bytes = TERMINATOR) -> bytes:
+        """Send a command and wait for the response.
+
+        Args:
+            command (bytes): Command to send.
+            terminator (bytes): Sequence that marks the end of the response.
+
+        Returns:
+            bytes: The response including the terminator.
+
+        Raises:
+            OSError: If the request failed after reconnecting.
+        """
+        with self._lock:
+            try:
+                return self._request(command=command, terminator=terminator)
+            except OSError as e:
+                logger.debug(f"Request to {self.ip}:{self.port} failed: {e}. Reconnecting.")
+                self.close()
+            try:
+                return self._request(command=command, terminator=terminator)
+            except OSError:
+                self.close()
+                raise
+
+    def _request(self, command: bytes, terminator: bytes) -> bytes:
+        with span('connect'):
+            self.connect()
+        with span('send'):
+            self._socket.sendall(command)
+        with span('recv'):
+            return self._read_until(terminator=terminator)
+
+    def _read_until(self, terminator: bytes) -> bytes:
+        while True:
+            index = self._buffer.find(terminator)
+            if index >= 0:
+                end = index + len(terminator)
+                response, self._buffer = self._buffer[:end], self._buffer[end:]
+                return response
+            chunk = self._socket.recv(1024)
+            if not chunk:
+                raise ConnectionResetError(f"Connection closed by {self.ip}:{self.port}")
+            self._buffer += chunk
+
+
+class JSONFramer(object):
+    """Splits a stream of bytes into the JSON objects it contains.
+
+    Data is added as it arrives and every complete object is returned, no matter how the objects were split or joined
+    by the network. Objects may be separated by whitespace or newlines or not separated at all. The end of an object is
+    found by matching its braces outside of strings, then it is decoded with `codec.loads`. Bytes that are not part of
+    an object are discarded up to the next ``{``, and so is an incomplete object that grows beyond `max_size`.
+
+    Args:
+        max_size (int): Maximum number of characters kept while waiting for the end of an object.
+    """
+
+    _tokens = re.compile(r'"(?:[^"\\]|\\.|\\\Z)*(")?|[{}]', re.DOTALL)
+
+    def __init__(self, max_size: int = 65536):
+        self.max_size = max_size
+        self._text_decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        self._buffer = ''
+        self.discarded = 0
+
+    def feed(self, data: bytes) -> list:
+        """Add received data.
+
+        Args:
+            data (bytes): Bytes received from the stream.
+
+        Returns:
+            list: Objects completed by this data, in the order they were sent.
+        """
+        self._buffer += self._text_decoder.decode(data)
+        messages = []
+        position = 0
+        while True:
+            start = self._buffer.find('{', position)
+            self._discard(self._buffer[position:start if start >= 0 else len(self._buffer)])
+            if start < 0:
+                self._buffer = ''
+                break
+            end = self._find_end(start=start)
+            if end is None:
+                if len(self._buffer) - start > self.max_size:
+                    logger.warning(f"Discarding an incomplete JSON object longer than {self.max_size} characters")
+                    self.discarded += 1
+                    self._buffer = ''
+                else:
+                    self._buffer = self._buffer[start:]
+                break
+            try:
+                message = loads(self._buffer[start:end])
+            except ValueError as e:
+                logger.debug(f"Discarding invalid data: {e}")
+                self.discarded += 1
+                position = start + 1
+                continue
+            position = end
+            messages.append(message)
+        return messages
+
+    def reset(self):
+        """Discard the incomplete data, for instance after reconnecting."""
+        self._text_decoder.reset()
+        self._buffer = ''
+
+    def _find_end(self, start: int) -> Union[int, None]:
+        """Get the position after the brace closing the object that starts at `start`, None if it is incomplete."""
+        depth = 0
+        for match in self._tokens.finditer(self._buffer, start):
+            token = match.group()
+            if token == '{':
+                depth += 1
+            elif token == '}':
+                depth -= 1
+                if depth == 0:
+                    return match.end()
+            elif match.group(1) is None:
+                return None
+        return None
+
+    def _discard(self, text: str):
+        if text.strip():
+            logger.debug(f"Discarding data outside of a JSON object: {text[:50]!r}")
+            self.discarded += 1
+
+
+class MessageStream(object):
+    """Long-lived TCP connection to a device that pushes JSON messages.
+
+    The socket is opened on the first read and kept open, so messages sent while the reader was busy are received on
+    the next read. A connection closed by the device or silent for longer than `idle_timeout` raises an `OSError`, the
+    following read opens it again.
+
+    Args:
+        ip (str): IP address of the device.
+        port (int): TCP port of the device.
+        timeout (float): Timeout in seconds for connecting.
+        idle_timeout (float): Seconds to wait for a message before considering the connection broken.
+    """
+
+    def __init__(self, ip: str, port: int, timeout: float = 5, idle_timeout: float = STREAM_IDLE_TIMEOUT):
+        self.ip = ip
+        self.port = port
+        self.timeout = timeout
+        self.idle_timeout = idle_timeout
+        self.framer = JSONFramer()
+        self._socket = None
+
+    def __repr__(self):
+        return f"Stream from {self.ip}:{self.port} ({'open' if self.is_open else 'closed'})"
+
+    @property
+    def is_open(self) -> bool:
+        return self._socket is not None
+
+    def connect(self):
+        """Open the connection if it is not open already."""
+        if self._socket is None:
+            logger.debug(f"Creating stream connection to {self.ip}:{self.port}")
+            self._socket = socket.create_connection((self.ip, self.port), timeout=self.timeout)
+            self.framer.reset()
+
+    def close(self):
+        """Close the connection, the next read will open it again."""
+        if self._socket is not None:
+            logger.debug(f"Closing stream connection to {self.ip}:{self.port}")
+            try:
+                self._socket.close()
+            except OSError:
+                pass
+        self._socket = None
+
+    def read(self) -> list:
+        """Wait for at least one complete message and return every message received so far.
+
+        Returns:
+            list: Messages in the order they were sent.
+
+        Raises:
+            OSError: If the connection failed, was closed by the device or timed out. The connection is closed.
+        """
+        try:
+            self.connect()
+            self._socket.settimeout(self.idle_timeout)
+            messages = []
+            while not messages:
+                messages.extend(self.framer.feed(self._receive()))
+            self._socket.setblocking(False)
+            while True:
+                try:
+                    messages.extend(self.framer.feed(self._receive()))
+                except BlockingIOError:
+                    return messages
+        except OSError:
+            self.close()
+            raise
+
+    def _receive(self) -> bytes:
+        chunk = self._socket.recv(4096)
+        if not chunk:
+            raise ConnectionResetError(f"Connection closed by {self.ip}:{self.port}")
+        return chunk
+
+
+_pool = {}
+_pool_lock = threading.Lock()
+
+
+def get_connection(ip: str, port: int, timeout: float = 5) -> DeviceConnection:
+    """Get the shared persistent connection for a device.
+
+    Args:
+        ip (str): IP address of the device.
+        port (int): TCP port of the device.
+        timeout (float): Timeout in seconds, only used when the connection is created.
+
+    Returns:
+        DeviceConnection: The same instance for every call with the same address.
+    """
+    with _pool_lock:
+        connection = _pool.get((ip, port))
+        if connection is None:
+            connection = DeviceConnection(ip=ip, port=port, timeout=timeout)
+            _pool[(ip, port)] = connection
+        return connection
+
+
+def close_connections(ip: Union[str, None] = None, port: Union[int, None] = None):
+    """Close pooled connections.
+
+    Args:
+        ip (str): Close only the connection to this address. Closes all if not given.
+        port (int): Port of the connection to close.
+    """
+    with _pool_lock:
+        keys = [(ip, port)] if ip is not None else list(_pool.keys())
+        for key in keys:
+            connection = _pool.pop(key, None)
+            if connection is not None:
+                connection.close()
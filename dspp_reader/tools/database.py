@@ -0,0 +1,219 @@
+import datetime
+import logging
+import sqlite3
+import threading
+import time
+
+from pathlib import Path
+from typing import NamedTuple, Union
+from zoneinfo import ZoneInfo
+
+from dspp_reader.tools.writers import split_units
+
+logger = logging.getLogger()
+
+DATABASE_FILENAME = 'dspp_reader.sqlite'
+
+_LOCATION_COLUMNS = [
+    ('serial_number', 'TEXT'),
+    ('timestamp', 'TEXT NOT NULL'),
+    ('localtime', 'TEXT'),
+    ('device', 'TEXT'),
+    ('altitude', 'REAL'),
+    ('azimuth', 'REAL'),
+    ('site', 'TEXT'),
+    ('timezone', 'TEXT'),
+    ('latitude', 'REAL'),
+    ('longitude', 'REAL'),
+    ('elevation', 'REAL'),
+]
+
+
+class TableSchema(NamedTuple):
+    """Table of a device type, columns are named as the keys of the datapoint flattened by `split_units`."""
+    table: str
+    columns: list
+
+    @property
+    def names(self) -> list:
+        return [name for name, _ in self.columns]
+
+
+SCHEMAS = {
+    'sqm-le': TableSchema(table='sqmle', columns=[
+        ('type', 'TEXT'),
+        ('magnitude', 'REAL'),
+        ('frequency', 'REAL'),
+        ('period_count', 'REAL'),
+        ('period_seconds', 'REAL'),
+        ('temperature', 'REAL'),
+        *[(f"{field}_{statistic}", 'REAL')
+          for field in ['magnitude', 'frequency', 'period_seconds', 'temperature']
+          for statistic in ['std', 'min', 'max']],
+        *_LOCATION_COLUMNS,
+    ]),
+    'tess-w4c': TableSchema(table='tessw4c', columns=[
+        ('udp', 'INTEGER'),
+        ('rev', 'INTEGER'),
+        ('name', 'TEXT'),
+        ('wdBm', 'INTEGER'),
+        ('hash', 'TEXT'),
+        ('ain', 'INTEGER'),
+        *[(f"F{channel}_{field}", 'REAL') for channel in range(1, 5) for field in ['freq', 'mag', 'zp']],
+        ('tamb', 'REAL'),
+        ('tsky', 'REAL'),
+        *_LOCATION_COLUMNS,
+    ]),
+}
+
+
+class SQLiteStorage(object):
+    """Stores datapoints of one device type in a local SQLite database.
+
+    The database uses write-ahead logging, so it can be queried while readers are writing to it, and several readers
+    can share the same file. Datapoints are kept in memory and inserted in a single transaction, with one prepared
+    statement, when `batch_size` datapoints are pending or `batch_interval` seconds have passed since the last insert.
+    `close` inserts the remaining datapoints.
+
+    Each device type has its own table, see `SCHEMAS`, with a unique index on ``(serial_number, timestamp)`` that is
+    used to query a device over a period of time and to ignore datapoints that were already stored.
+
+    Args:
+        filename (Path): Database file, created if it does not exist.
+        device_type (str): Type of the device, one of the keys of `SCHEMAS`.
+        batch_size (int): Number of datapoints inserted per transaction.
+        batch_interval (float): Maximum seconds between inserts while datapoints are being added.
+    """
+
+    def __init__(self,
+                 filename: Union[Path, str],
+                 device_type: str,
+                 batch_size: int = 1,
+                 batch_interval: float = 60):
+        if device_type not in SCHEMAS:
+            raise ValueError(f"Unknown device type {device_type}, use one of {', '.join(SCHEMAS.keys())}")
+        self.filename = Path(filename)
+        self.device_type = device_type
+        self.schema = SCHEMAS[device_type]
+        self.batch_size = max(1, batch_size)
+        self.batch_interval = batch_interval
+        self._rows = []
+        self._last_insert = time.monotonic()
+        self._lock = threading.Lock()
+
+        self.filename.parent.mkdir(parents=True, exist_ok=True)
+        self.connection = sqlite3.connect(self.filename, timeout=30, check_same_thread=False)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        self._create_table()
+
+        columns = ', '.join(f'"{name}"' for name in self.schema.names)
+        placeholders = ', '.join('?' for _ in self.schema.names)
+        self._insert = f'INSERT OR IGNORE INTO {self.schema.table} ({columns}) VALUES ({placeholders})'
+
+    def __repr__(self):
+        return f"SQLiteStorage({self.filename}, {self.schema.table})"
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @property
+    def pending(self) -> int:
+        """Number of datapoints added but not inserted yet."""
+        return len(self._rows)
+
+    def _create_table(self):
+        columns = ', '.join(f'"{name}" {column_type}' for name, column_type in self.schema.columns)
+        with self.connection:
+            self.connection.execute(f'CREATE TABLE IF NOT EXISTS {self.schema.table} (id INTEGER PRIMARY KEY, {columns})')
+            self.connection.execute(f'CREATE UNIQUE INDEX IF NOT EXISTS {self.schema.table}_serial_number_timestamp '
+                                    f'ON {self.schema.table} (serial_number, timestamp)')
+
+    def add(self, data: dict):
+        """Add a datapoint, it is inserted according to the batch policy.
+
+        Args:
+            data (dict): Datapoint as passed to the outputs of the readers.
+        """
+        record, _ = split_units(data=data)
+        with self._lock:
+            self._rows.append(tuple(record.get(name) for name in self.schema.names))
+            if len(self._rows) >= self.batch_size or time.monotonic() - self._last_insert >= self.batch_interval:
+                self._flush()
+
+    def flush(self):
+        """Insert the pending datapoints."""
+        with self._lock:
+            self._flush()
+
+    def close(self):
+        """Insert the pending datapoints and close the database."""
+        with self._lock:
+            if self.connection is None:
+                return
+            self._flush()
+            self.connection.close()
+            self.connection = None
+
+    def _flush(self):
+        if self._rows:
+            with self.connection:
+                self.connection.executemany(self._insert, self._rows)
+            logger.debug(f"Inserted {len(self._rows)} datapoints into {self.filename}")
+        self._rows = []
+        self._last_insert = time.monotonic()
+
+    def query(self, serial_number: str, start: datetime.datetime, end: datetime.datetime) -> list:
+        """Get the datapoints of a device between two times.
+
+        Args:
+            serial_number (str): Serial number of the device, ``device_id`` in the configuration.
+            start (datetime.datetime): Timezone aware start, inclusive.
+            end (datetime.datetime): Timezone aware end, exclusive.
+
+        Returns:
+            list: One `sqlite3.Row` per datapoint sorted by timestamp, they can be converted with `dict`.
+        """
+        with self._lock:
+            self._flush()
+            return self.connection.execute(
+                f'SELECT * FROM {self.schema.table} WHERE serial_number = ? AND timestamp >= ? AND timestamp < ? ORDER BY timestamp',
+                (str(serial_number), _to_timestamp(start), _to_timestamp(end))).fetchall()
+
+    def query_night(self, serial_number: str, date: datetime.date, timezone: str) -> list:
+        """Get the datapoints of a device for one night, from local noon of `date` to local noon of the next day.
+
+        This is the same period of time stored in a data file.
+
+        Args:
+            serial_number (str): Serial number of the device.
+            date (datetime.date): Date when the night starts.
+            timezone (str): Timezone of the site. For example 'America/Santiago'.
+        """
+        start = datetime.datetime.combine(date, datetime.time(12), tzinfo=ZoneInfo(timezone))
+        end = datetime.datetime.combine(date + datetime.timedelta(days=1), datetime.time(12), tzinfo=ZoneInfo(timezone))
+        return self.query(serial_number=serial_number, start=start, end=end)
+
+    def query_month(self, serial_number: str, year: int, month: int, timezone: str) -> list:
+        """Get the datapoints of a device for all nights starting in a month.
+
+        Args:
+            serial_number (str): Serial number of the device.
+            year (int): Year.
+            month (int): Month, from 1 to 12.
+            timezone (str): Timezone of the site. For example 'America/Santiago'.
+        """
+        first_night = datetime.date(year, month, 1)
+        next_month = datetime.date(year + month // 12, month % 12 + 1, 1)
+        start = datetime.datetime.combine(first_night, datetime.time(12), tzinfo=ZoneInfo(timezone))
+        end = datetime.datetime.combine(next_month, datetime.time(12), tzinfo=ZoneInfo(timezone))
+        return self.query(serial_number=serial_number, start=start, end=end)
+
+
+def _to_timestamp(value: datetime.datetime) -> str:
+    """Format a time as the timestamps of the datapoints, ISO format in UTC, so they sort as text."""
+    return value.astimezone(datetime.UTC).isoformat()
@@ -1,6 +1,7 @@
-from typing import Union
+from typing import TYPE_CHECKING, Union
 
-from dspp_reader.tools import Site
+if TYPE_CHECKING:  # pragma: no cover
+    from dspp_reader.tools.site import Site
 
 
 class Device(object):
@@ -22,7 +23,7 @@ class Device(object):
                  type: str,
                  altitude: float,
                  azimuth: float,
-                 site: Site,
+                 site: 'Site',
                  window_correction: float = 0,
                  ip: Union[str, None] = None,
                  port: Union[int, None] = None):
@@ -0,0 +1,357 @@
+import asyncio
+import datetime
+import logging
+import os
+import random
+import resource
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Union
+
+import yaml
+
+from dspp_reader.sqmle.sqmle import SQMLE, READ_WITH_SERIAL_NUMBER
+from dspp_reader.tessw4c import TESSW4C
+from dspp_reader.tools.codec import validate_tess_message
+from dspp_reader.tools.common import get_reader_class, reader_registry
+from dspp_reader.tools.connection import STREAM_IDLE_TIMEOUT, JSONFramer
+from dspp_reader.tools.generics import augment_data
+from dspp_reader.tools.metrics import start_exporters
+from dspp_reader.tools.udp import DatagramQueue, UDPDemultiplexer, open_udp_socket
+
+logger = logging.getLogger()
+
+
+def load_engine_config(filename: Union[Path, str]) -> list:
+    """Read the configuration file of the engine.
+
+    The file contains a list of ``devices``, each one with the same fields used by the configuration file of the
+    respective reader, and an optional ``defaults`` section with fields shared by all devices, for instance the site or
+    the outputs. Fields defined for a device override the defaults.
+
+    .. code-block:: yaml
+
+        defaults:
+          site_id: ctio
+          site_name: Cerro Tololo
+          save_files_to: /data
+        devices:
+          - device_type: sqm-le
+            device_id: '1823'
+            device_ip: 10.0.0.10
+          - device_type: tess-w4c
+            device_id: stars1823
+            device_ip: 10.0.0.11
+
+    Args:
+        filename (Path): Configuration file.
+
+    Returns:
+        list: One dictionary of reader arguments per device.
+    """
+    with open(filename, "r") as f:
+        config = yaml.safe_load(f) or {}
+    defaults = config.get('defaults') or {}
+    devices = config.get('devices') or []
+    if not devices:
+        raise ValueError(f"No devices defined in {filename}")
+    return [{**defaults, **device} for device in devices]
+
+
+def get_memory_usage() -> int:
+    """Get the resident memory of the current process in bytes."""
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return max_rss if os.uname().sysname == 'Darwin' else max_rss * 1024
+
+
+class ReaderEngine(object):
+    """Drives many SQM-LE and TESS-W4C devices from a single process using asyncio.
+
+    Each device is configured exactly as its reader, and a reader instance is created for it to reuse the parsing,
+    averaging and output methods. Only the network I/O is replaced by non-blocking streams, one task per device.
+    Outputs, which may block, run in a thread pool so a slow destination does not delay other devices.
+
+    Sites with the same ID share one `Site` instance, so the night windows are computed once per site.
+
+    Args:
+        devices_config (list): Reader arguments for each device, see `load_engine_config`.
+        response_timeout (float): Seconds to wait for a device to connect or respond.
+        reconnect_delay (float): Seconds to wait before reconnecting to a failing device.
+        stats_interval (float): Seconds between logging resource usage. Zero disables it.
+        max_workers (int): Threads used for the outputs. Defaults to one per device, up to 32.
+        metrics_port (int): Serve the Prometheus metrics of all devices over HTTP on this port. Optional.
+        metrics_file (Path): Write the Prometheus metrics of all devices to this file. Optional.
+        metrics_address (str): Address the metrics are served on with `metrics_port`, only the local host by default.
+    """
+
+    def __init__(self,
+                 devices_config: list,
+                 response_timeout: float = 5,
+                 reconnect_delay: float = 20,
+                 stats_interval: float = 600,
+                 max_workers: Union[int, None] = None,
+                 metrics_port: Union[int, None] = None,
+                 metrics_file: Union[Path, str, None] = None,
+                 metrics_address: Union[str, None] = None):
+        self.response_timeout = response_timeout
+        self.reconnect_delay = reconnect_delay
+        self.stats_interval = stats_interval
+        self.metrics_port = metrics_port
+        self.metrics_file = metrics_file
+        self.metrics_address = metrics_address
+
+        self.readers = []
+        for config in devices_config:
+            config = dict(config)
+            config.pop('save_logs_to', None)
+            device_type = config.get('device_type')
+            if device_type not in reader_registry:
+                raise ValueError(f"Unknown device type {device_type} for device {config.get('device_id')}")
+            self.readers.append(get_reader_class(device_type=device_type)(**config))
+        self._share_sites()
+
+        self.datapoints = {self._get_name(reader): 0 for reader in self.readers}
+        self.demultiplexers = {}
+        self.executor = ThreadPoolExecutor(max_workers=max_workers or min(32, len(self.readers)),
+                                           thread_name_prefix='dspp-output')
+
+    def __call__(self):
+        exporters = start_exporters(metrics_port=self.metrics_port, metrics_file=self.metrics_file, metrics_address=self.metrics_address)
+        try:
+            asyncio.run(self.run())
+        except KeyboardInterrupt:
+            logger.info("Engine stopped by user")
+        finally:
+            self.executor.shutdown(wait=True)
+            for reader in self.readers:
+                reader.close()
+            for exporter in exporters:
+                exporter.close()
+
+    async def run(self):
+        """Run one task per device until cancelled."""
+        logger.info(f"Starting engine with {len(self.readers)} devices")
+        tasks = []
+        udp_readers = {}
+        for reader in self.readers:
+            if isinstance(reader, SQMLE):
+                tasks.append(asyncio.create_task(self._read_sqmle(reader=reader)))
+            elif isinstance(reader, TESSW4C) and reader.udp_port:
+                udp_readers.setdefault(reader.udp_port, []).append(reader)
+            elif isinstance(reader, TESSW4C):
+                tasks.append(asyncio.create_task(self._read_tessw4c(reader=reader)))
+        for port, readers in udp_readers.items():
+            tasks.append(asyncio.create_task(self._listen_udp(port=port, readers=readers)))
+        if self.stats_interval:
+            tasks.append(asyncio.create_task(self._log_stats()))
+        await asyncio.gather(*tasks)
+
+    def get_stats(self) -> dict:
+        """Get resource usage of the engine.
+
+        Returns:
+            dict: Number of devices, datapoints per device, CPU seconds, resident memory in bytes and the counters of
+                every UDP port, see `UDPDemultiplexer.get_stats`.
+        """
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        return {
+            'devices': len(self.readers),
+            'datapoints': dict(self.datapoints),
+            'cpu_seconds': usage.ru_utime + usage.ru_stime,
+            'memory': get_memory_usage(),
+            'udp': {port: demultiplexer.get_stats() for port, demultiplexer in self.demultiplexers.items()},
+        }
+
+    async def _log_stats(self):
+        start_time = time.monotonic()
+        start_cpu_seconds = self.get_stats()['cpu_seconds']
+        while True:
+            await asyncio.sleep(self.stats_interval)
+            stats = self.get_stats()
+            devices = max(1, stats['devices'])
+            cpu_percent = 100 * (stats['cpu_seconds'] - start_cpu_seconds) / (time.monotonic() - start_time)
+            logger.info(f"Engine: {stats['devices']} devices, {sum(stats['datapoints'].values())} datapoints, "
+                        f"CPU {cpu_percent:.2f}% ({cpu_percent / devices:.3f}% per device), "
+                        f"memory {stats['memory'] / 2 ** 20:.1f} MiB ({stats['memory'] / 2 ** 20 / devices:.2f} MiB per device)")
+            for port, udp_stats in stats['udp'].items():
+                counters = udp_stats['devices'].values()
+                logger.info(f"UDP port {port}: {sum(counter['received'] for counter in counters)} messages, "
+                            f"{sum(counter['missing'] for counter in counters)} missing, "
+                            f"{sum(counter['duplicated'] for counter in counters)} duplicated, "
+                            f"{udp_stats['unknown']} from unknown devices")
+
+    def _share_sites(self):
+        sites = {}
+        for reader in self.readers:
+            if reader.site is None:
+                continue
+            key = (reader.site.id, reader.site.latitude.value, reader.site.longitude.value)
+            site = sites.setdefault(key, reader.site)
+            reader.site = site
+            reader.scheduler.site = site
+            if reader.device:
+                reader.device.site = site
+
+    @staticmethod
+    def _get_name(reader) -> str:
+        return f"{reader.device_type.upper()} {reader.device_id}"
+
+    async def _wait_for_window(self, reader):
+        """Asynchronous version of `WindowScheduler.wait_for_window`."""
+        if reader.read_always or reader.site is None:
+            return
+        while not reader.site.is_within_window(sun_altitude=reader.sun_altitude):
+            seconds = reader.site.seconds_to_next_window(sun_altitude=reader.sun_altitude)
+            start = datetime.datetime.now(datetime.UTC) + datetime.timedelta(seconds=seconds)
+            logger.info(f"{self._get_name(reader)}: waiting until next sunset at {start.strftime('%Y-%m-%d %H:%M:%S %Z')}")
+            await asyncio.sleep(seconds)
+
+    async def _store(self, reader, data: dict):
+        name = self._get_name(reader)
+        try:
+            await asyncio.get_running_loop().run_in_executor(self.executor, reader.store_data_point, data)
+        except Exception as e:
+            logger.error(f"{name}: unable to store datapoint: {e}", exc_info=logger.getEffectiveLevel() == logging.DEBUG)
+            return
+        self.datapoints[name] += 1
+        logger.info(f"{name}: datapoint recorded at {data['timestamp']}")
+
+    async def _read_sqmle(self, reader: SQMLE):
+        """Request, average and store SQM-LE datapoints over a persistent non-blocking connection."""
+        name = self._get_name(reader)
+        command_seconds = reader.metrics.command_seconds(command=READ_WITH_SERIAL_NUMBER.decode().strip())
+        stream_reader, stream_writer = None, None
+        while True:
+            await self._wait_for_window(reader=reader)
+            timestamp = datetime.datetime.now(datetime.UTC)
+            accumulator = reader.create_accumulator()
+            while len(accumulator) < reader.number_of_reads:
+                try:
+                    # asyncio.timeout instead of asyncio.wait_for, which may swallow the cancellation of the task
+                    async with asyncio.timeout(self.response_timeout):
+                        if stream_writer is None:
+                            stream_reader, stream_writer = await asyncio.open_connection(reader.device.ip, reader.device.port)
+                        start = time.perf_counter()
+                        stream_writer.write(READ_WITH_SERIAL_NUMBER)
+                        await stream_writer.drain()
+                        response = await stream_reader.readuntil(b'\r\n')
+                    command_seconds.observe(time.perf_counter() - start)
+                    logger.debug(f"{name}: response {response}")
+                    accumulator.add(reader.process_response(response=response.decode()))
+                except (OSError, asyncio.IncompleteReadError, asyncio.LimitOverrunError) as e:
+                    reader.metrics.reconnects.inc()
+                    logger.error(f"{name}: unable to read from {reader.device.ip}:{reader.device.port}: {e}. Attempting again in {self.reconnect_delay} seconds.")
+                    if stream_writer is not None:
+                        stream_writer.close()
+                    stream_reader, stream_writer = None, None
+                    await asyncio.sleep(self.reconnect_delay)
+                    continue
+                except (ValueError, IndexError) as e:
+                    logger.error(f"{name}: error parsing data: {e}")
+                await asyncio.sleep(reader.reads_spacing)
+
+            data = reader.combine_measurements(accumulator=accumulator, timestamp=timestamp)
+            await self._store(reader=reader, data=data)
+            await asyncio.sleep(reader.get_delay(data=data))
+
+    async def _read_tessw4c(self, reader: TESSW4C):
+        """Receive and store TESS-W4C messages from a persistent connection to its push stream.
+
+        With the `latest` stream policy the first message received after `delay_between_reads`, or the delay chosen by
+        the adaptive cadence, is stored and the others are discarded, with `all` every message is stored.
+        """
+        name = self._get_name(reader)
+        last_message_id = None
+        next_store = 0.
+        framer = JSONFramer()
+        stream_reader, stream_writer = None, None
+        reconnect_delay = 0.
+        while True:
+            if stream_writer is not None and not self._is_within_window(reader=reader):
+                stream_writer.close()
+                stream_reader, stream_writer = None, None
+            await self._wait_for_window(reader=reader)
+            try:
+                if stream_writer is None:
+                    async with asyncio.timeout(self.response_timeout):
+                        stream_reader, stream_writer = await asyncio.open_connection(reader.device.ip, reader.device.port)
+                    framer.reset()
+                async with asyncio.timeout(STREAM_IDLE_TIMEOUT):
+                    data = await stream_reader.read(4096)
+                if not data:
+                    raise ConnectionResetError("connection closed by the device")
+            except OSError as e:
+                reader.metrics.reconnects.inc()
+                if stream_writer is not None:
+                    stream_writer.close()
+                stream_reader, stream_writer = None, None
+                reconnect_delay = min(self.reconnect_delay, max(1., reconnect_delay * 2))
+                logger.error(f"{name}: unable to read from {reader.device.ip}:{reader.device.port}: {str(e) or 'timed out'}. Attempting again in {reconnect_delay:.0f} seconds.")
+                await asyncio.sleep(reconnect_delay * random.uniform(0.5, 1))
+                continue
+            reconnect_delay = 0.
+            timestamp = datetime.datetime.now(datetime.UTC)
+
+            discarded = framer.discarded
+            with reader.metrics.parse_seconds.time():
+                messages = framer.feed(data)
+            reader.metrics.decode_errors.inc(framer.discarded - discarded)
+            for message in messages:
+                try:
+                    message_id = validate_tess_message(message=message)['udp']
+                except ValueError as e:
+                    reader.metrics.decode_errors.inc()
+                    logger.error(f"{name}: error parsing data: {e}")
+                    continue
+                if message_id == last_message_id:
+                    reader.metrics.duplicates.inc()
+                    logger.debug(f"{name}: message id {message_id} skipped because it has the same id as previous message.")
+                    continue
+                if reader.stream_policy == 'latest' and time.monotonic() < next_store:
+                    continue
+                last_message_id = message_id
+                data = augment_data(data=message, timestamp=timestamp, device=reader.device)
+                if reader.stream_policy == 'latest':
+                    next_store = time.monotonic() + reader.get_delay(data=data)
+                await self._store(reader=reader, data=data)
+
+    async def _listen_udp(self, port: int, readers: list):
+        """Receive the datagrams of every TESS-W4C broadcasting to a UDP port and store them with the reader of each device.
+
+        The stream policy of each reader applies as with `_read_tessw4c`. Datagrams received outside of the reading
+        window of their device are discarded.
+        """
+        datagrams = asyncio.Queue()
+        transport, _ = await asyncio.get_running_loop().create_datagram_endpoint(lambda: DatagramQueue(datagrams=datagrams),
+                                                                                 sock=open_udp_socket(port=port))
+        demultiplexer = UDPDemultiplexer(readers=readers)
+        self.demultiplexers[port] = demultiplexer
+        next_store = {id(reader): 0. for reader in readers}
+        logger.info(f"Listening to {len(readers)} devices on UDP port {port}")
+        try:
+            while True:
+                data, address, timestamp = await datagrams.get()
+                routed = demultiplexer.route(data=data, address=address)
+                if routed is None:
+                    continue
+                reader, message = routed
+                if not self._is_within_window(reader=reader):
+                    continue
+                if reader.stream_policy == 'latest' and time.monotonic() < next_store[id(reader)]:
+                    continue
+                data = augment_data(data=message, timestamp=timestamp, device=reader.device)
+                if reader.stream_policy == 'latest':
+                    next_store[id(reader)] = time.monotonic() + reader.get_delay(data=data)
+                await self._store(reader=reader, data=data)
+        finally:
+            transport.close()
+
+    @staticmethod
+    def _is_within_window(reader) -> bool:
+        return reader.read_always or reader.site is None or reader.site.is_within_window(sun_altitude=reader.sun_altitude)
@@ -0,0 +1,160 @@
+import logging
+import os
+
+import numpy as np
+
+from astropy.coordinates import EarthLocation, TETE, get_sun
+from astropy.time import Time
+from pathlib import Path
+from typing import Union
+
+logger = logging.getLogger()
+
+SECONDS_PER_DAY = 86400
+SUN_POSITION_STEP = 6 * 3600
+
+
+def compute_sun_crossings(location: EarthLocation, sun_altitude: float, start: float, end: float, resolution: int = 600):
+    """Compute the times the sun crosses a given altitude between two dates in a single vectorized pass.
+
+    The apparent position of the sun is obtained with astropy every six hours and interpolated to a grid of
+    `resolution` seconds, the altitude is then computed with NumPy using the mean sidereal time. Crossings are found
+    where the altitude changes sign with respect to `sun_altitude` and refined with a linear interpolation, the same
+    approach astroplan uses but for all the nights at once.
+
+    Args:
+        location (EarthLocation): Location of the site.
+        sun_altitude (float): Sun's altitude in degrees with respect to the horizon.
+        start (float): Unix timestamp where to start searching.
+        end (float): Unix timestamp where to stop searching.
+        resolution (int): Grid spacing in seconds.
+
+    Returns:
+        tuple: Two arrays of unix timestamps with the same length and the time the windows are complete from.
+            - numpy.ndarray: Window starts, the sun sets below `sun_altitude`.
+            - numpy.ndarray: Window ends, the sun rises above `sun_altitude`.
+            - float: `start`, or the end of a window in progress at `start`, which is not included. From then until
+              the first start the sun is above `sun_altitude`.
+    """
+    coarse_grid = np.arange(start - SUN_POSITION_STEP, end + 2 * SUN_POSITION_STEP, SUN_POSITION_STEP)
+    coarse_times = Time(coarse_grid, format='unix')
+    sun = get_sun(coarse_times).transform_to(TETE(obstime=coarse_times))
+
+    grid = np.arange(start, end + resolution, resolution, dtype=float)
+    right_ascension = np.interp(grid, coarse_grid, np.unwrap(sun.ra.rad))
+    declination = np.interp(grid, coarse_grid, sun.dec.rad)
+
+    julian_date = grid / SECONDS_PER_DAY + 2440587.5
+    sidereal_time = np.deg2rad(280.46061837 + 360.98564736629 * (julian_date - 2451545.0))
+    hour_angle = sidereal_time + location.lon.rad - right_ascension
+    latitude = location.lat.rad
+
+    altitude = np.rad2deg(np.arcsin(np.sin(latitude) * np.sin(declination)
+                                    + np.cos(latitude) * np.cos(declination) * np.cos(hour_angle)))
+    difference = altitude - sun_altitude
+
+    setting = np.nonzero((difference[:-1] > 0) & (difference[1:] <= 0))[0]
+    rising = np.nonzero((difference[:-1] <= 0) & (difference[1:] > 0))[0]
+
+    starts = grid[setting] + resolution * difference[setting] / (difference[setting] - difference[setting + 1])
+    ends = grid[rising] + resolution * difference[rising] / (difference[rising] - difference[rising + 1])
+
+    since = float(start)
+    if len(starts) > 0:
+        if len(ends) > 0 and ends[0] <= starts[0]:
+            since = float(ends[0])
+        ends = ends[ends > starts[0]]
+        starts = starts[:len(ends)]
+    if len(starts) != len(ends) or np.any(ends <= starts):
+        raise ValueError(f"Sun crossings for altitude {sun_altitude} do not alternate, the sun may not set or rise at this location.")
+    return starts, ends, since
+
+
+def get_ephemeris_filename(directory: Union[Path, str], site_id: str, sun_altitude: float) -> Path:
+    """Get the filename of an ephemeris table for a site and sun altitude.
+
+    Args:
+        directory (Path): Directory where the table is stored.
+        site_id (str): ID of the site.
+        sun_altitude (float): Sun's altitude in degrees with respect to the horizon.
+
+    Returns:
+        Path: Full path of the table.
+    """
+    return Path(directory) / f"ephemeris_{site_id}_{float(sun_altitude):+.1f}.npz"
+
+
+class EphemerisTable(object):
+    """Precomputed night windows for a site and a sun altitude.
+
+    Args:
+        site_id (str): ID of the site the table was computed for.
+        sun_altitude (float): Sun's altitude in degrees with respect to the horizon.
+        starts (numpy.ndarray): Unix timestamps of window starts.
+        ends (numpy.ndarray): Unix timestamps of window ends.
+        since (float): Unix timestamp from which the sun is above `sun_altitude` until the first start, so times
+            before the first start are known to be outside a window. None if unknown.
+    """
+
+    def __init__(self, site_id: str, sun_altitude: float, starts: np.ndarray, ends: np.ndarray, since: Union[float, None] = None):
+        self.site_id = site_id
+        self.sun_altitude = float(sun_altitude)
+        self.starts = np.asarray(starts, dtype=float)
+        self.ends = np.asarray(ends, dtype=float)
+        self.since = since
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __repr__(self):
+        if len(self) == 0:
+            return f"Ephemeris table for {self.site_id} at {self.sun_altitude} degrees: empty"
+        first, last = Time([self.starts[0], self.ends[-1]], format='unix').iso
+        return f"Ephemeris table for {self.site_id} at {self.sun_altitude} degrees: {len(self)} nights from {first} to {last}"
+
+    @property
+    def boundaries(self) -> np.ndarray:
+        """Sorted unix timestamps ``[start_0, end_0, start_1, end_1, ...]``."""
+        boundaries = np.empty(2 * len(self))
+        boundaries[0::2] = self.starts
+        boundaries[1::2] = self.ends
+        return boundaries
+
+    def save(self, directory: Union[Path, str]) -> Path:
+        """Save the table as a compressed npz file.
+
+        Args:
+            directory (Path): Directory where to save the table.
+
+        Returns:
+            Path: Full path of the saved table.
+        """
+        os.makedirs(directory, exist_ok=True)
+        filename = get_ephemeris_filename(directory=directory, site_id=self.site_id, sun_altitude=self.sun_altitude)
+        with open(filename, 'wb') as f:
+            np.savez_compressed(f,
+                                site_id=np.array(self.site_id),
+                                sun_altitude=np.array(self.sun_altitude),
+                                starts=self.starts,
+                                ends=self.ends,
+                                since=np.array(np.nan if self.since is None else self.since))
+        logger.info(f"Ephemeris table saved to {filename}")
+        return filename
+
+    @classmethod
+    def load(cls, filename: Union[Path, str]) -> 'EphemerisTable':
+        """Load a table saved with `save`.
+
+        Args:
+            filename (Path): Full path of the table.
+
+        Returns:
+            EphemerisTable: The loaded table.
+        """
+        with np.load(filename) as table:
+            since = float(table['since']) if 'since' in table.files else np.nan
+            return cls(site_id=str(table['site_id']),
+                       sun_altitude=float(table['sun_altitude']),
+                       starts=table['starts'],
+                       ends=table['ends'],
+                       since=None if np.isnan(since) else since)
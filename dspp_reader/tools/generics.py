@@ -1,20 +1,24 @@
+import atexit
 import datetime
 import logging
 import os
+import queue
 import time
-from typing import Union
+from typing import TYPE_CHECKING, Union
 
-from astropy.units import Quantity
 from argparse import ArgumentParser, SUPPRESS, Namespace
 from importlib.metadata import version
-from logging.handlers import TimedRotatingFileHandler
+from logging.handlers import QueueHandler, QueueListener, TimedRotatingFileHandler
 
 from pathlib import Path
 
+from dspp_reader.tools.profiling import TRACE_FORMATS
+
 
 __version__ = version('dspp-reader')
 
-from dspp_reader.tools import Device
+if TYPE_CHECKING:  # pragma: no cover
+    from dspp_reader.tools.device import Device
 
 
 class DeviceTimeRotatingFileHandler(TimedRotatingFileHandler):  # pragma: no cover
@@ -33,6 +37,7 @@ class DeviceTimeRotatingFileHandler(TimedRotatingFileHandler):  # pragma: no cov
         self.device_id = device_id
         self.save_logs_to = save_logs_to
         self._current_date = datetime.datetime.now().strftime('%Y%m%d')
+        self._next_date_at = self._get_next_midnight(timestamp=time.time())
 
         if self.save_logs_to:
             os.makedirs(self.save_logs_to, exist_ok=True)
@@ -48,16 +53,28 @@ class DeviceTimeRotatingFileHandler(TimedRotatingFileHandler):  # pragma: no cov
         filename = self._get_dated_filename()
         return os.path.join(self.save_logs_to, filename) if self.save_logs_to else filename
 
+    @staticmethod
+    def _get_next_midnight(timestamp: float) -> float:
+        tomorrow = datetime.date.fromtimestamp(timestamp) + datetime.timedelta(days=1)
+        return datetime.datetime.combine(tomorrow, datetime.time()).timestamp()
+
     def emit(self, record):
-        today = datetime.datetime.now().strftime('%Y%m%d')
-        if today != self._current_date:
-            self._current_date = today
+        # comparing timestamps avoids formatting the date of every record
+        if record.created >= self._next_date_at:
+            self._current_date = datetime.datetime.fromtimestamp(record.created).strftime('%Y%m%d')
+            self._next_date_at = self._get_next_midnight(timestamp=record.created)
             self.doRollover()
         super().emit(record)
 
 
+_log_handler = None
+_log_listener = None
+
+
 def clean_data(obj):
     """Recursively convert Quantities to plain numbers inside nested structures."""
+    from astropy.units import Quantity
+
     if isinstance(obj, Quantity):
         return obj.value
     elif isinstance(obj, dict):
@@ -68,7 +85,7 @@ def clean_data(obj):
         return obj
 
 
-def augment_data(data, timestamp, device: Union[None, Device] = None):
+def augment_data(data, timestamp, device: Union[None, 'Device'] = None):
     """Appends data to payload.
 
     This function will append timestamp, device and site information to payload.
@@ -100,6 +117,10 @@ def augment_data(data, timestamp, device: Union[None, Device] = None):
 def setup_logging(debug=False, device_type='photometer', device_id='0000', save_logs_to=None):
     """Setup logging format and file rotation.
 
+    Records are only put in a queue by the thread that logs them, they are written to the console and the log file by a
+    background thread, so slow disks and log rotations do not delay the readers. The queue is flushed on exit or with
+    `stop_logging`.
+
     Args:
         debug (bool, optional): Debug mode. Defaults to False.
         device_type (str, optional): Device type. Defaults to 'photometer'.
@@ -118,7 +139,19 @@ def setup_logging(debug=False, device_type='photometer', device_id='0000', save_
     logging_datefmt = "%Y-%m-%d %H:%M:%S UTC"
     logging.Formatter.converter = time.gmtime
 
-    logging.basicConfig(format=logging_format, level=logging_level, datefmt=logging_datefmt)
+    formatter = logging.Formatter(logging_format, datefmt=logging_datefmt)
+    formatter.converter = time.gmtime
+
+    stop_logging()
+    logger = logging.getLogger()
+    logger.setLevel(logging_level)
+
+    handlers = []
+    if not logger.handlers:
+        # like logging.basicConfig, the console is used only when no handlers have been configured
+        console_handler = logging.StreamHandler()
+        console_handler.setFormatter(formatter)
+        handlers.append(console_handler)
 
     file_handler = DeviceTimeRotatingFileHandler(
         device_type=device_type,
@@ -132,16 +165,33 @@ def setup_logging(debug=False, device_type='photometer', device_id='0000', save_
         encoding='utf-8'
     )
     file_handler.setLevel(logging_level)
-    formatter = logging.Formatter(logging_format, datefmt=logging_datefmt)
-    formatter.converter = time.gmtime
     file_handler.setFormatter(formatter)
+    handlers.append(file_handler)
 
-    logger = logging.getLogger()
-    logger.addHandler(file_handler)
+    global _log_handler, _log_listener
+    records = queue.SimpleQueue()
+    _log_listener = QueueListener(records, *handlers, respect_handler_level=True)
+    _log_listener.start()
+    _log_handler = QueueHandler(records)
+    logger.addHandler(_log_handler)
 
     return logger
 
 
+@atexit.register
+def stop_logging():
+    """Write the records waiting in the queue and close the handlers created by `setup_logging`."""
+    global _log_handler, _log_listener
+    if _log_listener is None:
+        return
+    logging.getLogger().removeHandler(_log_handler)
+    _log_listener.stop()
+    for handler in _log_listener.handlers:
+        handler.close()
+    _log_handler = None
+    _log_listener = None
+
+
 def get_filename(save_files_to: Path, device_name: str, device_type: str, file_format: str) -> Path:
     """Get filename to save data to.
 
@@ -164,6 +214,23 @@ def get_filename(save_files_to: Path, device_name: str, device_type: str, file_f
     return save_files_to / f"{date_string}_{device_type}_{device_name}.{file_format}"
 
 
+def get_next_local_noon(when: float = None) -> datetime.datetime:
+    """Get the next local noon, when `get_filename` starts returning the file of the next night.
+
+    Args:
+        when (float): Unix timestamp used as reference. Defaults to now.
+
+    Returns:
+        datetime.datetime: Timezone aware local time of the next noon.
+    """
+    now_local = datetime.datetime.now().astimezone() if when is None else datetime.datetime.fromtimestamp(when).astimezone()
+    local_noon = now_local.replace(hour=12, minute=0, second=0, microsecond=0)
+    if now_local >= local_noon:
+        local_noon += datetime.timedelta(days=1)
+    # resolve the UTC offset again in case daylight saving time changes before noon
+    return local_noon.replace(tzinfo=None).astimezone()
+
+
 def get_args(device_type, args=None) -> Namespace:  # pragma: no cover
     """Helper function to get device arguments from command line.
 
@@ -183,6 +250,7 @@ def get_args(device_type, args=None) -> Namespace:  # pragma: no cover
     parser.add_argument('--site-elevation', action='store', dest='site_elevation', type=int, default=SUPPRESS, help='Site elevation')
     parser.add_argument('--site-timezone', action='store', dest='site_timezone', default=SUPPRESS, help='Site timezone')
     parser.add_argument('--sun-altitude', action='store', dest='sun_altitude', type=float, default=SUPPRESS, help='Sun altitude with respect to the horizon. This defines when to start reading.')
+    parser.add_argument('--ephemeris-table', action='store', dest='ephemeris_table', type=str, default=SUPPRESS, help='Precomputed ephemeris table created with `dspp-ephemeris`. Optional.')
     parser.add_argument('--device-id', action='store', dest='device_id', type=str, default=SUPPRESS, help='Device serial ID')
     parser.add_argument('--device-altitude', action='store', dest='device_altitude', type=float, default=SUPPRESS, help='Device altitude')
     parser.add_argument('--device-azimuth', action='store', dest='device_azimuth', type=float, default=SUPPRESS, help='Device azimuth')
@@ -191,19 +259,42 @@ def get_args(device_type, args=None) -> Namespace:  # pragma: no cover
     if device_type in ['sqm-le']:
         parser.add_argument('--device-window-correction', action='store', dest='device_window_correction', type=float, default=SUPPRESS, help='If an SQM was mounted in housing with acrylic window the correction must be -0.11 mag')
         parser.add_argument('--number-of-reads', action='store', dest='number_of_reads', type=int, default=SUPPRESS, help='Number of reads to average')
+        parser.add_argument('--reads-spacing', action='store', dest='reads_spacing', type=float, default=SUPPRESS, help='Seconds between the reads that are averaged')
+        parser.add_argument('--averaging-method', action='store', dest='averaging_method', type=str, choices=['mean', 'median', 'sigma_clip'], default=SUPPRESS, help='How the reads are combined into one datapoint')
+    if device_type in ['tess-w4c']:
+        parser.add_argument('--stream-policy', action='store', dest='stream_policy', type=str, choices=['latest', 'all'], default=SUPPRESS, help='Store only the latest message received after each delay between reads, or every message')
+        parser.add_argument('--udp-port', action='store', dest='udp_port', type=int, default=SUPPRESS, help='Receive the messages broadcast by the device to this UDP port instead of connecting to it')
     parser.add_argument('--delay-between-reads', action='store', dest='delay_between_reads', type=int, default=SUPPRESS, help='How many seconds between reads')
+    parser.add_argument('--adaptive-cadence', action='store_true', dest='adaptive_cadence', default=False, help='Read faster during the twilight and when the sky brightness changes fast, and up to --delay-between-reads apart when it is stable')
+    parser.add_argument('--min-delay-between-reads', action='store', dest='min_delay_between_reads', type=float, default=SUPPRESS, help='Seconds between reads while the sky brightness changes fast, with --adaptive-cadence')
+    parser.add_argument('--max-datapoints-per-night', action='store', dest='max_datapoints_per_night', type=int, default=SUPPRESS, help='Maximum number of datapoints per night, with --adaptive-cadence')
     parser.add_argument('--read-always', action='store_true', dest='read_always', default=False, help='Allows to ignore the time constraints')
+    parser.add_argument('--health-check-interval', action='store', dest='health_check_interval', type=int, default=SUPPRESS, help='Seconds between connection tests while waiting for the night')
     parser.add_argument('--save-to-file', action='store_true', dest='save_to_file', help="Save to a plain text file")
     parser.add_argument('--save-to-database', action='store_true', dest='save_to_database', help="Save to a database")
     parser.add_argument('--post-to-api', action='store_true', dest='post_to_api', help="Send data through a POST request to a REST API")
     parser.add_argument('--save-files-to', action='store', dest='save_files_to', default=SUPPRESS, help="Destination path to save files")
     parser.add_argument('--api-endpoint', action='store', dest='api_endpoint', type=str, default=SUPPRESS, help='API endpoint')
     parser.add_argument('--api-token', action='store', dest='api_token', type=str, default=SUPPRESS, help='API Token')
-    parser.add_argument('--file-format', action='store', dest='file_format', choices=['tsv', 'csv', 'txt'], default=SUPPRESS, help='File format to use')
+    parser.add_argument('--file-format', action='store', dest='file_format', choices=['tsv', 'csv', 'txt', 'parquet', 'arrow'], default=SUPPRESS, help='File format to use, parquet and arrow require pyarrow')
+    parser.add_argument('--database-file', action='store', dest='database_file', type=str, default=SUPPRESS, help='SQLite database used with --save-to-database, by default in --save-files-to')
+    parser.add_argument('--outbox-file', action='store', dest='outbox_file', type=str, default=SUPPRESS, help='SQLite database where datapoints wait to be posted with --post-to-api, by default in --save-files-to')
+    parser.add_argument('--api-bulk-endpoint', action='store', dest='api_bulk_endpoint', type=str, default=SUPPRESS, help='API endpoint that accepts a list of datapoints')
+    parser.add_argument('--api-batch-size', action='store', dest='api_batch_size', type=int, default=SUPPRESS, help='Maximum number of datapoints posted in one request to --api-bulk-endpoint')
+    parser.add_argument('--api-batch-latency', action='store', dest='api_batch_latency', type=float, default=SUPPRESS, help='Maximum seconds a datapoint waits for a batch to be complete')
+    parser.add_argument('--file-flush-every', action='store', dest='file_flush_every', type=int, default=SUPPRESS, help='Number of datapoints buffered before writing them to the file')
+    parser.add_argument('--file-flush-interval', action='store', dest='file_flush_interval', type=float, default=SUPPRESS, help='Maximum seconds between writes to the file')
+    parser.add_argument('--metrics-port', action='store', dest='metrics_port', type=int, default=SUPPRESS, help='Serve Prometheus metrics over HTTP on this port')
+    parser.add_argument('--metrics-file', action='store', dest='metrics_file', type=str, default=SUPPRESS, help='Write Prometheus metrics to this file, for the textfile collector of the node exporter')
+    parser.add_argument('--metrics-address', action='store', dest='metrics_address', type=str, default=SUPPRESS, help='Address to serve the metrics on with --metrics-port, 127.0.0.1 by default, 0.0.0.0 for all interfaces')
     parser.add_argument('--config-file', action='store', dest='config_file', default=SUPPRESS, help="Configuration file full path")
     parser.add_argument('--save-logs-to', action='store', dest='save_logs_to', default=SUPPRESS, help="Directory to save logs to")
     parser.add_argument('--config-file-example', action='store_true', dest='config_file_example', help="Print a configuration file example")
     parser.add_argument('--debug', action='store_true', dest='debug', default=False, help="Enable debug mode")
+    parser.add_argument('--profile', action='store_true', dest='profile', default=False, help="Record the time spent in every stage of each datapoint")
+    parser.add_argument('--profile-file', action='store', dest='profile_file', default=SUPPRESS, help="File to write the timing spans to, by default in the directory of the data files")
+    parser.add_argument('--profile-format', action='store', dest='profile_format', choices=TRACE_FORMATS, default=SUPPRESS, help="Write the timing spans as JSON lines or as a Chrome trace. Default jsonl")
+    parser.add_argument('--profile-stats', action='store', dest='profile_stats', default=SUPPRESS, help="Profile the reader with cProfile and write the statistics to this file on exit")
 
     args = parser.parse_args(args=args)
 
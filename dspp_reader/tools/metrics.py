@@ -0,0 +1,395 @@
+import logging
+import math
+import os
+import threading
+import time
+
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Callable, Union
+
+logger = logging.getLogger()
+
+# Content type of the Prometheus text exposition format.
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Address the metrics endpoint listens on by default, only the local host, use 0.0.0.0 to scrape it from another host.
+METRICS_BIND_ADDRESS = '127.0.0.1'
+
+# Upper bounds in seconds of the histogram buckets, from sub-millisecond parsing to slow network round trips.
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+DEVICE_LABELS = ('device_type', 'device_id')
+
+
+def _format_value(value: float) -> str:
+    if math.isnan(value):
+        return 'NaN'
+    if math.isinf(value):
+        return '+Inf' if value > 0 else '-Inf'
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+def _format_labels(names: tuple, values: tuple) -> str:
+    if not names:
+        return ''
+    pairs = ','.join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+    return f'{{{pairs}}}'
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class CounterValue(object):
+    def __init__(self):
+        self.value = 0.
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1):
+        with self._lock:
+            self.value += amount
+
+    def get_samples(self, name: str, labels: str) -> list:
+        return [f"{name}{labels} {_format_value(self.value)}"]
+
+
+class GaugeValue(object):
+    def __init__(self):
+        self.value = 0.
+        self._function = None
+
+    def set(self, value: float):
+        self.value = value
+
+    def set_function(self, function: Callable[[], float]):
+        """Compute the value when the metrics are collected instead of setting it."""
+        self._function = function
+
+    def get(self) -> float:
+        if self._function is None:
+            return self.value
+        try:
+            return float(self._function())
+        except Exception as e:
+            logger.debug(f"Unable to compute gauge: {e}")
+            return math.nan
+
+    def get_samples(self, name: str, labels: str) -> list:
+        return [f"{name}{labels} {_format_value(self.get())}"]
+
+
+class HistogramValue(object):
+    def __init__(self, buckets: tuple):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        with self._lock:
+            self.counts[bisect_left(self.buckets, value)] += 1
+            self.sum += value
+            self.count += 1
+
+    def time(self) -> 'Timer':
+        """Observe the duration of a ``with`` block, unless it raises an exception."""
+        return Timer(histogram=self)
+
+    def get_samples(self, name: str, labels: str) -> list:
+        with self._lock:
+            counts, total, count = list(self.counts), self.sum, self.count
+        separator = ',' if labels else ''
+        prefix = labels[:-1] + separator if labels else '{'
+        samples = []
+        cumulative = 0
+        for bound, bucket_count in zip([*self.buckets, math.inf], counts):
+            cumulative += bucket_count
+            samples.append(f'{name}_bucket{prefix}le="{_format_value(bound)}"}} {cumulative}')
+        samples.append(f"{name}_sum{labels} {_format_value(total)}")
+        samples.append(f"{name}_count{labels} {count}")
+        return samples
+
+
+class Timer(object):
+    def __init__(self, histogram: HistogramValue):
+        self.histogram = histogram
+        self.start = 0.
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.histogram.observe(time.perf_counter() - self.start)
+
+
+class Metric(object):
+    """Family of values of a metric, one per combination of labels.
+
+    Args:
+        name (str): Name of the metric, counters end in ``_total``.
+        documentation (str): Description shown in the ``HELP`` line.
+        labelnames (tuple): Names of the labels.
+        registry (MetricsRegistry): Registry the metric is added to. None to not register it.
+    """
+
+    metric_type = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = DEVICE_LABELS, registry: Union['MetricsRegistry', None] = None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+        if registry is not None:
+            registry.register(self)
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.name}, {len(self._children)} series)"
+
+    def labels(self, **labels):
+        """Get the value for some labels, created the first time.
+
+        Raises:
+            ValueError: If the labels are not the ones of the metric.
+        """
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects the labels {', '.join(self.labelnames)}")
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            child = self._children.get(key)
+            if child is None:
+                child = self._children[key] = self._new_child()
+        return child
+
+    def remove(self, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            self._children.pop(key, None)
+
+    def collect(self) -> list:
+        """Get the lines of the metric in the text exposition format."""
+        with self._lock:
+            children = list(self._children.items())
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.metric_type}"]
+        for key, child in children:
+            lines.extend(child.get_samples(self.name, _format_labels(self.labelnames, key)))
+        return lines
+
+    def _new_child(self):
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    metric_type = 'counter'
+
+    def _new_child(self) -> CounterValue:
+        return CounterValue()
+
+
+class Gauge(Metric):
+    metric_type = 'gauge'
+
+    def _new_child(self) -> GaugeValue:
+        return GaugeValue()
+
+
+class Histogram(Metric):
+    metric_type = 'histogram'
+
+    def __init__(self, *args, buckets: tuple = LATENCY_BUCKETS, **kwargs):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(*args, **kwargs)
+
+    def _new_child(self) -> HistogramValue:
+        return HistogramValue(buckets=self.buckets)
+
+
+class MetricsRegistry(object):
+    """Collection of metrics rendered together."""
+
+    def __init__(self):
+        self.metrics = {}
+
+    def register(self, metric: Metric):
+        if metric.name in self.metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self.metrics[metric.name] = metric
+
+    def render(self) -> str:
+        """Get every metric in the Prometheus text exposition format."""
+        return '\n'.join(line for metric in list(self.metrics.values()) for line in metric.collect()) + '\n'
+
+
+REGISTRY = MetricsRegistry()
+
+COMMAND_SECONDS = Histogram('dspp_command_seconds', 'Round trip time of the commands sent to the devices.',
+                            labelnames=(*DEVICE_LABELS, 'command'), registry=REGISTRY)
+PARSE_SECONDS = Histogram('dspp_parse_seconds', 'Time to decode a response or message.', registry=REGISTRY)
+AVERAGING_SECONDS = Histogram('dspp_averaging_seconds', 'Time to combine the measurements of a datapoint.', registry=REGISTRY)
+OUTPUT_SECONDS = Histogram('dspp_output_seconds', 'Time to write a datapoint to an output, or to queue it for the API.',
+                           labelnames=(*DEVICE_LABELS, 'output'), registry=REGISTRY)
+RECONNECTS = Counter('dspp_reconnects_total', 'Connections to the device lost or failed.', registry=REGISTRY)
+DECODE_ERRORS = Counter('dspp_decode_errors_total', 'Responses, messages or datagrams that could not be decoded.', registry=REGISTRY)
+DUPLICATES = Counter('dspp_duplicate_messages_total', 'Messages skipped because their udp id was already received.', registry=REGISTRY)
+DATAPOINTS = Counter('dspp_datapoints_total', 'Datapoints stored.', registry=REGISTRY)
+QUEUE_DEPTH = Gauge('dspp_queue_depth', 'Datapoints waiting to be written by an output.', labelnames=(*DEVICE_LABELS, 'queue'), registry=REGISTRY)
+LAST_DATAPOINT_AGE = Gauge('dspp_last_datapoint_age_seconds', 'Seconds since the last datapoint was stored, NaN before the first.', registry=REGISTRY)
+
+
+class ReaderMetrics(object):
+    """Metrics of one device.
+
+    Args:
+        device_type (str): Type of the device, used as the ``device_type`` label.
+        device_id (str): Id of the device, used as the ``device_id`` label.
+    """
+
+    def __init__(self, device_type: str, device_id: str):
+        self.labels = {'device_type': str(device_type), 'device_id': str(device_id)}
+        self.parse_seconds = PARSE_SECONDS.labels(**self.labels)
+        self.averaging_seconds = AVERAGING_SECONDS.labels(**self.labels)
+        self.reconnects = RECONNECTS.labels(**self.labels)
+        self.decode_errors = DECODE_ERRORS.labels(**self.labels)
+        self.duplicates = DUPLICATES.labels(**self.labels)
+        self.datapoints = DATAPOINTS.labels(**self.labels)
+        self._command_seconds = {}
+        self._output_seconds = {}
+        self._last_datapoint = None
+        LAST_DATAPOINT_AGE.labels(**self.labels).set_function(self.get_last_datapoint_age)
+
+    def __repr__(self):
+        return f"ReaderMetrics({self.labels['device_type']} {self.labels['device_id']})"
+
+    def command_seconds(self, command: str) -> HistogramValue:
+        if command not in self._command_seconds:
+            self._command_seconds[command] = COMMAND_SECONDS.labels(**self.labels, command=command)
+        return self._command_seconds[command]
+
+    def output_seconds(self, output: str) -> HistogramValue:
+        if output not in self._output_seconds:
+            self._output_seconds[output] = OUTPUT_SECONDS.labels(**self.labels, output=output)
+        return self._output_seconds[output]
+
+    def track_queue(self, queue: str, function: Callable[[], float]):
+        """Report the depth of a queue, computed by `function` when the metrics are collected."""
+        QUEUE_DEPTH.labels(**self.labels, queue=queue).set_function(function)
+
+    def datapoint_stored(self):
+        self.datapoints.inc()
+        self._last_datapoint = time.monotonic()
+
+    def get_last_datapoint_age(self) -> float:
+        if self._last_datapoint is None:
+            return math.nan
+        return time.monotonic() - self._last_datapoint
+
+
+class MetricsServer(object):
+    """Serves the metrics over HTTP from a background thread, at ``/metrics`` or any other path.
+
+    Args:
+        port (int): Port to listen on, zero for a free port.
+        address (str): Address to listen on.
+        registry (MetricsRegistry): Metrics to serve.
+    """
+
+    def __init__(self, port: int, address: str = METRICS_BIND_ADDRESS, registry: MetricsRegistry = REGISTRY):
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = registry.render().encode()
+                self.send_response(200)
+                self.send_header('Content-Type', CONTENT_TYPE)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                logger.debug(f"Metrics request from {self.address_string()}: {format % args}")
+
+        self.server = ThreadingHTTPServer((address, port), Handler)
+        self.server.daemon_threads = True
+        self.port = self.server.server_address[1]
+        self._thread = threading.Thread(target=self.server.serve_forever, name='dspp-metrics', daemon=True)
+        self._thread.start()
+        logger.info(f"Serving metrics on http://{address}:{self.port}/metrics")
+
+    def __repr__(self):
+        return f"MetricsServer({self.port})"
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self._thread.join()
+
+
+class TextfileExporter(object):
+    """Writes the metrics to a file every `interval` seconds, for the textfile collector of the node exporter.
+
+    The file is replaced atomically so it is never read half written.
+
+    Args:
+        filename (Path): File to write, should end in ``.prom`` for the node exporter.
+        interval (float): Seconds between writes.
+        registry (MetricsRegistry): Metrics to write.
+    """
+
+    def __init__(self, filename: Union[Path, str], interval: float = 15, registry: MetricsRegistry = REGISTRY):
+        self.filename = Path(filename)
+        self.interval = interval
+        self.registry = registry
+        self._stop = threading.Event()
+        self.filename.parent.mkdir(parents=True, exist_ok=True)
+        self._thread = threading.Thread(target=self._run, name='dspp-metrics-file', daemon=True)
+        self._thread.start()
+        logger.info(f"Writing metrics to {self.filename} every {self.interval} seconds")
+
+    def __repr__(self):
+        return f"TextfileExporter({self.filename})"
+
+    def write(self):
+        temporary = self.filename.with_name(f".{self.filename.name}.{os.getpid()}")
+        try:
+            temporary.write_text(self.registry.render())
+            os.replace(temporary, self.filename)
+        except OSError as e:
+            logger.error(f"Unable to write metrics to {self.filename}: {e}")
+
+    def close(self):
+        self._stop.set()
+        self._thread.join()
+        self.write()
+
+    def _run(self):
+        while True:
+            self.write()
+            if self._stop.wait(self.interval):
+                return
+
+
+def start_exporters(metrics_port: Union[int, None] = None,
+                    metrics_file: Union[Path, str, None] = None,
+                    metrics_address: Union[str, None] = None) -> list:
+    """Start the exporters enabled by the configuration.
+
+    Args:
+        metrics_port (int): Serve the metrics over HTTP on this port. Optional.
+        metrics_address (str): Address the metrics are served on, `METRICS_BIND_ADDRESS` if None.
+        metrics_file (Path): Write the metrics to this file. Optional.
+
+    Returns:
+        list: The exporters started, to be closed on shutdown.
+    """
+    exporters = []
+    if metrics_port is not None:
+        try:
+            exporters.append(MetricsServer(port=metrics_port, address=metrics_address or METRICS_BIND_ADDRESS))
+        except OSError as e:
+            logger.error(f"Unable to serve metrics on {metrics_address or METRICS_BIND_ADDRESS}:{metrics_port}: {e}")
+    if metrics_file:
+        exporters.append(TextfileExporter(filename=metrics_file))
+    return exporters
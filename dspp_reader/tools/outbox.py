@@ -0,0 +1,242 @@
+import logging
+import random
+import sqlite3
+import threading
+import time
+
+from pathlib import Path
+from typing import Union
+
+from dspp_reader.tools.api import ApiClient
+from dspp_reader.tools.codec import dumps
+
+logger = logging.getLogger()
+
+OUTBOX_FILENAME = 'dspp_reader_outbox.sqlite'
+
+# Status codes that may succeed if the same request is sent again later, any other error means the API rejected it.
+RETRY_STATUS_CODES = [408, 425, 429, 500, 502, 503, 504]
+
+# Status codes caused by the token or the configuration of the client, not by the payload, which is accepted once they
+# are fixed, so payloads are kept as if the API could not be reached.
+AUTH_STATUS_CODES = [401, 403, 407]
+
+
+class Outbox(object):
+    """Durable queue of datapoints to post to the API, drained by a background thread.
+
+    `put` stores the payload in a local SQLite database and returns immediately, so reading a device never waits for
+    the API. A daemon thread posts the queued payloads in order and only deletes them once the API accepted them. When
+    the API can not be reached, or it answers with one of `RETRY_STATUS_CODES`, the thread waits before trying again,
+    doubling the wait after every failure up to `max_backoff` seconds. Payloads survive restarts and are posted by the
+    next reader that uses the same queue. Authentication errors, see `AUTH_STATUS_CODES`, are logged as errors and
+    retried the same way, so the queue is kept until the token is fixed.
+
+    With a `batch_size` larger than one, the thread waits until that many payloads are queued, or the oldest one has
+    waited `batch_latency` seconds, and posts them in a single request to the bulk endpoint of the client. If the
+    client has no bulk endpoint, or the API rejects the batch, the payloads are posted one by one.
+
+    Payloads rejected by the API, for instance with a 400, are never going to be accepted and would block the queue, so
+    they are moved to the ``rejected`` table with the response of the API instead of being deleted.
+
+    Several readers can share the same database using different queues, each reader drains only its own.
+
+    Args:
+        filename (Path): Database file, created if it does not exist.
+        queue (str): Name of the queue, for instance the type and id of the device.
+        client (ApiClient): Client used to post the payloads.
+        batch_size (int): Maximum number of payloads per request.
+        batch_latency (float): Maximum seconds a payload waits for a batch to be complete.
+        min_backoff (float): Seconds to wait after the first failure.
+        max_backoff (float): Maximum seconds to wait between attempts.
+    """
+
+    def __init__(self,
+                 filename: Union[Path, str],
+                 queue: str,
+                 client: ApiClient,
+                 batch_size: int = 1,
+                 batch_latency: float = 60,
+                 min_backoff: float = 1,
+                 max_backoff: float = 300):
+        self.filename = Path(filename)
+        self.queue = queue
+        self.client = client
+        self.batch_size = max(1, batch_size)
+        self.batch_latency = batch_latency
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.backoff = 0.
+        self._lock = threading.Lock()
+        self._wake_up = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+        self.filename.parent.mkdir(parents=True, exist_ok=True)
+        self.connection = sqlite3.connect(self.filename, timeout=30, check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        with self.connection:
+            self.connection.execute('CREATE TABLE IF NOT EXISTS outbox '
+                                    '(id INTEGER PRIMARY KEY, queue TEXT NOT NULL, payload TEXT NOT NULL, created REAL, attempts INTEGER DEFAULT 0)')
+            self.connection.execute('CREATE INDEX IF NOT EXISTS outbox_queue ON outbox (queue, id)')
+            self.connection.execute('CREATE TABLE IF NOT EXISTS rejected '
+                                    '(id INTEGER PRIMARY KEY, queue TEXT NOT NULL, payload TEXT NOT NULL, created REAL, status_code INTEGER, response TEXT)')
+
+    def __repr__(self):
+        return f"Outbox({self.filename}, {self.queue}, {len(self)} pending)"
+
+    def __len__(self):
+        return self._get_pending()[0]
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def put(self, payload: dict):
+        """Add a payload to the queue.
+
+        Args:
+            payload (dict): JSON serializable payload as expected by the API.
+        """
+        with self._lock, self.connection:
+            self.connection.execute('INSERT INTO outbox (queue, payload, created) VALUES (?, ?, ?)',
+                                    (self.queue, dumps(payload), time.time()))
+        self._wake_up.set()
+
+    def start(self):
+        """Start draining the queue in a background thread."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._drain, name=f"outbox-{self.queue}", daemon=True)
+        self._thread.start()
+
+    def close(self, timeout: float = 5):
+        """Stop the background thread and close the database, pending payloads are kept for the next start.
+
+        Args:
+            timeout (float): Seconds to wait for a request in progress.
+        """
+        self._stop.set()
+        self._wake_up.set()
+        if self._thread is not None:
+            self._thread.join(timeout=timeout)
+            if self._thread.is_alive():
+                logger.warning(f"Outbox {self.queue} did not stop in {timeout} seconds")
+                return
+            self._thread = None
+        self.client.close()
+        with self._lock:
+            if self.connection is not None:
+                self.connection.close()
+                self.connection = None
+
+    def drain(self) -> int:
+        """Post the queued payloads until the queue is empty or a request fails.
+
+        Returns:
+            int: Number of payloads that left the queue, posted or rejected.
+        """
+        drained = 0
+        while not self._stop.is_set():
+            result = self._post_next_batch()
+            if not result:
+                break
+            drained += result
+        return drained
+
+    def _post_next_batch(self) -> Union[int, None]:
+        """Post the oldest payloads of the queue, up to `batch_size`.
+
+        Returns:
+            int: Number of payloads that left the queue, 0 if a request failed, or None if the queue is empty.
+        """
+        with self._lock:
+            rows = self.connection.execute('SELECT id, payload, created FROM outbox WHERE queue = ? ORDER BY id LIMIT ?',
+                                           (self.queue, self.batch_size)).fetchall()
+        if not rows:
+            return None
+        result = self.client.post_bulk(payloads=[payload for _, payload, _ in rows]) if len(rows) > 1 else None
+        if result is not None:
+            status_code, response = result
+            if status_code is not None and 200 <= status_code < 300:
+                with self._lock, self.connection:
+                    self.connection.executemany('DELETE FROM outbox WHERE id = ?', [(row_id,) for row_id, _, _ in rows])
+                return len(rows)
+            if status_code in AUTH_STATUS_CODES:
+                logger.error(f"API refused the credentials with status code {status_code}, keeping {len(rows)} datapoints queued: {response}")
+            if status_code is None or status_code in RETRY_STATUS_CODES + AUTH_STATUS_CODES:
+                self._add_attempt(rows=rows)
+                return 0
+            logger.warning(f"API rejected a batch of {len(rows)} datapoints with status code {status_code}, posting them one by one")
+        posted = 0
+        for row in rows:
+            if not self._post(row=row):
+                break
+            posted += 1
+        return posted
+
+    def _post(self, row: tuple) -> bool:
+        row_id, payload, created = row
+        status_code, response = self.client.post(payload=payload)
+        with self._lock, self.connection:
+            if status_code is not None and 200 <= status_code < 300:
+                self.connection.execute('DELETE FROM outbox WHERE id = ?', (row_id,))
+            elif status_code is not None and status_code not in RETRY_STATUS_CODES + AUTH_STATUS_CODES:
+                logger.error(f"API rejected datapoint with status code {status_code}: {response}")
+                self.connection.execute('INSERT INTO rejected (queue, payload, created, status_code, response) VALUES (?, ?, ?, ?, ?)',
+                                        (self.queue, payload, created, status_code, response))
+                self.connection.execute('DELETE FROM outbox WHERE id = ?', (row_id,))
+            else:
+                if status_code in AUTH_STATUS_CODES:
+                    logger.error(f"API refused the credentials with status code {status_code}, keeping the datapoints queued: {response}")
+                self.connection.execute('UPDATE outbox SET attempts = attempts + 1 WHERE id = ?', (row_id,))
+                return False
+        return True
+
+    def _add_attempt(self, rows: list):
+        with self._lock, self.connection:
+            self.connection.executemany('UPDATE outbox SET attempts = attempts + 1 WHERE id = ?', [(row_id,) for row_id, _, _ in rows])
+
+    def _get_pending(self) -> tuple:
+        with self._lock:
+            return self.connection.execute('SELECT COUNT(*), MIN(created) FROM outbox WHERE queue = ?', (self.queue,)).fetchone()
+
+    def _get_batch_wait(self) -> Union[float, None]:
+        """Seconds until the next batch is due, or None if the queue is empty."""
+        if self.batch_size == 1:
+            return 0.
+        pending, oldest = self._get_pending()
+        if pending == 0:
+            return None
+        if pending >= self.batch_size:
+            return 0.
+        return oldest + self.batch_latency - time.time()
+
+    def _drain(self):
+        while not self._stop.is_set():
+            wait = self._get_batch_wait()
+            if wait is None or wait > 0:
+                self._wake_up.wait(timeout=wait)
+                self._wake_up.clear()
+                continue
+            try:
+                posted = self._post_next_batch()
+            except sqlite3.Error as e:
+                logger.error(f"Outbox {self.queue} failed to read the queue: {e}")
+                posted = 0
+            if posted is None:
+                self.backoff = 0.
+                self._wake_up.wait()
+                self._wake_up.clear()
+            elif posted:
+                self.backoff = 0.
+            elif not self._stop.is_set():
+                self.backoff = min(self.max_backoff, max(self.min_backoff, self.backoff * 2))
+                wait = self.backoff * random.uniform(0.5, 1)
+                logger.warning(f"{len(self)} datapoints waiting to be posted to {self.client.api_endpoint}, next attempt in {wait:.1f} seconds")
+                self._stop.wait(timeout=wait)
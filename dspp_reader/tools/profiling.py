@@ -0,0 +1,223 @@
+import contextvars
+import cProfile
+import io
+import json
+import logging
+import os
+import pstats
+import threading
+import time
+
+from pathlib import Path
+from typing import Union
+
+logger = logging.getLogger()
+
+TRACE_FORMATS = ['jsonl', 'chrome']
+
+# Number of functions logged from the cProfile statistics on exit.
+PROFILE_STATS_LINES = 20
+
+_active_trace = contextvars.ContextVar('dspp_trace', default=None)
+
+
+class Trace(object):
+    """Timing spans of one datapoint.
+
+    Args:
+        name (str): Name of the trace, for instance the device.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.wall_start = time.time()
+        self.start = time.perf_counter()
+        self.duration = 0.
+        self.spans = []
+
+    def __repr__(self):
+        return f"Trace({self.name}, {len(self.spans)} spans)"
+
+
+class _Span(object):
+    def __init__(self, trace: Trace, name: str):
+        self.trace = trace
+        self.name = name
+        self.start = 0.
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        end = time.perf_counter()
+        self.trace.spans.append((self.name, self.start - self.trace.start, end - self.start))
+
+
+class _NullSpan(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return None
+
+
+NULL_SPAN = _NullSpan()
+
+
+def span(name: str):
+    """Time a stage of the datapoint being traced.
+
+    Outside of `SpanTracer.trace` it does nothing, so stages can be instrumented at no cost when not profiling.
+
+    Args:
+        name (str): Name of the stage, for instance ``recv`` or ``parse``.
+
+    Returns:
+        A context manager.
+    """
+    trace = _active_trace.get()
+    if trace is None:
+        return NULL_SPAN
+    return _Span(trace=trace, name=name)
+
+
+class _TraceContext(object):
+    def __init__(self, tracer: 'SpanTracer', name: str):
+        self.tracer = tracer
+        self.trace = Trace(name=name)
+        self._token = None
+
+    def __enter__(self) -> Trace:
+        self._token = _active_trace.set(self.trace)
+        return self.trace
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        _active_trace.reset(self._token)
+        self.trace.duration = time.perf_counter() - self.trace.start
+        self.tracer.write(trace=self.trace)
+
+
+class SpanTracer(object):
+    """Writes the spans of every datapoint to a file, and logs where the time went on close.
+
+    With the ``jsonl`` format every datapoint is a line with its spans as ``[name, start, duration]`` in milliseconds
+    from the start of the datapoint. With the ``chrome`` format the file is a Chrome trace event array that can be
+    opened with ``chrome://tracing`` or Perfetto.
+
+    Args:
+        filename (Path): Trace file, overwritten.
+        trace_format (str): One of `TRACE_FORMATS`.
+    """
+
+    def __init__(self, filename: Union[Path, str], trace_format: str = 'jsonl'):
+        if trace_format not in TRACE_FORMATS:
+            raise ValueError(f"Unknown trace format {trace_format}, use one of {', '.join(TRACE_FORMATS)}")
+        self.filename = Path(filename)
+        self.trace_format = trace_format
+        self.traces = 0
+        self.totals = {}
+        self.total_duration = 0.
+        self._lock = threading.Lock()
+        self.filename.parent.mkdir(parents=True, exist_ok=True)
+        self._file = open(self.filename, 'w')
+        if self.trace_format == 'chrome':
+            self._file.write('[')
+        logger.info(f"Writing timing spans of every datapoint to {self.filename}")
+
+    def __repr__(self):
+        return f"SpanTracer({self.filename}, {self.traces} traces)"
+
+    def trace(self, name: str) -> _TraceContext:
+        """Trace a datapoint, the spans inside the ``with`` block are attributed to it.
+
+        Args:
+            name (str): Name of the trace, for instance the device.
+        """
+        return _TraceContext(tracer=self, name=name)
+
+    def write(self, trace: Trace):
+        with self._lock:
+            if self._file is None:
+                return
+            if self.trace_format == 'chrome':
+                events = self._get_chrome_events(trace=trace)
+                self._file.write(('\n' if self.traces == 0 else ',\n') + ',\n'.join(json.dumps(event) for event in events))
+            else:
+                self._file.write(json.dumps({
+                    'name': trace.name,
+                    'start': round(trace.wall_start, 6),
+                    'duration': round(trace.duration * 1e3, 3),
+                    'spans': [[name, round(start * 1e3, 3), round(duration * 1e3, 3)] for name, start, duration in trace.spans],
+                }) + '\n')
+            self._file.flush()
+            self.traces += 1
+            self.total_duration += trace.duration
+            for name, _, duration in trace.spans:
+                self.totals[name] = self.totals.get(name, 0.) + duration
+
+    def get_summary(self) -> str:
+        """Get the mean time per datapoint of every stage and its share of the total."""
+        if not self.traces:
+            return "No datapoints traced"
+        stages = sorted(self.totals.items(), key=lambda item: item[1], reverse=True)
+        return (f"{self.traces} datapoints, {self.total_duration / self.traces * 1e3:.1f} ms each: " +
+                ', '.join(f"{name} {total / self.traces * 1e3:.1f} ms ({100 * total / self.total_duration:.0f}%)" for name, total in stages))
+
+    def close(self):
+        with self._lock:
+            if self._file is None:
+                return
+            if self.trace_format == 'chrome':
+                self._file.write('\n]\n')
+            self._file.close()
+            self._file = None
+        logger.info(f"Profile: {self.get_summary()}")
+
+    @staticmethod
+    def _get_chrome_events(trace: Trace) -> list:
+        process, thread = os.getpid(), threading.get_ident()
+        start = trace.wall_start * 1e6
+        events = [{'name': trace.name, 'ph': 'X', 'ts': round(start), 'dur': round(trace.duration * 1e6), 'pid': process, 'tid': thread}]
+        for name, offset, duration in trace.spans:
+            events.append({'name': name, 'ph': 'X', 'ts': round(start + offset * 1e6), 'dur': round(duration * 1e6), 'pid': process, 'tid': thread})
+        return events
+
+
+class _NullTracer(object):
+    def trace(self, name: str) -> _NullSpan:
+        return NULL_SPAN
+
+    def close(self):
+        return None
+
+
+# Tracer of the readers when not profiling.
+NULL_TRACER = _NullTracer()
+
+
+class StatsProfiler(object):
+    """Profile the code inside a ``with`` block with cProfile.
+
+    On exit the statistics are written to `filename`, to be opened with `pstats` or a viewer like snakeviz, and the
+    functions with the largest cumulative time are logged.
+
+    Args:
+        filename (Path): File to write the statistics to.
+    """
+
+    def __init__(self, filename: Union[Path, str]):
+        self.filename = Path(filename)
+        self.profiler = cProfile.Profile()
+
+    def __enter__(self):
+        self.profiler.enable()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.profiler.disable()
+        self.filename.parent.mkdir(parents=True, exist_ok=True)
+        self.profiler.dump_stats(self.filename)
+        stream = io.StringIO()
+        pstats.Stats(self.profiler, stream=stream).sort_stats(pstats.SortKey.CUMULATIVE).print_stats(PROFILE_STATS_LINES)
+        logger.info(f"Profile statistics written to {self.filename}\n{stream.getvalue()}")
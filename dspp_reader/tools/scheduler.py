@@ -0,0 +1,127 @@
+import datetime
+import logging
+import socket
+import time
+
+from typing import Callable, Union
+from zoneinfo import ZoneInfo
+
+from dspp_reader.tools.device import Device
+from dspp_reader.tools.site import Site
+
+logger = logging.getLogger()
+
+
+def check_connection(device: Device, timeout: float = 5) -> bool:
+    """Test that a TCP connection can be established with a device.
+
+    Args:
+        device (Device): Device to test, `ip` and `port` must be defined.
+        timeout (float): Connection timeout in seconds.
+
+    Returns:
+        bool: True if the connection was successful.
+    """
+    try:
+        with socket.create_connection((device.ip, device.port), timeout=timeout) as sock:
+            peer = sock.getpeername()
+            logger.info(f"Successful connection test to {device.type.upper()} {device.serial_id} at {peer[0]}:{peer[1]}.")
+            return True
+    except OSError as e:
+        logger.error(f"Socket error: {e}. The {device.type.upper()} {device.serial_id} at {device.ip}:{device.port} may be unavailable.")
+        return False
+
+
+class WindowScheduler(object):
+    """Blocks the reader until the next reading window starts.
+
+    The time of the next window start is obtained once from the site's schedule cache, after that the scheduler sleeps
+    until that moment, waking up only to run the health check every `health_check_interval` seconds and, if enabled, to
+    refresh the terminal countdown once per second. None of those wake-ups involve ephemeris calculations.
+
+    Args:
+        site (Site): Site used to obtain the reading windows.
+        sun_altitude (float): Sun's altitude in degrees with respect to the horizon that defines the windows.
+        read_always (bool): If true, never wait.
+        health_check (Callable): Function called periodically while waiting. Optional.
+        health_check_interval (float): Seconds between health checks.
+        show_countdown (bool): If true, print a countdown to the terminal. Ignored in debug mode.
+    """
+
+    def __init__(self,
+                 site: Union[Site, None],
+                 sun_altitude: float = -10,
+                 read_always: bool = False,
+                 health_check: Union[Callable, None] = None,
+                 health_check_interval: float = 1800,
+                 show_countdown: bool = True):
+        self.site = site
+        self.sun_altitude = sun_altitude
+        self.read_always = read_always
+        self.health_check = health_check
+        self.health_check_interval = health_check_interval
+        self.show_countdown = show_countdown
+
+    def wait_for_window(self):
+        """Sleep until the current time is inside a reading window.
+
+        Returns immediately if `read_always` is set, there is no site or a window is already open.
+        """
+        if self.read_always or self.site is None:
+            return
+
+        while not self.site.is_within_window(sun_altitude=self.sun_altitude):
+            window_start = time.time() + self.site.seconds_to_next_window(sun_altitude=self.sun_altitude)
+            start = datetime.datetime.fromtimestamp(window_start, tz=ZoneInfo(self.site.timezone))
+            logger.info(f"Next Sunset (Sun at {self.sun_altitude} degrees from the horizon) is at {start.astimezone(datetime.UTC).strftime('%Y-%m-%d %H:%M:%S %Z')}")
+            self._sleep_until(wake_up_time=window_start,
+                              message=f"until next sunset {start.strftime('%Y-%m-%d %H:%M:%S')} {self.site.timezone} ",
+                              run_health_check=True)
+            if self.show_countdown and logger.getEffectiveLevel() != logging.DEBUG:
+                print("")
+
+    def sleep(self, seconds: float, message: str = "until next read"):
+        """Sleep a given amount of seconds showing the countdown if enabled.
+
+        Args:
+            seconds (float): How long to sleep.
+            message (str): Message to show in the countdown.
+        """
+        self._sleep_until(wake_up_time=time.time() + seconds, message=message, run_health_check=False)
+        if self.show_countdown and logger.getEffectiveLevel() != logging.DEBUG:
+            print("")
+
+    def _sleep_until(self, wake_up_time: float, message: str, run_health_check: bool):
+        """Sleep until a unix timestamp.
+
+        Args:
+            wake_up_time (float): Unix timestamp to wake up at.
+            message (str): Countdown message.
+            run_health_check (bool): If true, run the health check periodically.
+        """
+        countdown = self.show_countdown and logger.getEffectiveLevel() != logging.DEBUG
+        next_health_check = time.time()
+        while True:
+            now = time.time()
+            remaining = wake_up_time - now
+            if remaining <= 0:
+                return
+
+            next_wake_up = wake_up_time
+            if run_health_check and self.health_check is not None:
+                if now >= next_health_check:
+                    self.health_check()
+                    next_health_check = now + self.health_check_interval
+                    logger.debug(f"Waiting {self._format_seconds(remaining)} {message}")
+                next_wake_up = min(next_wake_up, next_health_check)
+
+            if countdown:
+                print(f"\033[2K\rWaiting {self._format_seconds(remaining)} {message}", end="", flush=True)
+                next_wake_up = min(next_wake_up, now + 1)
+
+            time.sleep(max(0., next_wake_up - time.time()))
+
+    @staticmethod
+    def _format_seconds(seconds: float) -> str:
+        seconds = int(seconds)
+        return f"{seconds // 3600:02d} hours {(seconds % 3600) // 60:02d} minutes {seconds % 60:02d} seconds"
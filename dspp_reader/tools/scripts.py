@@ -0,0 +1,267 @@
+import datetime
+import logging
+import os
+import signal
+import sys
+
+from argparse import ArgumentParser
+from importlib.metadata import version
+from pathlib import Path
+from typing import Union
+from zoneinfo import ZoneInfo
+
+import yaml
+
+from dspp_reader.tools.generics import setup_logging
+
+__version__ = version("dspp-reader")
+
+
+def build_ephemeris(args: Union[list, None] = None):
+    """Entry point for building ephemeris tables.
+
+    Computes the night windows of a site for a range of dates and saves them so the readers can load them at startup
+    using `ephemeris_table`. Site information is read from a reader's configuration file, or from the arguments.
+
+    Args:
+        args (list): Optional list of arguments to pass to argparse.
+    """
+    parser = ArgumentParser(description=f"Ephemeris table builder\nVersion: {__version__}")
+    parser.add_argument('--config-file', action='store', dest='config_file', help="Reader configuration file to read the site information from")
+    parser.add_argument('--site-id', action='store', dest='site_id', type=str, help='A conventional unique site id, for instance, `ctio`, `pachon` or `morado`')
+    parser.add_argument('--site-name', action='store', dest='site_name', type=str, help='Full site name')
+    parser.add_argument('--site-latitude', action='store', dest='site_latitude', type=float, help='Site latitude')
+    parser.add_argument('--site-longitude', action='store', dest='site_longitude', type=float, help='Site longitude')
+    parser.add_argument('--site-elevation', action='store', dest='site_elevation', type=int, help='Site elevation')
+    parser.add_argument('--site-timezone', action='store', dest='site_timezone', help='Site timezone')
+    parser.add_argument('--sun-altitude', action='store', dest='sun_altitude', type=float, help='Sun altitude with respect to the horizon.')
+    parser.add_argument('--start-date', action='store', dest='start_date', type=datetime.date.fromisoformat, default=datetime.date.today(), help='First night to compute in YYYY-MM-DD format. Defaults to today.')
+    parser.add_argument('--nights', action='store', dest='nights', type=int, default=366, help='Number of nights to compute.')
+    parser.add_argument('--save-to', action='store', dest='save_to', default=os.getcwd(), help='Directory where to save the table.')
+    args = parser.parse_args(args=args)
+
+    logging.basicConfig(format='[%(asctime)s][%(levelname).1s]: %(message)s', level=logging.INFO)
+    logger = logging.getLogger()
+
+    site_config = {}
+    if args.config_file:
+        with open(args.config_file, "r") as f:
+            site_config = yaml.safe_load(f) or {}
+
+    fields = ['site_id', 'site_name', 'site_latitude', 'site_longitude', 'site_elevation', 'site_timezone', 'sun_altitude']
+    config = {field: getattr(args, field) if getattr(args, field) is not None else site_config.get(field) for field in fields}
+    missing_fields = [field for field, value in config.items() if value is None]
+    if missing_fields:
+        for field in missing_fields:
+            logger.error(f"Missing argument: --{field.replace('_', '-')}")
+        sys.exit(1)
+
+    from dspp_reader.tools.site import Site
+
+    site = Site(id=config['site_id'],
+                name=config['site_name'],
+                latitude=config['site_latitude'],
+                longitude=config['site_longitude'],
+                elevation=config['site_elevation'],
+                timezone=config['site_timezone'])
+    start = datetime.datetime.combine(args.start_date, datetime.time(12), tzinfo=ZoneInfo(config['site_timezone']))
+    table = site.get_ephemeris_table(sun_altitude=config['sun_altitude'], start=start, nights=args.nights)
+    logger.info(f"Computed {table}")
+    table.save(directory=args.save_to)
+
+
+def run_engine(args: Union[list, None] = None):
+    """Entry point for reading many devices from a single process.
+
+    Args:
+        args (list): Optional list of arguments to pass to argparse.
+    """
+    parser = ArgumentParser(description=f"Multi-device reader engine\nVersion: {__version__}")
+    parser.add_argument('--config-file', action='store', dest='config_file', required=True, help="Configuration file listing all devices")
+    parser.add_argument('--stats-interval', action='store', dest='stats_interval', type=float, default=600, help="Seconds between logging CPU and memory usage, 0 to disable")
+    parser.add_argument('--processes', action='store', dest='processes', type=int, default=0, help="Read the devices with this many worker processes and store their datapoints from a single process, 0 to read all devices from a single process")
+    parser.add_argument('--metrics-port', action='store', dest='metrics_port', type=int, default=None, help="Serve Prometheus metrics over HTTP on this port")
+    parser.add_argument('--metrics-file', action='store', dest='metrics_file', default=None, help="Write Prometheus metrics to this file, for the textfile collector of the node exporter")
+    parser.add_argument('--metrics-address', action='store', dest='metrics_address', default=None, help="Address to serve the metrics on with --metrics-port, 127.0.0.1 by default, 0.0.0.0 for all interfaces")
+    parser.add_argument('--save-logs-to', action='store', dest='save_logs_to', default=None, help="Directory to save logs to")
+    parser.add_argument('--debug', action='store_true', dest='debug', default=False, help="Enable debug mode")
+    args = parser.parse_args(args=args)
+
+    setup_logging(debug=args.debug, device_type='engine', device_id=Path(args.config_file).stem, save_logs_to=args.save_logs_to)
+    logger = logging.getLogger()
+    logger.info(f"Starting multi-device reader engine, Version: {__version__}")
+
+    from dspp_reader.tools.engine import ReaderEngine, load_engine_config
+
+    try:
+        devices_config = load_engine_config(filename=args.config_file)
+    except (OSError, ValueError, yaml.YAMLError) as e:
+        logger.error(f"Unable to read {args.config_file}: {e}")
+        sys.exit(1)
+
+    if args.processes > 0:
+        from dspp_reader.tools.supervisor import ProcessSupervisor
+
+        engine = ProcessSupervisor(devices_config=devices_config, processes=args.processes, stats_interval=args.stats_interval,
+                                   metrics_port=args.metrics_port, metrics_file=args.metrics_file, metrics_address=args.metrics_address)
+    else:
+        engine = ReaderEngine(devices_config=devices_config, stats_interval=args.stats_interval,
+                              metrics_port=args.metrics_port, metrics_file=args.metrics_file, metrics_address=args.metrics_address)
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    engine()
+
+
+def backfill(args: Union[list, None] = None):
+    """Entry point for uploading existing data files to the API.
+
+    The API is read from a reader's configuration file, or from the arguments. The progress of each file is saved, so
+    the same command can be run again to resume after an interruption or to upload the rows added since the last run.
+
+    Args:
+        args (list): Optional list of arguments to pass to argparse.
+    """
+    parser = ArgumentParser(description=f"Data files uploader\nVersion: {__version__}")
+    parser.add_argument('paths', nargs='+', help="Data files, or directories to search for .tsv, .csv and .txt files")
+    parser.add_argument('--config-file', action='store', dest='config_file', help="Reader configuration file to read the API information from")
+    parser.add_argument('--api-endpoint', action='store', dest='api_endpoint', type=str, help='API endpoint')
+    parser.add_argument('--api-token', action='store', dest='api_token', type=str, help='API Token')
+    parser.add_argument('--api-bulk-endpoint', action='store', dest='api_bulk_endpoint', type=str, help='API endpoint that accepts a list of datapoints')
+    parser.add_argument('--api-gzip', action='store_true', dest='api_gzip', default=None, help='Compress the requests to the API with gzip')
+    parser.add_argument('--site-name', action='store', dest='site_name', type=str, help='Full site name, it is not stored in the files')
+    parser.add_argument('--batch-size', action='store', dest='batch_size', type=int, default=100, help='Number of datapoints per request to the bulk endpoint')
+    parser.add_argument('--workers', action='store', dest='workers', type=int, default=4, help='Number of files uploaded at the same time')
+    parser.add_argument('--checkpoint-file', action='store', dest='checkpoint_file', default=None, help='Database with the progress of each file, by default dspp_backfill.sqlite in the current directory')
+    parser.add_argument('--debug', action='store_true', dest='debug', default=False, help="Enable debug mode")
+    args = parser.parse_args(args=args)
+
+    logging.basicConfig(format='[%(asctime)s][%(levelname).1s]: %(message)s', level=logging.DEBUG if args.debug else logging.INFO)
+    logger = logging.getLogger()
+
+    reader_config = {}
+    if args.config_file:
+        with open(args.config_file, "r") as f:
+            reader_config = yaml.safe_load(f) or {}
+
+    fields = ['api_endpoint', 'api_token', 'api_bulk_endpoint', 'api_gzip', 'site_name']
+    config = {field: getattr(args, field) if getattr(args, field) is not None else reader_config.get(field) for field in fields}
+    for field in ['api_endpoint', 'api_token']:
+        if not config[field]:
+            logger.error(f"Missing argument: --{field.replace('_', '-')}")
+            sys.exit(1)
+
+    from dspp_reader.tools.api import ApiClient
+    from dspp_reader.tools.backfill import CHECKPOINT_FILENAME, Backfill, Checkpoints, find_night_files
+
+    filenames = find_night_files(paths=args.paths)
+    if not filenames:
+        logger.error(f"No data files found in {', '.join(args.paths)}")
+        sys.exit(1)
+    logger.info(f"Uploading {len(filenames)} files to {config['api_bulk_endpoint'] or config['api_endpoint']}")
+
+    checkpoints = Checkpoints(filename=args.checkpoint_file or Path(os.getcwd()) / CHECKPOINT_FILENAME)
+    uploader = Backfill(
+        get_client=lambda: ApiClient(
+            api_endpoint=config['api_endpoint'],
+            api_token=config['api_token'],
+            api_bulk_endpoint=config['api_bulk_endpoint'],
+            compress=bool(config['api_gzip'])),
+        checkpoints=checkpoints,
+        site_name=config['site_name'],
+        batch_size=args.batch_size,
+        workers=args.workers)
+    try:
+        results = uploader(filenames=filenames)
+    finally:
+        checkpoints.close()
+
+    failed = [filename for filename, uploaded in results.items() if uploaded is None]
+    logger.info(f"Uploaded {sum(uploaded for uploaded in results.values() if uploaded)} rows from {len(filenames) - len(failed)} files")
+    if failed:
+        logger.error(f"{len(failed)} files could not be uploaded, run the same command again to resume them")
+        sys.exit(1)
+
+
+def simulator(args: Union[list, None] = None):
+    """Entry point for simulating devices on local ports.
+
+    Serves simulated SQM-LE and TESS-W4C devices, or replays sessions captured from real devices, so the readers and the
+    engine can be tested without hardware. With ``--record`` it captures a session from a real device instead.
+
+    Args:
+        args (list): Optional list of arguments to pass to argparse.
+    """
+    parser = ArgumentParser(description=f"Device simulator\nVersion: {__version__}")
+    parser.add_argument('--sqm-le', action='store', dest='sqm_le', type=int, default=0, help="Number of SQM-LE devices to simulate")
+    parser.add_argument('--tess-w4c', action='store', dest='tess_w4c', type=int, default=0, help="Number of TESS-W4C devices to simulate")
+    parser.add_argument('--replay', action='append', dest='replay', default=[], metavar='DEVICE_TYPE:FILENAME', help="Replay a session captured with --record, for instance tess-w4c:session.jsonl. Can be repeated")
+    parser.add_argument('--speed', action='store', dest='speed', type=float, default=1., help="Replay speed of pushed data")
+    parser.add_argument('--host', action='store', dest='host', default='127.0.0.1', help="Address to listen on")
+    parser.add_argument('--port', action='store', dest='port', type=int, default=0, help="Port of the first device, the others use the following ports. 0 for free ports")
+    parser.add_argument('--interval', action='store', dest='interval', type=float, default=1., help="Seconds between TESS-W4C messages")
+    parser.add_argument('--latency', action='store', dest='latency', type=float, default=0., help="Seconds before each response")
+    parser.add_argument('--jitter', action='store', dest='jitter', type=float, default=0., help="Maximum random seconds added to the latency")
+    parser.add_argument('--drop-rate', action='store', dest='drop_rate', type=float, default=0., help="Probability of not sending a response or message")
+    parser.add_argument('--garble-rate', action='store', dest='garble_rate', type=float, default=0., help="Probability of corrupting a response or message")
+    parser.add_argument('--seed', action='store', dest='seed', type=int, default=None, help="Seed for reproducible faults and readings")
+    parser.add_argument('--write-config', action='store', dest='write_config', default=None, help="Write a dspp-reader-engine configuration file for the simulated devices")
+    parser.add_argument('--record', action='store', dest='record', default=None, help="Capture a session from --device-ip and --device-port to this file")
+    parser.add_argument('--device-ip', action='store', dest='device_ip', default=None, help="IP address of the device to record")
+    parser.add_argument('--device-port', action='store', dest='device_port', type=int, default=None, help="Port of the device to record")
+    parser.add_argument('--debug', action='store_true', dest='debug', default=False, help="Enable debug mode")
+    args = parser.parse_args(args=args)
+
+    logging.basicConfig(format='[%(asctime)s][%(levelname).1s]: %(message)s', level=logging.DEBUG if args.debug else logging.INFO)
+    logger = logging.getLogger()
+
+    import asyncio
+
+    from dspp_reader.tools.simulator import DeviceSimulator, Faults, ReplayedDevice, SimulatedSQMLE, SimulatedTESSW4C, load_session, record_session
+
+    if args.record:
+        if not args.device_ip or not args.device_port:
+            logger.error("Missing argument: --device-ip and --device-port are required with --record")
+            sys.exit(1)
+        try:
+            asyncio.run(record_session(device_ip=args.device_ip, device_port=args.device_port, filename=args.record, host=args.host, port=args.port))
+        except KeyboardInterrupt:
+            logger.info(f"Session saved to {args.record}")
+        return
+
+    def get_faults(number: int) -> Faults:
+        return Faults(latency=args.latency,
+                      jitter=args.jitter,
+                      drop_rate=args.drop_rate,
+                      garble_rate=args.garble_rate,
+                      seed=None if args.seed is None else args.seed + number)
+
+    devices = [SimulatedSQMLE(serial_number=number + 1, faults=get_faults(number)) for number in range(args.sqm_le)]
+    devices += [SimulatedTESSW4C(name=f"stars{number + 1}", faults=get_faults(args.sqm_le + number), interval=args.interval) for number in range(args.tess_w4c)]
+    for number, replay in enumerate(args.replay, start=len(devices)):
+        device_type, _, filename = replay.partition(':')
+        if device_type not in ['sqm-le', 'tess-w4c'] or not filename:
+            logger.error(f"Invalid --replay {replay}, use sqm-le:<filename> or tess-w4c:<filename>")
+            sys.exit(1)
+        try:
+            session = load_session(filename=filename)
+            devices.append(ReplayedDevice(session=session, device_id=Path(filename).stem, device_type=device_type, faults=get_faults(number), speed=args.speed))
+        except (OSError, ValueError) as e:
+            logger.error(f"Unable to read {filename}: {e}")
+            sys.exit(1)
+    if not devices:
+        logger.error("Nothing to simulate, use --sqm-le, --tess-w4c or --replay")
+        sys.exit(1)
+
+    device_simulator = DeviceSimulator(devices=devices, host=args.host, port=args.port)
+
+    async def serve():
+        await device_simulator.start()
+        if args.write_config:
+            with open(args.write_config, 'w') as f:
+                yaml.safe_dump(device_simulator.get_engine_config(), f, sort_keys=False)
+            logger.info(f"Engine configuration written to {args.write_config}")
+        await asyncio.Event().wait()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        logger.info("Simulator stopped")
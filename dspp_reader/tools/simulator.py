@@ -0,0 +1,463 @@
+import asyncio
+import json
+import logging
+import math
+import random
+import threading
+import time
+
+from pathlib import Path
+from typing import Union
+
+logger = logging.getLogger()
+
+TERMINATOR = b'\r\n'
+
+
+def _signed(value: float, width: int, decimals: int) -> str:
+    return f"{'-' if value < 0 else ' '}{abs(value):0{width}.{decimals}f}"
+
+
+def format_reading(magnitude: float,
+                   frequency: float,
+                   period_count: int,
+                   period_seconds: float,
+                   temperature: float,
+                   serial_number: Union[int, None] = None) -> str:
+    """Response of an SQM-LE to `rx`, or to `Rx` when `serial_number` is given.
+
+    Returns:
+        str: Response with the field widths of the device, for instance
+            ``r, 19.29m,0000000022Hz,0000000000c,0000000.000s, 027.0C,00000001``, including the terminator.
+    """
+    response = (f"r,{_signed(magnitude, 5, 2)}m,{int(frequency):010d}Hz,{int(period_count):010d}c,"
+                f"{period_seconds:011.3f}s,{_signed(temperature, 5, 1)}C")
+    if serial_number is not None:
+        response += f",{int(serial_number):08d}"
+    return f"{response}\r\n"
+
+
+def format_calibration(magnitude_offset: float = 19.84,
+                       dark_period: float = 151.517,
+                       light_temperature: float = 23.2,
+                       manufacturer_offset: float = 8.71,
+                       dark_temperature: float = 29.6) -> str:
+    """Response of an SQM-LE to `cx`."""
+    return (f"c,{magnitude_offset:011.2f}m,{dark_period:011.3f}s,{_signed(light_temperature, 5, 1)}C,"
+            f"{manufacturer_offset:011.2f}m,{_signed(dark_temperature, 5, 1)}C\r\n")
+
+
+def format_unit_information(serial_number: int, protocol: int = 2, model: int = 3, feature: int = 1) -> str:
+    """Response of an SQM-LE to `ix`."""
+    return f"i,{protocol:08d},{model:08d},{feature:08d},{int(serial_number):08d}\r\n"
+
+
+class Faults(object):
+    """Network problems added to the responses of a simulated device.
+
+    Args:
+        latency (float): Seconds before each response or message is sent.
+        jitter (float): Maximum seconds added at random to `latency`.
+        drop_rate (float): Probability of not sending a response or message.
+        garble_rate (float): Probability of corrupting some bytes of a response or message, the terminator is kept.
+        seed (int): Seed of the random generator, for reproducible runs.
+    """
+
+    def __init__(self, latency: float = 0., jitter: float = 0., drop_rate: float = 0., garble_rate: float = 0., seed: Union[int, None] = None):
+        self.latency = latency
+        self.jitter = jitter
+        self.drop_rate = drop_rate
+        self.garble_rate = garble_rate
+        self.random = random.Random(seed)
+
+    def __repr__(self):
+        return f"Faults(latency={self.latency}, jitter={self.jitter}, drop_rate={self.drop_rate}, garble_rate={self.garble_rate})"
+
+    def get_delay(self) -> float:
+        return self.latency + self.random.uniform(0, self.jitter)
+
+    def apply(self, data: bytes) -> Union[bytes, None]:
+        """Drop or garble a frame.
+
+        Args:
+            data (bytes): Frame to send.
+
+        Returns:
+            bytes: The frame, possibly corrupted, or None if it is dropped.
+        """
+        if self.drop_rate and self.random.random() < self.drop_rate:
+            return None
+        if self.garble_rate and self.random.random() < self.garble_rate:
+            body = bytearray(data[:-len(TERMINATOR)] if data.endswith(TERMINATOR) else data)
+            for _ in range(max(1, len(body) // 10)):
+                body[self.random.randrange(len(body))] = self.random.choice(b'#?x}{,\x00')
+            return bytes(body) + (TERMINATOR if data.endswith(TERMINATOR) else b'')
+        return data
+
+
+class SimulatedSQMLE(object):
+    """SQM-LE that answers the `rx`, `Rx`, `cx` and `ix` commands with readings of a slowly changing sky.
+
+    Args:
+        serial_number (int): Serial number of the device.
+        faults (Faults): Network problems to add.
+        magnitude (float): Mean sky brightness in magnitudes per square arcsecond.
+        temperature (float): Mean temperature in Celsius.
+    """
+
+    device_type = 'sqm-le'
+
+    def __init__(self, serial_number: int, faults: Union[Faults, None] = None, magnitude: float = 21., temperature: float = 15.):
+        self.serial_number = serial_number
+        self.faults = faults or Faults()
+        self.magnitude = magnitude
+        self.temperature = temperature
+        self.requests = 0
+
+    def __repr__(self):
+        return f"SimulatedSQMLE({self.serial_number})"
+
+    @property
+    def device_id(self) -> str:
+        return str(self.serial_number)
+
+    def get_response(self, command: str) -> Union[str, None]:
+        """Response to a command, without faults.
+
+        Args:
+            command (str): Command without the terminator.
+
+        Returns:
+            str: The response, or None for unknown commands, which the device ignores.
+        """
+        if command in ['rx', 'Rx']:
+            hour = time.time() / 3600
+            magnitude = self.magnitude + 0.3 * math.sin(hour) + self.faults.random.gauss(0, 0.02)
+            frequency = 10 ** ((20.8 - magnitude) / 2.5) * 100
+            return format_reading(magnitude=magnitude,
+                                  frequency=frequency,
+                                  period_count=0,
+                                  period_seconds=0.,
+                                  temperature=self.temperature + 2 * math.cos(hour),
+                                  serial_number=self.serial_number if command == 'Rx' else None)
+        if command == 'cx':
+            return format_calibration()
+        if command == 'ix':
+            return format_unit_information(serial_number=self.serial_number)
+        return None
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    return
+                self.requests += 1
+                response = self.get_response(command=line.decode(errors='replace').strip())
+                if response is None:
+                    continue
+                await asyncio.sleep(self.faults.get_delay())
+                data = self.faults.apply(response.encode())
+                if data is not None:
+                    writer.write(data)
+                    await writer.drain()
+        except ConnectionError:
+            return
+        finally:
+            writer.close()
+
+
+class SimulatedTESSW4C(object):
+    """TESS-W4C that pushes a JSON message every `interval` seconds to every client.
+
+    Args:
+        name (str): Name of the device, sent in every message.
+        faults (Faults): Network problems to add. Dropped messages still increase the `udp` counter, as a lost message.
+        interval (float): Seconds between messages.
+    """
+
+    device_type = 'tess-w4c'
+
+    def __init__(self, name: str, faults: Union[Faults, None] = None, interval: float = 1.):
+        self.name = name
+        self.faults = faults or Faults()
+        self.interval = interval
+        self.message_id = 0
+
+    def __repr__(self):
+        return f"SimulatedTESSW4C({self.name})"
+
+    @property
+    def device_id(self) -> str:
+        return self.name
+
+    def get_message(self) -> dict:
+        """Next message of the device, without faults."""
+        self.message_id += 1
+        hour = time.time() / 3600
+        message = {'udp': self.message_id, 'rev': 3, 'name': self.name, 'wdBm': -54, 'hash': '22C', 'ain': 489}
+        for channel, zero_point in enumerate([19.96, 20.04, 19.99, 19.94], start=1):
+            magnitude = round(7.5 + 0.3 * math.sin(hour) + self.faults.random.gauss(0, 0.02), 2)
+            message[f"F{channel}"] = {'freq': round(10 ** ((zero_point - magnitude) / 2.5), 1), 'mag': magnitude, 'zp': zero_point}
+        message['tamb'] = round(15 + 2 * math.cos(hour), 2)
+        message['tsky'] = round(-10 + 2 * math.cos(hour), 2)
+        return message
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while not reader.at_eof():
+                await asyncio.sleep(self.interval + self.faults.get_delay())
+                data = self.faults.apply(json.dumps(self.get_message()).encode() + TERMINATOR)
+                if data is not None:
+                    writer.write(data)
+                    await writer.drain()
+        except ConnectionError:
+            return
+        finally:
+            writer.close()
+
+
+def load_session(filename: Union[Path, str]) -> list:
+    """Read a session captured with `record_session`.
+
+    Args:
+        filename (Path): JSON lines file, each line with the `time` since the start of the session in seconds, the
+            `request` sent to the device, null for pushed data, and the `response`.
+
+    Returns:
+        list: The exchanges of the session.
+    """
+    with open(filename) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+class ReplayedDevice(object):
+    """Device that sends the responses of a captured session again.
+
+    Sessions with requests are answered command by command, cycling through the responses recorded for each command.
+    Sessions with pushed data only are sent again with the recorded time between messages, divided by `speed`, and
+    start again from the beginning at the end.
+
+    Args:
+        session (list): Exchanges from `load_session`.
+        device_id (str): Id of the device in the configuration written for the readers.
+        device_type (str): `sqm-le` or `tess-w4c`.
+        faults (Faults): Network problems to add.
+        speed (float): Replay speed of pushed data.
+    """
+
+    def __init__(self, session: list, device_id: str, device_type: str, faults: Union[Faults, None] = None, speed: float = 1.):
+        if not session:
+            raise ValueError("The session is empty")
+        self.session = session
+        self.device_id = device_id
+        self.device_type = device_type
+        self.faults = faults or Faults()
+        self.speed = speed
+        self.responses = {}
+        for exchange in session:
+            if exchange.get('request') is not None:
+                self.responses.setdefault(exchange['request'].strip(), []).append(exchange['response'])
+        self._next_response = {request: 0 for request in self.responses}
+
+    def __repr__(self):
+        return f"ReplayedDevice({self.device_type} {self.device_id}, {len(self.session)} exchanges)"
+
+    def get_response(self, command: str) -> Union[str, None]:
+        responses = self.responses.get(command)
+        if not responses:
+            return None
+        index = self._next_response[command]
+        self._next_response[command] = (index + 1) % len(responses)
+        return responses[index]
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            if self.responses:
+                await self._answer(reader=reader, writer=writer)
+            else:
+                await self._push(reader=reader, writer=writer)
+        except ConnectionError:
+            return
+        finally:
+            writer.close()
+
+    async def _answer(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        while True:
+            line = await reader.readline()
+            if not line:
+                return
+            response = self.get_response(command=line.decode(errors='replace').strip())
+            if response is None:
+                continue
+            await asyncio.sleep(self.faults.get_delay())
+            data = self.faults.apply(response.encode())
+            if data is not None:
+                writer.write(data)
+                await writer.drain()
+
+    async def _push(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        while True:
+            previous = self.session[0]['time']
+            for exchange in self.session:
+                await asyncio.sleep(max(0., exchange['time'] - previous) / self.speed + self.faults.get_delay())
+                previous = exchange['time']
+                if reader.at_eof():
+                    return
+                data = self.faults.apply(exchange['response'].encode())
+                if data is not None:
+                    writer.write(data)
+                    await writer.drain()
+
+
+class DeviceSimulator(object):
+    """Serves simulated devices on local TCP ports.
+
+    Every device listens on its own port, consecutive from `port`, or on a free port chosen by the system if `port` is
+    zero. All of them run in a single event loop, so hundreds of devices can be simulated by one process.
+
+    Args:
+        devices (list): Simulated devices, `SimulatedSQMLE`, `SimulatedTESSW4C` or `ReplayedDevice`.
+        host (str): Address to listen on.
+        port (int): Port of the first device, zero for free ports.
+    """
+
+    def __init__(self, devices: list, host: str = '127.0.0.1', port: int = 0):
+        self.devices = devices
+        self.host = host
+        self.port = port
+        self.ports = []
+        self._servers = []
+        self._loop = None
+        self._thread = None
+
+    def __repr__(self):
+        return f"DeviceSimulator({len(self.devices)} devices on {self.host})"
+
+    async def start(self):
+        """Start listening, the devices are served while the event loop runs."""
+        for number, device in enumerate(self.devices):
+            server = await asyncio.start_server(device.handle, host=self.host, port=self.port + number if self.port else 0)
+            self._servers.append(server)
+            self.ports.append(server.sockets[0].getsockname()[1])
+        logger.info(f"Simulating {len(self.devices)} devices on {self.host} ports {self.ports[0]} to {self.ports[-1]}")
+
+    async def serve_forever(self):
+        """Start and serve the devices until cancelled."""
+        await self.start()
+        try:
+            await asyncio.gather(*(server.serve_forever() for server in self._servers))
+        finally:
+            await self.stop()
+
+    async def stop(self):
+        for server in self._servers:
+            server.close()
+        self._servers = []
+
+    def start_in_thread(self):
+        """Serve the devices from a background thread, for instance to test a reader in the same process."""
+        started = threading.Event()
+
+        def run():
+            self._loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(self._loop)
+            self._loop.run_until_complete(self.start())
+            started.set()
+            self._loop.run_forever()
+            self._loop.run_until_complete(self.stop())
+            tasks = asyncio.all_tasks(self._loop)
+            for task in tasks:
+                task.cancel()
+            self._loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+            self._loop.close()
+
+        self._thread = threading.Thread(target=run, name='dspp-simulator', daemon=True)
+        self._thread.start()
+        started.wait()
+
+    def close(self):
+        """Stop the background thread started with `start_in_thread`."""
+        if self._thread is not None:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+            self._thread = None
+
+    def get_engine_config(self, defaults: Union[dict, None] = None) -> dict:
+        """Configuration of `dspp-reader-engine` for reading the simulated devices.
+
+        Args:
+            defaults (dict): Fields shared by all devices, for instance the site and the outputs.
+
+        Returns:
+            dict: Configuration with `defaults` and one entry per device.
+        """
+        return {
+            'defaults': dict(defaults or {}),
+            'devices': [{'device_type': device.device_type,
+                         'device_id': device.device_id,
+                         'device_altitude': 90,
+                         'device_azimuth': 0,
+                         'device_ip': self.host,
+                         'device_port': port} for device, port in zip(self.devices, self.ports)],
+        }
+
+
+async def record_session(device_ip: str, device_port: int, filename: Union[Path, str], host: str = '127.0.0.1', port: int = 0,
+                         started: Union[asyncio.Future, None] = None):
+    """Capture the traffic between a reader and a real device to replay it later with `ReplayedDevice`.
+
+    Listens on `port` and forwards every connection to the device. Each response line, or each chunk of pushed data, is
+    appended to `filename` with the request that produced it, see `load_session`.
+
+    Args:
+        device_ip (str): IP address of the device.
+        device_port (int): TCP port of the device.
+        filename (Path): JSON lines file, appended to.
+        host (str): Address to listen on.
+        port (int): Port to listen on, the reader connects here instead of to the device. Zero for a free port.
+        started (asyncio.Future): Set to the listening port once ready. Optional.
+    """
+    start_time = time.monotonic()
+    output = open(filename, 'a')
+
+    def save(request: Union[str, None], response: bytes):
+        output.write(json.dumps({'time': round(time.monotonic() - start_time, 3), 'request': request, 'response': response.decode(errors='replace')}) + '\n')
+        output.flush()
+
+    async def forward(client_reader: asyncio.StreamReader, client_writer: asyncio.StreamWriter):
+        device_reader, device_writer = await asyncio.open_connection(device_ip, device_port)
+        requests = []
+
+        async def requests_to_device():
+            while line := await client_reader.readline():
+                requests.append(line.decode(errors='replace').strip())
+                device_writer.write(line)
+                await device_writer.drain()
+            device_writer.close()
+
+        async def responses_to_client():
+            while True:
+                data = await device_reader.readline() if requests else await device_reader.read(4096)
+                if not data:
+                    break
+                save(request=requests.pop(0) if requests else None, response=data)
+                client_writer.write(data)
+                await client_writer.drain()
+            client_writer.close()
+
+        try:
+            await asyncio.gather(requests_to_device(), responses_to_client())
+        except ConnectionError as e:
+            logger.warning(f"Recording connection closed: {e}")
+
+    server = await asyncio.start_server(forward, host=host, port=port)
+    listening_port = server.sockets[0].getsockname()[1]
+    logger.info(f"Recording {device_ip}:{device_port} to {filename}, connect the reader to {host}:{listening_port}")
+    if started is not None:
+        started.set_result(listening_port)
+    try:
+        await server.serve_forever()
+    finally:
+        server.close()
+        output.close()
@@ -1,15 +1,26 @@
 import astropy.units as u
 import datetime
+import logging
 
-from astropy.time import Time
+import numpy as np
+
+from astropy.time import Time, TimeDelta
 from astropy.coordinates import EarthLocation
-from pytz import timezone as tz
-from astroplan import Observer
+from pathlib import Path
+from typing import Union
+
+from dspp_reader.tools.ephemeris import SECONDS_PER_DAY, EphemerisTable, compute_sun_crossings
+
+logger = logging.getLogger()
 
 
 class Site(object):
     """Defines a device location or site.
 
+    Night windows, defined by the sun crossing a given altitude, are computed in blocks of ``schedule_horizon``
+    nights, or loaded from an `EphemerisTable`, and cached as a sorted array of boundaries ``[start_0, end_0, start_1, end_1, ...]`` per sun altitude,
+    so that subsequent queries are answered with a binary search instead of solving the ephemerides again.
+
     Args:
         id (str): ID of site, a unique ID for a give site. Uniqueness is not enforced.
         name (str): Verbose name of the site.
@@ -17,8 +28,9 @@ class Site(object):
         longitude (float): Longitude of the site's location in degrees.
         elevation (float): Elevation of the site's location in meters above sea level.
         timezone (str): Timezone of the site. For example, 'America/Santiago'.
+        schedule_horizon (int): Number of nights to compute each time the schedule cache runs out.
     """
-    def __init__(self, id: str, name: str, latitude: float, longitude: float, elevation: float, timezone: str,):
+    def __init__(self, id: str, name: str, latitude: float, longitude: float, elevation: float, timezone: str, schedule_horizon: int = 7):
 
         self.id = id
         self.name = name
@@ -26,12 +38,25 @@ class Site(object):
         self.longitude = longitude * u.deg
         self.elevation = elevation * u.m
         self.timezone = timezone
+        self.schedule_horizon = schedule_horizon
         self.location = EarthLocation.from_geodetic(self.longitude, self.latitude, self.elevation)
-        self.observer = Observer(
-            name=self.name,
-            location=self.location,
-            timezone=tz(self.timezone),
-            description=self.name)
+        self._observer = None
+        self._schedules = {}
+        self._schedules_since = {}
+
+    @property
+    def observer(self):
+        """astroplan Observer of the site, created on first use since astroplan is slow to import."""
+        if self._observer is None:
+            from astroplan import Observer
+            from pytz import timezone as tz
+
+            self._observer = Observer(
+                name=self.name,
+                location=self.location,
+                timezone=tz(self.timezone),
+                description=self.name)
+        return self._observer
 
     def get_time_range(self, sun_altitude: float = -10):
         """Get times for specified sun altitude at defined location.
@@ -46,11 +71,134 @@ class Site(object):
                 - timedelta: Time to next period start
                 - timedelta: Time to next period end
         """
-        now = Time(datetime.datetime.now(datetime.UTC))
-        # now = Time("2024-12-02 09:00:00")
-        reference_time = now
-        next_period_start = self.observer.sun_set_time(reference_time, which='next', horizon=sun_altitude * u.deg)
-        next_period_end = self.observer.sun_rise_time(reference_time, which='next', horizon=sun_altitude * u.deg)
-        time_to_next_start = next_period_start - now
-        time_to_next_end = next_period_end - now
-        return next_period_start, next_period_end, time_to_next_start, time_to_next_end
+        now = datetime.datetime.now(datetime.UTC).timestamp()
+        next_period_start, next_period_end = self._get_next_boundaries(sun_altitude=sun_altitude, when=now)
+        time_to_next_start = TimeDelta(next_period_start - now, format='sec')
+        time_to_next_end = TimeDelta(next_period_end - now, format='sec')
+        return (Time(next_period_start, format='unix'),
+                Time(next_period_end, format='unix'),
+                time_to_next_start,
+                time_to_next_end)
+
+    def is_within_window(self, sun_altitude: float = -10, when: float = None) -> bool:
+        """Check if the sun is below the given altitude.
+
+        Args:
+            sun_altitude (float): Sun's altitude in degrees with respect to the horizon.
+            when (float): Unix timestamp to check. Defaults to now.
+
+        Returns:
+            bool: True if `when` falls inside a night window.
+        """
+        if when is None:
+            when = datetime.datetime.now(datetime.UTC).timestamp()
+        index, _ = self._search_schedule(sun_altitude=sun_altitude, when=when)
+        return index % 2 == 1
+
+    def seconds_to_next_window(self, sun_altitude: float = -10, when: float = None) -> float:
+        """Get the number of seconds until the next window starts.
+
+        Args:
+            sun_altitude (float): Sun's altitude in degrees with respect to the horizon.
+            when (float): Unix timestamp used as reference. Defaults to now.
+
+        Returns:
+            float: Seconds to the next window start, zero if `when` is already inside a window.
+        """
+        if when is None:
+            when = datetime.datetime.now(datetime.UTC).timestamp()
+        index, boundaries = self._search_schedule(sun_altitude=sun_altitude, when=when)
+        if index % 2 == 1:
+            return 0.
+        return float(boundaries[index] - when)
+
+    def _get_next_boundaries(self, sun_altitude: float, when: float):
+        """Get the next window start and next window end after `when` as unix timestamps.
+
+        This mimics astroplan's ``which='next'`` behaviour, if `when` is inside a window the next start belongs to
+        the following night while the next end belongs to the current one.
+        """
+        index, boundaries = self._search_schedule(sun_altitude=sun_altitude, when=when)
+        if index % 2 == 1:
+            return float(boundaries[index + 1]), float(boundaries[index])
+        return float(boundaries[index]), float(boundaries[index + 1])
+
+    def _search_schedule(self, sun_altitude: float, when: float):
+        """Binary search `when` in the cached boundaries, extending the cache if needed.
+
+        Returns:
+            tuple: Insertion index of `when` and the boundaries array. An odd index means `when` is inside a window.
+        """
+        boundaries = self._schedules.get(sun_altitude)
+        if boundaries is not None:
+            index = int(np.searchsorted(boundaries, when, side='right'))
+            if 0 < index < len(boundaries) - 1:
+                return index, boundaries
+            # before the first start `when` is outside a window if the sun is known to be up since before it
+            if index == 0 and len(boundaries) > 1 and when >= self._schedules_since.get(sun_altitude, np.inf):
+                return index, boundaries
+        self._schedules_since.pop(sun_altitude, None)
+        boundaries = self._compute_schedule(sun_altitude=sun_altitude, when=when)
+        self._schedules[sun_altitude] = boundaries
+        return int(np.searchsorted(boundaries, when, side='right')), boundaries
+
+    def get_ephemeris_table(self, sun_altitude: float = -10, start: Union[datetime.datetime, None] = None, nights: int = 366, resolution: int = 600) -> EphemerisTable:
+        """Compute the night windows for a range of dates in a single vectorized pass.
+
+        Args:
+            sun_altitude (float): Sun's altitude in degrees with respect to the horizon.
+            start (datetime.datetime): Date to start computing from. Defaults to now.
+            nights (int): Number of nights to compute.
+            resolution (int): Resolution of the altitude grid in seconds.
+
+        Returns:
+            EphemerisTable: Table with the start and end of each window.
+        """
+        if start is None:
+            start = datetime.datetime.now(datetime.UTC)
+        start_timestamp = start.timestamp()
+        starts, ends, since = compute_sun_crossings(
+            location=self.location,
+            sun_altitude=sun_altitude,
+            start=start_timestamp,
+            end=start_timestamp + nights * SECONDS_PER_DAY,
+            resolution=resolution)
+        return EphemerisTable(site_id=self.id, sun_altitude=sun_altitude, starts=starts, ends=ends, since=since)
+
+    def load_ephemeris_table(self, table: Union[EphemerisTable, Path, str]):
+        """Use a precomputed ephemeris table as the schedule cache.
+
+        Once the table runs out the schedule is computed again as usual.
+
+        Args:
+            table (EphemerisTable, Path): Table or path to a table saved with `EphemerisTable.save`.
+
+        Raises:
+            ValueError: If the table was computed for a different site.
+        """
+        if not isinstance(table, EphemerisTable):
+            table = EphemerisTable.load(table)
+        if table.site_id != self.id:
+            raise ValueError(f"Ephemeris table was computed for site {table.site_id}, not {self.id}")
+        self._schedules[table.sun_altitude] = table.boundaries
+        if table.since is None:
+            self._schedules_since.pop(table.sun_altitude, None)
+        else:
+            self._schedules_since[table.sun_altitude] = table.since
+        logger.info(f"Loaded {table}")
+
+    def _compute_schedule(self, sun_altitude: float, when: float):
+        """Compute the window boundaries for `schedule_horizon` nights starting the day before `when`.
+
+        Returns:
+            numpy.ndarray: Sorted unix timestamps ``[start_0, end_0, start_1, end_1, ...]``.
+        """
+        starts, ends, since = compute_sun_crossings(
+            location=self.location,
+            sun_altitude=sun_altitude,
+            start=when - SECONDS_PER_DAY,
+            end=when + self.schedule_horizon * SECONDS_PER_DAY)
+        if len(starts) == 0:
+            raise ValueError(f"The sun does not cross {sun_altitude} degrees at {self.name} in the next {self.schedule_horizon} days")
+        self._schedules_since[sun_altitude] = since
+        return EphemerisTable(site_id=self.id, sun_altitude=sun_altitude, starts=starts, ends=ends).boundaries
@@ -0,0 +1,178 @@
+import math
+
+import numpy as np
+
+AVERAGING_METHODS = ['mean', 'median', 'sigma_clip']
+
+
+class StreamingStatistics(object):
+    """Statistics of a stream of values updated one value at a time.
+
+    Mean and variance are updated with Welford's algorithm so they do not need the previous values. The last
+    `buffer_size` values are also kept in a preallocated NumPy array for the robust estimators.
+
+    Args:
+        buffer_size (int): Number of values kept for `median` and `sigma_clipped_mean`.
+    """
+
+    def __init__(self, buffer_size: int = 64):
+        self.buffer_size = buffer_size
+        self.buffer = np.empty(buffer_size, dtype=float)
+        self.count = 0
+        self.mean = 0.
+        self.minimum = math.inf
+        self.maximum = -math.inf
+        self._sum_of_squares = 0.
+
+    def add(self, value: float):
+        """Fold a new value into the statistics."""
+        self.buffer[self.count % self.buffer_size] = value
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self._sum_of_squares += delta * (value - self.mean)
+        if value < self.minimum:
+            self.minimum = value
+        if value > self.maximum:
+            self.maximum = value
+
+    @property
+    def variance(self) -> float:
+        """Sample variance, zero for less than two values."""
+        if self.count < 2:
+            return 0.
+        return self._sum_of_squares / (self.count - 1)
+
+    @property
+    def std(self) -> float:
+        """Sample standard deviation, zero for less than two values."""
+        return math.sqrt(self.variance)
+
+    @property
+    def values(self) -> np.ndarray:
+        """View of the values in the buffer."""
+        return self.buffer[:min(self.count, self.buffer_size)]
+
+    def median(self) -> float:
+        """Median of the values in the buffer."""
+        return float(np.median(self.values))
+
+    def sigma_clipped_mean(self, sigma: float = 3., max_iterations: int = 5) -> float:
+        """Mean of the values in the buffer after iteratively rejecting outliers.
+
+        Values further than `sigma` standard deviations from the median are rejected until no more values are rejected
+        or `max_iterations` is reached.
+
+        Args:
+            sigma (float): Rejection threshold in standard deviations.
+            max_iterations (int): Maximum number of iterations.
+
+        Returns:
+            float: The clipped mean.
+        """
+        values = self.values
+        mask = np.ones(len(values), dtype=bool)
+        for _ in range(max_iterations):
+            kept = values[mask]
+            deviation = kept.std()
+            if deviation == 0:
+                break
+            new_mask = np.abs(values - np.median(kept)) <= sigma * deviation
+            if not new_mask.any() or np.array_equal(new_mask, mask):
+                break
+            mask = new_mask
+        return float(values[mask].mean())
+
+    def get(self, method: str = 'mean', sigma: float = 3.) -> float:
+        """Get the central value using one of `AVERAGING_METHODS`.
+
+        Raises:
+            ValueError: If the method is not known.
+        """
+        if method == 'mean':
+            return self.mean
+        elif method == 'median':
+            return self.median()
+        elif method == 'sigma_clip':
+            return self.sigma_clipped_mean(sigma=sigma)
+        raise ValueError(f"Unknown averaging method {method}, use one of {', '.join(AVERAGING_METHODS)}")
+
+
+class ConstantFieldError(ValueError):
+    """A record has a different value in one of the constant fields of a `RecordAccumulator`."""
+
+
+class RecordAccumulator(object):
+    """Combines records, for instance `SQMReading`, field by field as they arrive.
+
+    Args:
+        fields (tuple): Numeric fields to average.
+        dispersion_fields (tuple): Fields for which the standard deviation, minimum and maximum are also returned as
+            `<field>_std`, `<field>_min` and `<field>_max`.
+        constant_fields (tuple): Fields that must have the same value in every record.
+        method (str): Averaging method, one of `AVERAGING_METHODS`.
+        buffer_size (int): Number of records kept for the robust methods.
+        sigma (float): Rejection threshold for `sigma_clip`.
+    """
+
+    def __init__(self,
+                 fields: tuple,
+                 dispersion_fields: tuple = (),
+                 constant_fields: tuple = (),
+                 method: str = 'mean',
+                 buffer_size: int = 64,
+                 sigma: float = 3.):
+        if method not in AVERAGING_METHODS:
+            raise ValueError(f"Unknown averaging method {method}, use one of {', '.join(AVERAGING_METHODS)}")
+        self.fields = fields
+        self.dispersion_fields = dispersion_fields
+        self.constant_fields = constant_fields
+        self.method = method
+        self.sigma = sigma
+        self.statistics = {field: StreamingStatistics(buffer_size=buffer_size) for field in fields}
+        self.constants = {}
+        self._order = constant_fields + fields
+
+    def __len__(self):
+        return self.statistics[self.fields[0]].count
+
+    def add(self, record):
+        """Fold a record into the statistics.
+
+        Raises:
+            ConstantFieldError: If one of the `constant_fields` differs from the previous records, the record is
+                discarded.
+        """
+        if len(self) == 0 and hasattr(record, '_fields'):
+            self._order = tuple(field for field in record._fields if field in self.constant_fields + self.fields)
+        for field in self.constant_fields:
+            value = getattr(record, field)
+            if self.constants.setdefault(field, value) != value:
+                raise ConstantFieldError(f"Data is not clean, received multiple {field}: {self.constants[field]} and {value}")
+        for field in self.fields:
+            self.statistics[field].add(getattr(record, field))
+
+    def result(self) -> dict:
+        """Get the combined record.
+
+        Returns:
+            dict: Constant and averaged fields, in the order of the record if it is a named tuple, followed by the
+                dispersion fields.
+
+        Raises:
+            ValueError: If no record was added.
+        """
+        if len(self) == 0:
+            raise ValueError("No data has been read")
+        result = {}
+        for field in self._order:
+            if field in self.statistics:
+                result[field] = self.statistics[field].get(method=self.method, sigma=self.sigma)
+            else:
+                result[field] = self.constants[field]
+        for field in self.dispersion_fields:
+            statistics = self.statistics[field]
+            result[f"{field}_std"] = statistics.std
+            result[f"{field}_min"] = statistics.minimum
+            result[f"{field}_max"] = statistics.maximum
+        return result
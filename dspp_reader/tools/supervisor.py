@@ -0,0 +1,214 @@
+import logging
+import multiprocessing
+import os
+import queue
+import signal
+import time
+
+from logging.handlers import QueueHandler, QueueListener
+from pathlib import Path
+from typing import Union
+
+from dspp_reader.tools.common import get_reader_class, reader_registry
+from dspp_reader.tools.engine import ReaderEngine
+from dspp_reader.tools.metrics import start_exporters
+
+logger = logging.getLogger()
+
+# Outputs that are only enabled in the writer process.
+OUTPUT_FIELDS = ['save_to_file', 'save_to_database', 'post_to_api']
+
+
+class QueueReaderEngine(ReaderEngine):
+    """Reader engine that sends the datapoints to a queue instead of storing them.
+
+    Args:
+        devices_config (list): Reader arguments for each device, outputs are disabled.
+        indexes (list): Index of each device in the configuration of the supervisor.
+        records (multiprocessing.Queue): Queue where ``(index, datapoint)`` tuples are put.
+        **kwargs: Other arguments of `ReaderEngine`.
+    """
+
+    def __init__(self, devices_config: list, indexes: list, records, **kwargs):
+        super().__init__(devices_config=[{**config, **{field: False for field in OUTPUT_FIELDS}} for config in devices_config], **kwargs)
+        self.records = records
+        self.indexes = {id(reader): index for reader, index in zip(self.readers, indexes)}
+
+    async def _store(self, reader, data: dict):
+        self.records.put((self.indexes[id(reader)], data))
+        self.datapoints[self._get_name(reader)] += 1
+        logger.debug(f"{self._get_name(reader)}: datapoint read at {data['timestamp']}")
+
+
+def run_worker(devices_config: list, indexes: list, records, logs, level: int, engine_options: dict):
+    """Read a group of devices in a worker process, see `ProcessSupervisor`.
+
+    Args:
+        devices_config (list): Reader arguments for each device of the group.
+        indexes (list): Index of each device in the configuration of the supervisor.
+        records (multiprocessing.Queue): Queue for the datapoints.
+        logs (multiprocessing.Queue): Queue for the log records, they are handled by the supervisor.
+        level (int): Logging level.
+        engine_options (dict): Other arguments of `ReaderEngine`.
+    """
+    # Ctrl+C reaches every process of the group, only the supervisor handles it and then terminates the workers.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    root = logging.getLogger()
+    root.handlers = [QueueHandler(logs)]
+    root.setLevel(level)
+
+    engine = QueueReaderEngine(devices_config=devices_config, indexes=indexes, records=records, stats_interval=0, **engine_options)
+    engine()
+
+
+class ProcessSupervisor(object):
+    """Reads many devices with a pool of worker processes and a single process for the outputs.
+
+    Devices are split into `processes` groups and each group is read by a `ReaderEngine` running in its own process, so
+    reading, parsing and averaging scale across cores. Workers send the datapoints through a queue to this process,
+    which owns the files, database and API queues of every device and stores each datapoint with the reader of its
+    device, exactly as the single process engine does. The queue has no size limit, so a slow output delays only the
+    outputs and never the reading of a device.
+
+    Devices that receive their messages on the same UDP port are always read by the same worker. Workers that die are
+    started again after `restart_delay` seconds. Logs of the workers are sent to this process and handled by its
+    handlers.
+
+    Args:
+        devices_config (list): Reader arguments for each device, see `load_engine_config`.
+        processes (int): Number of worker processes. Defaults to the number of CPUs, up to one per device.
+        stats_interval (float): Seconds between logging the number of datapoints and the size of the queue. Zero disables it.
+        restart_delay (float): Seconds to wait before starting a worker that stopped.
+        metrics_port (int): Serve the Prometheus metrics of this process over HTTP on this port, they cover the outputs
+            but not the reading, which happens in the workers. Optional.
+        metrics_file (Path): Write the Prometheus metrics of this process to this file. Optional.
+        metrics_address (str): Address the metrics are served on with `metrics_port`, only the local host by default.
+        **engine_options: Other arguments of `ReaderEngine` used by the workers, for instance `response_timeout`.
+    """
+
+    def __init__(self,
+                 devices_config: list,
+                 processes: Union[int, None] = None,
+                 stats_interval: float = 600,
+                 restart_delay: float = 10,
+                 metrics_port: Union[int, None] = None,
+                 metrics_file: Union[Path, str, None] = None,
+                 metrics_address: Union[str, None] = None,
+                 **engine_options):
+        self.devices_config = []
+        for config in devices_config:
+            config = dict(config)
+            config.pop('save_logs_to', None)
+            if config.get('device_type') not in reader_registry:
+                raise ValueError(f"Unknown device type {config.get('device_type')} for device {config.get('device_id')}")
+            self.devices_config.append(config)
+        self.readers = [get_reader_class(device_type=config['device_type'])(**config) for config in self.devices_config]
+        self.datapoints = {index: 0 for index in range(len(self.readers))}
+        # devices listening on the same UDP port share its socket, so they are read by the same worker
+        units = {}
+        for index, config in enumerate(self.devices_config):
+            units.setdefault(('udp', config['udp_port']) if config.get('udp_port') else index, []).append(index)
+        units = list(units.values())
+        self.processes = max(1, min(processes or os.cpu_count() or 1, len(units)))
+        self.stats_interval = stats_interval
+        self.restart_delay = restart_delay
+        self.metrics_port = metrics_port
+        self.metrics_file = metrics_file
+        self.metrics_address = metrics_address
+        self.engine_options = engine_options
+
+        self.groups = [sorted(index for unit in units[i::self.processes] for index in unit) for i in range(self.processes)]
+        self.context = multiprocessing.get_context('spawn')
+        self.records = self.context.Queue()
+        self.logs = self.context.Queue()
+        self.workers = [None] * self.processes
+        self._started = [0.] * self.processes
+        self._running = False
+
+    def __call__(self):
+        listener = QueueListener(self.logs, *logging.getLogger().handlers, respect_handler_level=True)
+        listener.start()
+        exporters = start_exporters(metrics_port=self.metrics_port, metrics_file=self.metrics_file, metrics_address=self.metrics_address)
+        try:
+            logger.info(f"Starting {self.processes} worker processes for {len(self.readers)} devices")
+            self.run()
+        except KeyboardInterrupt:
+            logger.info("Supervisor stopped by user")
+        finally:
+            self.stop()
+            for exporter in exporters:
+                exporter.close()
+            listener.stop()
+
+    def run(self):
+        """Start the workers and store their datapoints until `stop` is called."""
+        self._running = True
+        last_stats = time.monotonic()
+        while self._running:
+            self._check_workers()
+            self._store_records(timeout=1)
+            if self.stats_interval and time.monotonic() - last_stats >= self.stats_interval:
+                last_stats = time.monotonic()
+                logger.info(f"Supervisor: {len(self.readers)} devices, {sum(self.datapoints.values())} datapoints, "
+                            f"{sum(worker.is_alive() for worker in self.workers if worker)} workers alive")
+
+    def stop(self, timeout: float = 10):
+        """Stop the workers, store the datapoints they already read and close the outputs.
+
+        Args:
+            timeout (float): Seconds to wait for each worker to stop.
+        """
+        self._running = False
+        for worker in self.workers:
+            if worker is not None and worker.is_alive():
+                worker.terminate()
+        for worker in self.workers:
+            if worker is not None:
+                worker.join(timeout=timeout)
+        self._store_records(timeout=0)
+        for reader in self.readers:
+            reader.close()
+
+    def _check_workers(self):
+        for number, worker in enumerate(self.workers):
+            if worker is not None and worker.is_alive():
+                continue
+            if worker is not None:
+                if time.monotonic() - self._started[number] < self.restart_delay:
+                    continue
+                logger.error(f"Worker {number} stopped with exit code {worker.exitcode}, starting it again")
+            indexes = self.groups[number]
+            worker = self.context.Process(
+                target=run_worker,
+                name=f"dspp-worker-{number}",
+                kwargs={
+                    'devices_config': [self.devices_config[index] for index in indexes],
+                    'indexes': indexes,
+                    'records': self.records,
+                    'logs': self.logs,
+                    'level': logging.getLogger().getEffectiveLevel(),
+                    'engine_options': self.engine_options,
+                },
+                daemon=True)
+            worker.start()
+            self.workers[number] = worker
+            self._started[number] = time.monotonic()
+
+    def _store_records(self, timeout: float):
+        """Store the queued datapoints, waiting up to `timeout` seconds for the first one."""
+        block = timeout > 0
+        while True:
+            try:
+                index, data = self.records.get(block=block, timeout=timeout if block else None)
+            except queue.Empty:
+                return
+            block = False
+            reader = self.readers[index]
+            try:
+                reader.store_data_point(data)
+            except Exception as e:
+                logger.error(f"{reader.device_type.upper()} {reader.device_id}: unable to store datapoint: {e}",
+                             exc_info=logger.getEffectiveLevel() == logging.DEBUG)
+                continue
+            self.datapoints[index] += 1
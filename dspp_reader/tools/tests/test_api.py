@@ -0,0 +1,176 @@
+import gzip
+import json
+import os
+import threading
+import time
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import TestCase, skipUnless
+
+from dspp_reader.tools.api import ApiClient
+
+
+class FakeAPI(object):
+    """HTTP server that records the payloads it receives and answers with the next status code of `status_codes`.
+
+    Single datapoints are posted to ``/api/`` and lists of datapoints to ``/api/bulk/`` when `bulk` is true. With
+    `record` false the payloads are only counted in `received`.
+    """
+
+    def __init__(self, status_codes=None, delay=0., bulk=False, record=True):
+        self.status_codes = list(status_codes or [])
+        self.delay = delay
+        self.bulk = bulk
+        self.record = record
+        self.payloads = []
+        self.received = 0
+        self.requests = 0
+        self.compressed_requests = 0
+        self.connections = set()
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers['Content-Length']))
+                if self.headers.get('Content-Encoding') == 'gzip':
+                    body = gzip.decompress(body)
+                    api.compressed_requests += 1
+                time.sleep(api.delay)
+                api.requests += 1
+                api.connections.add(self.client_address)
+                if self.path.endswith('/bulk/') and not api.bulk:
+                    status_code = 404
+                else:
+                    status_code = api.status_codes.pop(0) if api.status_codes else 201
+                if status_code == 201:
+                    payload = json.loads(body)
+                    payloads = payload if isinstance(payload, list) else [payload]
+                    api.received += len(payloads)
+                    if api.record:
+                        api.payloads.extend(payloads)
+                self.send_response(status_code)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    @property
+    def endpoint(self):
+        return f"http://127.0.0.1:{self.server.server_address[1]}/api/"
+
+    @property
+    def bulk_endpoint(self):
+        return f"{self.endpoint}bulk/"
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class TestApiClient(TestCase):
+
+    def get_api(self, **kwargs):
+        api = FakeAPI(**kwargs)
+        self.addCleanup(api.close)
+        return api
+
+    def get_client(self, api, **kwargs):
+        client = ApiClient(api_endpoint=api.endpoint, api_token='token', **kwargs)
+        self.addCleanup(client.close)
+        return client
+
+    def test_reuses_connection(self):
+        api = self.get_api()
+        client = self.get_client(api=api)
+
+        for i in range(5):
+            self.assertEqual(client.post(payload=json.dumps({'magnitude': 19. + i}))[0], 201)
+
+        self.assertEqual(len(api.payloads), 5)
+        self.assertEqual(len(api.connections), 1)
+
+    def test_post_bulk(self):
+        api = self.get_api(bulk=True)
+        client = self.get_client(api=api, api_bulk_endpoint=api.bulk_endpoint)
+
+        status_code, _ = client.post_bulk(payloads=[json.dumps({'magnitude': 19.}), json.dumps({'magnitude': 20.})])
+
+        self.assertEqual(status_code, 201)
+        self.assertEqual(api.requests, 1)
+        self.assertEqual(api.payloads, [{'magnitude': 19.}, {'magnitude': 20.}])
+
+    def test_bulk_not_supported(self):
+        api = self.get_api(bulk=False)
+        client = self.get_client(api=api, api_bulk_endpoint=api.bulk_endpoint)
+
+        self.assertIsNone(client.post_bulk(payloads=['{}', '{}']))
+        self.assertFalse(client.bulk_supported)
+        self.assertIsNone(client.post_bulk(payloads=['{}', '{}']))
+        self.assertEqual(api.requests, 1)
+
+    def test_without_bulk_endpoint(self):
+        api = self.get_api(bulk=True)
+        client = self.get_client(api=api)
+
+        self.assertIsNone(client.post_bulk(payloads=['{}', '{}']))
+        self.assertEqual(api.requests, 0)
+
+    def test_gzip(self):
+        api = self.get_api()
+        client = self.get_client(api=api, compress=True)
+
+        client.post(payload=json.dumps({'magnitude': 19.}))
+
+        self.assertEqual(api.compressed_requests, 1)
+        self.assertEqual(api.payloads, [{'magnitude': 19.}])
+
+    def test_unreachable(self):
+        client = ApiClient(api_endpoint='http://127.0.0.1:9/api/', api_token='token')
+
+        status_code, response = client.post(payload='{}')
+
+        self.assertIsNone(status_code)
+        self.assertTrue(response)
+
+
+@skipUnless(os.environ.get('DSPP_BENCHMARK'), 'Set DSPP_BENCHMARK=1 to run benchmarks')
+class BenchmarkApiClient(TestCase):
+
+    def test_throughput(self):
+        import requests
+
+        datapoints = 500
+        batch_size = 50
+        payloads = [json.dumps({'magnitude': 19. + i / 1000, 'timestamp': f'2026-01-10T03:{i // 60 % 60:02d}:{i % 60:02d}'}) for i in range(datapoints)]
+        api = FakeAPI(bulk=True)
+        self.addCleanup(api.close)
+
+        start = time.perf_counter()
+        for payload in payloads:
+            requests.post(api.endpoint, data=payload, headers={'Authorization': 'Token token', 'Content-Type': 'application/json'})
+        post_time = time.perf_counter() - start
+
+        with ApiClient(api_endpoint=api.endpoint, api_token='token') as client:
+            start = time.perf_counter()
+            for payload in payloads:
+                client.post(payload=payload)
+            session_time = time.perf_counter() - start
+
+        with ApiClient(api_endpoint=api.endpoint, api_token='token', api_bulk_endpoint=api.bulk_endpoint, compress=True) as client:
+            start = time.perf_counter()
+            for i in range(0, datapoints, batch_size):
+                client.post_bulk(payloads=payloads[i:i + batch_size])
+            bulk_time = time.perf_counter() - start
+
+        self.assertEqual(len(api.payloads), 3 * datapoints)
+        print(f"\nrequests.post: {datapoints / post_time:.0f} datapoints/s, session: {datapoints / session_time:.0f} datapoints/s, "
+              f"bulk of {batch_size} with gzip: {datapoints / bulk_time:.0f} datapoints/s")
+        self.assertLess(session_time, post_time)
+        self.assertLess(bulk_time, session_time)
@@ -0,0 +1,210 @@
+import datetime
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from pathlib import Path
+from unittest import TestCase, skipUnless
+
+from dspp_reader.tools.archive import ArchiveIndex, NightFileReader, get_unix_times, open_night_file
+from dspp_reader.tools.backfill import read_night_file
+from dspp_reader.tools.tests.test_backfill import SQMLE_COLUMNS, get_sqmle_line, write_sqmle_file, write_tessw4c_file
+from dspp_reader.tools.writers import ColumnarNightWriter
+
+try:
+    import pyarrow
+except ImportError:  # pragma: no cover
+    pyarrow = None
+
+# timestamp of the first row written by `write_sqmle_file`, rows are 30 seconds apart
+START = datetime.datetime(2026, 1, 11, tzinfo=datetime.UTC)
+
+
+class TestNightFileReader(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.filename = Path(self.directory.name) / '20260110_sqmle_1823.tsv'
+
+    def test_columns(self):
+        write_sqmle_file(filename=self.filename, rows=10)
+
+        with NightFileReader(filename=self.filename) as night_file:
+            self.assertEqual(len(night_file), 10)
+            self.assertEqual(night_file.columns, SQMLE_COLUMNS)
+            self.assertEqual(night_file.units, {'magnitude': 'mag', 'temperature': 'C'})
+            self.assertEqual(night_file.device_type, 'sqm-le')
+            self.assertEqual(night_file['magnitude'].dtype, np.float64)
+            self.assertAlmostEqual(night_file['magnitude'][9], 19.00009)
+            self.assertEqual(night_file['site'][0], 'ctio')
+            self.assertEqual(night_file.times[1] - night_file.times[0], 30)
+            self.assertEqual(night_file.times[0], START.timestamp())
+            self.assertRaises(KeyError, night_file.__getitem__, 'F1_freq')
+
+    def test_partial_and_invalid_rows(self):
+        write_sqmle_file(filename=self.filename, rows=3, separator=',')
+        self.filename.rename(self.filename.with_suffix('.csv'))
+        filename = self.filename.with_suffix('.csv')
+        with open(filename, 'a') as f:
+            f.write('r,19.1,22.0\n')
+            f.write(get_sqmle_line(i=3, separator=',').replace('\n', '\r\n'))
+            f.write(get_sqmle_line(i=4, separator=',')[:-10])
+
+        with self.assertLogs(level='WARNING'), NightFileReader(filename=filename) as night_file:
+            self.assertEqual(len(night_file), 4)
+            self.assertEqual(night_file.size, os.path.getsize(filename) - len(get_sqmle_line(i=4, separator=',')) + 10)
+            self.assertEqual(night_file['elevation'][3], 2174.)
+
+    def test_missing_values(self):
+        write_sqmle_file(filename=self.filename, rows=2)
+        with open(self.filename, 'a') as f:
+            f.write(get_sqmle_line(i=2).replace('\t27.0\t', '\tNone\t').replace('\tctio\t', '\tNone\t'))
+
+        with NightFileReader(filename=self.filename) as night_file:
+            self.assertTrue(np.isnan(night_file['temperature'][2]))
+            self.assertIsNone(night_file['site'][2])
+
+    def test_to_array(self):
+        write_sqmle_file(filename=self.filename, rows=10)
+
+        with NightFileReader(filename=self.filename) as night_file:
+            array = night_file.to_array(columns=['timestamp', 'magnitude'], start=START + datetime.timedelta(seconds=60), end=START.timestamp() + 150)
+
+        self.assertEqual(array.dtype.names, ('timestamp', 'magnitude'))
+        self.assertEqual(len(array), 3)
+        self.assertAlmostEqual(array['magnitude'][0], 19.00002)
+
+    def test_empty(self):
+        write_sqmle_file(filename=self.filename, rows=0)
+
+        with NightFileReader(filename=self.filename) as night_file:
+            self.assertEqual(len(night_file), 0)
+            self.assertEqual(len(night_file.to_array()), 0)
+
+    def test_space_separated_tessw4c_file(self):
+        filename = Path(self.directory.name) / '20260110_tessw4c_stars1567.txt'
+        write_tessw4c_file(filename=filename, separator=' ')
+
+        with NightFileReader(filename=filename) as night_file:
+            self.assertEqual(len(night_file), 1)
+            self.assertEqual(night_file.device_type, 'tess-w4c')
+            self.assertEqual(night_file['latitude'][0], -30.169166)
+            self.assertEqual(night_file['elevation'][0], 2174.)
+            self.assertEqual(night_file['azimuth'][0], 0.)
+            self.assertEqual(night_file['site'][0], 'ctio')
+            self.assertEqual(night_file['timezone'][0], 'America/Santiago')
+
+    def test_get_unix_times(self):
+        timestamps = np.array(['2026-01-11T00:00:00+00:00', '2026-01-11T00:00:00.500000+00:00'])
+
+        self.assertEqual(get_unix_times(timestamps).tolist(), [START.timestamp(), START.timestamp() + 0.5])
+        self.assertEqual(get_unix_times(np.array(['2026-01-10T21:00:00-03:00', None], dtype=object))[0], START.timestamp())
+
+
+@skipUnless(pyarrow, 'pyarrow is not installed')
+class TestColumnarNightReader(TestCase):
+
+    def test_arrow_before_close(self):
+        with tempfile.TemporaryDirectory() as directory:
+            writer = ColumnarNightWriter(save_files_to=directory, device_name='1823', device_type='sqmle', file_format='arrow', flush_every=2)
+            for i in range(5):
+                timestamp = START + datetime.timedelta(seconds=30 * i)
+                filename = writer.write(record={'magnitude': 19. + i / 100, 'temperature': 20., 'timestamp': timestamp.isoformat()}, units={'magnitude': 'mag'})
+
+            with open_night_file(filename) as night_file:
+                self.assertEqual(len(night_file), 4)
+                self.assertEqual(night_file.units, {'magnitude': 'mag'})
+                self.assertEqual(night_file.times[3], START.timestamp() + 90)
+                self.assertEqual(len(night_file.to_array(start=START.timestamp() + 60)), 2)
+            writer.close()
+
+
+class TestArchiveIndex(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.path = Path(self.directory.name)
+        (self.path / 'ctio').mkdir()
+        write_sqmle_file(filename=self.path / 'ctio' / '20260110_sqmle_1823.tsv', rows=10)
+        write_sqmle_file(filename=self.path / '20260110_sqmle_1900.tsv', rows=5)
+        (self.path / 'notes.txt').write_text('not a data file\n')
+        self.index = ArchiveIndex(directory=self.path)
+        self.addCleanup(self.index.close)
+
+    def test_update(self):
+        self.assertEqual(self.index.update(), 2)
+        self.assertEqual(self.index.update(), 0)
+        entry = self.index.query(device_id='1823')[0]
+
+        self.assertEqual(entry.filename, Path('ctio/20260110_sqmle_1823.tsv'))
+        self.assertEqual(entry.night, datetime.date(2026, 1, 10))
+        self.assertEqual(entry.device_type, 'sqm-le')
+        self.assertEqual(entry.rows, 10)
+        self.assertEqual((entry.first_time, entry.last_time), (START.timestamp(), START.timestamp() + 270))
+
+        write_sqmle_file(filename=self.path / 'ctio' / '20260110_sqmle_1823.tsv', rows=2, start=10)
+        (self.path / '20260110_sqmle_1900.tsv').unlink()
+        self.assertEqual(self.index.update(), 1)
+        self.assertEqual(len(self.index), 1)
+        self.assertEqual(self.index.query(device_id='1823')[0].rows, 12)
+
+    def test_query(self):
+        self.index.update()
+
+        self.assertEqual(len(self.index.query(start=START + datetime.timedelta(seconds=200))), 1)
+        self.assertEqual(len(self.index.query(end=START + datetime.timedelta(seconds=10))), 2)
+        self.assertEqual(self.index.query(end=START), [])
+        self.assertEqual(len(self.index.query(device_type='sqm-le')), 2)
+
+    def test_read(self):
+        self.index.update()
+
+        data = self.index.read(start=START + datetime.timedelta(seconds=60), columns=['timestamp', 'magnitude'])
+
+        self.assertEqual(set(data.keys()), {('sqm-le', '1823'), ('sqm-le', '1900')})
+        self.assertEqual(len(data[('sqm-le', '1823')]), 8)
+        self.assertEqual(len(data[('sqm-le', '1900')]), 3)
+
+    def test_space_separated_tessw4c_file(self):
+        write_tessw4c_file(filename=self.path / '20260110_tessw4c_stars1567.txt', separator=' ')
+        self.index.update()
+
+        entry = self.index.query(device_type='tess-w4c')[0]
+        self.assertEqual((entry.device_id, entry.rows), ('stars1567', 1))
+        self.assertEqual(entry.first_time, datetime.datetime(2026, 1, 11, 3, tzinfo=datetime.UTC).timestamp())
+
+    def test_persistent(self):
+        self.index.update()
+        self.index.close()
+
+        with ArchiveIndex(directory=self.path) as index:
+            self.assertEqual(len(index), 2)
+            self.assertEqual(index.update(), 0)
+
+
+@skipUnless(os.environ.get('DSPP_BENCHMARK'), 'Set DSPP_BENCHMARK=1 to run benchmarks')
+class BenchmarkNightFileReader(TestCase):
+
+    def test_large_file(self):
+        rows = 200000
+        with tempfile.TemporaryDirectory() as directory:
+            filename = Path(directory) / '20260110_sqmle_1823.tsv'
+            write_sqmle_file(filename=filename, rows=rows)
+
+            start = time.perf_counter()
+            magnitudes = [record['magnitude'] for _, _, record in read_night_file(filename=filename)]
+            line_by_line = time.perf_counter() - start
+
+            start = time.perf_counter()
+            with NightFileReader(filename=filename) as night_file:
+                array = night_file.to_array(columns=['timestamp', 'magnitude'], start=START.timestamp() + 30 * rows / 2)
+            memory_mapped = time.perf_counter() - start
+
+        print(f"\nNight file: {rows / line_by_line:.0f} rows/s line by line, {rows / memory_mapped:.0f} rows/s memory-mapped")
+        self.assertEqual(len(magnitudes), rows)
+        self.assertEqual(len(array), rows / 2)
+        self.assertLess(memory_mapped, line_by_line)
@@ -0,0 +1,226 @@
+import datetime
+import os
+import tempfile
+import time
+import tracemalloc
+
+from pathlib import Path
+from unittest import TestCase, skipUnless
+
+from dspp_reader.sqmle.sqmle import SQMLE
+from dspp_reader.tools.api import ApiClient
+from dspp_reader.tools.backfill import Backfill, Checkpoints, find_night_files, read_night_file
+from dspp_reader.tools.scripts import backfill
+from dspp_reader.tools.tests.test_api import FakeAPI
+from dspp_reader.tools.tests.test_connection import RESPONSE
+from dspp_reader.tools.tests.test_engine import SITE_CONFIG, TESS_MESSAGE
+
+SQMLE_COLUMNS = ['type', 'magnitude', 'frequency', 'period_count', 'period_seconds', 'temperature', 'serial_number', 'timestamp',
+                 'localtime', 'device', 'altitude', 'azimuth', 'site', 'timezone', 'latitude', 'longitude', 'elevation']
+
+
+def get_sqmle_line(i, separator='\t'):
+    timestamp = datetime.datetime(2026, 1, 11, tzinfo=datetime.UTC) + datetime.timedelta(seconds=30 * i)
+    values = ['r', f'{19 + i / 1e5:.5f}', '22.0', '0.0', '0.0', '27.0', '1823', timestamp.isoformat(), timestamp.isoformat(),
+              'sqm-le', '90', '0', 'ctio', 'America/Santiago', '-30.169166', '-70.804', '2174.0']
+    return f"{separator.join(values)}\n"
+
+
+def write_sqmle_file(filename, rows, separator='\t', start=0):
+    with open(filename, 'a') as f:
+        if start == 0:
+            f.write(f"# Filename {filename}\n# magnitude: mag\n# temperature: C\n# {separator.join(SQMLE_COLUMNS)}\n")
+        for i in range(start, start + rows):
+            f.write(get_sqmle_line(i=i, separator=separator))
+
+
+def write_tessw4c_file(filename, separator=','):
+    """Write a row of a TESS-W4C file, the site coordinates have units as written by the reader."""
+    columns = ['udp', 'rev', 'name', 'wdBm', 'hash', 'ain', *[f"F{channel}_{field}" for channel in range(1, 5) for field in ['freq', 'mag', 'zp']],
+               'tamb', 'tsky', 'timestamp', 'localtime', 'device', 'serial_number', 'altitude', 'azimuth', 'site', 'timezone',
+               'latitude', 'longitude', 'elevation']
+    values = [TESS_MESSAGE[key] for key in ['udp', 'rev', 'name', 'wdBm', 'hash', 'ain']]
+    values += [TESS_MESSAGE[f"F{channel}"][field] for channel in range(1, 5) for field in ['freq', 'mag', 'zp']]
+    values += [TESS_MESSAGE['tamb'], TESS_MESSAGE['tsky'], '2026-01-11T03:00:00+00:00', '2026-01-11T00:00:00-03:00', 'tess-w4c',
+               'stars1567', 90, 0, 'ctio', 'America/Santiago', '-30.169166 deg', '-70.804 deg', '2174.0 m']
+    filename.write_text(f"# File name: {filename}\n# {separator.join(columns)}\n{separator.join(map(str, values))}\n")
+
+
+class TestBackfill(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.path = Path(self.directory.name)
+        self.checkpoints = Checkpoints(filename=self.path / 'checkpoints' / 'dspp_backfill.sqlite')
+        self.addCleanup(self.checkpoints.close)
+
+    def get_api(self, **kwargs):
+        api = FakeAPI(**kwargs)
+        self.addCleanup(api.close)
+        return api
+
+    def get_backfill(self, api, bulk=True, **kwargs):
+        return Backfill(
+            get_client=lambda: ApiClient(api_endpoint=api.endpoint, api_token='token', api_bulk_endpoint=api.bulk_endpoint if bulk else None),
+            checkpoints=self.checkpoints,
+            site_name='Cerro Tololo',
+            min_backoff=0.01,
+            **kwargs)
+
+    def test_same_payload_as_reader(self):
+        reader_api = self.get_api()
+        reader = SQMLE(**{**SITE_CONFIG, 'save_to_file': True}, device_id='1', device_altitude=90, device_azimuth=0, device_ip='127.0.0.1',
+                       save_files_to=self.path, post_to_api=True, api_endpoint=reader_api.endpoint, api_token='token')
+        self.addCleanup(reader.close)
+        accumulator = reader.create_accumulator()
+        for _ in range(3):
+            accumulator.add(reader.process_response(response=RESPONSE.decode()))
+        reader.store_data_point(data=reader.combine_measurements(accumulator=accumulator, timestamp=datetime.datetime.now(datetime.UTC)))
+        reader.writer.flush()
+        end = time.monotonic() + 5
+        while not reader_api.payloads and time.monotonic() < end:
+            time.sleep(0.01)
+
+        api = self.get_api()
+        filenames = find_night_files(paths=[self.path])
+        results = self.get_backfill(api=api)(filenames=filenames)
+
+        self.assertEqual(list(results.values()), [1])
+        self.assertEqual(api.payloads, reader_api.payloads)
+
+    def test_tessw4c_file(self):
+        self.assert_tessw4c_file(filename=self.path / '20260110_stars1567.csv', separator=',')
+
+    def test_tessw4c_space_separated_file(self):
+        self.assert_tessw4c_file(filename=self.path / '20260110_stars1567.txt', separator=' ')
+
+    def assert_tessw4c_file(self, filename, separator):
+        write_tessw4c_file(filename=filename, separator=separator)
+
+        api = self.get_api()
+        self.get_backfill(api=api)(filenames=[filename])
+
+        payload = api.payloads[0]
+        self.assertEqual(payload['message_id'], 542411)
+        self.assertEqual(payload['channel_3'], {'frequency': 76923.1, 'magnitude': 7.77, 'zeropoint': 19.99})
+        self.assertEqual(payload['sky_temperature'], -10.23)
+        self.assertEqual(payload['device']['serial_number'], 'stars1567')
+        self.assertEqual(payload['device']['site']['name'], 'Cerro Tololo')
+        self.assertEqual(payload['device']['site']['latitude'], -30.169166)
+        self.assertEqual(payload['device']['site']['elevation'], 2174.0)
+
+    def test_batches_and_resumes(self):
+        filename = self.path / '20260110_sqmle_1823.tsv'
+        write_sqmle_file(filename=filename, rows=25)
+        api = self.get_api(bulk=True)
+        uploader = self.get_backfill(api=api, batch_size=10)
+
+        self.assertEqual(uploader.upload_file(filename=filename), 25)
+        self.assertEqual(api.requests, 3)
+        self.assertEqual(uploader.upload_file(filename=filename), 0)
+
+        write_sqmle_file(filename=filename, rows=5, start=25)
+        self.assertEqual(uploader.upload_file(filename=filename), 5)
+
+        self.assertEqual([payload['magnitude'] for payload in api.payloads], [round(19 + i / 1e5, 5) for i in range(30)])
+        self.assertEqual(self.checkpoints.get(filename=filename.resolve()), (os.path.getsize(filename), 30, 0))
+
+    def test_resumes_after_failure_without_duplicates(self):
+        filename = self.path / '20260110_sqmle_1823.csv'
+        write_sqmle_file(filename=filename, rows=30, separator=',')
+        api = self.get_api(bulk=True, status_codes=[201, 503, 503])
+        uploader = self.get_backfill(api=api, batch_size=10, retries=2)
+
+        results = uploader(filenames=[filename])
+
+        self.assertEqual(results, {filename: None})
+        self.assertEqual(len(api.payloads), 10)
+        self.assertEqual(uploader.upload_file(filename=filename), 20)
+        self.assertEqual([payload['magnitude'] for payload in api.payloads], [round(19 + i / 1e5, 5) for i in range(30)])
+
+    def test_single_posts_resume_after_failure_without_duplicates(self):
+        filename = self.path / '20260110_sqmle_1823.tsv'
+        write_sqmle_file(filename=filename, rows=10)
+        api = self.get_api(status_codes=[201, 201, 400, 503, 503])
+        uploader = self.get_backfill(api=api, bulk=False, batch_size=10, retries=2)
+
+        self.assertEqual(uploader(filenames=[filename]), {filename: None})
+        self.assertEqual(self.checkpoints.get(filename=filename.resolve())[1:], (2, 1))
+        self.assertEqual(uploader.upload_file(filename=filename), 7)
+        self.assertEqual([payload['magnitude'] for payload in api.payloads], [round(19 + i / 1e5, 5) for i in range(10) if i != 2])
+
+    def test_authentication_error_keeps_checkpoint(self):
+        filename = self.path / '20260110_sqmle_1823.tsv'
+        write_sqmle_file(filename=filename, rows=3)
+        for bulk in [True, False]:
+            with self.subTest(bulk=bulk):
+                api = self.get_api(bulk=bulk, status_codes=[401])
+
+                with self.assertLogs(level='ERROR'):
+                    self.assertEqual(self.get_backfill(api=api, bulk=bulk)(filenames=[filename]), {filename: None})
+                self.assertEqual(api.requests, 1)
+                self.assertEqual(self.checkpoints.get(filename=filename.resolve()), (0, 0, 0))
+
+    def test_single_posts_and_rejected_rows(self):
+        filename = self.path / '20260110_sqmle_1823.txt'
+        write_sqmle_file(filename=filename, rows=3, separator=' ')
+        api = self.get_api(status_codes=[201, 400, 201])
+
+        self.assertEqual(self.get_backfill(api=api, bulk=False)(filenames=[filename]), {filename: 2})
+        self.assertEqual(self.checkpoints.get(filename=filename.resolve())[1:], (2, 1))
+
+    def test_does_not_read_incomplete_line(self):
+        filename = self.path / '20260110_sqmle_1823.tsv'
+        write_sqmle_file(filename=filename, rows=2)
+        with open(filename, 'a') as f:
+            f.write(get_sqmle_line(i=2)[:20])
+
+        rows = [row for _, _, row in read_night_file(filename=filename)]
+
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(rows[1]['magnitude'], 19.00001)
+        self.assertEqual(rows[1]['serial_number'], '1823')
+
+    def test_script(self):
+        write_sqmle_file(filename=self.path / '20260110_sqmle_1823.tsv', rows=5)
+        write_sqmle_file(filename=self.path / '20260111_sqmle_1823.tsv', rows=5)
+        api = self.get_api(bulk=True)
+
+        backfill([str(self.path), '--api-endpoint', api.endpoint, '--api-token', 'token', '--api-bulk-endpoint', api.bulk_endpoint,
+                  '--checkpoint-file', str(self.path / 'script.sqlite'), '--workers', '2'])
+
+        self.assertEqual(len(api.payloads), 10)
+        self.assertEqual(api.requests, 2)
+
+
+@skipUnless(os.environ.get('DSPP_BENCHMARK'), 'Set DSPP_BENCHMARK=1 to run benchmarks')
+class BenchmarkBackfill(TestCase):
+
+    def test_large_file(self):
+        rows = 200000
+        with tempfile.TemporaryDirectory() as directory:
+            filenames = [Path(directory) / f'2026011{night}_sqmle_1823.tsv' for night in range(2)]
+            for filename in filenames:
+                write_sqmle_file(filename=filename, rows=rows)
+            api = FakeAPI(bulk=True, record=False)
+            self.addCleanup(api.close)
+            checkpoints = Checkpoints(filename=Path(directory) / 'dspp_backfill.sqlite')
+            uploader = Backfill(get_client=lambda: ApiClient(api_endpoint=api.endpoint, api_token='token', api_bulk_endpoint=api.bulk_endpoint),
+                                checkpoints=checkpoints,
+                                batch_size=500)
+
+            start = time.perf_counter()
+            uploader.upload_file(filename=filenames[0])
+            elapsed = time.perf_counter() - start
+
+            tracemalloc.start()
+            uploader.upload_file(filename=filenames[1])
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            checkpoints.close()
+            size = os.path.getsize(filenames[1])
+
+        print(f"\nBackfill: {rows / elapsed:.0f} rows/s, file of {size / 1e6:.1f} MB, peak memory {peak / 1e6:.1f} MB")
+        self.assertEqual(api.received, 2 * rows)
+        self.assertLess(peak, size / 10)
@@ -0,0 +1,227 @@
+"""Benchmarks of the acquisition path, compared against the stored baselines.
+
+Run with ``DSPP_BENCHMARK=1 python -m pytest -s dspp_reader/tools/tests/test_benchmarks.py`` or ``tox -e benchmark``. A
+result worse than its baseline by more than ``DSPP_BENCHMARK_TOLERANCE`` times, 0.5 by default, fails, so only large
+regressions are caught on slower machines. ``DSPP_BENCHMARK_SAVE=1`` writes the results as the new baselines.
+"""
+import asyncio
+import datetime
+import json
+import logging
+import os
+import statistics
+import tempfile
+import time
+
+from pathlib import Path
+from unittest import TestCase, skipUnless
+
+from dspp_reader.sqmle.sqmle import READ_WITH_SERIAL_NUMBER, SQMLE
+from dspp_reader.tools.codec import decode_tess_message, dumps, flatten_tess_message, get_tessw4c_payload
+from dspp_reader.tools.engine import ReaderEngine
+from dspp_reader.tools.generics import augment_data, clean_data, get_filename, setup_logging, stop_logging
+from dspp_reader.tools.simulator import DeviceSimulator, SimulatedSQMLE, SimulatedTESSW4C
+from dspp_reader.tools.site import Site
+from dspp_reader.tools.tests.test_connection import RESPONSE, FakeDevice
+from dspp_reader.tools.tests.test_engine import SITE_CONFIG, TESS_MESSAGE
+from dspp_reader.tools.writers import NightFileWriter
+
+BASELINES_FILE = Path(__file__).parent / 'benchmark_baselines.json'
+
+TOLERANCE = float(os.environ.get('DSPP_BENCHMARK_TOLERANCE', 0.5))
+
+RESULTS = {}
+
+
+def measure(function, repetitions: int, rounds: int = 3) -> float:
+    """Get the best rate of a function over a few rounds.
+
+    Args:
+        function (callable): Function without arguments.
+        repetitions (int): Calls per round.
+        rounds (int): Number of rounds.
+
+    Returns:
+        float: Calls per second.
+    """
+    best = float('inf')
+    for _ in range(rounds):
+        start = time.perf_counter()
+        for _ in range(repetitions):
+            function()
+        best = min(best, time.perf_counter() - start)
+    return repetitions / best
+
+
+def load_baselines() -> dict:
+    if not BASELINES_FILE.exists():
+        return {}
+    return json.loads(BASELINES_FILE.read_text())
+
+
+def tearDownModule():
+    if not RESULTS:
+        return
+    print('\n' + '\n'.join(f"{name:>32}: {result['value']:12.1f} {result['unit']}" for name, result in RESULTS.items()))
+    if os.environ.get('DSPP_BENCHMARK_SAVE'):
+        baselines = load_baselines()
+        baselines.update({name: {**result, 'value': round(result['value'], 1)} for name, result in RESULTS.items()})
+        BASELINES_FILE.write_text(json.dumps(dict(sorted(baselines.items())), indent=2) + '\n')
+
+
+class BaselineMixin(object):
+
+    def check_result(self, name: str, value: float, unit: str, higher_is_better: bool = True):
+        """Save a result and compare it with its baseline."""
+        RESULTS[name] = {'value': value, 'unit': unit, 'higher_is_better': higher_is_better}
+        baseline = load_baselines().get(name)
+        if baseline is None or os.environ.get('DSPP_BENCHMARK_SAVE'):
+            return
+        if higher_is_better:
+            self.assertGreater(value, baseline['value'] * TOLERANCE, f"{name} regressed: {value:.1f} {unit}, baseline {baseline['value']} {unit}")
+        else:
+            self.assertLess(value, baseline['value'] / TOLERANCE, f"{name} regressed: {value:.1f} {unit}, baseline {baseline['value']} {unit}")
+
+
+def get_sqmle_reader(**kwargs) -> SQMLE:
+    return SQMLE(**{**SITE_CONFIG, **kwargs}, device_id='1', device_altitude=90, device_azimuth=0, device_ip='127.0.0.1')
+
+
+@skipUnless(os.environ.get('DSPP_BENCHMARK'), 'Set DSPP_BENCHMARK=1 to run benchmarks')
+class BenchmarkAcquisitionPath(BaselineMixin, TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.directory = tempfile.TemporaryDirectory()
+        cls.reader = get_sqmle_reader(save_to_file=True, save_files_to=cls.directory.name)
+        cls.response = RESPONSE.decode()
+        cls.timestamp = datetime.datetime.now(datetime.UTC)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.reader.close()
+        cls.directory.cleanup()
+
+    def get_data_point(self) -> dict:
+        accumulator = self.reader.create_accumulator()
+        for _ in range(5):
+            accumulator.add(self.reader.process_response(response=self.response))
+        return self.reader.combine_measurements(accumulator=accumulator, timestamp=self.timestamp)
+
+    def test_sqmle_parse_data(self):
+        rate = measure(lambda: self.reader._parse_data(data=self.response, command=READ_WITH_SERIAL_NUMBER), repetitions=20000)
+
+        self.check_result(name='sqmle_parse_data', value=rate, unit='responses/s')
+
+    def test_sqmle_combine_measurements(self):
+        rate = measure(self.get_data_point, repetitions=2000)
+
+        self.check_result(name='sqmle_combine_measurements', value=rate, unit='datapoints/s')
+
+    def test_augment_data(self):
+        rate = measure(lambda: augment_data(data=dict(TESS_MESSAGE), timestamp=self.timestamp, device=self.reader.device), repetitions=5000)
+
+        self.check_result(name='augment_data', value=rate, unit='datapoints/s')
+
+    def test_clean_data(self):
+        data = self.get_data_point()
+
+        rate = measure(lambda: clean_data(data), repetitions=5000)
+
+        self.check_result(name='clean_data', value=rate, unit='datapoints/s')
+
+    def test_get_filename(self):
+        rate = measure(lambda: get_filename(save_files_to=Path(self.directory.name), device_name='1', device_type='sqmle', file_format='tsv'),
+                       repetitions=5000)
+
+        self.check_result(name='get_filename', value=rate, unit='calls/s')
+
+    def test_site_get_time_range(self):
+        site = Site(id='ctio', name='CTIO', latitude=-30.169166, longitude=-70.804, elevation=2174, timezone='America/Santiago')
+        site.get_time_range()
+
+        rate = measure(site.get_time_range, repetitions=500)
+
+        self.check_result(name='site_get_time_range', value=rate, unit='calls/s')
+
+    def test_tessw4c_json(self):
+        data = json.dumps(TESS_MESSAGE).encode()
+        device = {'type': 'tess-w4c', 'serial_number': 'stars1567'}
+
+        def handle():
+            row = flatten_tess_message(data=decode_tess_message(data=data))
+            return '\t'.join(map(str, row.values())), dumps(get_tessw4c_payload(row=row, device=device))
+
+        rate = measure(handle, repetitions=20000)
+
+        self.check_result(name='tessw4c_json', value=rate, unit='messages/s')
+
+    def test_night_file_writer(self):
+        with NightFileWriter(save_files_to=self.directory.name, device_name='writer', device_type='sqmle', file_format='tsv', flush_every=100) as writer:
+            rate = measure(lambda: writer.write(line='1\t2\t3\n', header=lambda filename: '# header\n'), repetitions=20000)
+
+        self.check_result(name='night_file_writer', value=rate, unit='lines/s')
+
+    def test_sqmle_store_to_file(self):
+        data = self.get_data_point()
+
+        rate = measure(lambda: self.reader.store_data_point(data=data), repetitions=2000)
+
+        self.check_result(name='sqmle_store_to_file', value=rate, unit='datapoints/s')
+
+    def test_debug_logging(self):
+        root = logging.getLogger()
+        self.addCleanup(root.setLevel, root.level)
+        self.addCleanup(stop_logging)
+        logger = setup_logging(debug=True, device_type='sqm-le', device_id='benchmark', save_logs_to=self.directory.name)
+
+        rate = measure(lambda: logger.debug(f"Response: {self.response}"), repetitions=20000)
+
+        self.check_result(name='debug_logging', value=rate, unit='records/s')
+
+
+@skipUnless(os.environ.get('DSPP_BENCHMARK'), 'Set DSPP_BENCHMARK=1 to run benchmarks')
+class BenchmarkEndToEnd(BaselineMixin, TestCase):
+
+    def test_sqmle_reader(self):
+        device = FakeDevice()
+        self.addCleanup(device.close)
+        reader = get_sqmle_reader(device_port=device.port, number_of_reads=5, reads_spacing=0)
+        self.addCleanup(reader.close)
+
+        durations = []
+        for _ in range(200):
+            start = time.perf_counter()
+            reader.get_data_point()
+            durations.append(time.perf_counter() - start)
+
+        self.check_result(name='sqmle_reader', value=len(durations) / sum(durations), unit='datapoints/s')
+        self.check_result(name='sqmle_reader_p99_latency', value=statistics.quantiles(durations, n=100)[98] * 1e3, unit='ms', higher_is_better=False)
+
+    def test_engine(self):
+        simulator = DeviceSimulator(devices=[SimulatedSQMLE(serial_number=number) for number in range(20)] +
+                                            [SimulatedTESSW4C(name=f'stars{number}', interval=0.01) for number in range(20)])
+        simulator.start_in_thread()
+        self.addCleanup(simulator.close)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        devices_config = simulator.get_engine_config()['devices']
+        for config in devices_config:
+            config.update(SITE_CONFIG, save_to_file=True, save_files_to=directory.name)
+            if config['device_type'] == 'sqm-le':
+                config.update(number_of_reads=5, reads_spacing=0)
+            else:
+                config.update(stream_policy='all')
+        engine = ReaderEngine(devices_config=devices_config, stats_interval=0)
+        seconds = 3
+
+        async def run_for():
+            try:
+                await asyncio.wait_for(engine.run(), timeout=seconds)
+            except asyncio.TimeoutError:
+                pass
+        asyncio.run(run_for())
+        engine.executor.shutdown(wait=True)
+
+        self.assertTrue(all(count > 0 for count in engine.datapoints.values()))
+        self.check_result(name='engine_40_devices', value=sum(engine.datapoints.values()) / seconds, unit='datapoints/s')
@@ -0,0 +1,75 @@
+from types import SimpleNamespace
+from unittest import TestCase
+
+from dspp_reader.sqmle.sqmle import SQMLE
+from dspp_reader.tessw4c.tessw4c import TESSW4C
+from dspp_reader.tools.cadence import AdaptiveCadence
+from dspp_reader.tools.generics import get_next_local_noon
+from dspp_reader.tools.tests.test_engine import SITE_CONFIG, TESS_MESSAGE
+
+# 2026-01-15 06:00 UTC, during the night in Chile
+NIGHT = 1768456800.
+
+
+class TestAdaptiveCadence(TestCase):
+
+    def setUp(self):
+        self.cadence = AdaptiveCadence(min_delay=5, max_delay=40)
+
+    def test_backs_off_while_stable(self):
+        delays = [self.cadence.update(magnitude=21.3, when=NIGHT + 60 * index) for index in range(5)]
+
+        self.assertEqual(delays, [10, 20, 40, 40, 40])
+
+    def test_fast_change(self):
+        for index in range(4):
+            self.cadence.update(magnitude=21.3, when=NIGHT + 60 * index)
+
+        self.assertEqual(self.cadence.update(magnitude=20.8, when=NIGHT + 240), 5)
+        self.assertEqual(self.cadence.update(magnitude=20.8, when=NIGHT + 245), 10)
+
+    def test_dispersion(self):
+        self.cadence.update(magnitude=21.3, dispersion=0.01, when=NIGHT)
+
+        self.assertEqual(self.cadence.update(magnitude=21.3, dispersion=0.2, when=NIGHT + 60), 5)
+
+    def test_twilight(self):
+        site = SimpleNamespace(is_within_window=lambda sun_altitude, when: sun_altitude == -10)
+        cadence = AdaptiveCadence(min_delay=5, max_delay=40, site=site, sun_altitude=-10)
+
+        self.assertEqual([cadence.update(magnitude=21.3, when=NIGHT + 60 * index) for index in range(3)], [5, 5, 5])
+
+    def test_max_datapoints_per_night(self):
+        cadence = AdaptiveCadence(min_delay=5, max_delay=40, max_datapoints_per_night=3)
+        night_end = get_next_local_noon(when=NIGHT).timestamp()
+
+        self.assertEqual(cadence.update(magnitude=21.3, when=NIGHT), (night_end - NIGHT) / 3)
+        cadence.update(magnitude=21.3, when=NIGHT + 60)
+        self.assertEqual(cadence.update(magnitude=21.3, when=NIGHT + 120), night_end - NIGHT - 120)
+        next_night_end = get_next_local_noon(when=night_end + 60).timestamp()
+        self.assertEqual(cadence.update(magnitude=21.3, when=night_end + 60), (next_night_end - night_end - 60) / 3)
+
+    def test_invalid_delays(self):
+        self.assertRaises(ValueError, AdaptiveCadence, min_delay=60, max_delay=30)
+
+
+class TestReaderCadence(TestCase):
+
+    def test_sqmle(self):
+        config = {**SITE_CONFIG, 'delay_between_reads': 60, 'sun_altitude': -18}
+        fixed = SQMLE(**config, device_id='cadence1', device_altitude=90, device_azimuth=0, device_ip='127.0.0.1')
+        adaptive = SQMLE(**config, device_id='cadence2', device_altitude=90, device_azimuth=0, device_ip='127.0.0.1',
+                         adaptive_cadence=True, min_delay_between_reads=2)
+        self.addCleanup(fixed.close)
+        self.addCleanup(adaptive.close)
+
+        self.assertEqual(fixed.get_delay(data={'magnitude': 21.3, 'magnitude_std': 0.5}), 60)
+        self.assertEqual(adaptive.get_delay(data={'magnitude': 21.3, 'magnitude_std': 0.5}), 2)
+        self.assertEqual(adaptive.get_delay(data={'magnitude': 21.3, 'magnitude_std': 0.01}), 4)
+
+    def test_tessw4c(self):
+        reader = TESSW4C(**{**SITE_CONFIG, 'delay_between_reads': 60, 'sun_altitude': -18}, device_id='stars1567',
+                         adaptive_cadence=True, min_delay_between_reads=2)
+        self.addCleanup(reader.close)
+
+        self.assertEqual(reader.get_delay(data=dict(TESS_MESSAGE)), 4)
@@ -0,0 +1,108 @@
+import datetime
+import json
+import os
+import tempfile
+import time
+
+from pathlib import Path
+from unittest import TestCase, skipUnless
+from unittest.mock import patch
+
+import numpy as np
+
+from dspp_reader.tessw4c import TESSW4C
+from dspp_reader.tools import codec
+from dspp_reader.tools.codec import decode_tess_message, dumps, flatten_tess_message, get_tessw4c_payload, loads
+from dspp_reader.tools.generics import augment_data
+from dspp_reader.tools.tests.test_engine import SITE_CONFIG, TESS_MESSAGE
+
+
+def get_recorded_messages(count):
+    return [json.dumps({**TESS_MESSAGE, 'udp': message_id, 'tsky': -10 - message_id / 1e4}).encode() for message_id in range(count)]
+
+
+class TestCodec(TestCase):
+
+    def test_decode_tess_message(self):
+        message = decode_tess_message(data=json.dumps(TESS_MESSAGE).encode())
+
+        self.assertEqual(message, TESS_MESSAGE)
+
+    def test_invalid_tess_messages(self):
+        for data in [b'{"udp": 1', b'[1, 2]', b'{"name": "stars1"}', json.dumps({**TESS_MESSAGE, 'F3': {'freq': 1.}}).encode()]:
+            with self.subTest(data=data):
+                self.assertRaises(ValueError, decode_tess_message, data=data)
+
+    def test_standard_library_fallback(self):
+        data = json.dumps(TESS_MESSAGE).encode()
+        with patch.object(codec, 'orjson', None):
+            self.assertEqual(codec.get_json_backend(), 'json')
+            self.assertEqual(loads(data), TESS_MESSAGE)
+            self.assertEqual(dumps(TESS_MESSAGE), json.dumps(TESS_MESSAGE))
+
+    def test_dumps_numpy_values(self):
+        self.assertEqual(json.loads(dumps({'magnitude': np.float64(19.5), 'reads': np.int64(5)})), {'magnitude': 19.5, 'reads': 5})
+
+    def test_flatten_and_payload(self):
+        row = flatten_tess_message(data={**TESS_MESSAGE, 'timestamp': '2026-01-11T03:00:00+00:00'})
+
+        self.assertEqual(list(row)[6:9], ['F1_freq', 'F1_mag', 'F1_zp'])
+        payload = get_tessw4c_payload(row=row, device={'type': 'tess-w4c'})
+        self.assertEqual(payload['message_id'], 542411)
+        self.assertEqual(payload['channel_4'], {'frequency': 62500.0, 'magnitude': 7.95, 'zeropoint': 19.94})
+        self.assertEqual(payload['sky_temperature'], -10.23)
+
+    def test_reader_file_line(self):
+        with tempfile.TemporaryDirectory() as directory:
+            reader = TESSW4C(**{**SITE_CONFIG, 'save_to_file': True}, device_id='stars1567', device_altitude=90, device_azimuth=0,
+                             device_ip='127.0.0.1', save_files_to=directory)
+            data = augment_data(data=dict(TESS_MESSAGE), timestamp=datetime.datetime(2026, 1, 11, 3, tzinfo=datetime.UTC), device=reader.device)
+            reader.store_data_point(data=data)
+            reader.close()
+            lines = next(Path(directory).glob('*.tsv')).read_text().splitlines()
+
+        self.assertEqual(lines[1].split('\t')[6:10], ['F1_freq', 'F1_mag', 'F1_zp', 'F2_freq'])
+        values = lines[2].split('\t')
+        self.assertEqual(values[:7], ['542411', '3', 'stars1567', '-54', '22C', '489', '111111.1'])
+        self.assertEqual(values[lines[1].split('\t').index('latitude')], str(reader.site.latitude))
+
+
+@skipUnless(os.environ.get('DSPP_BENCHMARK'), 'Set DSPP_BENCHMARK=1 to run benchmarks')
+class BenchmarkCodec(TestCase):
+
+    def test_tess_messages(self):
+        messages = get_recorded_messages(count=20000)
+        device = {'type': 'tess-w4c', 'serial_number': 'stars1567'}
+
+        def standard_library(data):
+            message = json.loads(data)
+            fields = []
+            for key in message.keys():
+                if key.startswith('F'):
+                    for subkey in message[key].keys():
+                        fields.append(str(message[key][subkey]))
+                else:
+                    fields.append(str(message[key]))
+            payload = {'message_id': message['udp']}
+            for channel in range(1, 5):
+                payload[f"channel_{channel}"] = {'frequency': message[f"F{channel}"]['freq'],
+                                                 'magnitude': message[f"F{channel}"]['mag'],
+                                                 'zeropoint': message[f"F{channel}"]['zp']}
+            payload['device'] = device
+            return '\t'.join(fields), json.dumps(payload)
+
+        def fast_path(data):
+            row = flatten_tess_message(data=decode_tess_message(data=data))
+            return '\t'.join(map(str, row.values())), dumps(get_tessw4c_payload(row=row, device=device))
+
+        results = {}
+        for name, function in [('json', standard_library), (codec.get_json_backend(), fast_path)]:
+            start = time.perf_counter()
+            for data in messages:
+                function(data)
+            results[name] = len(messages) / (time.perf_counter() - start)
+
+        print(f"\nTESS-W4C decode, flatten and encode: {', '.join(f'{name}: {rate:.0f} messages/s' for name, rate in results.items())}")
+        self.assertEqual(standard_library(messages[0])[0], fast_path(messages[0])[0])
+        if codec.get_json_backend() == 'orjson':
+            self.assertGreater(results['orjson'], results['json'])
@@ -0,0 +1,190 @@
+import json
+import socket
+import threading
+
+from unittest import TestCase
+
+from dspp_reader.tools.connection import DeviceConnection, JSONFramer, MessageStream, close_connections, get_connection
+
+RESPONSE = b'r, 19.29m,0000000022Hz,0000000000c,0000000.000s, 027.0C,00000001\r\n'
+
+
+class FakeDevice(object):
+    """Minimal TCP server that answers every line received with `RESPONSE`.
+
+    Args:
+        close_after (int): Close the client connection after this many responses.
+        split (bool): Send each response in two chunks.
+    """
+
+    def __init__(self, close_after=None, split=False):
+        self.close_after = close_after
+        self.split = split
+        self.connections = 0
+        self.server = socket.create_server(('127.0.0.1', 0))
+        self.port = self.server.getsockname()[1]
+        self.thread = threading.Thread(target=self._serve, daemon=True)
+        self.thread.start()
+
+    def _serve(self):
+        while True:
+            try:
+                client, _ = self.server.accept()
+            except OSError:
+                return
+            self.connections += 1
+            with client:
+                responses = 0
+                buffer = b''
+                while self.close_after is None or responses < self.close_after:
+                    chunk = client.recv(1024)
+                    if not chunk:
+                        break
+                    buffer += chunk
+                    while b'\r\n' in buffer:
+                        _, buffer = buffer.split(b'\r\n', 1)
+                        if self.split:
+                            client.sendall(RESPONSE[:10])
+                            client.sendall(RESPONSE[10:])
+                        else:
+                            client.sendall(RESPONSE)
+                        responses += 1
+
+    def close(self):
+        # shutdown wakes up the thread blocked in accept, close alone keeps the socket listening
+        try:
+            self.server.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.server.close()
+
+
+class TestDeviceConnection(TestCase):
+
+    def test_reuses_the_connection(self):
+        device = FakeDevice()
+        self.addCleanup(device.close)
+        connection = DeviceConnection(ip='127.0.0.1', port=device.port)
+        self.addCleanup(connection.close)
+
+        for _ in range(5):
+            self.assertEqual(connection.request(command=b'Rx\r\n'), RESPONSE)
+
+        self.assertEqual(device.connections, 1)
+
+    def test_reads_until_terminator(self):
+        device = FakeDevice(split=True)
+        self.addCleanup(device.close)
+        connection = DeviceConnection(ip='127.0.0.1', port=device.port)
+        self.addCleanup(connection.close)
+
+        self.assertEqual(connection.request(command=b'Rx\r\n'), RESPONSE)
+
+    def test_reconnects_when_closed_by_device(self):
+        device = FakeDevice(close_after=1)
+        self.addCleanup(device.close)
+        connection = DeviceConnection(ip='127.0.0.1', port=device.port)
+        self.addCleanup(connection.close)
+
+        self.assertEqual(connection.request(command=b'Rx\r\n'), RESPONSE)
+        self.assertEqual(connection.request(command=b'Rx\r\n'), RESPONSE)
+
+        self.assertEqual(device.connections, 2)
+
+    def test_raises_when_device_is_unavailable(self):
+        device = FakeDevice()
+        device.close()
+        connection = DeviceConnection(ip='127.0.0.1', port=device.port, timeout=1)
+
+        self.assertRaises(OSError, connection.request, command=b'Rx\r\n')
+        self.assertFalse(connection.is_open)
+
+
+class TestJSONFramer(TestCase):
+
+    def test_split_and_joined_messages(self):
+        framer = JSONFramer()
+        data = b'{"udp": 1, "F1": {"mag": 7.35}}\r\n{"udp": 2, "name": "a \\"}{\\" b"}{"udp": 3}'
+
+        messages = [message for i in range(0, len(data), 7) for message in framer.feed(data[i:i + 7])]
+
+        self.assertEqual(messages, [{'udp': 1, 'F1': {'mag': 7.35}}, {'udp': 2, 'name': 'a "}{" b'}, {'udp': 3}])
+
+    def test_multibyte_character_split(self):
+        framer = JSONFramer()
+        data = json.dumps({'name': 'ñandú'}, ensure_ascii=False).encode()
+
+        self.assertEqual(framer.feed(data[:10]), [])
+        self.assertEqual(framer.feed(data[10:]), [{'name': 'ñandú'}])
+
+    def test_discards_invalid_data(self):
+        framer = JSONFramer()
+
+        self.assertEqual(framer.feed(b'garbage {"udp": 1,, } more {"udp": 2}'), [{'udp': 2}])
+        self.assertEqual(framer.discarded, 3)
+
+    def test_discards_incomplete_object_too_long(self):
+        framer = JSONFramer(max_size=20)
+
+        self.assertEqual(framer.feed(b'{"name": "' + b'a' * 30), [])
+        self.assertEqual(framer.feed(b'"}{"udp": 1}'), [{'udp': 1}])
+
+
+class TestMessageStream(TestCase):
+
+    def get_server(self, data, close=True):
+        server = socket.create_server(('127.0.0.1', 0))
+        self.addCleanup(server.close)
+
+        def serve():
+            client, _ = server.accept()
+            client.sendall(data)
+            if close:
+                client.close()
+            else:
+                self.addCleanup(client.close)
+
+        threading.Thread(target=serve, daemon=True).start()
+        return server.getsockname()[1]
+
+    def test_reads_every_message(self):
+        port = self.get_server(data=b'{"udp": 1}{"udp": 2}\n{"udp": 3', close=False)
+        stream = MessageStream(ip='127.0.0.1', port=port)
+        self.addCleanup(stream.close)
+
+        self.assertEqual(stream.read(), [{'udp': 1}, {'udp': 2}])
+        self.assertTrue(stream.is_open)
+
+    def test_raises_when_closed_by_device(self):
+        port = self.get_server(data=b'{"udp": 1')
+        stream = MessageStream(ip='127.0.0.1', port=port)
+
+        self.assertRaises(ConnectionResetError, stream.read)
+        self.assertFalse(stream.is_open)
+
+    def test_raises_when_idle(self):
+        port = self.get_server(data=b'', close=False)
+        stream = MessageStream(ip='127.0.0.1', port=port, idle_timeout=0.1)
+
+        self.assertRaises(TimeoutError, stream.read)
+        self.assertFalse(stream.is_open)
+
+
+class TestConnectionPool(TestCase):
+
+    def tearDown(self):
+        close_connections()
+
+    def test_same_address_same_connection(self):
+        first = get_connection(ip='127.0.0.1', port=10001)
+        second = get_connection(ip='127.0.0.1', port=10001)
+        other = get_connection(ip='127.0.0.1', port=10002)
+
+        self.assertIs(first, second)
+        self.assertIsNot(first, other)
+
+    def test_close_connections(self):
+        first = get_connection(ip='127.0.0.1', port=10001)
+        close_connections()
+
+        self.assertIsNot(get_connection(ip='127.0.0.1', port=10001), first)
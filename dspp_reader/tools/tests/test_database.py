@@ -0,0 +1,178 @@
+import datetime
+import os
+import sqlite3
+import tempfile
+import time
+
+from pathlib import Path
+from unittest import TestCase, skipUnless
+
+import astropy.units as u
+
+from dspp_reader.tools.database import SCHEMAS, SQLiteStorage
+
+UTC = datetime.timezone.utc
+
+
+def get_sqmle_data(timestamp, serial_number='1823', magnitude=19.29):
+    return {
+        'type': 'r',
+        'magnitude': magnitude * u.mag,
+        'frequency': 0.0 * u.Hz,
+        'period_count': 0.0 * u.count,
+        'period_seconds': 0.0 * u.second,
+        'temperature': 20.5 * u.deg_C,
+        'timestamp': timestamp.isoformat(),
+        'localtime': timestamp.astimezone().isoformat(),
+        'device': 'sqm-le',
+        'serial_number': serial_number,
+        'altitude': 90.,
+        'azimuth': 0.,
+        'site': 'ctio',
+        'timezone': 'America/Santiago',
+        'latitude': -30.17 * u.deg,
+        'longitude': -70.8 * u.deg,
+        'elevation': 2200 * u.m,
+    }
+
+
+def get_tessw4c_data(timestamp):
+    return {
+        'udp': 1234, 'rev': 3, 'name': 'stars1000', 'wdBm': -60, 'hash': 'abc', 'ain': 0,
+        'F1': {'freq': 1.5, 'mag': 7.35, 'zp': 20.5},
+        'F2': {'freq': 2.5, 'mag': 8.35, 'zp': 20.5},
+        'F3': {'freq': 3.5, 'mag': 9.35, 'zp': 20.5},
+        'F4': {'freq': 4.5, 'mag': 10.35, 'zp': 20.5},
+        'tamb': 10.1, 'tsky': -20.3,
+        'timestamp': timestamp.isoformat(),
+        'serial_number': 'stars1000',
+    }
+
+
+class TestSQLiteStorage(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.filename = Path(self.directory.name) / 'data' / 'dspp_reader.sqlite'
+
+    def get_storage(self, device_type='sqm-le', **kwargs):
+        storage = SQLiteStorage(filename=self.filename, device_type=device_type, **kwargs)
+        self.addCleanup(storage.close)
+        return storage
+
+    def count_rows(self, table='sqmle'):
+        with sqlite3.connect(self.filename) as connection:
+            return connection.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+
+    def test_unknown_device_type(self):
+        self.assertRaises(ValueError, SQLiteStorage, filename=self.filename, device_type='sqm-lu')
+
+    def test_uses_write_ahead_logging(self):
+        storage = self.get_storage()
+
+        self.assertEqual(storage.connection.execute('PRAGMA journal_mode').fetchone()[0], 'wal')
+
+    def test_stores_plain_values(self):
+        storage = self.get_storage()
+        timestamp = datetime.datetime(2026, 1, 11, 3, tzinfo=UTC)
+
+        storage.add(data=get_sqmle_data(timestamp=timestamp))
+
+        row = dict(storage.query(serial_number='1823', start=timestamp, end=timestamp + datetime.timedelta(seconds=1))[0])
+        self.assertEqual(row['magnitude'], 19.29)
+        self.assertEqual(row['latitude'], -30.17)
+        self.assertEqual(row['timestamp'], timestamp.isoformat())
+        self.assertIsNone(row['magnitude_std'])
+
+    def test_tessw4c_channels(self):
+        storage = self.get_storage(device_type='tess-w4c')
+        timestamp = datetime.datetime(2026, 1, 11, 3, tzinfo=UTC)
+
+        storage.add(data=get_tessw4c_data(timestamp=timestamp))
+
+        row = storage.query(serial_number='stars1000', start=timestamp, end=timestamp + datetime.timedelta(seconds=1))[0]
+        self.assertEqual(row['F3_mag'], 9.35)
+        self.assertEqual(row['udp'], 1234)
+        self.assertEqual(set(SCHEMAS['tess-w4c'].names) - set(row.keys()), set())
+
+    def test_batches_inserts(self):
+        storage = self.get_storage(batch_size=3)
+        start = datetime.datetime(2026, 1, 11, 3, tzinfo=UTC)
+
+        for i in range(2):
+            storage.add(data=get_sqmle_data(timestamp=start + datetime.timedelta(minutes=i)))
+        self.assertEqual(self.count_rows(), 0)
+
+        storage.add(data=get_sqmle_data(timestamp=start + datetime.timedelta(minutes=2)))
+        self.assertEqual(self.count_rows(), 3)
+
+    def test_inserts_after_interval(self):
+        storage = self.get_storage(batch_size=100, batch_interval=0)
+
+        storage.add(data=get_sqmle_data(timestamp=datetime.datetime(2026, 1, 11, 3, tzinfo=UTC)))
+
+        self.assertEqual(self.count_rows(), 1)
+
+    def test_close_inserts_pending(self):
+        storage = self.get_storage(batch_size=100)
+        storage.add(data=get_sqmle_data(timestamp=datetime.datetime(2026, 1, 11, 3, tzinfo=UTC)))
+
+        storage.close()
+        storage.close()
+
+        self.assertEqual(self.count_rows(), 1)
+
+    def test_ignores_duplicates(self):
+        storage = self.get_storage()
+        timestamp = datetime.datetime(2026, 1, 11, 3, tzinfo=UTC)
+
+        storage.add(data=get_sqmle_data(timestamp=timestamp))
+        storage.add(data=get_sqmle_data(timestamp=timestamp, magnitude=20.))
+        storage.add(data=get_sqmle_data(timestamp=timestamp, serial_number='1824'))
+
+        self.assertEqual(self.count_rows(), 2)
+
+    def test_query_night_and_month(self):
+        storage = self.get_storage(batch_size=1000)
+        santiago_noon_utc = 15  # America/Santiago is UTC-3 in January
+        for day in range(1, 32):
+            for hour in [santiago_noon_utc - 1, santiago_noon_utc, 3 + 24]:
+                timestamp = datetime.datetime(2026, 1, day, tzinfo=UTC) + datetime.timedelta(hours=hour)
+                storage.add(data=get_sqmle_data(timestamp=timestamp))
+        storage.add(data=get_sqmle_data(timestamp=datetime.datetime(2026, 1, 10, 20, tzinfo=UTC), serial_number='1824'))
+
+        night = storage.query_night(serial_number='1823', date=datetime.date(2026, 1, 10), timezone='America/Santiago')
+        month = storage.query_month(serial_number='1823', year=2026, month=1, timezone='America/Santiago')
+        december = storage.query_month(serial_number='1823', year=2025, month=12, timezone='America/Santiago')
+
+        self.assertEqual([row['timestamp'] for row in night], ['2026-01-10T15:00:00+00:00', '2026-01-11T03:00:00+00:00', '2026-01-11T14:00:00+00:00'])
+        self.assertEqual(len(month), 31 * 3 - 1)
+        self.assertEqual(len(december), 1)
+
+
+@skipUnless(os.environ.get('DSPP_BENCHMARK'), 'Set DSPP_BENCHMARK=1 to run benchmarks')
+class BenchmarkSQLiteStorage(TestCase):
+
+    def test_month_of_datapoints(self):
+        devices = 10
+        with tempfile.TemporaryDirectory() as directory:
+            with SQLiteStorage(filename=Path(directory) / 'dspp_reader.sqlite', device_type='sqm-le', batch_size=500) as storage:
+                start = datetime.datetime(2026, 1, 1, tzinfo=UTC)
+                datapoints = 0
+                insert_start = time.perf_counter()
+                for minute in range(0, 31 * 24 * 60, 5):
+                    timestamp = start + datetime.timedelta(minutes=minute)
+                    for device in range(devices):
+                        storage.add(data=get_sqmle_data(timestamp=timestamp, serial_number=str(device)))
+                        datapoints += 1
+                storage.flush()
+                insert_time = time.perf_counter() - insert_start
+
+                query_start = time.perf_counter()
+                month = storage.query_month(serial_number='5', year=2026, month=1, timezone='America/Santiago')
+                query_time = time.perf_counter() - query_start
+
+        print(f"\nInsert: {insert_time / datapoints * 1e6:.1f} us per datapoint, "
+              f"month query: {len(month)} datapoints in {query_time * 1e3:.1f} ms")
+        self.assertLess(query_time, 1)
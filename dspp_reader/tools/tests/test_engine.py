@@ -0,0 +1,228 @@
+import asyncio
+import json
+import os
+import socket
+import tempfile
+import threading
+import time
+import tracemalloc
+
+from unittest import TestCase, skipUnless
+from unittest.mock import patch
+
+import yaml
+
+from dspp_reader.tools.engine import ReaderEngine, load_engine_config
+from dspp_reader.tools.tests.test_connection import FakeDevice
+
+TESS_MESSAGE = {
+    "udp": 542411, "rev": 3, "name": "stars1567", "wdBm": -54, "hash": "22C", "ain": 489,
+    "F1": {"freq": 111111.1, "mag": 7.35, "zp": 19.96},
+    "F2": {"freq": 111111.1, "mag": 7.43, "zp": 20.04},
+    "F3": {"freq": 76923.1, "mag": 7.77, "zp": 19.99},
+    "F4": {"freq": 62500.0, "mag": 7.95, "zp": 19.94},
+    "tamb": 14.83, "tsky": -10.23,
+}
+
+SITE_CONFIG = {
+    'site_id': 'ctio',
+    'site_name': 'Cerro Tololo',
+    'site_latitude': -30.169166,
+    'site_longitude': -70.804,
+    'site_elevation': 2174,
+    'site_timezone': 'America/Santiago',
+    'read_always': True,
+    'save_to_file': False,
+    'delay_between_reads': 0,
+}
+
+
+class FakeTESSW4C(object):
+    """Minimal TCP server that pushes a TESS-W4C message with a new `udp` id to every client every `interval` seconds.
+
+    Args:
+        interval (float): Seconds between messages.
+        chunk_size (int): Send the messages in chunks of this many bytes, regardless of where messages start.
+    """
+
+    def __init__(self, interval=0.05, chunk_size=None):
+        self.interval = interval
+        self.chunk_size = chunk_size
+        self.message_id = 0
+        self.connections = 0
+        self.closed = False
+        self.server = socket.create_server(('127.0.0.1', 0))
+        self.port = self.server.getsockname()[1]
+        self.thread = threading.Thread(target=self._serve, daemon=True)
+        self.thread.start()
+
+    def _serve(self):
+        while True:
+            try:
+                client, _ = self.server.accept()
+            except OSError:
+                return
+            self.connections += 1
+            threading.Thread(target=self._push, args=(client,), daemon=True).start()
+
+    def _push(self, client):
+        with client:
+            pending = b''
+            while not self.closed:
+                self.message_id += 1
+                pending += json.dumps({**TESS_MESSAGE, 'udp': self.message_id}).encode() + b'\r\n'
+                size = self.chunk_size or len(pending)
+                try:
+                    while len(pending) >= size:
+                        client.sendall(pending[:size])
+                        pending = pending[size:]
+                except OSError:
+                    return
+                time.sleep(self.interval)
+
+    def close(self):
+        self.closed = True
+        # shutdown wakes up the thread blocked in accept, close alone keeps the socket listening
+        try:
+            self.server.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.server.close()
+
+
+class TestLoadEngineConfig(TestCase):
+
+    def test_defaults_are_merged(self):
+        config = {
+            'defaults': {'site_id': 'ctio', 'delay_between_reads': 30},
+            'devices': [
+                {'device_type': 'sqm-le', 'device_id': '1'},
+                {'device_type': 'tess-w4c', 'device_id': 'stars1', 'delay_between_reads': 60},
+            ]
+        }
+        with tempfile.NamedTemporaryFile('w', suffix='.yaml', delete=False) as f:
+            yaml.dump(config, f)
+        self.addCleanup(os.remove, f.name)
+
+        devices = load_engine_config(filename=f.name)
+
+        self.assertEqual(devices[0], {'site_id': 'ctio', 'delay_between_reads': 30, 'device_type': 'sqm-le', 'device_id': '1'})
+        self.assertEqual(devices[1]['delay_between_reads'], 60)
+
+    def test_no_devices(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.yaml', delete=False) as f:
+            yaml.dump({'defaults': {}}, f)
+        self.addCleanup(os.remove, f.name)
+
+        self.assertRaises(ValueError, load_engine_config, filename=f.name)
+
+
+class TestReaderEngine(TestCase):
+
+    def setUp(self):
+        self.sqm_devices = [FakeDevice(), FakeDevice()]
+        self.tess_device = FakeTESSW4C()
+        for device in [*self.sqm_devices, self.tess_device]:
+            self.addCleanup(device.close)
+
+        self.devices_config = [
+            {**SITE_CONFIG, 'device_type': 'sqm-le', 'device_id': '1', 'device_altitude': 90, 'device_azimuth': 0,
+             'device_ip': '127.0.0.1', 'device_port': device.port, 'number_of_reads': 3, 'reads_spacing': 0}
+            for device in self.sqm_devices
+        ]
+        self.devices_config.append({**SITE_CONFIG, 'device_type': 'tess-w4c', 'device_id': 'stars1567', 'device_altitude': 90,
+                                    'device_azimuth': 0, 'device_ip': '127.0.0.1', 'device_port': self.tess_device.port})
+
+    def _run(self, engine, seconds):
+        async def run_for():
+            try:
+                await asyncio.wait_for(engine.run(), timeout=seconds)
+            except asyncio.TimeoutError:
+                pass
+        asyncio.run(run_for())
+        engine.executor.shutdown(wait=True)
+
+    def test_sites_are_shared(self):
+        engine = ReaderEngine(devices_config=self.devices_config, stats_interval=0)
+
+        self.assertIs(engine.readers[0].site, engine.readers[2].site)
+        self.assertIs(engine.readers[1].device.site, engine.readers[2].site)
+
+    def test_unknown_device_type(self):
+        self.assertRaises(ValueError, ReaderEngine, devices_config=[{'device_type': 'sqm-lu'}])
+
+    def test_reads_all_devices(self):
+        engine = ReaderEngine(devices_config=self.devices_config, stats_interval=0)
+        stored = []
+        for reader in engine.readers:
+            reader.store_data_point = stored.append
+
+        self._run(engine=engine, seconds=1)
+
+        self.assertTrue(all(count > 0 for count in engine.datapoints.values()))
+        self.assertEqual(sum(device.connections for device in self.sqm_devices), 2)
+        sqm_data = [data for data in stored if data['device'] == 'sqm-le']
+        tess_data = [data for data in stored if data['device'] == 'tess-w4c']
+        self.assertEqual(sqm_data[0]['magnitude'], 19.29)
+        self.assertEqual(tess_data[0]['F1']['mag'], 7.35)
+        self.assertEqual(len({data['udp'] for data in tess_data}), len(tess_data))
+        self.assertEqual(self.tess_device.connections, 1)
+
+    def test_stream_policy(self):
+        tess_devices = [FakeTESSW4C(interval=0.01, chunk_size=100), FakeTESSW4C(interval=0.01)]
+        for device in tess_devices:
+            self.addCleanup(device.close)
+        engine = ReaderEngine(devices_config=[{**self.devices_config[2], 'device_port': tess_devices[0].port, 'stream_policy': 'all'},
+                                              {**self.devices_config[2], 'device_port': tess_devices[1].port, 'device_id': 'stars1568',
+                                               'stream_policy': 'latest', 'delay_between_reads': 0.2}],
+                              stats_interval=0)
+        stored = {}
+        for reader in engine.readers:
+            reader.store_data_point = stored.setdefault(reader.device_id, []).append
+
+        self._run(engine=engine, seconds=1)
+
+        message_ids = [data['udp'] for data in stored['stars1567']]
+        self.assertGreater(len(message_ids), 20)
+        self.assertEqual(message_ids, list(range(message_ids[0], message_ids[0] + len(message_ids))))
+        self.assertLessEqual(len(stored['stars1568']), 6)
+        self.assertEqual([device.connections for device in tess_devices], [1, 1])
+
+
+@skipUnless(os.environ.get('DSPP_BENCHMARK'), 'Set DSPP_BENCHMARK=1 to run benchmarks')
+class BenchmarkReaderEngine(TestCase):
+
+    def test_cost_per_device(self):
+        devices = [FakeDevice() for _ in range(50)]
+        for device in devices:
+            self.addCleanup(device.close)
+        devices_config = [
+            {**SITE_CONFIG, 'device_type': 'sqm-le', 'device_id': '1', 'device_altitude': 90, 'device_azimuth': 0,
+             'device_ip': '127.0.0.1', 'device_port': device.port, 'number_of_reads': 5, 'reads_spacing': 1,
+             'delay_between_reads': 5}
+            for device in devices
+        ]
+
+        ReaderEngine(devices_config=devices_config[:1], stats_interval=0)
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        engine = ReaderEngine(devices_config=devices_config, stats_interval=0)
+        memory_per_device = (tracemalloc.get_traced_memory()[0] - before) / len(devices)
+        tracemalloc.stop()
+
+        with patch.object(type(engine.readers[0]), 'store_data_point'):
+            cpu_start = time.process_time()
+            wall_start = time.monotonic()
+
+            async def run_for():
+                try:
+                    await asyncio.wait_for(engine.run(), timeout=20)
+                except asyncio.TimeoutError:
+                    pass
+            asyncio.run(run_for())
+            cpu_percent = 100 * (time.process_time() - cpu_start) / (time.monotonic() - wall_start)
+        engine.executor.shutdown(wait=True)
+
+        print(f"\n{len(devices)} devices: {memory_per_device / 1024:.1f} KiB and {cpu_percent / len(devices):.3f}% CPU per device, "
+              f"{sum(engine.datapoints.values())} datapoints")
+        self.assertLess(memory_per_device, 2 * 2 ** 20)
@@ -0,0 +1,118 @@
+import astropy.units as u
+import datetime
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from astropy.time import Time
+from unittest import TestCase, skipUnless
+from unittest.mock import patch
+
+from dspp_reader.tools import Site
+from dspp_reader.tools.ephemeris import EphemerisTable, get_ephemeris_filename
+
+
+class TestEphemerisTable(TestCase):
+
+    def setUp(self):
+        self.table = EphemerisTable(site_id='ctio', sun_altitude=-10, starts=[100., 1100.], ends=[200., 1200.], since=50.)
+
+    def test_boundaries(self):
+        np.testing.assert_array_equal(self.table.boundaries, [100., 200., 1100., 1200.])
+
+    def test_save_and_load(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            filename = self.table.save(directory=temp_dir)
+            self.assertEqual(filename, get_ephemeris_filename(directory=temp_dir, site_id='ctio', sun_altitude=-10))
+
+            loaded = EphemerisTable.load(filename)
+
+        self.assertEqual(loaded.site_id, 'ctio')
+        self.assertEqual(loaded.sun_altitude, -10.)
+        np.testing.assert_array_equal(loaded.starts, self.table.starts)
+        np.testing.assert_array_equal(loaded.ends, self.table.ends)
+        self.assertEqual(loaded.since, 50.)
+
+
+class TestSiteEphemerisTable(TestCase):
+
+    def setUp(self):
+        self.site = Site(id='ctio', name='CTIO', latitude=-30.169166, longitude=-70.804, elevation=2174, timezone='America/Santiago')
+        self.start = datetime.datetime(2026, 1, 1, 12, tzinfo=datetime.UTC)
+
+    def test_matches_astroplan(self):
+        table = self.site.get_ephemeris_table(sun_altitude=-10, start=self.start, nights=5)
+
+        self.assertEqual(len(table), 5)
+        expected_starts = self.site.observer.sun_set_time(Time(table.starts - 3600, format='unix'), which='next', horizon=-10 * u.deg)
+        expected_ends = self.site.observer.sun_rise_time(Time(table.ends - 3600, format='unix'), which='next', horizon=-10 * u.deg)
+        np.testing.assert_allclose(table.starts, expected_starts.unix, atol=30)
+        np.testing.assert_allclose(table.ends, expected_ends.unix, atol=30)
+        self.assertEqual(table.since, self.start.timestamp())
+
+    def test_starts_during_a_night(self):
+        table = self.site.get_ephemeris_table(sun_altitude=-10, start=self.start - datetime.timedelta(hours=10), nights=2)
+
+        self.assertGreater(table.since, self.start.timestamp() - 10 * 3600)
+        self.assertLess(table.since, table.starts[0])
+        self.assertFalse(self.site.observer.is_night(Time(table.since + 600, format='unix'), horizon=-10 * u.deg))
+
+    def test_load_ephemeris_table(self):
+        table = EphemerisTable(site_id='ctio', sun_altitude=-12, starts=[100., 1100.], ends=[200., 1200.])
+
+        self.site.load_ephemeris_table(table=table)
+
+        self.assertTrue(self.site.is_within_window(sun_altitude=-12, when=150.))
+        self.assertEqual(self.site.seconds_to_next_window(sun_altitude=-12, when=500.), 600.)
+
+    def test_loaded_table_is_used_before_first_start(self):
+        table = EphemerisTable(site_id='ctio', sun_altitude=-12, starts=[100., 1100.], ends=[200., 1200.], since=20.)
+        self.site.load_ephemeris_table(table=table)
+
+        with patch.object(self.site, '_compute_schedule') as mock_compute:
+            self.assertFalse(self.site.is_within_window(sun_altitude=-12, when=90.))
+            self.assertEqual(self.site.seconds_to_next_window(sun_altitude=-12, when=90.), 10.)
+            self.assertEqual(self.site._get_next_boundaries(sun_altitude=-12, when=90.), (100., 200.))
+
+        mock_compute.assert_not_called()
+
+    def test_loaded_table_without_since_is_replaced_before_first_start(self):
+        table = EphemerisTable(site_id='ctio', sun_altitude=-12, starts=[100., 1100.], ends=[200., 1200.])
+        self.site.load_ephemeris_table(table=table)
+
+        with patch.object(self.site, '_compute_schedule', return_value=np.array([-100., 95., 100., 200.])) as mock_compute:
+            self.assertTrue(self.site.is_within_window(sun_altitude=-12, when=90.))
+
+        mock_compute.assert_called_once_with(sun_altitude=-12, when=90.)
+
+    def test_load_ephemeris_table_from_other_site(self):
+        table = EphemerisTable(site_id='pachon', sun_altitude=-12, starts=[100.], ends=[200.])
+
+        self.assertRaises(ValueError, self.site.load_ephemeris_table, table=table)
+
+
+@skipUnless(os.environ.get('DSPP_BENCHMARK'), 'Set DSPP_BENCHMARK=1 to run benchmarks')
+class BenchmarkEphemerisTable(TestCase):
+
+    def setUp(self):
+        self.site = Site(id='ctio', name='CTIO', latitude=-30.169166, longitude=-70.804, elevation=2174, timezone='America/Santiago')
+        self.start = datetime.datetime(2026, 1, 1, 12, tzinfo=datetime.UTC)
+        self.nights = 365
+
+    def test_vectorized_against_nightly_solves(self):
+        start_time = time.perf_counter()
+        table = self.site.get_ephemeris_table(sun_altitude=-10, start=self.start, nights=self.nights)
+        vectorized = time.perf_counter() - start_time
+
+        start_time = time.perf_counter()
+        for night in range(self.nights):
+            reference_time = Time(self.start + datetime.timedelta(days=night))
+            self.site.observer.sun_set_time(reference_time, which='next', horizon=-10 * u.deg)
+            self.site.observer.sun_rise_time(reference_time, which='next', horizon=-10 * u.deg)
+        looped = time.perf_counter() - start_time
+
+        print(f"\n{self.nights} nights: vectorized {vectorized:.2f} s, nightly get_time_range solves {looped:.2f} s, speedup {looped / vectorized:.1f}x")
+        self.assertGreaterEqual(len(table), self.nights - 1)
+        self.assertLess(vectorized, looped)
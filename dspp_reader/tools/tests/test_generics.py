@@ -1,14 +1,17 @@
 import astropy.units as u
 import datetime
+import logging
+import tempfile
 
 from astropy.units import Quantity
+from logging.handlers import QueueHandler
 from pathlib import Path
 from unittest import TestCase
 
 from unittest.mock import patch, Mock
 
 from dspp_reader.tools import Device, Site
-from dspp_reader.tools.generics import augment_data, clean_data, get_filename
+from dspp_reader.tools.generics import DeviceTimeRotatingFileHandler, augment_data, clean_data, get_filename, setup_logging, stop_logging
 
 
 class TestCleanData(TestCase):
@@ -148,6 +151,34 @@ class TestGetFilename(TestCase):
         expected_filename_full_path = Path(self.save_files_to, expected_filename)
         self.assertEqual(filename, expected_filename_full_path)
 
+
+class TestSetupLogging(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        root = logging.getLogger()
+        self.addCleanup(root.setLevel, root.level)
+        self.addCleanup(stop_logging)
+
+    def test_records_are_written_by_listener(self):
+        logger = setup_logging(debug=True, device_type='sqm-le', device_id='logs', save_logs_to=self.directory.name)
+
+        self.assertFalse(any(isinstance(handler, DeviceTimeRotatingFileHandler) for handler in logger.handlers))
+        logger.debug("Response: r, 19.29m")
+        stop_logging()
+
+        log_files = list(Path(self.directory.name).glob('*_sqm-le_logs.log'))
+        self.assertEqual(len(log_files), 1)
+        self.assertIn("Response: r, 19.29m", log_files[0].read_text())
+        self.assertFalse(any(isinstance(handler, QueueHandler) for handler in logger.handlers))
+
+    def test_setup_twice(self):
+        setup_logging(device_type='sqm-le', device_id='logs', save_logs_to=self.directory.name)
+        logger = setup_logging(device_type='sqm-le', device_id='logs', save_logs_to=self.directory.name)
+
+        self.assertEqual(len([handler for handler in logger.handlers if isinstance(handler, QueueHandler)]), 1)
+
 #
 # class TestGetArgs(TestCase):
 #
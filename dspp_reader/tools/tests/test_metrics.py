@@ -0,0 +1,127 @@
+import math
+import tempfile
+import urllib.request
+
+from pathlib import Path
+from types import SimpleNamespace
+from unittest import TestCase
+
+from dspp_reader.sqmle.sqmle import SQMLE
+from dspp_reader.tools.metrics import (CONTENT_TYPE, DUPLICATES, REGISTRY, Counter, Gauge, Histogram, MetricsRegistry,
+                                       MetricsServer, ReaderMetrics, TextfileExporter, start_exporters)
+from dspp_reader.tools.tests.test_connection import FakeDevice
+from dspp_reader.tools.tests.test_engine import SITE_CONFIG
+from dspp_reader.tools.tests.test_udp import get_datagram
+from dspp_reader.tools.udp import UDPDemultiplexer
+
+
+class TestMetricsRegistry(TestCase):
+
+    def setUp(self):
+        self.registry = MetricsRegistry()
+        self.labels = {'device_type': 'sqm-le', 'device_id': '1'}
+
+    def test_render(self):
+        Counter('test_errors_total', 'Errors.', registry=self.registry).labels(**self.labels).inc(2)
+        gauge = Gauge('test_depth', 'Depth.', registry=self.registry)
+        gauge.labels(**self.labels).set(3)
+        gauge.labels(device_type='sqm-le', device_id='"2"').set_function(lambda: 1 / 0)
+
+        lines = self.registry.render().splitlines()
+
+        self.assertEqual(lines[:2], ['# HELP test_errors_total Errors.', '# TYPE test_errors_total counter'])
+        self.assertIn('test_errors_total{device_type="sqm-le",device_id="1"} 2', lines)
+        self.assertIn('test_depth{device_type="sqm-le",device_id="1"} 3', lines)
+        self.assertIn('test_depth{device_type="sqm-le",device_id="\\"2\\""} NaN', lines)
+
+    def test_histogram(self):
+        histogram = Histogram('test_seconds', 'Time.', buckets=(0.1, 1), registry=self.registry).labels(**self.labels)
+        for value in [0.05, 0.1, 0.5, 3]:
+            histogram.observe(value)
+        with self.assertRaises(ZeroDivisionError), histogram.time():
+            1 / 0
+
+        lines = self.registry.render().splitlines()
+
+        self.assertEqual(lines[2:], ['test_seconds_bucket{device_type="sqm-le",device_id="1",le="0.1"} 2',
+                                     'test_seconds_bucket{device_type="sqm-le",device_id="1",le="1"} 3',
+                                     'test_seconds_bucket{device_type="sqm-le",device_id="1",le="+Inf"} 4',
+                                     'test_seconds_sum{device_type="sqm-le",device_id="1"} 3.65',
+                                     'test_seconds_count{device_type="sqm-le",device_id="1"} 4'])
+
+    def test_invalid_labels(self):
+        counter = Counter('test_total', 'Test.', registry=self.registry)
+
+        self.assertRaises(ValueError, counter.labels, device_id='1')
+        self.assertRaises(ValueError, Counter, 'test_total', 'Test.', registry=self.registry)
+
+
+class TestExporters(TestCase):
+
+    def setUp(self):
+        self.registry = MetricsRegistry()
+        Counter('test_total', 'Test.', labelnames=(), registry=self.registry).labels().inc()
+
+    def test_http_server(self):
+        server = MetricsServer(port=0, address='127.0.0.1', registry=self.registry)
+        self.addCleanup(server.close)
+
+        with urllib.request.urlopen(f'http://127.0.0.1:{server.port}/metrics', timeout=5) as response:
+            self.assertEqual(response.headers['Content-Type'], CONTENT_TYPE)
+            self.assertIn('test_total 1', response.read().decode().splitlines())
+
+    def test_http_server_is_local_by_default(self):
+        for metrics_address, expected in [(None, '127.0.0.1'), ('0.0.0.0', '0.0.0.0')]:
+            with self.subTest(metrics_address=metrics_address):
+                exporters = start_exporters(metrics_port=0, metrics_address=metrics_address)
+                for exporter in exporters:
+                    self.addCleanup(exporter.close)
+
+                self.assertEqual([exporter.server.server_address[0] for exporter in exporters], [expected])
+
+    def test_textfile(self):
+        with tempfile.TemporaryDirectory() as directory:
+            filename = Path(directory) / 'dspp.prom'
+            exporter = TextfileExporter(filename=filename, interval=60, registry=self.registry)
+            exporter.close()
+
+            self.assertIn('test_total 1', filename.read_text().splitlines())
+            self.assertEqual([path.name for path in Path(directory).iterdir()], ['dspp.prom'])
+
+
+class TestReaderMetrics(TestCase):
+
+    def test_sqmle_reader(self):
+        device = FakeDevice()
+        self.addCleanup(device.close)
+        reader = SQMLE(**SITE_CONFIG, device_id='metrics1', device_altitude=90, device_azimuth=0, device_ip='127.0.0.1',
+                       device_port=device.port, number_of_reads=3, reads_spacing=0)
+        self.addCleanup(reader.close)
+
+        reader.store_data_point(data=reader.get_data_point())
+        self.assertRaises(ValueError, reader.process_response, response='r, garbage\r\n')
+
+        lines = REGISTRY.render().splitlines()
+        labels = 'device_type="sqm-le",device_id="metrics1"'
+        self.assertIn(f'dspp_command_seconds_count{{{labels},command="Rx"}} 3', lines)
+        self.assertIn(f'dspp_parse_seconds_count{{{labels}}} 3', lines)
+        self.assertIn(f'dspp_averaging_seconds_count{{{labels}}} 1', lines)
+        self.assertIn(f'dspp_decode_errors_total{{{labels}}} 1', lines)
+        self.assertIn(f'dspp_datapoints_total{{{labels}}} 1', lines)
+        self.assertLess(reader.metrics.get_last_datapoint_age(), 5)
+
+    def test_last_datapoint_age(self):
+        metrics = ReaderMetrics(device_type='tess-w4c', device_id='metrics2')
+
+        self.assertTrue(math.isnan(metrics.get_last_datapoint_age()))
+        metrics.datapoint_stored()
+        self.assertGreaterEqual(metrics.get_last_datapoint_age(), 0)
+
+    def test_udp_duplicates(self):
+        reader = SimpleNamespace(device_type='tess-w4c', device_id='metrics3', device=SimpleNamespace(ip='0.0.0.0'))
+        demultiplexer = UDPDemultiplexer(readers=[reader])
+
+        for message_id in [1, 2, 2]:
+            demultiplexer.route(data=get_datagram(name='metrics3', message_id=message_id), address=('10.0.0.1', 2255))
+
+        self.assertEqual(DUPLICATES.labels(device_type='tess-w4c', device_id='metrics3').value, 1)
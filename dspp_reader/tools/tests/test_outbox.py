@@ -0,0 +1,178 @@
+import json
+import sqlite3
+import tempfile
+import time
+
+from pathlib import Path
+from unittest import TestCase
+
+from dspp_reader.tools.api import ApiClient
+from dspp_reader.tools.outbox import Outbox
+from dspp_reader.tools.tests.test_api import FakeAPI
+
+
+def wait_for(condition, timeout=5.):
+    end = time.monotonic() + timeout
+    while not condition() and time.monotonic() < end:
+        time.sleep(0.01)
+    return condition()
+
+
+class TestOutbox(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.filename = Path(self.directory.name) / 'outbox.sqlite'
+
+    def get_api(self, **kwargs):
+        api = FakeAPI(**kwargs)
+        self.addCleanup(api.close)
+        return api
+
+    def get_outbox(self, api_endpoint, queue='sqm-le_1823', api_bulk_endpoint=None, **kwargs):
+        client = ApiClient(api_endpoint=api_endpoint, api_token='token', api_bulk_endpoint=api_bulk_endpoint)
+        outbox = Outbox(filename=self.filename, queue=queue, client=client, **kwargs)
+        self.addCleanup(outbox.close)
+        return outbox
+
+    def test_posts_in_order(self):
+        api = self.get_api()
+        outbox = self.get_outbox(api_endpoint=api.endpoint)
+        outbox.start()
+
+        for i in range(5):
+            outbox.put(payload={'magnitude': 19. + i})
+
+        self.assertTrue(wait_for(lambda: len(api.payloads) == 5))
+        self.assertEqual([payload['magnitude'] for payload in api.payloads], [19., 20., 21., 22., 23.])
+        self.assertTrue(wait_for(lambda: len(outbox) == 0))
+
+    def test_retries_with_backoff(self):
+        api = self.get_api(status_codes=[503, 503])
+        outbox = self.get_outbox(api_endpoint=api.endpoint, min_backoff=0.05, max_backoff=0.1)
+        outbox.put(payload={'magnitude': 19.})
+
+        outbox.start()
+
+        self.assertTrue(wait_for(lambda: len(api.payloads) == 1))
+        self.assertEqual(api.requests, 3)
+        self.assertTrue(wait_for(lambda: outbox.backoff == 0.))
+
+    def test_keeps_payloads_while_api_is_down(self):
+        outbox = self.get_outbox(api_endpoint='http://127.0.0.1:9/api/', min_backoff=0.05)
+        outbox.put(payload={'magnitude': 19.})
+
+        self.assertEqual(outbox.drain(), 0)
+        self.assertEqual(len(outbox), 1)
+
+    def test_survives_restart(self):
+        outbox = self.get_outbox(api_endpoint='http://127.0.0.1:9/api/')
+        outbox.put(payload={'magnitude': 19.})
+        outbox.put(payload={'magnitude': 20.})
+        outbox.close()
+
+        api = self.get_api()
+        outbox = self.get_outbox(api_endpoint=api.endpoint)
+        outbox.start()
+
+        self.assertTrue(wait_for(lambda: len(api.payloads) == 2))
+
+    def test_moves_rejected_payloads(self):
+        api = self.get_api(status_codes=[400])
+        outbox = self.get_outbox(api_endpoint=api.endpoint)
+        outbox.put(payload={'magnitude': 'bad'})
+        outbox.put(payload={'magnitude': 19.})
+
+        self.assertEqual(outbox.drain(), 2)
+
+        self.assertEqual(api.payloads, [{'magnitude': 19.}])
+        with sqlite3.connect(self.filename) as connection:
+            rejected = connection.execute('SELECT payload, status_code FROM rejected').fetchall()
+        self.assertEqual([(json.loads(payload), status_code) for payload, status_code in rejected], [({'magnitude': 'bad'}, 400)])
+
+    def test_keeps_payloads_on_authentication_errors(self):
+        api = self.get_api(status_codes=[401, 403])
+        outbox = self.get_outbox(api_endpoint=api.endpoint)
+        outbox.put(payload={'magnitude': 19.})
+
+        with self.assertLogs(level='ERROR'):
+            self.assertEqual(outbox.drain(), 0)
+            self.assertEqual(outbox.drain(), 0)
+        self.assertEqual(len(outbox), 1)
+        self.assertEqual(outbox.drain(), 1)
+
+        self.assertEqual(api.payloads, [{'magnitude': 19.}])
+        with sqlite3.connect(self.filename) as connection:
+            self.assertEqual(connection.execute('SELECT COUNT(*) FROM rejected').fetchone()[0], 0)
+
+    def test_drains_only_its_queue(self):
+        api = self.get_api()
+        other = self.get_outbox(api_endpoint=api.endpoint, queue='tess-w4c_stars1000')
+        other.put(payload={'name': 'stars1000'})
+        outbox = self.get_outbox(api_endpoint=api.endpoint)
+        outbox.put(payload={'magnitude': 19.})
+
+        self.assertEqual(outbox.drain(), 1)
+        self.assertEqual(api.payloads, [{'magnitude': 19.}])
+        self.assertEqual(len(other), 1)
+
+    def test_put_does_not_wait_for_api(self):
+        api = self.get_api(delay=0.2)
+        outbox = self.get_outbox(api_endpoint=api.endpoint)
+        outbox.start()
+
+        start = time.perf_counter()
+        for i in range(3):
+            outbox.put(payload={'magnitude': 19. + i})
+        elapsed = time.perf_counter() - start
+
+        self.assertLess(elapsed, 0.2)
+        self.assertTrue(wait_for(lambda: len(api.payloads) == 3))
+
+    def test_posts_batches_to_bulk_endpoint(self):
+        api = self.get_api(bulk=True)
+        outbox = self.get_outbox(api_endpoint=api.endpoint, api_bulk_endpoint=api.bulk_endpoint, batch_size=3, batch_latency=10)
+        outbox.start()
+
+        for i in range(5):
+            outbox.put(payload={'magnitude': 19. + i})
+
+        self.assertTrue(wait_for(lambda: len(api.payloads) == 3))
+        time.sleep(0.1)
+        self.assertEqual(api.requests, 1)
+        self.assertEqual(len(outbox), 2)
+
+    def test_posts_incomplete_batch_after_latency(self):
+        api = self.get_api(bulk=True)
+        outbox = self.get_outbox(api_endpoint=api.endpoint, api_bulk_endpoint=api.bulk_endpoint, batch_size=10, batch_latency=0.2)
+        outbox.start()
+
+        outbox.put(payload={'magnitude': 19.})
+        outbox.put(payload={'magnitude': 20.})
+
+        self.assertTrue(wait_for(lambda: len(api.payloads) == 2))
+        self.assertEqual(api.requests, 1)
+
+    def test_falls_back_to_single_posts(self):
+        api = self.get_api(bulk=False)
+        outbox = self.get_outbox(api_endpoint=api.endpoint, api_bulk_endpoint=api.bulk_endpoint, batch_size=10)
+        for i in range(3):
+            outbox.put(payload={'magnitude': 19. + i})
+
+        self.assertEqual(outbox.drain(), 3)
+
+        self.assertEqual([payload['magnitude'] for payload in api.payloads], [19., 20., 21.])
+        self.assertEqual(api.requests, 4)
+
+    def test_rejected_batch_is_posted_one_by_one(self):
+        api = self.get_api(bulk=True, status_codes=[400, 201, 400])
+        outbox = self.get_outbox(api_endpoint=api.endpoint, api_bulk_endpoint=api.bulk_endpoint, batch_size=10)
+        outbox.put(payload={'magnitude': 19.})
+        outbox.put(payload={'magnitude': 'bad'})
+
+        self.assertEqual(outbox.drain(), 2)
+
+        self.assertEqual(api.payloads, [{'magnitude': 19.}])
+        with sqlite3.connect(self.filename) as connection:
+            self.assertEqual(connection.execute('SELECT COUNT(*) FROM rejected').fetchone()[0], 1)
@@ -0,0 +1,81 @@
+import json
+import pstats
+import tempfile
+
+from pathlib import Path
+from unittest import TestCase
+
+from dspp_reader.sqmle.sqmle import SQMLE
+from dspp_reader.tools.profiling import NULL_SPAN, SpanTracer, StatsProfiler, span
+from dspp_reader.tools.tests.test_connection import FakeDevice
+from dspp_reader.tools.tests.test_engine import SITE_CONFIG
+
+
+class TestSpanTracer(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.filename = Path(self.directory.name) / 'trace.jsonl'
+
+    def test_span_outside_trace(self):
+        self.assertIs(span('parse'), NULL_SPAN)
+
+    def test_jsonl(self):
+        tracer = SpanTracer(filename=self.filename)
+        for _ in range(2):
+            with tracer.trace(name='sqm-le 1'):
+                with span('send'):
+                    pass
+                with self.assertRaises(ValueError), span('parse'):
+                    raise ValueError
+        tracer.close()
+
+        traces = [json.loads(line) for line in self.filename.read_text().splitlines()]
+        self.assertEqual(len(traces), 2)
+        self.assertEqual(traces[0]['name'], 'sqm-le 1')
+        self.assertEqual([stage[0] for stage in traces[0]['spans']], ['send', 'parse'])
+        self.assertLessEqual(traces[0]['spans'][0][1], traces[0]['spans'][1][1])
+        self.assertIn('parse', tracer.get_summary())
+
+    def test_chrome(self):
+        tracer = SpanTracer(filename=self.filename, trace_format='chrome')
+        with tracer.trace(name='tess-w4c stars1'), span('write'):
+            pass
+        with tracer.trace(name='tess-w4c stars1'):
+            pass
+        tracer.close()
+
+        events = json.loads(self.filename.read_text())
+        self.assertEqual([event['name'] for event in events], ['tess-w4c stars1', 'write', 'tess-w4c stars1'])
+        self.assertTrue(all(event['ph'] == 'X' for event in events))
+
+    def test_invalid_format(self):
+        self.assertRaises(ValueError, SpanTracer, filename=self.filename, trace_format='csv')
+
+    def test_sqmle_reader(self):
+        device = FakeDevice()
+        self.addCleanup(device.close)
+        tracer = SpanTracer(filename=self.filename)
+        reader = SQMLE(**{**SITE_CONFIG, 'save_to_file': True}, device_id='profile1', device_altitude=90, device_azimuth=0, device_ip='127.0.0.1',
+                       device_port=device.port, number_of_reads=2, reads_spacing=0, save_files_to=self.directory.name,
+                       tracer=tracer)
+        self.addCleanup(reader.close)
+
+        with reader.tracer.trace(name='sqm-le profile1'):
+            reader.store_data_point(data=reader.get_data_point())
+        tracer.close()
+
+        stages = [stage[0] for stage in json.loads(self.filename.read_text())['spans']]
+        self.assertEqual(stages, ['connect', 'send', 'recv', 'parse', 'window_correction'] * 2 + ['average', 'augment', 'write'])
+
+
+class TestStatsProfiler(TestCase):
+
+    def test_dump(self):
+        with tempfile.TemporaryDirectory() as directory:
+            filename = Path(directory) / 'reader.prof'
+            with self.assertLogs(level='INFO'), StatsProfiler(filename=filename):
+                sorted(range(1000), key=lambda value: -value)
+
+            self.assertGreater(pstats.Stats(str(filename)).total_calls, 0)
@@ -0,0 +1,78 @@
+import logging
+
+from unittest import TestCase
+from unittest.mock import MagicMock, patch
+
+from dspp_reader.tools.scheduler import WindowScheduler
+
+
+class FakeClock(object):
+    """Replaces `time.time` and `time.sleep` so sleeping advances the clock instantly."""
+
+    def __init__(self, now=1000.):
+        self.now = now
+        self.sleeps = []
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class TestWindowScheduler(TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.site = MagicMock()
+        self.site.timezone = 'America/Santiago'
+        self.site.is_within_window.side_effect = lambda sun_altitude: self.clock.now >= 5000.
+        self.site.seconds_to_next_window.side_effect = lambda sun_altitude: max(0., 5000. - self.clock.now)
+        self.health_check = MagicMock()
+
+        patcher = patch('dspp_reader.tools.scheduler.time')
+        mock_time = patcher.start()
+        mock_time.time.side_effect = self.clock.time
+        mock_time.sleep.side_effect = self.clock.sleep
+        self.addCleanup(patcher.stop)
+        logging.getLogger().setLevel(logging.INFO)
+
+    def test_read_always_does_not_wait(self):
+        scheduler = WindowScheduler(site=self.site, read_always=True)
+
+        scheduler.wait_for_window()
+
+        self.site.is_within_window.assert_not_called()
+        self.assertEqual(self.clock.sleeps, [])
+
+    def test_sleeps_until_window_without_countdown(self):
+        scheduler = WindowScheduler(site=self.site,
+                                    health_check=self.health_check,
+                                    health_check_interval=1800,
+                                    show_countdown=False)
+
+        scheduler.wait_for_window()
+
+        self.assertEqual(self.clock.now, 5000.)
+        self.assertEqual(self.clock.sleeps, [1800., 1800., 400.])
+        self.assertEqual(self.health_check.call_count, 3)
+        self.assertEqual(self.site.seconds_to_next_window.call_count, 1)
+
+    def test_countdown_does_not_query_the_site(self):
+        scheduler = WindowScheduler(site=self.site, show_countdown=True)
+
+        with patch('builtins.print'):
+            scheduler.wait_for_window()
+
+        self.assertEqual(self.clock.now, 5000.)
+        self.assertEqual(len(self.clock.sleeps), 4000)
+        self.assertEqual(self.site.seconds_to_next_window.call_count, 1)
+        self.assertEqual(self.site.is_within_window.call_count, 2)
+
+    def test_sleep(self):
+        scheduler = WindowScheduler(site=self.site, show_countdown=False)
+
+        scheduler.sleep(seconds=30)
+
+        self.assertEqual(self.clock.sleeps, [30.])
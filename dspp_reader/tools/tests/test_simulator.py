@@ -0,0 +1,170 @@
+import asyncio
+import json
+import os
+import tempfile
+
+from pathlib import Path
+from unittest import TestCase
+
+import yaml
+
+from dspp_reader.sqmle.parser import parse_calibration, parse_reading, parse_unit_information
+from dspp_reader.tools.codec import decode_tess_message
+from dspp_reader.tools.connection import DeviceConnection, MessageStream
+from dspp_reader.tools.engine import ReaderEngine, load_engine_config
+from dspp_reader.tools.simulator import (DeviceSimulator, Faults, ReplayedDevice, SimulatedSQMLE, SimulatedTESSW4C,
+                                         format_reading, load_session, record_session)
+from dspp_reader.tools.tests.test_engine import SITE_CONFIG, TESS_MESSAGE
+
+
+class TestResponses(TestCase):
+
+    def test_responses_match_the_device(self):
+        self.assertEqual(format_reading(magnitude=19.29, frequency=22, period_count=0, period_seconds=0, temperature=27, serial_number=1),
+                         'r, 19.29m,0000000022Hz,0000000000c,0000000.000s, 027.0C,00000001\r\n')
+
+        device = SimulatedSQMLE(serial_number=413)
+        reading = parse_reading(device.get_response('Rx'))
+        self.assertEqual(reading.serial_number, '413')
+        self.assertAlmostEqual(reading.magnitude, 21, delta=1)
+        self.assertIsNone(parse_reading(device.get_response('rx'), with_serial_number=False).serial_number)
+        self.assertEqual(parse_calibration(device.get_response('cx')).magnitude_offset_calibration, 19.84)
+        self.assertEqual(parse_unit_information(device.get_response('ix')).serial_number, '00000413')
+        self.assertIsNone(device.get_response('zx'))
+
+    def test_negative_temperature(self):
+        reading = parse_reading(format_reading(magnitude=-0.5, frequency=1, period_count=0, period_seconds=0, temperature=-2.3), with_serial_number=False)
+
+        self.assertEqual((reading.magnitude, reading.temperature), (-0.5, -2.3))
+
+    def test_tess_messages(self):
+        device = SimulatedTESSW4C(name='stars7')
+
+        messages = [decode_tess_message(json.dumps(device.get_message())) for _ in range(3)]
+
+        self.assertEqual([message['udp'] for message in messages], [1, 2, 3])
+        self.assertEqual(messages[0]['name'], 'stars7')
+        self.assertEqual(set(messages[0]), set(TESS_MESSAGE))
+
+
+class TestFaults(TestCase):
+
+    def test_drop_and_garble(self):
+        data = b'r, 19.29m,0000000022Hz,0000000000c,0000000.000s, 027.0C,00000001\r\n'
+
+        self.assertIsNone(Faults(drop_rate=1).apply(data))
+        garbled = Faults(garble_rate=1, seed=1).apply(data)
+        self.assertNotEqual(garbled, data)
+        self.assertTrue(garbled.endswith(b'\r\n'))
+        self.assertEqual(len(garbled), len(data))
+        self.assertRaises(ValueError, parse_reading, garbled.decode(errors='replace'))
+        self.assertEqual(Faults(garble_rate=0.5, seed=3).apply(data), Faults(garble_rate=0.5, seed=3).apply(data))
+
+    def test_delay(self):
+        delays = [Faults(latency=0.1, jitter=0.05).get_delay() for _ in range(20)]
+
+        self.assertTrue(all(0.1 <= delay <= 0.15 for delay in delays))
+
+
+class TestDeviceSimulator(TestCase):
+
+    def setUp(self):
+        self.simulator = DeviceSimulator(devices=[SimulatedSQMLE(serial_number=number) for number in range(1, 4)] +
+                                                 [SimulatedTESSW4C(name=f'stars{number}', interval=0.02) for number in range(1, 3)])
+        self.simulator.start_in_thread()
+        self.addCleanup(self.simulator.close)
+
+    def test_clients(self):
+        connection = DeviceConnection(ip='127.0.0.1', port=self.simulator.ports[1], timeout=2)
+        self.addCleanup(connection.close)
+        self.assertEqual(parse_reading(connection.request(b'Rx\r\n').decode()).serial_number, '2')
+
+        stream = MessageStream(ip='127.0.0.1', port=self.simulator.ports[4], idle_timeout=2)
+        self.addCleanup(stream.close)
+        messages = stream.read()
+        self.assertEqual(messages[0]['name'], 'stars2')
+
+    def test_engine_reads_simulated_devices(self):
+        with tempfile.TemporaryDirectory() as directory:
+            filename = Path(directory) / 'devices.yaml'
+            config = self.simulator.get_engine_config(defaults=SITE_CONFIG)
+            for device in config['devices'][:3]:
+                device.update(number_of_reads=2, reads_spacing=0)
+            filename.write_text(yaml.safe_dump(config))
+            engine = ReaderEngine(devices_config=load_engine_config(filename=filename), stats_interval=0)
+        stored = {}
+        for reader in engine.readers:
+            reader.store_data_point = stored.setdefault(reader.device_id, []).append
+
+        async def run_for():
+            try:
+                await asyncio.wait_for(engine.run(), timeout=1)
+            except asyncio.TimeoutError:
+                pass
+        asyncio.run(run_for())
+        engine.executor.shutdown(wait=True)
+
+        self.assertEqual(sorted(stored), ['1', '2', '3', 'stars1', 'stars2'])
+        self.assertTrue(all(len(data_points) > 1 for data_points in stored.values()))
+
+
+class TestRecordAndReplay(TestCase):
+
+    def test_replays_recorded_session(self):
+        with tempfile.TemporaryDirectory() as directory:
+            filename = Path(directory) / 'session.jsonl'
+
+            async def record():
+                simulator = DeviceSimulator(devices=[SimulatedSQMLE(serial_number=5)])
+                await simulator.start()
+                started = asyncio.get_running_loop().create_future()
+                recorder = asyncio.create_task(record_session(device_ip='127.0.0.1', device_port=simulator.ports[0], filename=filename, started=started))
+                reader, writer = await asyncio.open_connection('127.0.0.1', await started)
+                responses = []
+                for command in [b'Rx\r\n', b'cx\r\n', b'Rx\r\n']:
+                    writer.write(command)
+                    responses.append((await reader.readline()).decode())
+                writer.close()
+                recorder.cancel()
+                await simulator.stop()
+                return responses
+
+            responses = asyncio.run(record())
+            session = load_session(filename=filename)
+
+        self.assertEqual([exchange['request'] for exchange in session], ['Rx', 'cx', 'Rx'])
+        device = ReplayedDevice(session=session, device_id='5', device_type='sqm-le')
+        self.assertEqual([device.get_response('Rx'), device.get_response('Rx'), device.get_response('Rx')],
+                         [responses[0], responses[2], responses[0]])
+        self.assertEqual(device.get_response('cx'), responses[1])
+
+    def test_replays_pushed_messages(self):
+        session = [{'time': index * 0.01, 'request': None, 'response': json.dumps({**TESS_MESSAGE, 'udp': index}) + '\r\n'}
+                   for index in range(5)]
+        simulator = DeviceSimulator(devices=[ReplayedDevice(session=session, device_id='stars1567', device_type='tess-w4c', speed=2)])
+        simulator.start_in_thread()
+        self.addCleanup(simulator.close)
+        stream = MessageStream(ip='127.0.0.1', port=simulator.ports[0], idle_timeout=2)
+        self.addCleanup(stream.close)
+
+        message_ids = []
+        while len(message_ids) < 7:
+            message_ids.extend(message['udp'] for message in stream.read())
+
+        self.assertEqual(message_ids[:7], [0, 1, 2, 3, 4, 0, 1])
+
+    def test_empty_session(self):
+        self.assertRaises(ValueError, ReplayedDevice, session=[], device_id='1', device_type='sqm-le')
+
+
+class TestSimulatorScale(TestCase):
+
+    def test_hundreds_of_devices(self):
+        count = int(os.environ.get('DSPP_SIMULATED_DEVICES', 200))
+        simulator = DeviceSimulator(devices=[SimulatedTESSW4C(name=f'stars{number}', interval=0.05) for number in range(count)])
+        simulator.start_in_thread()
+        self.addCleanup(simulator.close)
+
+        self.assertEqual(len(set(simulator.ports)), count)
+        config = simulator.get_engine_config()
+        self.assertEqual(config['devices'][-1]['device_port'], simulator.ports[-1])
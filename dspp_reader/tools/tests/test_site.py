@@ -0,0 +1,65 @@
+import numpy as np
+
+from unittest import TestCase
+from unittest.mock import patch
+
+from dspp_reader.tools import Site
+
+
+class TestSiteSchedule(TestCase):
+
+    def setUp(self):
+        self.site = Site(id='ctio', name='CTIO', latitude=-30.169166, longitude=-70.804, elevation=2174, timezone='America/Santiago')
+        self.boundaries = np.array([100., 200., 1100., 1200., 2100., 2200.])
+        self.site._schedules[-10] = self.boundaries
+
+    def test_within_window(self):
+        self.assertTrue(self.site.is_within_window(sun_altitude=-10, when=1150.))
+        self.assertEqual(self.site.seconds_to_next_window(sun_altitude=-10, when=1150.), 0.)
+
+    def test_outside_window(self):
+        self.assertFalse(self.site.is_within_window(sun_altitude=-10, when=500.))
+        self.assertEqual(self.site.seconds_to_next_window(sun_altitude=-10, when=500.), 600.)
+
+    def test_next_boundaries_inside_window(self):
+        next_start, next_end = self.site._get_next_boundaries(sun_altitude=-10, when=1150.)
+
+        self.assertEqual(next_start, 2100.)
+        self.assertEqual(next_end, 1200.)
+
+    def test_next_boundaries_outside_window(self):
+        next_start, next_end = self.site._get_next_boundaries(sun_altitude=-10, when=500.)
+
+        self.assertEqual(next_start, 1100.)
+        self.assertEqual(next_end, 1200.)
+
+    def test_cache_is_reused(self):
+        with patch.object(self.site, '_compute_schedule') as mock_compute:
+            self.site.is_within_window(sun_altitude=-10, when=1150.)
+            self.site.seconds_to_next_window(sun_altitude=-10, when=500.)
+
+        mock_compute.assert_not_called()
+
+    def test_cache_is_extended_when_exhausted(self):
+        extended = np.array([2100., 2200., 3100., 3200., 4100., 4200.])
+        with patch.object(self.site, '_compute_schedule', return_value=extended) as mock_compute:
+            self.assertFalse(self.site.is_within_window(sun_altitude=-10, when=2500.))
+
+        mock_compute.assert_called_once_with(sun_altitude=-10, when=2500.)
+        np.testing.assert_array_equal(self.site._schedules[-10], extended)
+
+    def test_get_time_range_matches_astroplan(self):
+        import astropy.units as u
+        from astropy.time import Time
+
+        self.site._schedules = {}
+        next_start, next_end, time_to_next_start, time_to_next_end = self.site.get_time_range(sun_altitude=-10)
+
+        now = Time.now()
+        expected_start = self.site.observer.sun_set_time(now, which='next', horizon=-10 * u.deg)
+        expected_end = self.site.observer.sun_rise_time(now, which='next', horizon=-10 * u.deg)
+
+        self.assertAlmostEqual(next_start.unix, expected_start.unix, delta=60)
+        self.assertAlmostEqual(next_end.unix, expected_end.unix, delta=60)
+        self.assertAlmostEqual(time_to_next_start.sec, (next_start - now).sec, delta=60)
+        self.assertAlmostEqual(time_to_next_end.sec, (next_end - now).sec, delta=60)
@@ -0,0 +1,67 @@
+import os
+import re
+import subprocess
+import sys
+
+from pathlib import Path
+from unittest import TestCase, skipUnless
+
+ROOT = Path(__file__).parents[3]
+
+HEAVY_MODULES = ['astropy', 'astroplan', 'numpy', 'pytz', 'requests']
+
+# Cumulative import time allowed for each console script module. Importing the readers with astropy takes around
+# half a second, so a value close to this budget means a heavy dependency is being imported again.
+STARTUP_BUDGET_SECONDS = 0.35
+
+SCRIPTS = {
+    'read-sqmle': ('dspp_reader.sqmle.scripts', 'read_sqmle'),
+    'read-tessw4c': ('dspp_reader.tessw4c.scripts', 'read_tessw4c'),
+    'dspp-ephemeris': ('dspp_reader.tools.scripts', 'build_ephemeris'),
+    'dspp-reader-engine': ('dspp_reader.tools.scripts', 'run_engine'),
+    'dspp-backfill': ('dspp_reader.tools.scripts', 'backfill'),
+    'dspp-simulator': ('dspp_reader.tools.scripts', 'simulator'),
+}
+
+
+def run_python(code: str, *options: str) -> subprocess.CompletedProcess:
+    return subprocess.run([sys.executable, *options, '-c', code], cwd=ROOT, capture_output=True, text=True, timeout=60)
+
+
+def get_import_time(module: str) -> float:
+    """Get the cumulative import time of a module in seconds using ``python -X importtime``."""
+    result = run_python(f"import {module}", '-X', 'importtime')
+    for line in result.stderr.splitlines():
+        match = re.match(r'import time:\s+\d+ \|\s+(\d+) \| (\S+)$', line)
+        if match and match[2] == module:
+            return int(match[1]) / 1e6
+    raise AssertionError(f"Import time of {module} not found:\n{result.stderr}")
+
+
+class TestStartup(TestCase):
+
+    def test_help_does_not_import_heavy_dependencies(self):
+        for script, (module, function) in SCRIPTS.items():
+            with self.subTest(script=script):
+                result = run_python(
+                    f"import sys\n"
+                    f"from {module} import {function}\n"
+                    f"try:\n"
+                    f"    {function}(['--help'])\n"
+                    f"except SystemExit:\n"
+                    f"    pass\n"
+                    f"print(','.join(name for name in {HEAVY_MODULES!r} if name in sys.modules))")
+
+                self.assertEqual(result.returncode, 0, result.stderr)
+                self.assertEqual(result.stdout.splitlines()[-1], '')
+
+
+@skipUnless(os.environ.get('DSPP_BENCHMARK'), 'Set DSPP_BENCHMARK=1 to run benchmarks')
+class BenchmarkStartup(TestCase):
+
+    def test_import_time_budget(self):
+        for module in sorted({module for module, _ in SCRIPTS.values()}):
+            with self.subTest(module=module):
+                import_time = min(get_import_time(module=module) for _ in range(3))
+
+                self.assertLess(import_time, STARTUP_BUDGET_SECONDS)
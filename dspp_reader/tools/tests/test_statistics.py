@@ -0,0 +1,158 @@
+import os
+import time
+
+from unittest import TestCase, skipUnless
+from unittest.mock import patch
+
+import numpy as np
+
+from dspp_reader.sqmle.parser import SQMReading
+from dspp_reader.sqmle.sqmle import SQMLE
+from dspp_reader.tools.statistics import ConstantFieldError, RecordAccumulator, StreamingStatistics
+from dspp_reader.tools.tests.test_engine import SITE_CONFIG
+
+FIELDS = ('magnitude', 'frequency', 'period_count', 'period_seconds', 'temperature')
+
+
+def get_reading(magnitude=19.29, serial_number='1823', response_type='r'):
+    return SQMReading(response_type, magnitude, 22., 0, 0., 27., serial_number)
+
+
+class TestStreamingStatistics(TestCase):
+
+    def test_matches_numpy(self):
+        values = np.random.default_rng(seed=1).normal(loc=19.5, scale=0.2, size=50)
+        statistics = StreamingStatistics(buffer_size=50)
+        for value in values:
+            statistics.add(value)
+
+        self.assertEqual(statistics.count, 50)
+        self.assertAlmostEqual(statistics.mean, values.mean())
+        self.assertAlmostEqual(statistics.std, values.std(ddof=1))
+        self.assertEqual(statistics.minimum, values.min())
+        self.assertEqual(statistics.maximum, values.max())
+        self.assertAlmostEqual(statistics.median(), np.median(values))
+
+    def test_single_value_has_no_dispersion(self):
+        statistics = StreamingStatistics(buffer_size=1)
+        statistics.add(19.29)
+
+        self.assertEqual(statistics.mean, 19.29)
+        self.assertEqual(statistics.std, 0)
+
+    def test_buffer_keeps_last_values(self):
+        statistics = StreamingStatistics(buffer_size=3)
+        for value in [100, 1, 2, 3]:
+            statistics.add(value)
+
+        self.assertEqual(statistics.median(), 2)
+        self.assertEqual(statistics.maximum, 100)
+        self.assertAlmostEqual(statistics.mean, 26.5)
+
+    def test_sigma_clipped_mean_rejects_outlier(self):
+        statistics = StreamingStatistics(buffer_size=20)
+        for value in [19.3, 19.31, 19.29, 19.3, 19.32, 19.28, 19.3, 19.31, 19.29, 19.3, 5.]:
+            statistics.add(value)
+
+        self.assertAlmostEqual(statistics.sigma_clipped_mean(sigma=3), 19.3, places=6)
+        self.assertLess(statistics.mean, 19)
+
+    def test_sigma_clipped_mean_of_constant_values(self):
+        statistics = StreamingStatistics(buffer_size=3)
+        for value in [1, 1, 1]:
+            statistics.add(value)
+
+        self.assertEqual(statistics.sigma_clipped_mean(), 1)
+
+    def test_unknown_method(self):
+        statistics = StreamingStatistics()
+        statistics.add(1)
+
+        self.assertRaises(ValueError, statistics.get, method='mode')
+
+
+class TestRecordAccumulator(TestCase):
+
+    def test_result_keeps_record_order(self):
+        accumulator = RecordAccumulator(fields=FIELDS, dispersion_fields=('magnitude',), constant_fields=('type', 'serial_number'))
+        accumulator.add(get_reading(magnitude=19.2))
+        accumulator.add(get_reading(magnitude=19.4))
+
+        result = accumulator.result()
+
+        self.assertEqual(list(result.keys()), list(SQMReading._fields) + ['magnitude_std', 'magnitude_min', 'magnitude_max'])
+        self.assertAlmostEqual(result['magnitude'], 19.3)
+        self.assertEqual(result['magnitude_min'], 19.2)
+        self.assertEqual(result['magnitude_max'], 19.4)
+        self.assertEqual(result['serial_number'], '1823')
+        self.assertEqual(len(accumulator), 2)
+
+    def test_rejects_different_serial_number(self):
+        accumulator = RecordAccumulator(fields=FIELDS, constant_fields=('type', 'serial_number'))
+        accumulator.add(get_reading())
+
+        self.assertRaises(ConstantFieldError, accumulator.add, get_reading(serial_number='1824'))
+        self.assertEqual(len(accumulator), 1)
+
+    def test_reader_starts_again_after_serial_number_change(self):
+        reader = SQMLE(**SITE_CONFIG, device_id='serial1', device_altitude=90, device_azimuth=0, device_ip='127.0.0.1',
+                       number_of_reads=3, reads_spacing=0)
+        self.addCleanup(reader.close)
+        responses = ['r, 19.29m,0000000022Hz,0000000000c,0000000.000s, 027.0C,00000002\r\n'] + \
+                    ['r, 19.30m,0000000022Hz,0000000000c,0000000.000s, 027.0C,00000001\r\n'] * 3
+
+        with patch.object(reader, '_send_command', side_effect=responses) as mock_send, self.assertLogs(level='WARNING'):
+            data = reader.get_data_point()
+
+        self.assertEqual(mock_send.call_count, 4)
+        self.assertAlmostEqual(data['magnitude'], 19.30, places=1)
+        self.assertEqual(data['magnitude_min'], data['magnitude_max'])
+
+    def test_median(self):
+        accumulator = RecordAccumulator(fields=FIELDS, method='median')
+        for magnitude in [19.2, 19.3, 25]:
+            accumulator.add(get_reading(magnitude=magnitude))
+
+        self.assertEqual(accumulator.result()['magnitude'], 19.3)
+
+    def test_empty(self):
+        accumulator = RecordAccumulator(fields=FIELDS)
+
+        self.assertRaises(ValueError, accumulator.result)
+
+    def test_unknown_method(self):
+        self.assertRaises(ValueError, RecordAccumulator, fields=FIELDS, method='mode')
+
+
+@skipUnless(os.environ.get('DSPP_BENCHMARK'), 'Set DSPP_BENCHMARK=1 to run benchmarks')
+class BenchmarkAveraging(TestCase):
+
+    def test_against_dataframe(self):
+        try:
+            import pandas as pd
+        except ImportError:
+            self.skipTest('pandas is no longer a dependency, install it to compare')
+
+        readings = [get_reading(magnitude=19.29 + i * 0.01) for i in range(5)]
+        repetitions = 2000
+
+        start = time.perf_counter()
+        for _ in range(repetitions):
+            df = pd.DataFrame([reading._asdict() for reading in readings])
+            df['type'].unique()
+            df['serial_number'].unique()
+            for field in FIELDS:
+                df[field].mean()
+        dataframe_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for _ in range(repetitions):
+            accumulator = RecordAccumulator(fields=FIELDS, dispersion_fields=FIELDS, constant_fields=('type', 'serial_number'), buffer_size=5)
+            for reading in readings:
+                accumulator.add(reading)
+            accumulator.result()
+        accumulator_time = time.perf_counter() - start
+
+        print(f"\nDataFrame: {dataframe_time / repetitions * 1e6:.1f} us per datapoint, "
+              f"accumulator: {accumulator_time / repetitions * 1e6:.1f} us per datapoint")
+        self.assertLess(accumulator_time, dataframe_time)
@@ -0,0 +1,66 @@
+import tempfile
+import threading
+import time
+
+from pathlib import Path
+from unittest import TestCase
+
+from dspp_reader.tools.supervisor import ProcessSupervisor
+from dspp_reader.tools.tests.test_connection import FakeDevice
+from dspp_reader.tools.tests.test_engine import SITE_CONFIG, FakeTESSW4C
+
+
+class TestProcessSupervisor(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.sqm_devices = [FakeDevice(), FakeDevice()]
+        self.tess_device = FakeTESSW4C()
+        for device in [*self.sqm_devices, self.tess_device]:
+            self.addCleanup(device.close)
+
+        output = {'save_to_file': True, 'save_files_to': self.directory.name, 'file_flush_every': 1}
+        self.devices_config = [
+            {**SITE_CONFIG, **output, 'device_type': 'sqm-le', 'device_id': str(number), 'device_altitude': 90, 'device_azimuth': 0,
+             'device_ip': '127.0.0.1', 'device_port': device.port, 'number_of_reads': 3, 'reads_spacing': 0}
+            for number, device in enumerate(self.sqm_devices)
+        ]
+        self.devices_config.append({**SITE_CONFIG, **output, 'device_type': 'tess-w4c', 'device_id': 'stars1567', 'device_altitude': 90,
+                                    'device_azimuth': 0, 'device_ip': '127.0.0.1', 'device_port': self.tess_device.port})
+
+    def test_unknown_device_type(self):
+        self.assertRaises(ValueError, ProcessSupervisor, devices_config=[{'device_type': 'sqm-lu'}])
+
+    def test_groups(self):
+        supervisor = ProcessSupervisor(devices_config=self.devices_config * 2, processes=4)
+
+        self.assertEqual(supervisor.groups, [[0, 4], [1, 5], [2], [3]])
+        self.assertEqual(ProcessSupervisor(devices_config=self.devices_config, processes=8).processes, 3)
+
+    def test_devices_sharing_udp_port_in_same_group(self):
+        devices_config = [{**self.devices_config[2], 'device_id': f'stars{number}', 'udp_port': 2255 if number % 2 else None}
+                          for number in range(5)]
+
+        supervisor = ProcessSupervisor(devices_config=devices_config, processes=4)
+
+        self.assertEqual(supervisor.groups, [[0], [1, 3], [2], [4]])
+
+    def test_reads_all_devices(self):
+        supervisor = ProcessSupervisor(devices_config=self.devices_config, processes=2, stats_interval=0)
+        self.addCleanup(supervisor.stop)
+        thread = threading.Thread(target=supervisor.run)
+
+        thread.start()
+        end = time.monotonic() + 60
+        while not all(supervisor.datapoints.values()) and time.monotonic() < end:
+            time.sleep(0.1)
+        supervisor.stop()
+        thread.join(timeout=10)
+
+        self.assertTrue(all(supervisor.datapoints.values()), supervisor.datapoints)
+        self.assertFalse(any(worker.is_alive() for worker in supervisor.workers))
+        filenames = sorted(path.name for path in Path(self.directory.name).rglob('*') if path.is_file())
+        self.assertEqual(len(filenames), 3, filenames)
+        for filename in Path(self.directory.name).rglob('*.*'):
+            self.assertTrue([line for line in filename.read_text().splitlines() if not line.startswith('#')])
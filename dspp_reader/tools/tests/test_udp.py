@@ -0,0 +1,129 @@
+import asyncio
+import json
+import socket
+
+from types import SimpleNamespace
+from unittest import TestCase
+from unittest.mock import MagicMock, patch
+
+from dspp_reader.tessw4c.tessw4c import TESSW4C
+from dspp_reader.tools.engine import ReaderEngine
+from dspp_reader.tools.udp import SequenceTracker, UDPDemultiplexer
+from dspp_reader.tools.tests.test_engine import SITE_CONFIG, TESS_MESSAGE
+
+
+def get_free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def get_datagram(name, message_id):
+    return json.dumps({**TESS_MESSAGE, 'name': name, 'udp': message_id}).encode()
+
+
+class TestSequenceTracker(TestCase):
+
+    def test_counts_lost_and_duplicated(self):
+        tracker = SequenceTracker()
+
+        self.assertEqual([tracker.check(message_id=i) for i in [1, 2, 2, 5, 6]], [True, True, False, True, True])
+
+        self.assertEqual((tracker.received, tracker.missing, tracker.duplicated), (4, 2, 1))
+
+    def test_late_message(self):
+        tracker = SequenceTracker()
+
+        self.assertEqual([tracker.check(message_id=i) for i in [1, 3, 2, 2]], [True, True, True, False])
+
+        self.assertEqual((tracker.received, tracker.missing, tracker.duplicated), (3, 0, 1))
+
+    def test_restart(self):
+        tracker = SequenceTracker(window=10)
+
+        self.assertEqual([tracker.check(message_id=i) for i in [500, 501, 1, 2]], [True, True, True, True])
+
+        self.assertEqual((tracker.restarts, tracker.missing, tracker.last), (1, 0, 2))
+
+
+class TestUDPDemultiplexer(TestCase):
+
+    def setUp(self):
+        self.readers = [
+            SimpleNamespace(device_type='tess-w4c', device_id='stars1', device=SimpleNamespace(ip='0.0.0.0')),
+            SimpleNamespace(device_type='tess-w4c', device_id='stars2', device=SimpleNamespace(ip='10.0.0.2')),
+        ]
+        self.demultiplexer = UDPDemultiplexer(readers=self.readers)
+
+    def test_routes_by_name_and_address(self):
+        reader, message = self.demultiplexer.route(data=get_datagram(name='stars1', message_id=1), address=('10.0.0.1', 2255))
+        self.assertIs(reader, self.readers[0])
+        self.assertEqual(message['udp'], 1)
+
+        reader, _ = self.demultiplexer.route(data=get_datagram(name='renamed', message_id=1), address=('10.0.0.2', 2255))
+        self.assertIs(reader, self.readers[1])
+
+    def test_drops_unknown_invalid_and_repeated(self):
+        self.assertIsNone(self.demultiplexer.route(data=get_datagram(name='stars9', message_id=1), address=('10.0.0.9', 2255)))
+        self.assertIsNone(self.demultiplexer.route(data=b'{"name": "stars1"', address=('10.0.0.1', 2255)))
+        self.assertIsNotNone(self.demultiplexer.route(data=get_datagram(name='stars1', message_id=7), address=('10.0.0.1', 2255)))
+        self.assertIsNone(self.demultiplexer.route(data=get_datagram(name='stars1', message_id=7), address=('10.0.0.1', 2255)))
+
+        stats = self.demultiplexer.get_stats()
+        self.assertEqual((stats['unknown'], stats['invalid']), (1, 1))
+        self.assertEqual(stats['devices']['stars1'], {'received': 1, 'missing': 0, 'duplicated': 1})
+
+
+class TestEngineUDPListener(TestCase):
+
+    def test_one_socket_for_many_devices(self):
+        port = get_free_port()
+        devices_config = [{**SITE_CONFIG, 'device_type': 'tess-w4c', 'device_id': f'stars{number}', 'device_altitude': 90,
+                           'device_azimuth': 0, 'device_ip': '0.0.0.0', 'udp_port': port, 'stream_policy': 'all'}
+                          for number in range(3)]
+        engine = ReaderEngine(devices_config=devices_config, stats_interval=0)
+        stored = {}
+        for reader in engine.readers:
+            reader.store_data_point = stored.setdefault(reader.device_id, []).append
+
+        async def send_and_stop():
+            task = asyncio.create_task(engine.run())
+            await asyncio.sleep(0.2)
+            with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+                for message_id in [1, 2, 2, 4]:
+                    for number in range(3):
+                        sock.sendto(get_datagram(name=f'stars{number}', message_id=message_id), ('127.0.0.1', port))
+                sock.sendto(get_datagram(name='stars9', message_id=1), ('127.0.0.1', port))
+            await asyncio.sleep(0.3)
+            task.cancel()
+
+        asyncio.run(send_and_stop())
+        engine.executor.shutdown(wait=True)
+
+        self.assertEqual({device_id: [data['udp'] for data in data_points] for device_id, data_points in stored.items()},
+                         {f'stars{number}': [1, 2, 4] for number in range(3)})
+        stats = engine.get_stats()['udp'][port]
+        self.assertEqual(stats['unknown'], 1)
+        self.assertEqual(stats['devices']['stars0'], {'received': 3, 'missing': 1, 'duplicated': 1})
+
+
+class TestReaderUDPListener(TestCase):
+
+    def test_reopens_socket_after_error(self):
+        reader = TESSW4C(**{**SITE_CONFIG, 'read_always': True, 'stream_policy': 'all'}, device_id='stars1', device_altitude=90,
+                         device_azimuth=0, device_ip='0.0.0.0', udp_port=get_free_port())
+        self.addCleanup(reader.close)
+        stored = []
+        reader.store_data_point = lambda data: stored.append(data)
+        broken, working = MagicMock(), MagicMock()
+        broken.recvfrom.side_effect = OSError('Network is unreachable')
+        working.recvfrom.side_effect = [(get_datagram(name='stars1', message_id=1), ('10.0.0.1', 2255)), KeyboardInterrupt]
+
+        with patch('dspp_reader.tessw4c.tessw4c.open_udp_socket', side_effect=[OSError('Address already in use'), broken, working]), \
+                patch.object(reader.scheduler, 'sleep') as mock_sleep, self.assertLogs(level='ERROR'):
+            self.assertRaises(KeyboardInterrupt, reader._listen)
+
+        self.assertEqual([data['udp'] for data in stored], [1])
+        self.assertEqual(mock_sleep.call_count, 2)
+        broken.close.assert_called_once()
+        working.close.assert_called_once()
@@ -0,0 +1,259 @@
+import os
+import tempfile
+import time
+
+from pathlib import Path
+from unittest import TestCase, skipUnless
+from unittest.mock import patch
+
+import astropy.units as u
+
+from dspp_reader.tools.generics import get_filename
+from dspp_reader.sqmle.sqmle import SQMLE
+from dspp_reader.tools.tests.test_engine import SITE_CONFIG
+from dspp_reader.tools.writers import ColumnarNightWriter, NightFileWriter, get_flush_policy, split_units
+
+try:
+    import pyarrow
+except ImportError:  # pragma: no cover
+    pyarrow = None
+
+
+def get_header(filename):
+    return f"# Filename {filename}\n# a\tb\n"
+
+
+class TestNightFileWriter(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.save_files_to = Path(self.directory.name)
+
+    def get_writer(self, **kwargs):
+        writer = NightFileWriter(save_files_to=self.save_files_to, device_name='1823', device_type='sqmle', file_format='tsv', **kwargs)
+        self.addCleanup(writer.close)
+        return writer
+
+    def read(self, filename):
+        with open(filename, 'r') as f:
+            return f.read()
+
+    def test_writes_header_once(self):
+        writer = self.get_writer()
+
+        filename = writer.write(line='1\t2\n', header=get_header)
+        writer.write(line='3\t4\n', header=get_header)
+
+        self.assertEqual(filename, get_filename(save_files_to=self.save_files_to, device_name='1823', device_type='sqmle', file_format='tsv'))
+        self.assertEqual(self.read(filename), get_header(filename) + '1\t2\n3\t4\n')
+
+    def test_keeps_file_open(self):
+        writer = self.get_writer()
+
+        with patch('builtins.open', wraps=open) as mock_open:
+            for i in range(5):
+                writer.write(line=f'{i}\n', header=get_header)
+
+        self.assertEqual(mock_open.call_count, 1)
+        self.assertTrue(writer.is_open)
+
+    def test_appends_to_existing_file_without_header(self):
+        writer = self.get_writer()
+        filename = writer.write(line='1\t2\n', header=get_header)
+        writer.close()
+
+        writer = self.get_writer()
+        writer.write(line='3\t4\n', header=get_header)
+        writer.close()
+
+        self.assertEqual(self.read(filename).count('# Filename'), 1)
+
+    def test_buffers_until_flush_every(self):
+        writer = self.get_writer(flush_every=3)
+
+        filename = writer.write(line='1\n', header=get_header)
+        writer.write(line='2\n', header=get_header)
+        self.assertNotIn('2\n', self.read(filename))
+
+        writer.write(line='3\n', header=get_header)
+        self.assertTrue(self.read(filename).endswith('1\n2\n3\n'))
+
+    def test_flushes_after_interval(self):
+        writer = self.get_writer(flush_every=100, flush_interval=0)
+
+        filename = writer.write(line='1\n', header=get_header)
+
+        self.assertTrue(self.read(filename).endswith('1\n'))
+
+    def test_close_flushes(self):
+        writer = self.get_writer(flush_every=100, fsync=True)
+
+        filename = writer.write(line='1\n', header=get_header)
+        writer.close()
+
+        self.assertTrue(self.read(filename).endswith('1\n'))
+        self.assertFalse(writer.is_open)
+
+    def test_rotates_at_noon(self):
+        writer = self.get_writer()
+        first = writer.write(line='1\n', header=get_header)
+        second = self.save_files_to / 'next_night.tsv'
+
+        writer._rotate_at = 0
+        with patch('dspp_reader.tools.writers.get_filename', return_value=second):
+            writer.write(line='2\n', header=get_header)
+
+        self.assertEqual(writer.filename, second)
+        self.assertEqual(self.read(first), get_header(first) + '1\n')
+        self.assertEqual(self.read(second), get_header(second) + '2\n')
+
+    def test_does_not_rotate_before_noon(self):
+        writer = self.get_writer()
+        writer.write(line='1\n', header=get_header)
+
+        with patch('dspp_reader.tools.writers.get_filename') as mock_get_filename:
+            writer.write(line='2\n', header=get_header)
+
+        mock_get_filename.assert_not_called()
+
+
+class TestSplitUnits(TestCase):
+
+    def test_flattens_and_removes_quantities(self):
+        data = {'magnitude': 19.29, 'F1': {'freq': 1.5, 'mag': 7.35}, 'latitude': -30.1 * u.deg, 'serial_number': '1823'}
+
+        record, units = split_units(data=data, units={'magnitude': 'mag'})
+
+        self.assertEqual(record, {'magnitude': 19.29, 'F1_freq': 1.5, 'F1_mag': 7.35, 'latitude': -30.1, 'serial_number': '1823'})
+        self.assertEqual(units, {'magnitude': 'mag', 'latitude': 'deg'})
+        self.assertIsInstance(record['latitude'], float)
+
+
+@skipUnless(pyarrow, 'pyarrow is not installed')
+class TestColumnarNightWriter(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.save_files_to = Path(self.directory.name)
+        self.units = {'magnitude': 'mag', 'temperature': 'C'}
+
+    def get_writer(self, file_format, **kwargs):
+        writer = ColumnarNightWriter(save_files_to=self.save_files_to, device_name='1823', device_type='sqmle', file_format=file_format, metadata={'site_name': 'Cerro Tololo'}, **kwargs)
+        self.addCleanup(writer.close)
+        return writer
+
+    def write_records(self, writer, count):
+        filename = None
+        for i in range(count):
+            filename = writer.write(record={'magnitude': 19. + i / 100, 'temperature': 20., 'serial_number': '1823', 'timestamp': f'2026-01-10T0{i % 10}:00:00'}, units=self.units)
+        return filename
+
+    def test_parquet_row_groups_and_units(self):
+        import pyarrow.parquet as pq
+
+        writer = self.get_writer(file_format='parquet', flush_every=4)
+        filename = self.write_records(writer=writer, count=10)
+        writer.close()
+
+        parquet_file = pq.ParquetFile(filename)
+        self.assertEqual(filename.suffix, '.parquet')
+        self.assertEqual(parquet_file.metadata.num_rows, 10)
+        self.assertEqual(parquet_file.metadata.num_row_groups, 3)
+        schema = parquet_file.schema_arrow
+        self.assertEqual(schema.field('magnitude').metadata, {b'unit': b'mag'})
+        self.assertIsNone(schema.field('serial_number').metadata)
+        self.assertEqual(schema.metadata[b'site_name'], b'Cerro Tololo')
+        self.assertEqual(str(schema.field('magnitude').type), 'double')
+        self.assertAlmostEqual(parquet_file.read().column('magnitude')[9].as_py(), 19.09)
+
+    def test_column_types_do_not_depend_on_first_values(self):
+        import pyarrow.parquet as pq
+
+        writer = self.get_writer(file_format='parquet', flush_every=1)
+        writer.write(record={'F1_mag': 0, 'tamb': 14, 'tsky': None, 'counter': 1, 'timestamp': '2026-01-10T00:00:00'})
+        filename = writer.write(record={'F1_mag': 7.35, 'tamb': 14.5, 'tsky': -3.25, 'counter': 2.5, 'timestamp': '2026-01-10T00:01:00'})
+        writer.close()
+
+        table = pq.read_table(filename)
+        self.assertEqual(table.column('F1_mag').to_pylist(), [0., 7.35])
+        self.assertEqual(table.column('tamb').to_pylist(), [14., 14.5])
+        self.assertEqual(table.column('tsky').to_pylist(), [None, -3.25])
+        self.assertEqual(table.column('counter').to_pylist(), [1., 2.5])
+        self.assertEqual(str(table.schema.field('timestamp').type), 'string')
+
+    def test_parquet_restart_uses_new_file(self):
+        writer = self.get_writer(file_format='parquet')
+        first = self.write_records(writer=writer, count=1)
+        writer.close()
+
+        writer = self.get_writer(file_format='parquet')
+        second = self.write_records(writer=writer, count=1)
+        writer.close()
+
+        self.assertNotEqual(first, second)
+        self.assertEqual(second.name, f"{first.stem}.1.parquet")
+
+    def test_arrow_is_readable_before_close(self):
+        writer = self.get_writer(file_format='arrow', flush_every=2)
+        filename = self.write_records(writer=writer, count=5)
+
+        with open(filename, 'rb') as f:
+            reader = pyarrow.ipc.open_stream(f)
+            rows = 0
+            try:
+                for batch in reader:
+                    rows += batch.num_rows
+            except pyarrow.ArrowInvalid:
+                pass
+
+        self.assertEqual(rows, 4)
+        writer.close()
+        self.assertEqual(pyarrow.ipc.open_stream(filename).read_all().num_rows, 5)
+
+    def test_flush_policy(self):
+        self.assertEqual(get_flush_policy(columnar=False), (1, 60))
+        self.assertEqual(get_flush_policy(columnar=True), (100, 600))
+        self.assertEqual(get_flush_policy(columnar=True, flush_every=10), (10, 600))
+
+    def test_reader_uses_columnar_defaults(self):
+        for file_format, flush_every, flush_interval in [('tsv', 1, 60), ('parquet', 100, 600)]:
+            with self.subTest(file_format=file_format):
+                reader = SQMLE(**{**SITE_CONFIG, 'save_to_file': True}, device_id='flush1', device_altitude=90, device_azimuth=0,
+                               device_ip='127.0.0.1', save_files_to=self.save_files_to, file_format=file_format)
+                self.addCleanup(reader.close)
+
+                self.assertEqual((reader.writer.flush_every, reader.writer.flush_interval), (flush_every, flush_interval))
+
+    def test_unknown_format(self):
+        self.assertRaises(ValueError, ColumnarNightWriter, save_files_to=self.save_files_to, device_name='1823', device_type='sqmle', file_format='tsv')
+
+
+@skipUnless(os.environ.get('DSPP_BENCHMARK'), 'Set DSPP_BENCHMARK=1 to run benchmarks')
+class BenchmarkNightFileWriter(TestCase):
+
+    def test_against_open_per_line(self):
+        lines = 20000
+        with tempfile.TemporaryDirectory() as directory:
+            save_files_to = Path(directory)
+
+            start = time.perf_counter()
+            for i in range(lines):
+                filename = get_filename(save_files_to=save_files_to, device_name='old', device_type='sqmle', file_format='tsv')
+                if not os.path.exists(filename):
+                    with open(filename, 'w') as f:
+                        f.write(get_header(filename))
+                with open(filename, 'a') as f:
+                    f.write(f'{i}\n')
+            open_per_line_time = time.perf_counter() - start
+
+            start = time.perf_counter()
+            with NightFileWriter(save_files_to=save_files_to, device_name='new', device_type='sqmle', file_format='tsv', flush_every=100) as writer:
+                for i in range(lines):
+                    writer.write(line=f'{i}\n', header=get_header)
+            writer_time = time.perf_counter() - start
+
+        print(f"\nOpen per line: {open_per_line_time / lines * 1e6:.1f} us per line, "
+              f"writer: {writer_time / lines * 1e6:.1f} us per line")
+        self.assertLess(writer_time, open_per_line_time)
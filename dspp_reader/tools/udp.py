@@ -0,0 +1,172 @@
+import asyncio
+import datetime
+import logging
+import socket
+
+from collections import deque
+from typing import Union
+
+from dspp_reader.tools.codec import decode_tess_message
+from dspp_reader.tools.metrics import DECODE_ERRORS, DUPLICATES
+
+logger = logging.getLogger()
+
+UDP_BUFFER_SIZE = 65535
+
+# Address to receive datagrams on, all interfaces.
+UDP_BIND_ADDRESS = '0.0.0.0'
+
+
+class SequenceTracker(object):
+    """Follows the `udp` counter of a device to detect lost, duplicated and reordered messages.
+
+    A counter that goes back more than `window` messages is a restart of the device, not a late message, and tracking
+    starts again from there.
+
+    Args:
+        name (str): Name used in the log messages.
+        window (int): Number of recent message ids kept to detect duplicates and late messages.
+    """
+
+    def __init__(self, name: str = '', window: int = 64):
+        self.name = name
+        self.window = window
+        self.last = None
+        self.recent = deque(maxlen=window)
+        self.received = 0
+        self.duplicated = 0
+        self.missing = 0
+        self.restarts = 0
+
+    def __repr__(self):
+        return (f"SequenceTracker({self.name}, received {self.received}, missing {self.missing}, "
+                f"duplicated {self.duplicated}, restarts {self.restarts})")
+
+    def check(self, message_id: int) -> bool:
+        """Register a message id.
+
+        Args:
+            message_id (int): Value of the `udp` field of the message.
+
+        Returns:
+            bool: True if the message is new, False if it was already received.
+        """
+        if message_id in self.recent:
+            self.duplicated += 1
+            logger.debug(f"{self.name}: duplicated message {message_id}")
+            return False
+        if self.last is None or message_id > self.last:
+            if self.last is not None and message_id > self.last + 1:
+                lost = message_id - self.last - 1
+                self.missing += lost
+                logger.warning(f"{self.name}: {lost} messages lost between {self.last} and {message_id}")
+            self.last = message_id
+        elif self.last - message_id > self.window:
+            self.restarts += 1
+            logger.warning(f"{self.name}: message counter went back from {self.last} to {message_id}, the device restarted")
+            self.recent.clear()
+            self.last = message_id
+        else:
+            self.missing = max(0, self.missing - 1)
+            logger.debug(f"{self.name}: message {message_id} received after {self.last}")
+        self.recent.append(message_id)
+        self.received += 1
+        return True
+
+
+class UDPDemultiplexer(object):
+    """Routes the TESS-W4C datagrams received on one port to the reader of the device that sent them.
+
+    Messages are assigned by their `name` field, which is the device id, or otherwise by the address of the sender
+    when the reader has a `device_ip`. Repeated messages are dropped and lost ones are logged, see `SequenceTracker`.
+
+    Args:
+        readers (list): TESS-W4C readers listening on the same port.
+    """
+
+    def __init__(self, readers: list):
+        self.readers = {str(reader.device_id): reader for reader in readers}
+        self.addresses = {reader.device.ip: reader for reader in readers if reader.device.ip not in ['', UDP_BIND_ADDRESS]}
+        self.trackers = {id(reader): SequenceTracker(name=f"{reader.device_type.upper()} {reader.device_id}") for reader in readers}
+        self.duplicates = {id(reader): DUPLICATES.labels(device_type=reader.device_type, device_id=reader.device_id) for reader in readers}
+        # datagrams that can not be decoded can not be attributed to a device
+        self.decode_errors = DECODE_ERRORS.labels(device_type='tess-w4c', device_id='')
+        self.invalid = 0
+        self.unknown = 0
+
+    def route(self, data: bytes, address: tuple) -> Union[tuple, None]:
+        """Find the reader of a datagram.
+
+        Args:
+            data (bytes): Datagram content.
+            address (tuple): Address of the sender.
+
+        Returns:
+            tuple: Reader and message, or None if the datagram is invalid, of an unknown device or repeated.
+        """
+        try:
+            message = decode_tess_message(data=data)
+        except ValueError as e:
+            self.invalid += 1
+            self.decode_errors.inc()
+            logger.error(f"Invalid datagram from {address[0]}: {e}")
+            return None
+        reader = self.readers.get(str(message.get('name'))) or self.addresses.get(address[0])
+        if reader is None:
+            self.unknown += 1
+            logger.debug(f"Datagram from unknown device {message.get('name')} at {address[0]}")
+            return None
+        if not self.trackers[id(reader)].check(message_id=message['udp']):
+            self.duplicates[id(reader)].inc()
+            return None
+        return reader, message
+
+    def get_stats(self) -> dict:
+        """Get the number of received, missing and duplicated messages per device.
+
+        Returns:
+            dict: Counters per device id, and the number of invalid and unknown datagrams.
+        """
+        return {
+            'devices': {device_id: {'received': self.trackers[id(reader)].received,
+                                    'missing': self.trackers[id(reader)].missing,
+                                    'duplicated': self.trackers[id(reader)].duplicated}
+                        for device_id, reader in self.readers.items()},
+            'invalid': self.invalid,
+            'unknown': self.unknown,
+        }
+
+
+class DatagramQueue(asyncio.DatagramProtocol):
+    """Asyncio protocol that puts every datagram received in a queue, with the time it was received.
+
+    Args:
+        datagrams (asyncio.Queue): Queue where ``(data, address, timestamp)`` tuples are put.
+    """
+
+    def __init__(self, datagrams: asyncio.Queue):
+        self.datagrams = datagrams
+
+    def datagram_received(self, data: bytes, address: tuple):
+        self.datagrams.put_nowait((data, address, datetime.datetime.now(datetime.UTC)))
+
+    def error_received(self, exc: Exception):
+        logger.error(f"UDP error: {exc}")
+
+
+def open_udp_socket(port: int, bind_address: str = UDP_BIND_ADDRESS, timeout: Union[float, None] = None) -> socket.socket:
+    """Open a socket that receives datagrams on a port.
+
+    Args:
+        port (int): Port to listen on.
+        bind_address (str): Address to bind to, all interfaces by default.
+        timeout (float): Timeout in seconds for receiving. Blocks forever if None.
+
+    Returns:
+        socket.socket: The bound socket.
+    """
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((bind_address, port))
+    sock.settimeout(timeout)
+    return sock
@@ -0,0 +1,373 @@
+import logging
+import os
+import threading
+import time
+
+from pathlib import Path
+from typing import Callable, Union
+
+from dspp_reader.tools.generics import get_filename, get_next_local_noon
+
+logger = logging.getLogger()
+
+
+# Default number of records and seconds between flushes of the plain text and of the columnar files.
+FILE_FLUSH_DEFAULTS = (1, 60)
+COLUMNAR_FLUSH_DEFAULTS = (100, 600)
+
+
+def get_flush_policy(columnar: bool, flush_every: Union[int, None] = None, flush_interval: Union[float, None] = None) -> tuple:
+    """Get the records and seconds between flushes, values that are not set take the defaults of the writer.
+
+    Args:
+        columnar (bool): If true, use the defaults of `ColumnarNightWriter`, otherwise those of `NightFileWriter`.
+        flush_every (int): Records between flushes set by the user. Optional.
+        flush_interval (float): Maximum seconds between flushes set by the user. Optional.
+
+    Returns:
+        tuple: Records and seconds between flushes.
+    """
+    default_every, default_interval = COLUMNAR_FLUSH_DEFAULTS if columnar else FILE_FLUSH_DEFAULTS
+    return (default_every if flush_every is None else flush_every,
+            default_interval if flush_interval is None else flush_interval)
+
+
+class NightFileWriter(object):
+    """Writes lines to the file of the current night keeping the file open between datapoints.
+
+    The file name comes from `get_filename`, which changes at local noon, so the name is only computed again once the
+    next local noon is reached. Lines are buffered and written to disk when `flush_every` lines are pending or
+    `flush_interval` seconds have passed since the last flush, whichever comes first. The check is done when a line is
+    written, so `close` must be called on shutdown to write the remaining lines.
+
+    Args:
+        save_files_to (Path): Directory where files are saved.
+        device_name (str): Name of the device used in the file name.
+        device_type (str): Type of the device used in the file name.
+        file_format (str): Extension of the file.
+        flush_every (int): Number of lines to buffer before flushing. One flushes every line.
+        flush_interval (float): Maximum seconds between flushes while lines are being written.
+        fsync (bool): If true, also ask the operating system to write the file to disk on every flush.
+    """
+
+    def __init__(self,
+                 save_files_to: Union[Path, str],
+                 device_name: str,
+                 device_type: str,
+                 file_format: str,
+                 flush_every: int = FILE_FLUSH_DEFAULTS[0],
+                 flush_interval: float = FILE_FLUSH_DEFAULTS[1],
+                 fsync: bool = False):
+        self.save_files_to = Path(save_files_to)
+        self.device_name = device_name
+        self.device_type = device_type
+        self.file_format = file_format
+        self.flush_every = max(1, flush_every)
+        self.flush_interval = flush_interval
+        self.fsync = fsync
+        self.filename = None
+        self._night_filename = None
+        self._file = None
+        self._pending = 0
+        self._last_flush = time.monotonic()
+        self._rotate_at = 0.
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return f"NightFileWriter({self.filename}, {'open' if self.is_open else 'closed'})"
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @property
+    def is_open(self) -> bool:
+        return self._file is not None
+
+    @property
+    def pending(self) -> int:
+        """Number of lines or records written but not flushed yet."""
+        return self._pending
+
+    def write(self, line: str, header: Union[Callable[[Path], str], None] = None) -> Path:
+        """Write a line to the file of the current night.
+
+        Args:
+            line (str): Line to write, including the new line character.
+            header (Callable): Called with the file name to get the header when a new file is started.
+
+        Returns:
+            Path: File the line was written to.
+        """
+        with self._lock:
+            self._rotate(header=header)
+            self._file.write(line)
+            self._pending += 1
+            self._flush_if_needed()
+            return self.filename
+
+    def flush(self):
+        """Write the buffered lines to disk."""
+        with self._lock:
+            self._flush()
+
+    def close(self):
+        """Flush and close the file, the next write opens it again."""
+        with self._lock:
+            self._close()
+
+    def _rotate(self, header):
+        if self._file is not None and time.time() < self._rotate_at:
+            return
+        filename = get_filename(save_files_to=self.save_files_to,
+                                device_name=self.device_name,
+                                device_type=self.device_type,
+                                file_format=self.file_format)
+        self._rotate_at = get_next_local_noon().timestamp()
+        if self._file is not None and filename == self._night_filename:
+            return
+        self._close()
+        self._night_filename = filename
+        self._open(filename=filename, header=header)
+        logger.debug(f"Opened {self.filename}")
+
+    def _open(self, filename: Path, header: Union[Callable[[Path], str], None]):
+        is_new = not os.path.exists(filename) or os.path.getsize(filename) == 0
+        self._file = open(filename, 'a')
+        self.filename = filename
+        if is_new and header is not None:
+            self._file.write(header(filename))
+
+    def _flush_if_needed(self):
+        if self._pending >= self.flush_every or time.monotonic() - self._last_flush >= self.flush_interval:
+            self._flush()
+
+    def _flush(self):
+        if self._file is None:
+            return
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+        if self._pending:
+            logger.debug(f"Flushed {self._pending} lines to {self.filename}")
+        self._pending = 0
+        self._last_flush = time.monotonic()
+
+    def _close(self):
+        if self._file is None:
+            return
+        self._flush()
+        self._file.close()
+        logger.debug(f"Closed {self.filename}")
+        self._file = None
+
+
+COLUMNAR_FORMATS = ['parquet', 'arrow']
+
+
+def split_units(data: dict, units: Union[dict, None] = None) -> tuple:
+    """Convert a datapoint into a flat record of plain values and the units of its columns.
+
+    Nested dictionaries, like the channels of the TESS-W4C, are flattened using ``<key>_<subkey>`` as in the plain text
+    files, and Quantities are replaced by their value.
+
+    Args:
+        data (dict): Datapoint as passed to the outputs.
+        units (dict): Known units of the columns, for values that are plain numbers.
+
+    Returns:
+        tuple: The flat record and a dictionary with the unit of each column that has one.
+    """
+    from astropy.units import Quantity
+
+    record = {}
+    record_units = {}
+    for key, value in data.items():
+        if isinstance(value, dict):
+            nested_record, nested_units = split_units(data={f"{key}_{subkey}": subvalue for subkey, subvalue in value.items()}, units=units)
+            record.update(nested_record)
+            record_units.update(nested_units)
+            continue
+        if isinstance(value, Quantity):
+            record_units[key] = str(value.unit)
+            value = value.value.item() if value.isscalar else value.value.tolist()
+        elif units and key in units:
+            record_units[key] = units[key]
+        record[key] = value
+    return record, record_units
+
+
+def _get_column_type(name: str, values: list):
+    """Get the Arrow type of a column, numbers are always stored as float64.
+
+    Known columns take their type from `SCHEMAS`, so a first value that is a whole number or None does not fix the
+    type of the column for the rest of the file. Other columns are inferred from `values`.
+    """
+    import pyarrow as pa
+
+    from dspp_reader.tools.database import SCHEMAS
+
+    for schema in SCHEMAS.values():
+        for column, column_type in schema.columns:
+            if column == name:
+                return pa.string() if column_type.startswith('TEXT') else pa.float64()
+    try:
+        field_type = pa.array(values).type
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        return pa.string()
+    if pa.types.is_integer(field_type) or pa.types.is_floating(field_type):
+        return pa.float64()
+    if pa.types.is_null(field_type):
+        return pa.string()
+    return field_type
+
+
+def _to_column_value(value, is_number: bool, is_text: bool):
+    """Convert a value to the type of its column, numbers that can not be converted are stored as null."""
+    if value is None:
+        return None
+    if is_number:
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            logger.warning(f"Unable to store {value!r} in a numeric column")
+            return None
+    if is_text and not isinstance(value, str):
+        return str(value)
+    return value
+
+
+class ColumnarNightWriter(NightFileWriter):
+    """Writes records to a Parquet or Arrow IPC file per night with typed columns.
+
+    Records are kept in memory until they are flushed, following the same policy as `NightFileWriter`, and each flush
+    is written as a Parquet row group or an Arrow record batch, so a night is never held in memory. The columns are
+    taken from the first flush, with the types of `SCHEMAS` when known and numbers always stored as float64, and units
+    are stored in the metadata of each column under ``unit``.
+
+    Parquet files can not be appended to, if the file of the night already exists, for instance after a restart, a new
+    file is started with a numeric suffix. Parquet files are only readable once closed, while Arrow IPC streams are
+    readable up to the last flush, which makes ``arrow`` the safer choice if the reader may be killed.
+
+    Requires pyarrow, which is an optional dependency: ``pip install dspp-reader[parquet]``.
+
+    Args:
+        save_files_to (Path): Directory where files are saved.
+        device_name (str): Name of the device used in the file name.
+        device_type (str): Type of the device used in the file name.
+        file_format (str): One of `COLUMNAR_FORMATS`.
+        flush_every (int): Number of records per row group or record batch.
+        flush_interval (float): Maximum seconds between flushes while records are being written.
+        metadata (dict): Extra metadata stored in the schema, for instance the site.
+    """
+
+    def __init__(self,
+                 save_files_to: Union[Path, str],
+                 device_name: str,
+                 device_type: str,
+                 file_format: str = 'parquet',
+                 flush_every: int = COLUMNAR_FLUSH_DEFAULTS[0],
+                 flush_interval: float = COLUMNAR_FLUSH_DEFAULTS[1],
+                 metadata: Union[dict, None] = None):
+        if file_format not in COLUMNAR_FORMATS:
+            raise ValueError(f"Unknown columnar format {file_format}, use one of {', '.join(COLUMNAR_FORMATS)}")
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError as e:
+            raise ImportError(f"pyarrow is required to write {file_format} files: pip install dspp-reader[parquet]") from e
+        super().__init__(save_files_to=save_files_to,
+                         device_name=device_name,
+                         device_type=device_type,
+                         file_format=file_format,
+                         flush_every=flush_every,
+                         flush_interval=flush_interval)
+        self.metadata = metadata or {}
+        self._rows = []
+        self._units = {}
+        self._schema = None
+        self._writer = None
+
+    def write(self, record: dict, units: Union[dict, None] = None) -> Path:
+        """Add a record to the file of the current night.
+
+        Args:
+            record (dict): Flat record, see `split_units`.
+            units (dict): Units of the columns, only used when a new file is started.
+
+        Returns:
+            Path: File the record was written to.
+        """
+        with self._lock:
+            self._rotate(header=units)
+            self._rows.append(record)
+            self._pending += 1
+            self._flush_if_needed()
+            return self.filename
+
+    def _open(self, filename: Path, header: Union[dict, None]):
+        part = 0
+        while os.path.exists(filename):
+            part += 1
+            filename = self._night_filename.with_name(f"{self._night_filename.stem}.{part}{self._night_filename.suffix}")
+        self._file = open(filename, 'wb')
+        self.filename = filename
+        self._units = header or {}
+
+    def _get_schema(self):
+        import pyarrow as pa
+
+        fields = []
+        for name in dict.fromkeys(key for row in self._rows for key in row):
+            field_type = _get_column_type(name=name, values=[row.get(name) for row in self._rows])
+            metadata = {'unit': self._units[name]} if name in self._units else None
+            fields.append(pa.field(name, field_type, metadata=metadata))
+        metadata = {'device_name': str(self.device_name), 'device_type': str(self.device_type), **{key: str(value) for key, value in self.metadata.items()}}
+        return pa.schema(fields, metadata=metadata)
+
+    def _get_table(self):
+        import pyarrow as pa
+
+        columns = {}
+        for field in self._schema:
+            is_number = pa.types.is_floating(field.type)
+            is_text = pa.types.is_string(field.type)
+            columns[field.name] = [_to_column_value(value=row.get(field.name), is_number=is_number, is_text=is_text) for row in self._rows]
+        return pa.Table.from_pydict(columns, schema=self._schema)
+
+    def _flush(self):
+        if self._file is None or not self._rows:
+            return
+        import pyarrow as pa
+
+        if self._schema is None:
+            self._schema = self._get_schema()
+            if self.file_format == 'parquet':
+                import pyarrow.parquet as pq
+
+                self._writer = pq.ParquetWriter(self._file, self._schema)
+            else:
+                self._writer = pa.ipc.new_stream(self._file, self._schema)
+        table = self._get_table()
+        if self.file_format == 'parquet':
+            self._writer.write_table(table, row_group_size=len(self._rows))
+        else:
+            self._writer.write_table(table)
+        self._file.flush()
+        logger.debug(f"Flushed {len(self._rows)} records to {self.filename}")
+        self._rows = []
+        self._pending = 0
+        self._last_flush = time.monotonic()
+
+    def _close(self):
+        if self._file is None:
+            return
+        self._flush()
+        if self._writer is not None:
+            self._writer.close()
+        self._file.close()
+        logger.debug(f"Closed {self.filename}")
+        self._file = None
+        self._writer = None
+        self._schema = None